@@ -128,6 +128,38 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
 
+# Upload de documentos gravado direto em MEDIA_ROOT (usuarios/upload.py)
+UPLOAD_DOCUMENTOS = {
+    "tamanho_max_mb": 100,      # Por arquivo; verificado a cada bloco recebido
+    "tipos_permitidos": [       # Detectados pelos bytes iniciais, não pela extensão
+        "application/pdf",
+        "image/png",
+        "image/jpeg",
+        "image/gif",
+        "image/bmp",
+        "image/tiff",
+        "image/webp",
+        "application/msword",
+        "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    ],
+}
+
+# Texto extraído dos documentos, fora da tabela de documentos (usuarios.ConteudoDocumento)
+CONTEUDO_DOCUMENTOS = {
+    "compressao": "zstd",   # zstd (pacote zstandard) ou gzip
+    "nivel": 3,             # Nível de compressão do algoritmo escolhido
+}
+
+# Upload em lote (vários arquivos ou um ZIP por cliente)
+UPLOAD_LOTE = {
+    "max_arquivos": 500,                # Documentos por lote (arquivos + membros dos ZIPs)
+    "tamanho_max_requisicao_mb": 1024,  # Corpo da requisição inteira
+    "tamanho_max_zip_mb": 1024,         # Por ZIP; cada membro segue UPLOAD_DOCUMENTOS
+    "enfileirar_por_vez": 10,           # Documentos enfileirados por rodada
+    "fila_max": 30,                     # Só enfileira enquanto a fila do django-q estiver abaixo disso
+    "intervalo_s": 15,                  # Espera entre rodadas quando sobra documento
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -148,9 +180,70 @@ Q_CLUSTER = {
     "queue_limit": 50,
     "orm": "default",
     "catch_up": False,
+    # Workers precisam criar filhos para o pool de OCR (ia/ocr_pool.py)
+    "daemonize_workers": False,
+}
+
+# Pool de processos do OCR paralelo (ia/ocr_pool.py)
+# Cada worker do Q_CLUSTER tem o seu pool: Q_CLUSTER["workers"] x workers x
+# intra_op_threads é limitado ao número de núcleos (ocr_pool.processos_por_worker)
+OCR_POOL = {
+    "workers": None,            # Processos por pool; None = núcleos / (workers do cluster x threads)
+    "intra_op_threads": 1,
+}
+
+# Reconhecimento em lote do RapidOCR (ia/ocr_utils.py)
+OCR_LOTE = {
+    "paginas": 4,               # Páginas cujas linhas são reconhecidas juntas
+    # Recortes de linha por inferência; lotes maiores aumentam o padding em CPU,
+    # medir com `manage.py benchmark_ocr_lote` antes de mudar
+    "rec_batch_num": 6,
+    "intra_op_threads": None,   # Threads ONNX por sessão (None = padrão do ONNX Runtime)
+}
+
+# Cadeia do ImagePreprocessor por task de OCR (ia/ocr_utils.py)
+# Etapas: "bordas", "inclinacao", "contraste", "threshold"; None usa só o
+# threshold simples
+OCR_PREPROCESSAMENTO = {
+    "rapidocr": ["bordas", "inclinacao", "threshold"],
+    "paralelo": ["bordas", "inclinacao", "threshold"],
+}
+
+# Documentos grandes divididos em faixas de páginas (ia/tasks_otimizado.py)
+# Cada faixa é uma task do mesmo grupo do django-q e deve caber no timeout
+# do Q_CLUSTER
+OCR_FAIXAS = {
+    "paginas_por_faixa": 20,    # Páginas pendentes de OCR por task
+    "motor": "rapidocr",        # "rapidocr", "docling" ou "paralelo"
+}
+
+# Modelo de custo do roteamento do OCR (ia/roteamento_ocr.py)
+# Segundos por estratégia: fixo + por_pagina * páginas de OCR / paralelismo
+# + por_mb * MB; recalibrar com `manage.py calibrar_roteamento_ocr`
+OCR_ROTEAMENTO = {
+    "custos": {
+        "camada_texto": {"fixo": 0.2, "por_pagina": 0.0, "por_mb": 0.02},
+        "rapidocr": {"fixo": 1.5, "por_pagina": 2.5, "por_mb": 0.05},
+        "docling": {"fixo": 0.5, "por_pagina": 2.0, "por_mb": 0.05},
+        "paralelo": {"fixo": 3.0, "por_pagina": 2.5, "por_mb": 0.05},
+        "faixas": {"fixo": 5.0, "por_pagina": 2.5, "por_mb": 0.05},
+    },
+    "margem_timeout": 0.8,            # Fração do timeout que uma task única pode ocupar
+    "segundos_por_task_fila": 30,     # Espera estimada por task enfileirada
+}
+
+# Conversores do Docling reutilizados por worker (ia/conversores_docling.py)
+DOCLING_CONVERSORES = {
+    "pre_aquecer": True,          # Carrega os modelos quando o worker do qcluster sobe
+    "max_conversores": 2,         # Combinações de opções mantidas em memória
+    "conversoes_max": 200,        # Recicla o conversor após N conversões
+    "memoria_max_mb": 4096,       # Descarta os conversores se o RSS do worker passar disso
 }
 
 # Configuração de Logging
+# logs/ fica fora do repositório (.gitignore)
+os.makedirs(os.path.join(BASE_DIR, 'logs'), exist_ok=True)
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -193,6 +286,53 @@ LOGGING = {
     },
 }
 
+# Ingestão do RAG (ia/ingestao.py): chunks e embeddings em lote
+RAG_INGESTAO = {
+    "tamanho_chunk": 1500,  # Caracteres por chunk
+    "sobreposicao": 200,    # Caracteres repetidos entre chunks da mesma seção
+    "tamanho_lote": 64,     # Textos por chamada ao embedder
+    "concorrencia": 4,      # Chamadas simultâneas ao embedder
+}
+
+# Embedder do RAG (ia/embedders.py). Cada embedder tem a própria tabela no
+# LanceDB; trocar o backend dispara, no migrate, a reindexação completa e
+# só depois dela as tabelas antigas são apagadas
+EMBEDDER_RAG = {
+    "backend": "openai",  # "openai" (API) ou "hashing" (local, CPU, sem rede)
+    "opcoes": {},         # Repassadas ao embedder, ex.: {"dimensions": 1024} no hashing
+    "reindexacao": {
+        "enfileirar_por_vez": 20,  # Documentos enfileirados por leva
+        "fila_max": 30,            # Não enfileira se a fila do qcluster já tiver isso
+        "intervalo_s": 15,         # Espera entre levas
+        "verificacoes": 20,        # Conferências do término antes de desistir
+        "validade_marca_s": 3600,  # Sem nova leva nesse tempo, a reindexação é dada como interrompida
+    },
+}
+
+# Busca do agente (ia/busca_hibrida.py): BM25 no SQLite FTS5 + vetores do LanceDB
+BUSCA_HIBRIDA = {
+    "modo": "hibrida",  # "vetorial", "lexical" ou "hibrida" (fusão por RRF)
+    "caminho": BASE_DIR / 'busca_lexica.sqlite3',
+    "candidatos": 20,   # Resultados de cada busca antes da fusão
+    "k_rrf": 60,        # Constante da reciprocal rank fusion
+    "max_fora_indice": 10000,  # Linhas fora do índice BITMAP de cliente_id antes de retreiná-lo
+}
+
+# Vetores já calculados, por (hash do chunk normalizado, modelo, dimensões)
+CACHE_EMBEDDINGS = {
+    "ativo": True,
+    "caminho": BASE_DIR / 'cache_embeddings.sqlite3',
+    "tipo_vetor": "float16",  # float16 ocupa metade; "float32" guarda o vetor exato
+}
+
+# Artefatos de OCR (texto por documento e por página, sidecars), fora do cache do Django
+ARMAZEM_OCR = {
+    "caminho": BASE_DIR / 'ocr_artefatos.sqlite3',
+    "orcamento_mb": 2048,   # Acima disso, despejo dos menos usados recentemente (LRU)
+    "lote_acessos": 200,    # Leituras acumuladas em memória antes de gravar acessos e contadores
+    "intervalo_acessos_s": 30,  # Tempo máximo com leituras ainda não gravadas
+}
+
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
@@ -1,16 +1,50 @@
+from django import forms
 from django.contrib import admin
-from usuarios.models import Documentos
+from martor.fields import MartorFormField
+from usuarios.models import ConteudoDocumento, Documentos
 from .models import (
     Pergunta, 
     ContextRag, 
     AnaliseJurisprudencia,
     ConversaWhatsApp,
     MensagemWhatsApp,
-    AgendamentoWhatsApp
+    AgendamentoWhatsApp,
+    PaginaOCR,
+    ProcessamentoOCR,
+    RotaOCR
 )
 
 # Register your models here.
-admin.site.register(Documentos)
+class DocumentosForm(forms.ModelForm):
+    # O texto fica em ConteudoDocumento; o editor lê e grava por Documentos.content
+    content = MartorFormField(required=False)
+
+    class Meta:
+        model = Documentos
+        exclude = ['conteudo']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk:
+            self.initial['content'] = self.instance.content
+
+    def save(self, commit=True):
+        self.instance.content = self.cleaned_data.get('content', '')
+        return super().save(commit)
+
+@admin.register(Documentos)
+class DocumentosAdmin(admin.ModelAdmin):
+    form = DocumentosForm
+    list_display = ['id', 'arquivo', 'cliente', 'tipo', 'tipo_mime', 'num_paginas', 'data_upload']
+    list_filter = ['tipo', 'tipo_mime']
+    search_fields = ['arquivo', 'cliente__nome', 'hash_conteudo']
+
+@admin.register(ConteudoDocumento)
+class ConteudoDocumentoAdmin(admin.ModelAdmin):
+    list_display = ['hash', 'compressao', 'tamanho', 'tamanho_comprimido', 'data_criacao']
+    readonly_fields = ['hash', 'compressao', 'tamanho', 'tamanho_comprimido', 'data_criacao']
+    exclude = ['dados']
+
 admin.site.register(Pergunta)
 admin.site.register(ContextRag)
 
@@ -85,4 +119,27 @@ class AgendamentoWhatsAppAdmin(admin.ModelAdmin):
             'fields': ('data_criacao', 'data_atualizacao'),
             'classes': ('collapse',)
         }),
-    )
\ No newline at end of file
+    )
+
+@admin.register(PaginaOCR)
+class PaginaOCRAdmin(admin.ModelAdmin):
+    list_display = ['id', 'documento', 'pagina', 'origem', 'caracteres', 'confianca', 'dpi', 'data_processamento']
+    list_filter = ['origem', 'dpi', 'data_processamento']
+    search_fields = ['documento__arquivo']
+    readonly_fields = ['data_processamento']
+
+
+@admin.register(ProcessamentoOCR)
+class ProcessamentoOCRAdmin(admin.ModelAdmin):
+    list_display = ['id', 'documento', 'status', 'motor', 'faixas_concluidas', 'faixas_total', 'total_paginas', 'data_inicio', 'data_conclusao']
+    list_filter = ['status', 'motor', 'data_inicio']
+    search_fields = ['documento__arquivo', 'grupo']
+    readonly_fields = ['grupo', 'data_inicio', 'data_atualizacao', 'data_conclusao']
+
+
+@admin.register(RotaOCR)
+class RotaOCRAdmin(admin.ModelAdmin):
+    list_display = ['id', 'documento', 'estrategia', 'paginas', 'paginas_ocr', 'fila', 'custo_estimado', 'tempo_real', 'data_criacao']
+    list_filter = ['estrategia', 'data_criacao']
+    search_fields = ['documento__arquivo']
+    readonly_fields = ['estimativas', 'data_criacao', 'data_conclusao']
@@ -1,13 +1,13 @@
 import json
 import requests
+from .busca_hibrida import LanceDbHibrido
+from .embedders import embedder_configurado
 from .literals import TribunalLiteral
 from agno.tools import tool
 from agno.agent import Agent
 from agno.db.sqlite import SqliteDb
-from agno.knowledge.embedder.openai import OpenAIEmbedder
 from agno.knowledge.knowledge import Knowledge
 from agno.tools import tool
-from agno.vectordb.lancedb import LanceDb
 
 
 @tool
@@ -81,11 +81,15 @@ class JuriAI:
     - Mantenha um tom profissional e objetivo em todas as respostas.
     """
 
+    # Backend de settings.EMBEDDER_RAG; cada embedder tem a própria tabela
+    EMBEDDER = embedder_configurado(tabela_base=VECTOR_DB_TABLE)
+
+    # Busca vetorial + BM25 fundidas por RRF (settings.BUSCA_HIBRIDA)
     knowledge = Knowledge(
-        vector_db=LanceDb(
-            table_name=VECTOR_DB_TABLE,
+        vector_db=LanceDbHibrido(
+            table_name=EMBEDDER.tabela,
             uri=VECTOR_DB_URI,
-            embedder=OpenAIEmbedder()
+            embedder=EMBEDDER.embedder
         ),
     )
 
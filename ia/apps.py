@@ -4,3 +4,32 @@ from django.apps import AppConfig
 class IaConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ia'
+
+    def ready(self):
+        from django.conf import settings
+
+        # Cada worker do qcluster carrega o Docling ao subir, não na primeira task
+        if getattr(settings, 'DOCLING_CONVERSORES', {}).get('pre_aquecer'):
+            from django_q.signals import post_spawn
+            from .conversores_docling import pre_aquecer
+
+            post_spawn.connect(pre_aquecer, dispatch_uid='ia_pre_aquecer_docling')
+
+        # Troca do backend de embeddings é aplicada no migrate do deploy
+        from django.db.models.signals import post_migrate
+
+        post_migrate.connect(verificar_embedder, sender=self, dispatch_uid='ia_verificar_embedder')
+
+
+def verificar_embedder(sender, using='default', **kwargs):
+    """
+    Se há vetores de outro embedder e nenhuma reindexação em andamento,
+    inicia a reindexação completa para o embedder de settings.EMBEDDER_RAG
+    """
+    from .agents import JuriAI
+    from .models import ChunkIndexado
+    from .tasks_otimizado import iniciar_reindexacao_embedder
+
+    if not ChunkIndexado.objects.using(using).exclude(embedder=JuriAI.EMBEDDER.assinatura).exists():
+        return
+    iniciar_reindexacao_embedder()
@@ -0,0 +1,316 @@
+"""
+Armazém local de artefatos de OCR, endereçado por hash de conteúdo
+
+Texto por documento, texto por página e saída estruturada (sidecar .npz)
+ficam em um SQLite próprio (settings.ARMAZEM_OCR), separados do cache do
+Django: sobrevivem a reinícios, têm orçamento de bytes com despejo LRU e
+contadores de acerto/falta/bytes persistidos no próprio arquivo.
+
+Tipos de artefato:
+    texto        texto do documento, chave '<motor>_<hash do arquivo>'
+    pagina       texto de uma página, chave '<motor>_<hash do bitmap>'
+    estruturado  bytes do sidecar .npz, chave '<hash do arquivo>'
+
+Processos diferentes (workers do qcluster, pool de OCR) abrem conexões
+próprias sobre o mesmo arquivo em modo WAL. Leituras não escrevem: acessos
+(para o LRU) e contadores ficam em memória e são gravados em lote, numa
+única transação, a cada `lote_acessos` leituras ou `intervalo_acessos_s`
+segundos, antes de cada gravação e ao fim do processo.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from multiprocessing.util import Finalize
+from typing import Dict, Optional, Tuple, Union
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+TIPO_TEXTO = 'texto'
+TIPO_PAGINA = 'pagina'
+TIPO_ESTRUTURADO = 'estruturado'
+
+ORCAMENTO_MB_PADRAO = 1024
+LOTE_ACESSOS_PADRAO = 200
+INTERVALO_ACESSOS_S_PADRAO = 30
+# Depois de passar do orçamento, despeja até esta fração dele, para não
+# despejar a cada gravação
+FRACAO_APOS_DESPEJO = 0.9
+
+_CONTADORES = ('acertos', 'faltas', 'bytes_lidos', 'bytes_gravados', 'despejos', 'bytes_despejados')
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS artefatos (
+    chave TEXT PRIMARY KEY,
+    tipo TEXT NOT NULL,
+    compressao TEXT NOT NULL DEFAULT '',
+    dados BLOB NOT NULL,
+    tamanho INTEGER NOT NULL,
+    criado REAL NOT NULL,
+    acessado REAL NOT NULL,
+    acessos INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS artefatos_acessado ON artefatos (acessado);
+CREATE TABLE IF NOT EXISTS contadores (
+    tipo TEXT NOT NULL,
+    nome TEXT NOT NULL,
+    valor INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (tipo, nome)
+);
+"""
+
+_SQL_CONTAR = (
+    "INSERT INTO contadores (tipo, nome, valor) VALUES (?, ?, ?) "
+    "ON CONFLICT (tipo, nome) DO UPDATE SET valor = valor + excluded.valor"
+)
+
+
+class ArmazemOCR:
+    """
+    Args:
+        caminho: Arquivo SQLite
+        orcamento_bytes: Total de bytes de artefatos antes do despejo LRU
+        lote_acessos: Leituras acumuladas em memória antes de gravá-las
+        intervalo_acessos_s: Tempo máximo com leituras não gravadas
+    """
+
+    def __init__(self, caminho: str, orcamento_bytes: int, lote_acessos: int = LOTE_ACESSOS_PADRAO,
+                 intervalo_acessos_s: float = INTERVALO_ACESSOS_S_PADRAO):
+        self.caminho = str(caminho)
+        self.orcamento_bytes = orcamento_bytes
+        self.lote_acessos = lote_acessos
+        self.intervalo_acessos_s = intervalo_acessos_s
+        self._local = threading.local()
+        self._trava_pendentes = threading.Lock()
+        self._zerar_pendentes()
+        os.makedirs(os.path.dirname(self.caminho) or '.', exist_ok=True)
+        self._conexao().executescript(_ESQUEMA)
+
+    @classmethod
+    def de_settings(cls) -> "ArmazemOCR":
+        config = getattr(settings, 'ARMAZEM_OCR', {})
+        return cls(
+            caminho=config.get('caminho', os.path.join(settings.BASE_DIR, 'ocr_artefatos.sqlite3')),
+            orcamento_bytes=int(config.get('orcamento_mb', ORCAMENTO_MB_PADRAO) * 1024 * 1024),
+            lote_acessos=config.get('lote_acessos', LOTE_ACESSOS_PADRAO),
+            intervalo_acessos_s=config.get('intervalo_acessos_s', INTERVALO_ACESSOS_S_PADRAO),
+        )
+
+    def _conexao(self) -> sqlite3.Connection:
+        # Uma conexão por thread e por processo (conexões SQLite não
+        # atravessam fork)
+        conexao = getattr(self._local, 'conexao', None)
+        if conexao is None or self._local.pid != os.getpid():
+            conexao = sqlite3.connect(self.caminho, timeout=30, isolation_level=None)
+            conexao.execute('PRAGMA journal_mode=WAL')
+            conexao.execute('PRAGMA synchronous=NORMAL')
+            self._local.conexao = conexao
+            self._local.pid = os.getpid()
+        return conexao
+
+    def _contar(self, conexao: sqlite3.Connection, tipo: str, **incrementos: int):
+        conexao.executemany(_SQL_CONTAR, [(tipo, nome, valor) for nome, valor in incrementos.items() if valor])
+
+    def _zerar_pendentes(self):
+        # Chamado com a trava, ou antes de o armazém ser compartilhado
+        self._acessos: Dict[str, Tuple[float, int]] = {}
+        self._contadores: Counter = Counter()
+        self._leituras = 0
+        self._ultima_descarga = time.monotonic()
+        self._pid = os.getpid()
+
+    def _registrar_leitura(self, tipo: str, chave: Optional[str], **incrementos: int):
+        with self._trava_pendentes:
+            if self._pid != os.getpid():
+                # Pendências herdadas no fork são do processo pai
+                self._zerar_pendentes()
+            if chave is not None:
+                _, acessos = self._acessos.get(chave, (0.0, 0))
+                self._acessos[chave] = (time.time(), acessos + 1)
+            for nome, valor in incrementos.items():
+                self._contadores[(tipo, nome)] += valor
+            self._leituras += 1
+            descarregar = (
+                self._leituras >= self.lote_acessos
+                or time.monotonic() - self._ultima_descarga >= self.intervalo_acessos_s
+            )
+        if descarregar:
+            self.descarregar()
+
+    def _tomar_pendentes(self):
+        with self._trava_pendentes:
+            if self._pid != os.getpid():
+                self._zerar_pendentes()
+            acessos, contadores = self._acessos, self._contadores
+            self._zerar_pendentes()
+        return acessos, contadores
+
+    def _gravar_pendentes(self, conexao: sqlite3.Connection, acessos, contadores):
+        conexao.executemany(
+            "UPDATE artefatos SET acessado = MAX(acessado, ?), acessos = acessos + ? WHERE chave = ?",
+            [(acessado, quantidade, chave) for chave, (acessado, quantidade) in acessos.items()],
+        )
+        conexao.executemany(_SQL_CONTAR, [(tipo, nome, valor) for (tipo, nome), valor in contadores.items() if valor])
+
+    def descarregar(self):
+        """Grava os acessos e contadores acumulados pelas leituras, numa transação"""
+        acessos, contadores = self._tomar_pendentes()
+        if not acessos and not contadores:
+            return
+        conexao = self._conexao()
+        conexao.execute('BEGIN IMMEDIATE')
+        try:
+            self._gravar_pendentes(conexao, acessos, contadores)
+            conexao.execute('COMMIT')
+        except BaseException:
+            conexao.execute('ROLLBACK')
+            raise
+
+    def obter(self, tipo: str, chave: str) -> Optional[bytes]:
+        """Bytes do artefato (o acesso para o LRU é gravado em lote), ou None"""
+        linha = self._conexao().execute(
+            "SELECT dados, compressao FROM artefatos WHERE chave = ?", (f'{tipo}:{chave}',)
+        ).fetchone()
+        if linha is None:
+            self._registrar_leitura(tipo, None, faltas=1)
+            return None
+        dados, compressao = linha
+        self._registrar_leitura(tipo, f'{tipo}:{chave}', acertos=1, bytes_lidos=len(dados))
+        if compressao:
+            from usuarios.conteudo import descomprimir
+            return descomprimir(dados, compressao).encode('utf-8')
+        return bytes(dados)
+
+    def obter_texto(self, tipo: str, chave: str) -> Optional[str]:
+        dados = self.obter(tipo, chave)
+        return None if dados is None else dados.decode('utf-8')
+
+    def salvar(self, tipo: str, chave: str, dados: Union[str, bytes]):
+        """
+        Grava o artefato (texto é comprimido) e despeja os menos usados
+        recentemente se o total passar do orçamento
+        """
+        compressao = ''
+        if isinstance(dados, str):
+            from usuarios.conteudo import comprimir
+            dados, compressao = comprimir(dados)
+        agora = time.time()
+        acessos, contadores = self._tomar_pendentes()
+        conexao = self._conexao()
+        conexao.execute('BEGIN IMMEDIATE')
+        try:
+            # Acessos antes do despejo, para o LRU ver as leituras recentes
+            self._gravar_pendentes(conexao, acessos, contadores)
+            anterior = conexao.execute(
+                "SELECT tamanho FROM artefatos WHERE chave = ?", (f'{tipo}:{chave}',)
+            ).fetchone()
+            conexao.execute(
+                "INSERT OR REPLACE INTO artefatos (chave, tipo, compressao, dados, tamanho, criado, acessado) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (f'{tipo}:{chave}', tipo, compressao, dados, len(dados), agora, agora),
+            )
+            self._contar(conexao, tipo, bytes_gravados=len(dados))
+            self._contar(conexao, '', total_bytes=len(dados) - (anterior[0] if anterior else 0))
+            self._despejar(conexao)
+            conexao.execute('COMMIT')
+        except BaseException:
+            conexao.execute('ROLLBACK')
+            raise
+
+    def _total_bytes(self, conexao: sqlite3.Connection) -> int:
+        linha = conexao.execute(
+            "SELECT valor FROM contadores WHERE tipo = '' AND nome = 'total_bytes'"
+        ).fetchone()
+        return linha[0] if linha else 0
+
+    def _despejar(self, conexao: sqlite3.Connection):
+        total = self._total_bytes(conexao)
+        if total <= self.orcamento_bytes:
+            return
+        alvo = int(self.orcamento_bytes * FRACAO_APOS_DESPEJO)
+        despejados: Dict[str, list] = {}
+        cursor = conexao.execute("SELECT chave, tipo, tamanho FROM artefatos ORDER BY acessado")
+        chaves = []
+        for chave, tipo, tamanho in cursor:
+            if total <= alvo:
+                break
+            chaves.append((chave,))
+            total -= tamanho
+            despejados.setdefault(tipo, [0, 0])
+            despejados[tipo][0] += 1
+            despejados[tipo][1] += tamanho
+        cursor.close()
+        conexao.executemany("DELETE FROM artefatos WHERE chave = ?", chaves)
+        for tipo, (quantidade, tamanho) in despejados.items():
+            self._contar(conexao, tipo, despejos=quantidade, bytes_despejados=tamanho)
+            self._contar(conexao, '', total_bytes=-tamanho)
+        logger.info(f"Armazém de OCR: {len(chaves)} artefato(s) despejado(s) (LRU), {total} bytes restantes")
+
+    def remover(self, tipo: str, chave: str):
+        conexao = self._conexao()
+        conexao.execute('BEGIN IMMEDIATE')
+        try:
+            linha = conexao.execute(
+                "DELETE FROM artefatos WHERE chave = ? RETURNING tamanho", (f'{tipo}:{chave}',)
+            ).fetchone()
+            if linha:
+                self._contar(conexao, '', total_bytes=-linha[0])
+            conexao.execute('COMMIT')
+        except BaseException:
+            conexao.execute('ROLLBACK')
+            raise
+
+    def limpar(self):
+        """Remove todos os artefatos e zera os contadores"""
+        self._tomar_pendentes()
+        conexao = self._conexao()
+        conexao.execute("DELETE FROM artefatos")
+        conexao.execute("DELETE FROM contadores")
+        conexao.execute("VACUUM")
+
+    def estatisticas(self) -> dict:
+        """Acertos, faltas e bytes por tipo, ocupação e orçamento"""
+        self.descarregar()
+        conexao = self._conexao()
+        por_tipo: Dict[str, Dict[str, Union[int, float]]] = {}
+        for tipo, nome, valor in conexao.execute("SELECT tipo, nome, valor FROM contadores WHERE tipo != ''"):
+            por_tipo.setdefault(tipo, {c: 0 for c in _CONTADORES})[nome] = valor
+        for tipo, itens, tamanho in conexao.execute(
+            "SELECT tipo, COUNT(*), COALESCE(SUM(tamanho), 0) FROM artefatos GROUP BY tipo"
+        ):
+            por_tipo.setdefault(tipo, {c: 0 for c in _CONTADORES}).update(itens=itens, bytes=tamanho)
+        for dados in por_tipo.values():
+            dados.setdefault('itens', 0)
+            dados.setdefault('bytes', 0)
+            consultas = dados['acertos'] + dados['faltas']
+            dados['taxa_acerto'] = round(dados['acertos'] / consultas, 4) if consultas else 0.0
+
+        total = self._total_bytes(conexao)
+        return {
+            'caminho': self.caminho,
+            'orcamento_bytes': self.orcamento_bytes,
+            'total_bytes': total,
+            'ocupacao': round(total / self.orcamento_bytes, 4) if self.orcamento_bytes else 0.0,
+            'tipos': por_tipo,
+        }
+
+
+_armazem: Optional[ArmazemOCR] = None
+_trava = threading.Lock()
+
+
+def obter_armazem() -> ArmazemOCR:
+    """Armazém configurado em settings.ARMAZEM_OCR (um por processo)"""
+    global _armazem
+    if _armazem is None:
+        with _trava:
+            if _armazem is None:
+                _armazem = ArmazemOCR.de_settings()
+                # Leituras pendentes ao fim do processo, também nos filhos do
+                # pool de OCR, onde o atexit não roda
+                Finalize(_armazem, _armazem.descarregar, exitpriority=10)
+    return _armazem
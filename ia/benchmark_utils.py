@@ -0,0 +1,242 @@
+"""
+Utilitários compartilhados pelos comandos de benchmark (management commands)
+"""
+import random
+import re
+import threading
+import time
+from typing import Callable, List, Tuple
+
+# Trechos típicos de peças processuais para compor páginas sintéticas
+FRASES_JURIDICAS = [
+    "EXCELENTISSIMO SENHOR DOUTOR JUIZ DE DIREITO DA VARA CIVEL",
+    "Processo n. 0008323-52.2018.4.01.3202",
+    "vem respeitosamente a presenca de Vossa Excelencia propor a presente",
+    "ACAO DE INDENIZACAO POR DANOS MORAIS E MATERIAIS",
+    "em face de EMPRESA EXEMPLO LTDA, pessoa juridica de direito privado",
+    "nos termos do art. 300 do Codigo de Processo Civil",
+    "DOS FATOS",
+    "O autor celebrou contrato de prestacao de servicos em 10/03/2022",
+    "no valor de R$ 15.000,00 (quinze mil reais), conforme documento anexo",
+    "DO DIREITO",
+    "A responsabilidade civil do fornecedor e objetiva, art. 14 do CDC",
+    "DOS PEDIDOS",
+    "a) a concessao da tutela de urgencia",
+    "b) a citacao da re para, querendo, apresentar contestacao",
+    "c) a condenacao da re ao pagamento de indenizacao",
+    "Da-se a causa o valor de R$ 30.000,00",
+    "Nestes termos, pede deferimento.",
+]
+
+
+def gerar_texto_pagina(num_linhas: int = 30, semente: int = 0) -> str:
+    """Gera o texto (ground truth) de uma página sintética"""
+    rng = random.Random(semente)
+    return "\n".join(rng.choice(FRASES_JURIDICAS) for _ in range(num_linhas))
+
+
+def _fonte(tamanho: int):
+    from PIL import ImageFont
+
+    try:
+        return ImageFont.load_default(size=tamanho)
+    except TypeError:
+        # Pillow < 10.1 não aceita tamanho na fonte padrão
+        return ImageFont.load_default()
+
+
+def gerar_pagina_sintetica(
+    texto: str,
+    largura: int = 1240,
+    altura: int = 1754,
+    tamanho_fonte: int = 26,
+):
+    """
+    Desenha o texto em uma página branca (A4 a 150 DPI por padrão)
+
+    Returns:
+        PIL.Image.Image: Página em RGB, como a entregue pelo pdf2image
+    """
+    from PIL import Image, ImageDraw
+
+    img = Image.new('RGB', (largura, altura), 'white')
+    draw = ImageDraw.Draw(img)
+    fonte = _fonte(tamanho_fonte)
+    y = 80
+    for linha in texto.split("\n"):
+        draw.text((80, y), linha, fill='black', font=fonte)
+        y += int(tamanho_fonte * 1.6)
+        if y > altura - 80:
+            break
+    return img
+
+
+def gerar_paginas_sinteticas(num_paginas: int, **kwargs) -> List[Tuple[str, object]]:
+    """Retorna [(texto, imagem PIL)] para as páginas sintéticas"""
+    paginas = []
+    for i in range(num_paginas):
+        texto = gerar_texto_pagina(semente=i)
+        paginas.append((texto, gerar_pagina_sintetica(texto, **kwargs)))
+    return paginas
+
+
+def cronometrar(fn: Callable, repeticoes: int = 1) -> float:
+    """Executa fn repetidas vezes e retorna o menor tempo (segundos)"""
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        fn()
+        tempos.append(time.perf_counter() - inicio)
+    return min(tempos)
+
+
+
+def _escapar_pdf(texto: str) -> str:
+    return texto.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def gerar_pdf_nativo(textos: List[str], caminho: str, tamanho_fonte: int = 11):
+    """
+    Grava um PDF "born-digital" (camada de texto em Helvetica, A4), uma
+    página por texto, sem depender de bibliotecas de geração de PDF
+    """
+    objetos = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # Pages, preenchido depois de conhecer os filhos
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    paginas = []
+    entrelinha = tamanho_fonte * 1.5
+    for texto in textos:
+        comandos = [f"BT /F1 {tamanho_fonte} Tf {entrelinha:.1f} TL 50 800 Td"]
+        for linha in texto.split("\n"):
+            comandos.append(f"({_escapar_pdf(linha)}) Tj T*")
+        comandos.append("ET")
+        conteudo = "\n".join(comandos).encode('latin-1')
+
+        objetos.append(b"<< /Length %d >>\nstream\n" % len(conteudo) + conteudo + b"\nendstream")
+        num_conteudo = len(objetos)
+        objetos.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % num_conteudo
+        )
+        paginas.append(len(objetos))
+
+    filhos = b" ".join(b"%d 0 R" % n for n in paginas)
+    objetos[1] = b"<< /Type /Pages /Kids [" + filhos + b"] /Count %d >>" % len(paginas)
+
+    saida = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for num, corpo in enumerate(objetos, start=1):
+        offsets.append(len(saida))
+        saida += b"%d 0 obj\n" % num + corpo + b"\nendobj\n"
+    inicio_xref = len(saida)
+    saida += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objetos) + 1)
+    for offset in offsets:
+        saida += b"%010d 00000 n \n" % offset
+    saida += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objetos) + 1, inicio_xref)
+
+    with open(caminho, 'wb') as f:
+        f.write(saida)
+
+
+def digitalizar(img, ruido: float = 12.0, inclinacao: float = 1.5, semente: int = 0):
+    """
+    Simula uma digitalização: inclinação, desfoque leve e ruído gaussiano
+
+    Args:
+        img: Página PIL
+        ruido: Desvio padrão do ruído (níveis de cinza)
+        inclinacao: Inclinação máxima em graus (sorteada em ±inclinacao)
+        semente: Semente do sorteio
+
+    Returns:
+        PIL.Image.Image: Página em escala de cinza
+    """
+    import numpy as np
+    from PIL import Image, ImageFilter
+
+    rng = np.random.default_rng(semente)
+    angulo = float(rng.uniform(-inclinacao, inclinacao))
+    cinza = img.convert('L').rotate(angulo, resample=Image.BICUBIC, fillcolor=255)
+    cinza = cinza.filter(ImageFilter.GaussianBlur(0.8))
+
+    arr = np.asarray(cinza, dtype=np.float32)
+    arr = arr + rng.normal(0, ruido, arr.shape)
+    return Image.fromarray(np.clip(arr, 0, 255).astype(np.uint8))
+
+
+_SEPARADOR_PAGINA = re.compile(r'^--- Página \d+ ---$', re.MULTILINE)
+
+
+def normalizar_texto(texto: str) -> str:
+    """Remove separadores de página e marcação simples e colapsa espaços"""
+    texto = _SEPARADOR_PAGINA.sub(' ', texto)
+    texto = re.sub(r'[#*_|`]', ' ', texto)
+    return ' '.join(texto.split())
+
+
+def distancia_edicao(a: str, b: str) -> int:
+    """Distância de Levenshtein (programação dinâmica em duas linhas)"""
+    if len(a) < len(b):
+        a, b = b, a
+    anterior = list(range(len(b) + 1))
+    for i, ca in enumerate(a, start=1):
+        atual = [i]
+        for j, cb in enumerate(b, start=1):
+            atual.append(min(anterior[j] + 1, atual[j - 1] + 1, anterior[j - 1] + (ca != cb)))
+        anterior = atual
+    return anterior[-1]
+
+
+def acuracia_caracteres(obtido: str, esperado: str) -> float:
+    """1 - CER entre os textos normalizados (0 a 1)"""
+    obtido, esperado = normalizar_texto(obtido), normalizar_texto(esperado)
+    if not esperado:
+        return 1.0 if not obtido else 0.0
+    return max(0.0, 1 - distancia_edicao(obtido, esperado) / len(esperado))
+
+
+class MonitorMemoria:
+    """
+    Amostra o RSS do processo atual somado ao dos filhos (ex.: pool de OCR)
+    e guarda o pico, em MB
+
+    Uso:
+        with MonitorMemoria() as monitor:
+            ...
+        monitor.pico_mb
+    """
+
+    def __init__(self, intervalo: float = 0.02):
+        self.intervalo = intervalo
+        self.pico_mb = 0.0
+        self._parar = threading.Event()
+        self._thread = None
+
+    def _medir(self) -> float:
+        import psutil
+
+        processo = psutil.Process()
+        total = processo.memory_info().rss
+        for filho in processo.children(recursive=True):
+            try:
+                total += filho.memory_info().rss
+            except psutil.Error:
+                pass
+        return total / (1024 * 1024)
+
+    def _amostrar(self):
+        while not self._parar.is_set():
+            self.pico_mb = max(self.pico_mb, self._medir())
+            self._parar.wait(self.intervalo)
+
+    def __enter__(self) -> "MonitorMemoria":
+        self._thread = threading.Thread(target=self._amostrar, name="monitor-memoria", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._parar.set()
+        self._thread.join()
+        self.pico_mb = max(self.pico_mb, self._medir())
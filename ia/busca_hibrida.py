@@ -0,0 +1,411 @@
+"""
+Busca híbrida do RAG: BM25 (SQLite FTS5) + vetores (LanceDB) com reciprocal
+rank fusion
+
+Números CNJ, "art. 300 do CPC", nomes de partes e valores quase não mudam o
+embedding de um chunk; a busca léxica os encontra pelo token. O índice léxico
+fica em um SQLite próprio (settings.BUSCA_HIBRIDA), espelhando os chunks
+indexados de cada documento, e toda consulta nele exige o token do cliente,
+então o filtro por cliente_id é aplicado nas listas de postings, antes do
+ranking. A busca vetorial também filtra antes de ordenar (prefilter), pela
+coluna escalar cliente_id da tabela do LanceDB com índice BITMAP: o custo de
+uma consulta acompanha o corpus do cliente, não o da tabela inteira.
+
+Modos (settings.BUSCA_HIBRIDA['modo']):
+    vetorial  só LanceDB
+    lexical   só FTS5
+    hibrida   as duas listas fundidas por RRF: soma de 1 / (k + posição)
+"""
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+from hashlib import md5
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import pyarrow as pa
+from agno.filters import AND, EQ, FilterExpr
+from agno.knowledge.document.base import Document
+from agno.vectordb.lancedb import LanceDb
+from django.conf import settings
+
+from . import lancedb_agno
+from .lancedb_agno import COLUNA_CLIENTE
+
+logger = logging.getLogger(__name__)
+
+MODO_VETORIAL = 'vetorial'
+MODO_LEXICAL = 'lexical'
+MODO_HIBRIDA = 'hibrida'
+MODOS = (MODO_VETORIAL, MODO_LEXICAL, MODO_HIBRIDA)
+
+CANDIDATOS_PADRAO = 20
+K_RRF_PADRAO = 60
+# Linhas gravadas depois do índice BITMAP de cliente_id antes de retreiná-lo
+MAX_FORA_INDICE_PADRAO = 10000
+# Termos da consulta usados na expressão do FTS5
+_MAX_TERMOS = 32
+
+# Número CNJ (NNNNNNN-DD.AAAA.J.TR.OOOO), com ou sem pontuação; indexado
+# também só com dígitos, como aparece na API do DataJud
+_REGEX_CNJ = re.compile(r'\b\d{7}-?\d{2}\.?\d{4}\.?\d\.?\d{2}\.?\d{4}\b')
+_REGEX_TERMO = re.compile(r'\w+')
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    id INTEGER PRIMARY KEY,
+    chave TEXT NOT NULL UNIQUE,
+    documento_id INTEGER NOT NULL,
+    cliente TEXT NOT NULL,
+    nome TEXT NOT NULL,
+    meta_data TEXT NOT NULL,
+    texto TEXT NOT NULL,
+    extras TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS chunks_documento ON chunks (documento_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+    cliente, texto, extras,
+    content='chunks', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+);
+"""
+
+
+def _token_cliente(cliente_id) -> str:
+    return f'c{int(cliente_id)}'
+
+
+def _extras(texto: str) -> str:
+    return ' '.join(re.sub(r'\D', '', numero) for numero in _REGEX_CNJ.findall(texto))
+
+
+def expressao_fts(consulta: str) -> str:
+    """
+    Termos da consulta em OR (o BM25 pondera pela raridade) mais a frase
+    inteira, que pontua a sequência exata ('art 300 do cpc')
+    """
+    termos = list(dict.fromkeys(t.lower() for t in _REGEX_TERMO.findall(consulta)))[:_MAX_TERMOS]
+    termos += [re.sub(r'\D', '', numero) for numero in _REGEX_CNJ.findall(consulta)]
+    termos = list(dict.fromkeys(termos))
+    if not termos:
+        return ''
+    partes = [f'"{termo}"' for termo in termos]
+    if len(termos) > 1:
+        partes.append('"' + ' '.join(_REGEX_TERMO.findall(consulta.lower())[:_MAX_TERMOS]) + '"')
+    return ' OR '.join(partes)
+
+
+class IndiceLexico:
+    """
+    Args:
+        caminho: Arquivo SQLite com a tabela FTS5
+    """
+
+    def __init__(self, caminho: str):
+        self.caminho = str(caminho)
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(self.caminho) or '.', exist_ok=True)
+        self._conexao().executescript(_ESQUEMA)
+
+    @classmethod
+    def de_settings(cls) -> "IndiceLexico":
+        config = getattr(settings, 'BUSCA_HIBRIDA', {})
+        return cls(caminho=config.get('caminho', os.path.join(settings.BASE_DIR, 'busca_lexica.sqlite3')))
+
+    def _conexao(self) -> sqlite3.Connection:
+        conexao = getattr(self._local, 'conexao', None)
+        if conexao is None or self._local.pid != os.getpid():
+            conexao = sqlite3.connect(self.caminho, timeout=30, isolation_level=None)
+            conexao.execute('PRAGMA journal_mode=WAL')
+            conexao.execute('PRAGMA synchronous=NORMAL')
+            self._local.conexao = conexao
+            self._local.pid = os.getpid()
+        return conexao
+
+    def _remover(self, conexao: sqlite3.Connection, documento_id: int):
+        linhas = conexao.execute(
+            "SELECT id, cliente, texto, extras FROM chunks WHERE documento_id = ?", (documento_id,)
+        ).fetchall()
+        # Tabela de conteúdo externo: o FTS5 precisa dos valores antigos para apagar
+        conexao.executemany(
+            "INSERT INTO chunks_fts (chunks_fts, rowid, cliente, texto, extras) VALUES ('delete', ?, ?, ?, ?)",
+            linhas,
+        )
+        conexao.execute("DELETE FROM chunks WHERE documento_id = ?", (documento_id,))
+
+    def sincronizar(self, documento_id: int, cliente_id: int, nome: str,
+                    itens: Sequence[Tuple[str, str, dict]]) -> bool:
+        """
+        Substitui os chunks do documento se as chaves ou o meta_data mudaram
+
+        Args:
+            itens: (chave do chunk, texto, meta_data)
+
+        Returns:
+            True se o índice foi regravado
+        """
+        conexao = self._conexao()
+        atuais = dict(conexao.execute("SELECT chave, meta_data FROM chunks WHERE documento_id = ?", (documento_id,)))
+        if atuais == {chave: json.dumps(meta_data) for chave, _, meta_data in itens}:
+            return False
+        cliente = _token_cliente(cliente_id)
+        conexao.execute('BEGIN IMMEDIATE')
+        try:
+            self._remover(conexao, documento_id)
+            for chave, texto, meta_data in itens:
+                extras = _extras(texto)
+                cursor = conexao.execute(
+                    "INSERT INTO chunks (chave, documento_id, cliente, nome, meta_data, texto, extras) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (chave, documento_id, cliente, nome, json.dumps(meta_data), texto, extras),
+                )
+                conexao.execute(
+                    "INSERT INTO chunks_fts (rowid, cliente, texto, extras) VALUES (?, ?, ?, ?)",
+                    (cursor.lastrowid, cliente, texto, extras),
+                )
+            conexao.execute('COMMIT')
+        except BaseException:
+            conexao.execute('ROLLBACK')
+            raise
+        return True
+
+    def remover(self, documento_id: int):
+        conexao = self._conexao()
+        conexao.execute('BEGIN IMMEDIATE')
+        try:
+            self._remover(conexao, documento_id)
+            conexao.execute('COMMIT')
+        except BaseException:
+            conexao.execute('ROLLBACK')
+            raise
+
+    def buscar(self, consulta: str, limite: int, cliente_id=None) -> List[Document]:
+        """Chunks por BM25 (melhor primeiro), só do cliente quando informado"""
+        expressao = expressao_fts(consulta)
+        if not expressao:
+            return []
+        expressao = f'{{texto extras}}: ({expressao})'
+        if cliente_id is not None:
+            expressao = f'cliente:"{_token_cliente(cliente_id)}" AND {expressao}'
+        linhas = self._conexao().execute(
+            "SELECT c.documento_id, c.nome, c.meta_data, c.texto FROM chunks_fts "
+            "JOIN chunks c ON c.id = chunks_fts.rowid "
+            "WHERE chunks_fts MATCH ? ORDER BY bm25(chunks_fts, 0.0, 1.0, 2.0) LIMIT ?",
+            (expressao, limite),
+        )
+        return [
+            Document(name=nome, meta_data=json.loads(meta_data), content=texto, content_id=str(documento_id))
+            for documento_id, nome, meta_data, texto in linhas
+        ]
+
+    def estatisticas(self) -> dict:
+        chunks, documentos, clientes = self._conexao().execute(
+            "SELECT COUNT(*), COUNT(DISTINCT documento_id), COUNT(DISTINCT cliente) FROM chunks"
+        ).fetchone()
+        return {'caminho': self.caminho, 'chunks': chunks, 'documentos': documentos, 'clientes': clientes}
+
+
+_indice: Optional[IndiceLexico] = None
+_trava = threading.Lock()
+
+
+def obter_indice_lexico() -> IndiceLexico:
+    """Índice configurado em settings.BUSCA_HIBRIDA (um por processo)"""
+    global _indice
+    if _indice is None:
+        with _trava:
+            if _indice is None:
+                _indice = IndiceLexico.de_settings()
+    return _indice
+
+
+def _chave_documento(documento: Document) -> str:
+    meta_data = documento.meta_data or {}
+    return meta_data.get('chunk_id') or md5(documento.content.encode()).hexdigest()
+
+
+def filtros_de_expressoes(expressoes: Sequence[FilterExpr]) -> Dict[str, Any]:
+    """
+    Expressões de filtro do agno (lista = AND) como filtros de igualdade
+
+    Só EQ e AND de EQ têm equivalente na busca híbrida. Qualquer outra
+    expressão levanta erro em vez de ser ignorada: sem ela a busca voltaria
+    chunks de todos os clientes.
+
+    Raises:
+        ValueError: Expressão não suportada ou a mesma chave com valores diferentes
+    """
+    filtros: Dict[str, Any] = {}
+    pendentes = list(expressoes)
+    while pendentes:
+        expressao = pendentes.pop(0)
+        if isinstance(expressao, AND):
+            pendentes.extend(expressao.expressions)
+        elif isinstance(expressao, EQ):
+            if filtros.get(expressao.key, expressao.value) != expressao.value:
+                raise ValueError(f"Filtros conflitantes para {expressao.key}: {filtros[expressao.key]!r} e {expressao.value!r}")
+            filtros[expressao.key] = expressao.value
+        else:
+            raise ValueError(f"Expressão de filtro não suportada na busca híbrida: {expressao!r}")
+    return filtros
+
+
+def fundir_rrf(listas: Iterable[Sequence[Document]], k: int = K_RRF_PADRAO) -> List[Document]:
+    """Reciprocal rank fusion: cada lista soma 1 / (k + posição) ao chunk"""
+    pontuacoes: Dict[str, float] = {}
+    documentos: Dict[str, Document] = {}
+    for lista in listas:
+        for posicao, documento in enumerate(lista, start=1):
+            chave = _chave_documento(documento)
+            pontuacoes[chave] = pontuacoes.get(chave, 0.0) + 1.0 / (k + posicao)
+            documentos.setdefault(chave, documento)
+    return [documentos[chave] for chave in sorted(pontuacoes, key=pontuacoes.get, reverse=True)]
+
+
+class LanceDbHibrido(LanceDb):
+    """
+    LanceDb do Knowledge com busca léxica e fusão RRF no `search`, o método
+    que a ferramenta de busca do agente chama com os knowledge_filters
+
+    A tabela tem, além de vetor, id e payload do agno, a coluna cliente_id
+    (do meta_data de cada linha) com índice escalar BITMAP, usada no
+    prefilter da busca vetorial. Tabelas gravadas antes da coluna ganham a
+    coluna no `create`; enquanto não a têm, o filtro lê o payload.
+
+    Args:
+        indice_lexico: Padrão: obter_indice_lexico() no primeiro uso
+        modo: 'vetorial', 'lexical' ou 'hibrida' (padrão: settings.BUSCA_HIBRIDA)
+    """
+
+    def __init__(self, *args, indice_lexico: Optional[IndiceLexico] = None, modo: Optional[str] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._indice_lexico = indice_lexico
+        self.modo = modo
+        self._coluna_cliente_pronta = False
+
+    @property
+    def indice_lexico(self) -> IndiceLexico:
+        if self._indice_lexico is None:
+            self._indice_lexico = obter_indice_lexico()
+        return self._indice_lexico
+
+    def _base_schema(self) -> pa.Schema:
+        return super()._base_schema().append(pa.field(COLUNA_CLIENTE, pa.int64()))
+
+    @property
+    def tem_coluna_cliente(self) -> bool:
+        return self.table is not None and COLUNA_CLIENTE in self.table.schema.names
+
+    def create(self) -> None:
+        super().create()
+        self.preparar_coluna_cliente()
+
+    def indice_cliente(self):
+        return next((indice for indice in self.table.list_indices() if indice.columns == [COLUNA_CLIENTE]), None)
+
+    def preparar_coluna_cliente(self, retreinar: bool = False) -> None:
+        """
+        Cria a coluna cliente_id (preenchida a partir do payload) e o índice
+        BITMAP dela quando faltam; com `retreinar`, refaz o índice para
+        cobrir as linhas gravadas depois dele
+        """
+        if self.table is None or (self._coluna_cliente_pronta and not retreinar):
+            return
+        if not self.tem_coluna_cliente:
+            logger.info(f"Adicionando a coluna {COLUNA_CLIENTE} à tabela {self.table_name}")
+            self.table.add_columns({COLUNA_CLIENTE: lancedb_agno.EXTRAIR_CLIENTE})
+        if retreinar or self.indice_cliente() is None:
+            self.table.create_scalar_index(COLUNA_CLIENTE, index_type='BITMAP', replace=True)
+        self._coluna_cliente_pronta = True
+
+    def linhas_fora_do_indice(self) -> int:
+        indice = self.indice_cliente()
+        if indice is None:
+            return 0
+        estatisticas = self.table.index_stats(indice.name)
+        return estatisticas.num_unindexed_rows if estatisticas else 0
+
+    def insert(self, content_hash: str, documents: List[Document], filters: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Mesmas linhas que o LanceDb.insert do agno grava (ia/lancedb_agno.py),
+        mais a coluna cliente_id
+        """
+        if not self.tem_coluna_cliente:
+            super().insert(content_hash, documents, filters)
+            return
+        if not documents:
+            return
+
+        linhas = []
+        for documento in documents:
+            if filters:
+                documento.meta_data = {**(documento.meta_data or {}), **filters}
+            if documento.embedding is None or len(documento.embedding) == 0:
+                documento.embed(embedder=self.embedder)
+            cliente_id = (documento.meta_data or {}).get(COLUNA_CLIENTE)
+            linhas.append({
+                **lancedb_agno.linha(self, documento, content_hash),
+                COLUNA_CLIENTE: int(cliente_id) if cliente_id is not None else None,
+            })
+
+        if self.on_bad_vectors is not None:
+            self.table.add(linhas, on_bad_vectors=self.on_bad_vectors, fill_value=self.fill_value)
+        else:
+            self.table.add(linhas)
+
+        limite = getattr(settings, 'BUSCA_HIBRIDA', {}).get('max_fora_indice', MAX_FORA_INDICE_PADRAO)
+        if self.linhas_fora_do_indice() > limite:
+            self.preparar_coluna_cliente(retreinar=True)
+
+    def _filtro_cliente(self, cliente_id) -> str:
+        if self.tem_coluna_cliente:
+            return f"{COLUNA_CLIENTE} = {int(cliente_id)}"
+        # Tabela ainda sem a coluna: cliente_id é a primeira chave do
+        # meta_data gravado (ia/ingestao.py)
+        return lancedb_agno.filtro_cliente_payload(cliente_id)
+
+    def busca_vetorial(self, consulta: str, limite: int, cliente_id=None) -> List[Document]:
+        if self.table is None:
+            return []
+        vetor = self.embedder.get_embedding(consulta)
+        return self.busca_por_vetor(vetor, limite, cliente_id)
+
+    def busca_por_vetor(self, vetor: Sequence[float], limite: int, cliente_id=None) -> List[Document]:
+        busca = self.table.search(query=vetor, vector_column_name=lancedb_agno.coluna_vetor(self)).limit(limite)
+        if cliente_id is not None:
+            busca = busca.where(self._filtro_cliente(cliente_id), prefilter=True)
+        if self.nprobes:
+            busca.nprobes(self.nprobes)
+        return lancedb_agno.documentos(self, busca.to_list())
+
+    def search(self, query: str, limit: int = 5, filters: Optional[Any] = None) -> List[Document]:
+        config = getattr(settings, 'BUSCA_HIBRIDA', {})
+        modo = self.modo or config.get('modo', MODO_HIBRIDA)
+        if modo not in MODOS:
+            raise ValueError(f"Modo de busca desconhecido: {modo}")
+        if isinstance(filters, list):
+            filtros = filtros_de_expressoes(filters)
+        else:
+            filtros = dict(filters or {})
+        cliente_id = filtros.pop('cliente_id', None)
+        candidatos = max(limit, config.get('candidatos', CANDIDATOS_PADRAO))
+
+        listas = []
+        if modo in (MODO_VETORIAL, MODO_HIBRIDA):
+            listas.append(self.busca_vetorial(query, candidatos, cliente_id))
+        if modo in (MODO_LEXICAL, MODO_HIBRIDA):
+            listas.append(self.indice_lexico.buscar(query, candidatos, cliente_id))
+        resultados = fundir_rrf(listas, config.get('k_rrf', K_RRF_PADRAO)) if len(listas) > 1 else listas[0]
+
+        # Demais filtros (ex.: linked_to) sobre o meta_data, como o LanceDb faz
+        if filtros:
+            resultados = [
+                documento for documento in resultados
+                if all((documento.meta_data or {}).get(chave) == valor for chave, valor in filtros.items())
+            ]
+        return resultados[:limit]
+
+    async def async_search(self, query: str, limit: int = 5, filters: Optional[Any] = None) -> List[Document]:
+        return self.search(query=query, limit=limit, filters=filters)
@@ -0,0 +1,149 @@
+"""
+Cache persistente de embeddings por (hash do texto normalizado, modelo, dimensões)
+
+Petições repetem muito texto (qualificação das partes, procurações, pedidos
+padrão); o mesmo chunk não volta ao embedder. Os vetores ficam em um SQLite
+próprio (settings.CACHE_EMBEDDINGS) como bytes de um array float16 ou
+float32, sem JSON.
+"""
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+TIPOS_VETOR = {'float16': np.float16, 'float32': np.float32}
+TIPO_VETOR_PADRAO = 'float16'
+# Variáveis por consulta IN (...) abaixo do limite do SQLite
+_LOTE_CONSULTA = 500
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    hash TEXT NOT NULL,
+    modelo TEXT NOT NULL,
+    dimensoes INTEGER NOT NULL,
+    tipo TEXT NOT NULL,
+    vetor BLOB NOT NULL,
+    criado REAL NOT NULL,
+    PRIMARY KEY (hash, modelo, dimensoes)
+) WITHOUT ROWID;
+"""
+
+_REGEX_ESPACOS = re.compile(r'\s+')
+
+
+def normalizar_texto(texto: str) -> str:
+    """NFC e espaços colapsados: quebras de linha do OCR não mudam a chave"""
+    return _REGEX_ESPACOS.sub(' ', unicodedata.normalize('NFC', texto)).strip()
+
+
+def hash_chunk(texto: str) -> str:
+    return hashlib.sha256(normalizar_texto(texto).encode('utf-8')).hexdigest()
+
+
+class CacheEmbeddings:
+    """
+    Args:
+        caminho: Arquivo SQLite
+        tipo_vetor: 'float16' (metade do espaço) ou 'float32'
+    """
+
+    def __init__(self, caminho: str, tipo_vetor: str = TIPO_VETOR_PADRAO):
+        if tipo_vetor not in TIPOS_VETOR:
+            raise ValueError(f"Tipo de vetor não suportado: {tipo_vetor}")
+        self.caminho = str(caminho)
+        self.tipo_vetor = tipo_vetor
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(self.caminho) or '.', exist_ok=True)
+        self._conexao().executescript(_ESQUEMA)
+
+    @classmethod
+    def de_settings(cls) -> "CacheEmbeddings":
+        config = getattr(settings, 'CACHE_EMBEDDINGS', {})
+        return cls(
+            caminho=config.get('caminho', os.path.join(settings.BASE_DIR, 'cache_embeddings.sqlite3')),
+            tipo_vetor=config.get('tipo_vetor', TIPO_VETOR_PADRAO),
+        )
+
+    def _conexao(self) -> sqlite3.Connection:
+        conexao = getattr(self._local, 'conexao', None)
+        if conexao is None or self._local.pid != os.getpid():
+            conexao = sqlite3.connect(self.caminho, timeout=30, isolation_level=None)
+            conexao.execute('PRAGMA journal_mode=WAL')
+            conexao.execute('PRAGMA synchronous=NORMAL')
+            self._local.conexao = conexao
+            self._local.pid = os.getpid()
+        return conexao
+
+    def obter(self, hashes: Iterable[str], modelo: str, dimensoes: int) -> Dict[str, np.ndarray]:
+        """Vetores (float32) dos hashes em cache; os ausentes não aparecem"""
+        hashes = list(dict.fromkeys(hashes))
+        encontrados: Dict[str, np.ndarray] = {}
+        conexao = self._conexao()
+        for i in range(0, len(hashes), _LOTE_CONSULTA):
+            lote = hashes[i:i + _LOTE_CONSULTA]
+            linhas = conexao.execute(
+                f"SELECT hash, tipo, vetor FROM embeddings WHERE modelo = ? AND dimensoes = ? "
+                f"AND hash IN ({','.join('?' * len(lote))})",
+                (modelo, dimensoes, *lote),
+            )
+            for hash_, tipo, vetor in linhas:
+                encontrados[hash_] = np.frombuffer(vetor, dtype=TIPOS_VETOR[tipo]).astype(np.float32)
+        return encontrados
+
+    def salvar(self, itens: Sequence[Tuple[str, Sequence[float]]], modelo: str, dimensoes: int):
+        """itens: (hash, vetor)"""
+        tipo = TIPOS_VETOR[self.tipo_vetor]
+        agora = time.time()
+        conexao = self._conexao()
+        conexao.execute('BEGIN')
+        try:
+            conexao.executemany(
+                "INSERT OR REPLACE INTO embeddings (hash, modelo, dimensoes, tipo, vetor, criado) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (hash_, modelo, dimensoes, self.tipo_vetor, np.asarray(vetor, dtype=tipo).tobytes(), agora)
+                    for hash_, vetor in itens
+                ],
+            )
+            conexao.execute('COMMIT')
+        except BaseException:
+            conexao.execute('ROLLBACK')
+            raise
+
+    def estatisticas(self) -> dict:
+        """Vetores e bytes por (modelo, dimensões)"""
+        linhas = self._conexao().execute(
+            "SELECT modelo, dimensoes, COUNT(*), SUM(LENGTH(vetor)) FROM embeddings GROUP BY modelo, dimensoes"
+        ).fetchall()
+        return {
+            'caminho': self.caminho,
+            'tipo_vetor': self.tipo_vetor,
+            'modelos': [
+                {'modelo': modelo, 'dimensoes': dimensoes, 'vetores': vetores, 'bytes': tamanho}
+                for modelo, dimensoes, vetores, tamanho in linhas
+            ],
+        }
+
+
+_cache: Optional[CacheEmbeddings] = None
+_trava = threading.Lock()
+
+
+def obter_cache_embeddings() -> CacheEmbeddings:
+    """Cache configurado em settings.CACHE_EMBEDDINGS (um por processo)"""
+    global _cache
+    if _cache is None:
+        with _trava:
+            if _cache is None:
+                _cache = CacheEmbeddings.de_settings()
+    return _cache
@@ -0,0 +1,69 @@
+"""
+Cache de OCR por página, endereçado pelo conteúdo da página renderizada
+
+Quando um documento é reenviado com poucas páginas alteradas, só as páginas
+novas ou modificadas passam pelo OCR; as demais vêm do cache. Os textos ficam
+no armazém de artefatos de OCR (ia/armazem_ocr.py).
+"""
+import hashlib
+import logging
+from typing import Optional, Tuple
+
+import numpy as np
+
+from .armazem_ocr import TIPO_PAGINA, obter_armazem
+
+logger = logging.getLogger(__name__)
+
+
+def hash_pagina(img: np.ndarray) -> str:
+    """Hash do bitmap renderizado (pixels + dimensões)"""
+    h = hashlib.blake2b(digest_size=20)
+    h.update(repr(img.shape).encode())
+    h.update(np.ascontiguousarray(img).data)
+    return h.hexdigest()
+
+
+class CachePaginas:
+    """
+    Cache de texto por página para um motor de OCR
+
+    Args:
+        motor: Identifica o motor/configuração (ex.: 'rapidocr_150'), pois o
+            mesmo bitmap gera textos diferentes em motores diferentes
+    """
+
+    def __init__(self, motor: str):
+        self.motor = motor
+        self.acertos = 0
+        self.faltas = 0
+
+    def _chave(self, hash_img: str) -> str:
+        return f'{self.motor}_{hash_img}'
+
+    def obter(self, img: np.ndarray) -> Tuple[str, Optional[str]]:
+        """
+        Returns:
+            (hash da página, texto em cache ou None)
+        """
+        hash_img = hash_pagina(img)
+        texto = obter_armazem().obter_texto(TIPO_PAGINA, self._chave(hash_img))
+        if texto is None:
+            self.faltas += 1
+        else:
+            self.acertos += 1
+        return hash_img, texto
+
+    def salvar(self, hash_img: str, texto: str):
+        obter_armazem().salvar(TIPO_PAGINA, self._chave(hash_img), texto)
+
+    @property
+    def taxa_acerto(self) -> float:
+        total = self.acertos + self.faltas
+        return self.acertos / total if total else 0.0
+
+    def resumo(self) -> str:
+        return (
+            f"{self.acertos}/{self.acertos + self.faltas} páginas do cache "
+            f"({self.taxa_acerto:.0%} de acerto, motor {self.motor})"
+        )
@@ -0,0 +1,123 @@
+"""
+Extração da camada de texto de PDFs nativos (born-digital) com pypdfium2
+
+Páginas cuja camada de texto passa na heurística de densidade e de
+caracteres inválidos são usadas diretamente; as demais (digitalizadas ou só
+imagem) seguem para o OCR.
+"""
+import logging
+import unicodedata
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ORIGEM_CAMADA_TEXTO = 'text-layer'
+ORIGEM_OCR = 'ocr'
+
+# Caracteres visíveis por polegada quadrada de página (A4 ≈ 93 pol²)
+DENSIDADE_MINIMA = 3.0
+# Fração máxima de caracteres inválidos (U+FFFD, controle, uso privado)
+PROPORCAO_LIXO_MAXIMA = 0.05
+# Fração mínima de letras/dígitos entre os caracteres visíveis
+PROPORCAO_ALFANUMERICA_MINIMA = 0.6
+
+_CATEGORIAS_LIXO = {'Cc', 'Cf', 'Co', 'Cs', 'Cn'}
+
+
+def texto_utilizavel(texto: str, largura_pt: float, altura_pt: float) -> bool:
+    """
+    Decide se a camada de texto de uma página substitui o OCR
+
+    Args:
+        texto: Texto extraído da página
+        largura_pt: Largura da página em pontos (1/72 pol)
+        altura_pt: Altura da página em pontos
+
+    Returns:
+        bool: True se o texto é denso e limpo o bastante
+    """
+    visiveis = [c for c in texto if not c.isspace()]
+    if not visiveis:
+        return False
+
+    area_pol2 = max((largura_pt / 72) * (altura_pt / 72), 1.0)
+    if len(visiveis) / area_pol2 < DENSIDADE_MINIMA:
+        return False
+
+    lixo = sum(1 for c in visiveis if c == '\ufffd' or unicodedata.category(c) in _CATEGORIAS_LIXO)
+    # Fontes sem ToUnicode costumam sair como "(cid:123)"
+    lixo += texto.count('(cid:') * 6
+    if lixo / len(visiveis) > PROPORCAO_LIXO_MAXIMA:
+        return False
+
+    alfanumericos = sum(1 for c in visiveis if c.isalnum())
+    return alfanumericos / len(visiveis) >= PROPORCAO_ALFANUMERICA_MINIMA
+
+
+def _texto_pagina(pdf, idx: int) -> Optional[str]:
+    """Texto da página idx se a camada de texto for utilizável, senão None"""
+    page = pdf[idx]
+    try:
+        textpage = page.get_textpage()
+        try:
+            texto = textpage.get_text_range()
+        finally:
+            textpage.close()
+        largura, altura = page.get_size()
+    finally:
+        page.close()
+
+    # pdfium usa \r\n entre linhas
+    texto = texto.replace('\r\n', '\n').replace('\r', '\n').strip()
+    return texto if texto_utilizavel(texto, largura, altura) else None
+
+
+def extrair_camada_texto(pdf_path: str) -> List[Optional[str]]:
+    """
+    Lê a camada de texto de todas as páginas do PDF
+
+    Args:
+        pdf_path: Caminho para o PDF
+
+    Returns:
+        List[Optional[str]]: Texto por página (índice base 0), ou None quando a
+        página precisa de OCR
+    """
+    import pypdfium2 as pdfium
+
+    pdf = pdfium.PdfDocument(pdf_path)
+    try:
+        paginas = [_texto_pagina(pdf, idx) for idx in range(len(pdf))]
+    finally:
+        pdf.close()
+
+    com_texto = sum(1 for t in paginas if t is not None)
+    logger.info(f"Camada de texto utilizável em {com_texto}/{len(paginas)} páginas de {pdf_path}")
+    return paginas
+
+
+def amostrar_camada_texto(pdf_path: str, amostra: int = 20) -> Tuple[int, float]:
+    """
+    Estima a fração de páginas com camada de texto utilizável lendo no máximo
+    `amostra` páginas espaçadas uniformemente
+
+    Args:
+        pdf_path: Caminho para o PDF
+        amostra: Máximo de páginas lidas
+
+    Returns:
+        (número de páginas, fração estimada com camada de texto)
+    """
+    import pypdfium2 as pdfium
+
+    pdf = pdfium.PdfDocument(pdf_path)
+    try:
+        num_paginas = len(pdf)
+        if not num_paginas:
+            return 0, 0.0
+        passo = max(num_paginas / amostra, 1.0)
+        indices = sorted({int(i * passo) for i in range(min(amostra, num_paginas))})
+        com_texto = sum(1 for idx in indices if _texto_pagina(pdf, idx) is not None)
+    finally:
+        pdf.close()
+    return num_paginas, com_texto / len(indices)
@@ -0,0 +1,123 @@
+"""
+Progresso do OCR por página, persistido em PaginaOCR
+
+Cada página concluída é gravada assim que sai do OCR (ou da camada de texto).
+Se a task estoura o timeout do Q_CLUSTER e é reexecutada, só as páginas que
+faltam são processadas; o conteúdo do documento é montado apenas quando todas
+as páginas estão concluídas.
+"""
+import logging
+from typing import Dict, List, Optional
+
+from django.db.models import Count
+
+from .camada_texto import ORIGEM_CAMADA_TEXTO, ORIGEM_OCR
+from .models import PaginaOCR
+from .ocr_utils import montar_texto_paginas, ResultadoPagina
+from .sidecar_ocr import codificar_linhas
+
+logger = logging.getLogger(__name__)
+
+
+class DocumentoIncompleto(Exception):
+    """Há páginas sem texto; a task deve falhar para ser retomada no retry"""
+
+
+def contar_concluidas(documento_id: int, hash_documento: str) -> int:
+    """Páginas no checkpoint do documento para o hash, sem carregar os textos"""
+    return PaginaOCR.objects.filter(documento_id=documento_id, hash_documento=hash_documento).count()
+
+
+class CheckpointOCR:
+    """
+    Páginas concluídas de um documento, válidas para um hash de conteúdo
+
+    Args:
+        documento: Instância de Documentos
+        hash_documento: Hash do arquivo; páginas gravadas para outro hash
+            (arquivo substituído) são descartadas
+    """
+
+    def __init__(self, documento, hash_documento: str):
+        self.documento = documento
+        self.hash_documento = hash_documento
+
+        PaginaOCR.objects.filter(documento=documento).exclude(hash_documento=hash_documento).delete()
+        self.concluidas: Dict[int, str] = {
+            pagina - 1: texto
+            for pagina, texto in PaginaOCR.objects.filter(documento=documento).values_list('pagina', 'texto')
+        }
+        self.retomadas = len(self.concluidas)
+
+    def _linha(self, idx: int, texto: str, origem: str, resultado: Optional[ResultadoPagina] = None) -> PaginaOCR:
+        return PaginaOCR(
+            documento=self.documento,
+            pagina=idx + 1,
+            origem=origem,
+            texto=texto,
+            caracteres=len(texto),
+            hash_documento=self.hash_documento,
+            confianca=resultado.confianca_media if resultado is not None else None,
+            dpi=resultado.dpi if resultado is not None else None,
+            linhas=codificar_linhas(resultado) if resultado is not None and resultado.linhas else None,
+        )
+
+    def salvar(self, idx: int, texto: str, origem: str = ORIGEM_OCR, resultado: Optional[ResultadoPagina] = None):
+        """Grava uma página concluída (base 0)"""
+        self.salvar_varias({idx: texto}, origem, {idx: resultado} if resultado is not None else None)
+
+    def salvar_varias(
+        self,
+        textos: Dict[int, str],
+        origem: str,
+        resultados: Optional[Dict[int, ResultadoPagina]] = None
+    ):
+        """Grava várias páginas concluídas em uma única query"""
+        if not textos:
+            return
+        resultados = resultados or {}
+        PaginaOCR.objects.bulk_create(
+            [self._linha(idx, texto, origem, resultados.get(idx)) for idx, texto in textos.items()],
+            update_conflicts=True,
+            unique_fields=['documento', 'pagina'],
+            update_fields=[
+                'origem', 'texto', 'caracteres', 'hash_documento', 'confianca', 'dpi', 'linhas', 'data_processamento'
+            ],
+        )
+        self.concluidas.update(textos)
+
+    def salvar_camada_texto(self, textos: Dict[int, str]):
+        """Grava as páginas resolvidas pela camada de texto que ainda não estão no checkpoint"""
+        self.salvar_varias(
+            {idx: texto for idx, texto in textos.items() if idx not in self.concluidas},
+            ORIGEM_CAMADA_TEXTO
+        )
+
+    def faltantes(self, indices: List[int]) -> List[int]:
+        return [idx for idx in indices if idx not in self.concluidas]
+
+    def montar_texto(self, num_paginas: int) -> str:
+        """
+        Junta o texto de todas as páginas
+
+        Raises:
+            DocumentoIncompleto: Se alguma página ainda não foi concluída
+        """
+        faltando = self.faltantes(list(range(num_paginas)))
+        if faltando:
+            raise DocumentoIncompleto(
+                f"Documento {self.documento.id}: {len(faltando)} de {num_paginas} página(s) sem texto "
+                f"(primeira: {faltando[0] + 1})"
+            )
+        return montar_texto_paginas(self.concluidas)
+
+    def resumo(self) -> str:
+        origens = dict(
+            PaginaOCR.objects.filter(documento=self.documento)
+            .values_list('origem')
+            .annotate(total=Count('id'))
+        )
+        return (
+            f"{origens.get(ORIGEM_CAMADA_TEXTO, 0)} página(s) da camada de texto, "
+            f"{origens.get(ORIGEM_OCR, 0)} página(s) por OCR, {self.retomadas} retomada(s) do checkpoint"
+        )
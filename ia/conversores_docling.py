@@ -0,0 +1,224 @@
+"""
+Registro de DocumentConverters do Docling aquecidos por processo
+
+Criar um DocumentConverter a cada task recarrega os modelos de layout e de
+tabelas, o que em documentos curtos custa mais que a própria conversão. O
+registro mantém um conversor por conjunto de opções de pipeline e o reutiliza
+entre tasks do mesmo worker, reciclando-o após um número de conversões ou
+quando a memória do processo passa do limite.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+MAX_CONVERSORES_PADRAO = 2
+CONVERSOES_MAX_PADRAO = 200
+MEMORIA_MAX_MB_PADRAO = 4096
+
+
+@dataclass(frozen=True)
+class OpcoesDocling:
+    """Opções de pipeline do PDF; cada combinação tem seu próprio conversor"""
+    do_ocr: bool = True
+    do_table_structure: bool = True
+    images_scale: float = 1.5  # Reduzido para melhor performance
+
+
+def memoria_processo_mb() -> float:
+    """RSS do processo atual em MB"""
+    import psutil
+    return psutil.Process().memory_info().rss / (1024 * 1024)
+
+
+def _criar_conversor(opcoes: OpcoesDocling):
+    """Cria o DocumentConverter do Docling com as opções informadas"""
+    from docling.document_converter import DocumentConverter, PdfFormatOption
+    from docling.datamodel.base_models import InputFormat
+    from docling.datamodel.pipeline_options import PdfPipelineOptions
+    from docling.backend.pypdfium2_backend import PyPdfiumDocumentBackend
+
+    pipeline_options = PdfPipelineOptions(
+        do_ocr=opcoes.do_ocr,
+        do_table_structure=opcoes.do_table_structure,
+        images_scale=opcoes.images_scale,
+        generate_page_images=False,
+        generate_picture_images=False,
+    )
+    converter = DocumentConverter(
+        format_options={
+            InputFormat.PDF: PdfFormatOption(
+                pipeline_options=pipeline_options,
+                backend=PyPdfiumDocumentBackend,
+            ),
+        }
+    )
+    # Carrega os modelos agora, para que o tempo de carga não seja contado
+    # como tempo de conversão
+    converter.initialize_pipeline(InputFormat.PDF)
+    return converter
+
+
+class _Entrada:
+    def __init__(self, converter):
+        self.converter = converter
+        self.conversoes = 0
+
+
+class RegistroConversores:
+    """
+    Conversores do Docling do processo atual, indexados por OpcoesDocling
+
+    Args:
+        max_conversores: Conversores mantidos ao mesmo tempo (LRU)
+        conversoes_max: Conversões antes de reciclar um conversor
+        memoria_max_mb: RSS do processo acima do qual os conversores são descartados
+    """
+
+    def __init__(
+        self,
+        max_conversores: int = MAX_CONVERSORES_PADRAO,
+        conversoes_max: int = CONVERSOES_MAX_PADRAO,
+        memoria_max_mb: float = MEMORIA_MAX_MB_PADRAO
+    ):
+        self.max_conversores = max_conversores
+        self.conversoes_max = conversoes_max
+        self.memoria_max_mb = memoria_max_mb
+        self._conversores: "OrderedDict[OpcoesDocling, _Entrada]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.cargas = 0
+        self.tempo_carga = 0.0
+        self.conversoes = 0
+        self.tempo_conversao = 0.0
+        self.reciclagens = 0
+
+    def obter(self, opcoes: OpcoesDocling = OpcoesDocling()):
+        """Retorna o conversor das opções, carregando os modelos se necessário"""
+        with self._lock:
+            return self._entrada(opcoes).converter
+
+    def _entrada(self, opcoes: OpcoesDocling) -> _Entrada:
+        entrada = self._conversores.get(opcoes)
+        if entrada is not None:
+            self._conversores.move_to_end(opcoes)
+            return entrada
+
+        while len(self._conversores) >= self.max_conversores:
+            antigas, _ = self._conversores.popitem(last=False)
+            logger.info(f"Conversor Docling {antigas} descartado (limite de {self.max_conversores})")
+
+        inicio = time.perf_counter()
+        entrada = _Entrada(_criar_conversor(opcoes))
+        tempo = time.perf_counter() - inicio
+        self.cargas += 1
+        self.tempo_carga += tempo
+        self._conversores[opcoes] = entrada
+        logger.info(f"Conversor Docling {opcoes} carregado em {tempo:.2f}s")
+        return entrada
+
+    def converter(self, path: str, opcoes: OpcoesDocling = OpcoesDocling(), **kwargs):
+        """
+        Converte o documento com o conversor aquecido das opções
+
+        Args:
+            path: Caminho do arquivo
+            opcoes: Opções de pipeline
+            **kwargs: Repassados a DocumentConverter.convert (ex.: page_range)
+
+        Returns:
+            ConversionResult do Docling
+        """
+        with self._lock:
+            entrada = self._entrada(opcoes)
+
+            inicio = time.perf_counter()
+            result = entrada.converter.convert(path, **kwargs)
+            self.tempo_conversao += time.perf_counter() - inicio
+            self.conversoes += 1
+            entrada.conversoes += 1
+
+            self._aplicar_reciclagem(opcoes, entrada)
+        return result
+
+    def _aplicar_reciclagem(self, opcoes: OpcoesDocling, entrada: _Entrada):
+        if entrada.conversoes >= self.conversoes_max:
+            del self._conversores[opcoes]
+            self.reciclagens += 1
+            logger.info(f"Conversor Docling {opcoes} reciclado após {entrada.conversoes} conversões")
+            return
+
+        memoria = memoria_processo_mb()
+        if memoria > self.memoria_max_mb:
+            self.reciclagens += len(self._conversores)
+            self._conversores.clear()
+            logger.warning(
+                f"Memória do processo em {memoria:.0f} MB (limite {self.memoria_max_mb:.0f} MB): "
+                f"conversores Docling descartados"
+            )
+
+    def limpar(self):
+        with self._lock:
+            self._conversores.clear()
+
+    def estatisticas(self) -> Dict[str, float]:
+        """Tempo de carga dos modelos separado do tempo de conversão"""
+        return {
+            'conversores_ativos': len(self._conversores),
+            'cargas': self.cargas,
+            'tempo_carga_s': round(self.tempo_carga, 3),
+            'conversoes': self.conversoes,
+            'tempo_conversao_s': round(self.tempo_conversao, 3),
+            'tempo_medio_conversao_s': round(self.tempo_conversao / self.conversoes, 3) if self.conversoes else 0.0,
+            'reciclagens': self.reciclagens,
+        }
+
+    def resumo(self) -> str:
+        e = self.estatisticas()
+        return (
+            f"{e['cargas']} carga(s) de modelos em {e['tempo_carga_s']:.2f}s, "
+            f"{e['conversoes']} conversão(ões) em {e['tempo_conversao_s']:.2f}s, "
+            f"{e['reciclagens']} reciclagem(ns)"
+        )
+
+
+_registro: Optional[RegistroConversores] = None
+_registro_lock = threading.Lock()
+
+
+def obter_registro() -> RegistroConversores:
+    """
+    Retorna o registro do processo atual, criando-o na primeira chamada
+
+    A configuração vem de settings.DOCLING_CONVERSORES
+    ({'max_conversores', 'conversoes_max', 'memoria_max_mb'}).
+    """
+    global _registro
+    with _registro_lock:
+        if _registro is None:
+            from django.conf import settings
+
+            config = getattr(settings, 'DOCLING_CONVERSORES', {})
+            _registro = RegistroConversores(
+                max_conversores=config.get('max_conversores', MAX_CONVERSORES_PADRAO),
+                conversoes_max=config.get('conversoes_max', CONVERSOES_MAX_PADRAO),
+                memoria_max_mb=config.get('memoria_max_mb', MEMORIA_MAX_MB_PADRAO),
+            )
+        return _registro
+
+
+def pre_aquecer(**kwargs):
+    """
+    Carrega o conversor padrão no worker recém-criado (sinal post_spawn do
+    django-q), para que a primeira task não pague a carga dos modelos
+    """
+    try:
+        obter_registro().obter()
+    except ImportError:
+        logger.warning("Docling não disponível; pré-aquecimento ignorado")
+    except Exception as e:
+        logger.error(f"Erro ao pré-aquecer o Docling: {str(e)}", exc_info=True)
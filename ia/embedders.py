@@ -0,0 +1,183 @@
+"""
+Embedders do RAG selecionáveis em settings.EMBEDDER_RAG
+
+Backends registrados:
+    openai   OpenAIEmbedder do agno (API, uma requisição por lote)
+    hashing  local, em CPU: palavras e pares de palavras sem acento projetados
+             por hashing com sinal em `dimensions` posições, frequência
+             sublinear e norma L2; o lote inteiro vira uma matriz NumPy
+
+Cada embedder tem uma assinatura ('<backend>:<id>:<dimensões>') e uma tabela
+própria no LanceDB: vetores de modelos diferentes não se misturam e trocar
+de backend reindexa todos os documentos em uma tabela nova
+(ia.tasks_otimizado.reindexar_embedder).
+"""
+import hashlib
+import logging
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from agno.knowledge.embedder.base import Embedder
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+BACKEND_PADRAO = 'openai'
+# Embedder usado antes do registro; a tabela dele mantém o nome original
+ASSINATURA_LEGADA = 'openai:text-embedding-3-small:1536'
+
+_REGEX_PALAVRA = re.compile(r'\w+')
+# Tokens com hash calculado mantidos em memória antes de limpar o dicionário
+_MAX_TOKENS_MEMORIZADOS = 500_000
+
+
+def _normalizar(texto: str) -> str:
+    """Minúsculas sem acento: 'Petição' e 'peticao' caem na mesma posição"""
+    decomposto = unicodedata.normalize('NFKD', texto.lower())
+    return ''.join(c for c in decomposto if not unicodedata.combining(c))
+
+
+@dataclass
+class EmbedderHashing(Embedder):
+    """
+    Embedder local sem modelo nem rede (hashing trick)
+
+    Args:
+        dimensions: Tamanho dos vetores
+        ngramas: Tamanhos de n-gramas de palavras (1: palavras, 2: pares)
+    """
+
+    id: str = 'hashing-v1'
+    dimensions: Optional[int] = 1024
+    ngramas: Tuple[int, ...] = (1, 2)
+    _posicoes: Dict[str, int] = field(default_factory=dict, repr=False)
+
+    def _posicao(self, token: str) -> int:
+        """Posição com sinal (+/- (índice + 1)), estável entre processos"""
+        posicao = self._posicoes.get(token)
+        if posicao is None:
+            valor = int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest(), 'little')
+            posicao = (valor % self.dimensions) + 1
+            if valor >> 63:
+                posicao = -posicao
+            if len(self._posicoes) >= _MAX_TOKENS_MEMORIZADOS:
+                self._posicoes.clear()
+            self._posicoes[token] = posicao
+        return posicao
+
+    def embeddar_lote(self, textos: Sequence[str]) -> np.ndarray:
+        """Matriz (len(textos), dimensions) float32 com linhas de norma 1"""
+        linhas: List[int] = []
+        posicoes: List[int] = []
+        for linha, texto in enumerate(textos):
+            palavras = _REGEX_PALAVRA.findall(_normalizar(texto))
+            for n in self.ngramas:
+                for i in range(len(palavras) - n + 1):
+                    posicoes.append(self._posicao(' '.join(palavras[i:i + n])))
+                    linhas.append(linha)
+
+        matriz = np.zeros((len(textos), self.dimensions), dtype=np.float32)
+        if posicoes:
+            posicoes_np = np.asarray(posicoes, dtype=np.int64)
+            celulas = np.asarray(linhas, dtype=np.int64) * self.dimensions + np.abs(posicoes_np) - 1
+            somas = np.bincount(celulas, weights=np.sign(posicoes_np), minlength=matriz.size)
+            matriz = somas.reshape(matriz.shape).astype(np.float32)
+        # Frequência sublinear: um termo repetido não domina o vetor
+        matriz = np.sign(matriz) * np.log1p(np.abs(matriz))
+        normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+        return matriz / np.where(normas == 0, 1, normas)
+
+    def get_embedding(self, text: str) -> List[float]:
+        return self.embeddar_lote([text])[0].tolist()
+
+    def get_embedding_and_usage(self, text: str) -> Tuple[List[float], Optional[Dict]]:
+        return self.get_embedding(text), None
+
+    async def async_get_embedding(self, text: str) -> List[float]:
+        return self.get_embedding(text)
+
+    async def async_get_embedding_and_usage(self, text: str) -> Tuple[List[float], Optional[Dict]]:
+        return self.get_embedding(text), None
+
+
+@dataclass(frozen=True)
+class Backend:
+    criar: Callable[..., Embedder]
+    # Local: sem custo por chamada, o cache de embeddings não compensa
+    local: bool = False
+
+
+_BACKENDS: Dict[str, Backend] = {}
+
+
+def registrar_backend(nome: str, local: bool = False):
+    """Decorator para uma fábrica de embedders que recebe as opções de settings"""
+    def registrar(criar):
+        _BACKENDS[nome] = Backend(criar, local)
+        return criar
+    return registrar
+
+
+@registrar_backend('openai')
+def _criar_openai(**opcoes) -> Embedder:
+    from agno.knowledge.embedder.openai import OpenAIEmbedder
+    return OpenAIEmbedder(**opcoes)
+
+
+@registrar_backend('hashing', local=True)
+def _criar_hashing(**opcoes) -> Embedder:
+    if 'ngramas' in opcoes:
+        opcoes['ngramas'] = tuple(opcoes['ngramas'])
+    return EmbedderHashing(**opcoes)
+
+
+def backends() -> List[str]:
+    return sorted(_BACKENDS)
+
+
+def assinatura(backend: str, embedder: Embedder) -> str:
+    return f'{backend}:{getattr(embedder, "id", type(embedder).__name__)}:{embedder.dimensions}'
+
+
+def nome_tabela(assinatura_embedder: str, tabela_base: str) -> str:
+    """Tabela do LanceDB com os vetores de um embedder"""
+    if assinatura_embedder == ASSINATURA_LEGADA:
+        return tabela_base
+    return f"{tabela_base}_{re.sub(r'[^a-z0-9]+', '_', assinatura_embedder.lower()).strip('_')}"
+
+
+@dataclass(frozen=True)
+class EmbedderConfigurado:
+    backend: str
+    embedder: Embedder
+    assinatura: str
+    tabela: str
+    local: bool
+
+
+def embedder_configurado(tabela_base: str, config: Optional[dict] = None) -> EmbedderConfigurado:
+    """
+    Args:
+        tabela_base: Nome da tabela do LanceDB antes do sufixo do embedder
+        config: Padrão: settings.EMBEDDER_RAG
+
+    Returns:
+        Embedder instanciado com a assinatura e a tabela dele
+    """
+    config = config if config is not None else getattr(settings, 'EMBEDDER_RAG', {})
+    nome = config.get('backend', BACKEND_PADRAO)
+    if nome not in _BACKENDS:
+        raise ValueError(f"Backend de embeddings desconhecido: {nome} (disponíveis: {', '.join(backends())})")
+    backend = _BACKENDS[nome]
+    embedder = backend.criar(**dict(config.get('opcoes', {})))
+    assinatura_embedder = assinatura(nome, embedder)
+    return EmbedderConfigurado(
+        backend=nome,
+        embedder=embedder,
+        assinatura=assinatura_embedder,
+        tabela=nome_tabela(assinatura_embedder, tabela_base),
+        local=backend.local,
+    )
@@ -0,0 +1,283 @@
+"""
+Indexação incremental dos documentos no banco vetorial do Knowledge
+
+Cada chunk gravado fica registrado em ChunkIndexado (hash do texto
+normalizado, repetição dele no documento e id da linha). Ao reindexar, os
+chunks novos são comparados por hash com o manifesto:
+    mantidos   mesmo texto na mesma posição: nada a fazer
+    movidos    mesmo texto em outra posição (índice, página ou seção): o vetor
+               é relido do banco vetorial e a linha regravada
+    novos      textos que o documento não tinha, os únicos enviados ao embedder
+               (a menos que um documento de mesmo conteúdo já tenha o vetor)
+    removidos  linhas apagadas pelo id
+
+Gravações apagam antes as linhas com os mesmos ids, então repetir a
+indexação não duplica vetores.
+"""
+import logging
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from django.db import transaction
+
+from usuarios.models import Documentos
+
+from . import lancedb_agno
+from .ingestao import Chunk, ChunkerJuridico, IngestaoRAG, MetricasIngestao, documentos_vetoriais, meta_data_chunk
+from .models import ChunkIndexado
+
+logger = logging.getLogger(__name__)
+
+# Ids por DELETE/SELECT ... IN (...)
+_LOTE_IDS = 500
+_TAMANHO_SECAO = ChunkIndexado._meta.get_field('secao').max_length
+
+
+def id_documento_vetorial(documento_id: int, hash_chunk: str, ocorrencia: int) -> str:
+    return f'{documento_id}_{hash_chunk[:16]}_{ocorrencia}'
+
+
+def id_vetor(id_documento: str, content_hash: str) -> str:
+    """Id da linha que o LanceDb.insert do agno grava para o Document"""
+    return lancedb_agno.id_linha(id_documento, content_hash)
+
+
+def remover_vetores(vector_db, ids: Iterable[str]) -> int:
+    """Apaga as linhas pelos ids; devolve quantos ids foram pedidos"""
+    ids = list(dict.fromkeys(ids))
+    if not ids or vector_db.table is None:
+        return 0
+    for i in range(0, len(ids), _LOTE_IDS):
+        vector_db.table.delete(lancedb_agno.filtro_ids(vector_db, ids[i:i + _LOTE_IDS]))
+    return len(ids)
+
+
+def _ler_vetores(vector_db, ids: Sequence[str]) -> Dict[str, List[float]]:
+    coluna_id, coluna_vetor = lancedb_agno.coluna_id(vector_db), lancedb_agno.coluna_vetor(vector_db)
+    vetores = {}
+    for i in range(0, len(ids), _LOTE_IDS):
+        lote = ids[i:i + _LOTE_IDS]
+        linhas = (
+            vector_db.table.search()
+            .where(lancedb_agno.filtro_ids(vector_db, lote))
+            .select([coluna_id, coluna_vetor])
+            .limit(len(lote))
+            .to_list()
+        )
+        for linha in linhas:
+            vetores[linha[coluna_id]] = list(linha[coluna_vetor])
+    return vetores
+
+
+def _filtro_sem_manifesto(documento_id: int, cliente_id: Optional[int] = None, nome: Optional[str] = None) -> str:
+    # Linhas deste módulo cujo manifesto foi descartado após uma falha
+    filtros = [lancedb_agno.filtro_content_id(int(documento_id))]
+    if nome and cliente_id is not None:
+        # Linhas do Knowledge.insert anterior ao manifesto: o agno grava um
+        # content_id derivado do hash, então o documento é identificado pelo
+        # arquivo e pelo cliente do meta_data
+        filtros.append(lancedb_agno.filtro_arquivo_cliente(nome, cliente_id))
+    return ' OR '.join(filtros)
+
+
+def _remover_sem_manifesto(vector_db, documento_id: int, cliente_id: Optional[int] = None,
+                           nome: Optional[str] = None):
+    """
+    Linhas gravadas antes do manifesto (ou cujo manifesto foi descartado
+    após uma falha), localizadas no payload pelo content_id ou pelo arquivo
+    e cliente
+    """
+    vector_db.table.delete(_filtro_sem_manifesto(documento_id, cliente_id, nome))
+
+
+def _chaves(chunks: Sequence[Chunk]) -> List[Tuple[str, int]]:
+    """(hash, repetição do mesmo texto no documento) de cada chunk"""
+    ocorrencias = Counter()
+    chaves = []
+    for chunk in chunks:
+        chaves.append((chunk.hash, ocorrencias[chunk.hash]))
+        ocorrencias[chunk.hash] += 1
+    return chaves
+
+
+def _vetores_de_identicos(vector_db, documento: Documentos, assinatura: str,
+                          hashes: Dict[int, str]) -> Dict[int, List[float]]:
+    """
+    Vetores já gravados para outro documento com o mesmo conteúdo (upload
+    repetido), relidos do banco vetorial em vez de ir ao embedder
+
+    Args:
+        hashes: Hash do texto de cada posição sem vetor
+
+    Returns:
+        Vetores das posições encontradas
+    """
+    if not hashes or documento.conteudo_id is None:
+        return {}
+    linhas = dict(
+        ChunkIndexado.objects
+        .filter(embedder=assinatura, documento__conteudo_id=documento.conteudo_id, hash__in=set(hashes.values()))
+        .exclude(documento_id=documento.id)
+        .values_list('hash', 'id_vetor')
+    )
+    lidos = _ler_vetores(vector_db, list(dict.fromkeys(linhas.values())))
+    return {
+        posicao: lidos[linhas[hash_]]
+        for posicao, hash_ in hashes.items()
+        if hash_ in linhas and linhas[hash_] in lidos
+    }
+
+
+def _metadata(documento: Documentos) -> dict:
+    return {"cliente_id": documento.cliente_id, "name": documento.arquivo.name}
+
+
+def _itens_lexicos(chunks: Sequence[Chunk], ids_documento: Sequence[str], metadata: dict, knowledge_nome: str):
+    return [
+        (id_chunk, chunk.texto, meta_data_chunk(chunk, metadata, id_chunk, knowledge_nome))
+        for chunk, id_chunk in zip(chunks, ids_documento)
+    ]
+
+
+def sincronizar_lexico(documento: Documentos, chunker: ChunkerJuridico, indice_lexico,
+                       knowledge_nome: str = '') -> bool:
+    """
+    Grava no índice léxico os chunks atuais do documento sem passar pelo
+    embedder (documentos indexados antes da busca híbrida)
+    """
+    chunks = chunker.dividir(documento.content)
+    ids_documento = [id_documento_vetorial(documento.id, hash_, ocorrencia) for hash_, ocorrencia in _chaves(chunks)]
+    return indice_lexico.sincronizar(
+        documento.id, documento.cliente_id, documento.arquivo.name,
+        _itens_lexicos(chunks, ids_documento, _metadata(documento), knowledge_nome),
+    )
+
+
+def indexar_documento(documento: Documentos, vector_db, ingestao: IngestaoRAG,
+                      content_hash: str, assinatura: str, knowledge_nome: str = '',
+                      indice_lexico=None) -> dict:
+    """
+    Indexa o texto atual do documento gravando só a diferença para o que
+    já está no banco vetorial
+
+    Args:
+        documento: Documento com o texto já extraído
+        vector_db: Banco vetorial do Knowledge (LanceDb)
+        ingestao: Chunking e embedding (com o cache de embeddings)
+        content_hash: Hash do arquivo, gravado em cada linha
+        assinatura: Assinatura do embedder dono da tabela (ia/embedders.py)
+        knowledge_nome: Nome do Knowledge (meta_data 'linked_to')
+        indice_lexico: IndiceLexico da busca híbrida, sincronizado com os
+            chunks atuais
+
+    Returns:
+        Contagens de chunks mantidos, movidos, novos e removidos, mais o
+        resumo das métricas de ingestão
+    """
+    metricas = MetricasIngestao()
+    chunks = ingestao.dividir(documento.content, metricas)
+    chaves = _chaves(chunks)
+    ids_documento = [id_documento_vetorial(documento.id, hash_, ocorrencia) for hash_, ocorrencia in chaves]
+    metadata = _metadata(documento)
+
+    vector_db.create()
+    try:
+        with transaction.atomic():
+            # Serializa reindexações do mesmo documento (no-op no SQLite)
+            Documentos.objects.select_for_update().filter(id=documento.id).first()
+            existentes = {(c.hash, c.ocorrencia): c for c in documento.chunks_indexados.filter(embedder=assinatura)}
+            if not existentes:
+                _remover_sem_manifesto(vector_db, documento.id, documento.cliente_id, documento.arquivo.name)
+
+            gravar: List[int] = []
+            reaproveitar: Dict[int, ChunkIndexado] = {}
+            mantidos = 0
+            for posicao, (chunk, chave) in enumerate(zip(chunks, chaves)):
+                atual = existentes.pop(chave, None)
+                if atual is None:
+                    gravar.append(posicao)
+                elif (
+                    (atual.indice, atual.pagina, atual.secao) != (chunk.indice, chunk.pagina, chunk.secao[:_TAMANHO_SECAO])
+                    or atual.id_vetor != id_vetor(ids_documento[posicao], content_hash)
+                ):
+                    gravar.append(posicao)
+                    reaproveitar[posicao] = atual
+                else:
+                    mantidos += 1
+            removidos = list(existentes.values())
+
+            vetores: Dict[int, List[float]] = {}
+            lidos = _ler_vetores(vector_db, [c.id_vetor for c in reaproveitar.values()])
+            for posicao, atual in reaproveitar.items():
+                if atual.id_vetor in lidos:
+                    vetores[posicao] = lidos[atual.id_vetor]
+            sem_vetor = [p for p in gravar if p not in vetores]
+            copiados = _vetores_de_identicos(vector_db, documento, assinatura, {p: chaves[p][0] for p in sem_vetor})
+            vetores.update(copiados)
+            sem_vetor = [p for p in sem_vetor if p not in copiados]
+            vetores.update(zip(sem_vetor, ingestao.embeddar([chunks[p].texto for p in sem_vetor], metricas)))
+
+            ids_gravar = [id_vetor(ids_documento[p], content_hash) for p in gravar]
+            remover_vetores(vector_db, [c.id_vetor for c in removidos] + [c.id_vetor for c in reaproveitar.values()] + ids_gravar)
+            if gravar:
+                vector_db.insert(
+                    content_hash,
+                    documentos_vetoriais(
+                        [chunks[p] for p in gravar], [vetores[p] for p in gravar], documento.arquivo.name,
+                        metadata, content_id=str(documento.id), knowledge_nome=knowledge_nome,
+                        ids=[ids_documento[p] for p in gravar],
+                    ),
+                    filters=metadata,
+                )
+
+            ChunkIndexado.objects.filter(id__in=[c.id for c in removidos + list(reaproveitar.values())]).delete()
+            ChunkIndexado.objects.bulk_create([
+                ChunkIndexado(
+                    documento=documento, embedder=assinatura, hash=chaves[p][0], ocorrencia=chaves[p][1],
+                    id_vetor=id_linha, indice=chunks[p].indice, pagina=chunks[p].pagina, secao=chunks[p].secao[:_TAMANHO_SECAO],
+                )
+                for p, id_linha in zip(gravar, ids_gravar)
+            ])
+
+            lexico_regravado = indice_lexico is not None and indice_lexico.sincronizar(
+                documento.id, documento.cliente_id, documento.arquivo.name,
+                _itens_lexicos(chunks, ids_documento, metadata, knowledge_nome),
+            )
+    except Exception:
+        # O banco vetorial não participa da transação: sem manifesto, a
+        # próxima indexação apaga as linhas do documento e grava tudo de novo
+        ChunkIndexado.objects.filter(documento=documento, embedder=assinatura).delete()
+        raise
+
+    return {
+        'mantidos': mantidos,
+        'movidos': len(reaproveitar),
+        'novos': len(gravar) - len(reaproveitar) - len(copiados),
+        'copiados': len(copiados),
+        'removidos': len(removidos),
+        'lexico_regravado': lexico_regravado,
+        **metricas.resumo(),
+    }
+
+
+def ids_vetores_documento(documento_id: int, assinatura: str) -> List[str]:
+    return list(
+        ChunkIndexado.objects
+        .filter(documento_id=documento_id, embedder=assinatura)
+        .values_list('id_vetor', flat=True)
+    )
+
+
+def remover_documento(vector_db, ids: Optional[Sequence[str]], documento_id: Optional[int] = None,
+                      cliente_id: Optional[int] = None, nome: Optional[str] = None) -> int:
+    """
+    Apaga os vetores de um documento excluído; sem ids no manifesto, procura
+    pelo content_id ou pelo arquivo e cliente (linhas anteriores ao manifesto)
+    """
+    if vector_db.table is None:
+        return 0
+    if ids:
+        return remover_vetores(vector_db, ids)
+    if documento_id is not None:
+        _remover_sem_manifesto(vector_db, documento_id, cliente_id, nome)
+    return 0
@@ -0,0 +1,399 @@
+"""
+Ingestão explícita do RAG: divisão em chunks e embeddings em lote
+
+O texto do documento é dividido por ChunkerJuridico (tamanho, sobreposição e
+fronteiras de seções jurídicas: títulos em caixa alta, cláusulas, artigos,
+parágrafos) e os embeddings são pedidos em lotes, com no máximo
+`concorrencia` chamadas simultâneas ao provedor. Os vetores prontos vão
+direto para o banco vetorial do Knowledge, sem o chunking interno do agno.
+
+Chunks já vistos (mesmo texto normalizado, modelo e dimensões) vêm do cache
+de embeddings (ia/cache_embeddings.py) e não voltam ao embedder; textos
+repetidos dentro do documento são enviados uma vez só.
+
+EmbedderFalso gera vetores determinísticos a partir do texto, para rodar a
+etapa (e o benchmark) sem rede.
+"""
+import hashlib
+import logging
+import math
+import re
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from django.conf import settings
+
+from .cache_embeddings import CacheEmbeddings, hash_chunk
+
+logger = logging.getLogger(__name__)
+
+TAMANHO_CHUNK_PADRAO = 1500
+SOBREPOSICAO_PADRAO = 200
+TAMANHO_LOTE_PADRAO = 64
+CONCORRENCIA_PADRAO = 4
+
+_REGEX_SEPARADOR_PAGINA = re.compile(r'^--- Página (\d+) ---$')
+# Início de cláusula, capítulo, artigo ou parágrafo
+_REGEX_DISPOSITIVO = re.compile(
+    r'^(CL[AÁ]USULA|CAP[IÍ]TULO|T[IÍ]TULO|SE[CÇ][AÃ]O|Cl[aá]usula|Cap[ií]tulo)\b'
+    r'|^Art(igo|\.)\s*\d+'
+    r'|^§\s*\d+'
+    r'|^Par[aá]grafo\s+(\w+)'
+)
+_REGEX_LETRAS = re.compile(r'[^\W\d_]')
+
+
+def eh_titulo(linha: str) -> bool:
+    """Título de seção: linha curta em caixa alta (DOS FATOS, EMENTA, VOTO...)"""
+    return len(linha) <= 80 and len(_REGEX_LETRAS.findall(linha)) >= 4 and linha.isupper()
+
+
+@dataclass
+class Chunk:
+    texto: str
+    indice: int
+    pagina: Optional[int] = None
+    secao: str = ''
+
+    @property
+    def hash(self) -> str:
+        """Hash do texto normalizado (chave do cache de embeddings)"""
+        return hash_chunk(self.texto)
+
+
+class ChunkerJuridico:
+    """
+    Divide o texto em chunks de até `tamanho` caracteres
+
+    Um título de seção ou dispositivo (cláusula, artigo, parágrafo) fecha o
+    chunk atual quando ele já tem `tamanho_minimo` caracteres, então seções
+    começam em chunk novo e sem sobreposição. Dentro de uma seção, o chunk
+    seguinte repete os últimos `sobreposicao` caracteres do anterior (a
+    partir de um início de palavra). Parágrafos longos são cortados entre
+    palavras; linhas curtas nunca são partidas. Os separadores de página não
+    entram no texto; a página de início fica em Chunk.pagina.
+
+    Args:
+        tamanho: Máximo de caracteres por chunk
+        sobreposicao: Caracteres repetidos entre chunks da mesma seção
+        tamanho_minimo: Tamanho a partir do qual uma fronteira fecha o chunk
+            (padrão: um quarto de `tamanho`)
+    """
+
+    def __init__(self, tamanho: int = TAMANHO_CHUNK_PADRAO, sobreposicao: int = SOBREPOSICAO_PADRAO,
+                 tamanho_minimo: Optional[int] = None):
+        if sobreposicao >= tamanho:
+            raise ValueError("A sobreposição deve ser menor que o tamanho do chunk")
+        self.tamanho = tamanho
+        self.sobreposicao = sobreposicao
+        self.tamanho_minimo = tamanho // 4 if tamanho_minimo is None else tamanho_minimo
+
+    @classmethod
+    def de_settings(cls) -> "ChunkerJuridico":
+        config = getattr(settings, 'RAG_INGESTAO', {})
+        return cls(
+            tamanho=config.get('tamanho_chunk', TAMANHO_CHUNK_PADRAO),
+            sobreposicao=config.get('sobreposicao', SOBREPOSICAO_PADRAO),
+        )
+
+    def _linhas(self, texto: str) -> Iterator[Tuple[str, Optional[int], bool]]:
+        """(linha, página, é fronteira), sem os separadores de página"""
+        pagina = None
+        for bruta in texto.splitlines():
+            linha = bruta.strip()
+            separador = _REGEX_SEPARADOR_PAGINA.match(linha)
+            if separador:
+                pagina = int(separador.group(1))
+            elif linha:
+                yield linha, pagina, eh_titulo(linha) or bool(_REGEX_DISPOSITIVO.match(linha))
+
+    def _sobreposicao(self, texto: str) -> str:
+        """Últimos `sobreposicao` caracteres, começando em início de palavra"""
+        if not self.sobreposicao or len(texto) <= self.sobreposicao:
+            return ''
+        cauda = texto[-self.sobreposicao:]
+        espaco = re.search(r'\s', cauda)
+        return cauda[espaco.end():] if espaco else ''
+
+    def dividir(self, texto: str) -> List[Chunk]:
+        chunks: List[Chunk] = []
+        partes: List[str] = []
+        pagina_inicio = None
+        secao = ''
+        secao_inicio = ''
+
+        def ocupado() -> int:
+            return sum(len(parte) for parte in partes) + max(len(partes) - 1, 0)
+
+        def fechar(sobrepor: bool):
+            nonlocal partes
+            texto_chunk = '\n'.join(partes)
+            chunks.append(Chunk(texto_chunk, len(chunks), pagina_inicio, secao_inicio))
+            cauda = self._sobreposicao(texto_chunk) if sobrepor else ''
+            partes = [cauda] if cauda else []
+
+        for linha, pagina, fronteira in self._linhas(texto):
+            if fronteira and partes and ocupado() >= self.tamanho_minimo:
+                fechar(sobrepor=False)
+            if eh_titulo(linha):
+                secao = linha
+
+            while linha:
+                if not partes:
+                    pagina_inicio, secao_inicio = pagina, secao
+                espaco = self.tamanho - ocupado() - (1 if partes else 0)
+                if len(linha) <= espaco:
+                    partes.append(linha)
+                    break
+                # Parágrafos longos (ou um chunk ainda quase vazio) são
+                # cortados na última palavra que cabe; linhas curtas vão
+                # inteiras para o chunk seguinte
+                if len(linha) > self.tamanho - self.sobreposicao or ocupado() < self.tamanho_minimo:
+                    corte = linha.rfind(' ', 0, espaco + 1)
+                    if corte <= 0:
+                        corte = espaco
+                    if corte > 0:
+                        partes.append(linha[:corte])
+                        linha = linha[corte:].lstrip()
+                fechar(sobrepor=True)
+
+        if partes:
+            fechar(sobrepor=False)
+        return chunks
+
+
+class EmbedderFalso:
+    """
+    Vetores determinísticos (normalizados) derivados do hash do texto, para
+    testes e benchmarks offline
+
+    Args:
+        dimensoes: Tamanho dos vetores
+        latencia_s: Espera simulada por chamada (lote), como a de uma API
+    """
+
+    nome = 'falso'
+
+    def __init__(self, dimensoes: int = 64, latencia_s: float = 0.0):
+        self.dimensoes = dimensoes
+        self.latencia_s = latencia_s
+
+    def embeddar_lote(self, textos: Sequence[str]) -> List[List[float]]:
+        if self.latencia_s:
+            time.sleep(self.latencia_s)
+        vetores = []
+        for texto in textos:
+            semente = int.from_bytes(hashlib.blake2b(texto.encode('utf-8'), digest_size=8).digest(), 'little')
+            vetor = np.random.default_rng(semente).standard_normal(self.dimensoes).astype(np.float32)
+            vetores.append((vetor / np.linalg.norm(vetor)).tolist())
+        return vetores
+
+
+class EmbedderAgno:
+    """
+    Adapta um embedder do agno (ex.: OpenAIEmbedder) para chamadas em lote
+
+    Embedders com `response` (API de embeddings da OpenAI) recebem o lote
+    inteiro em uma requisição, os locais com `embeddar_lote` o calculam de
+    uma vez; os demais, um texto por vez.
+    """
+
+    def __init__(self, embedder):
+        self.embedder = embedder
+        self.nome = getattr(embedder, 'id', type(embedder).__name__)
+        self.dimensoes = embedder.dimensions
+
+    def embeddar_lote(self, textos: Sequence[str]) -> List[List[float]]:
+        if hasattr(self.embedder, 'embeddar_lote'):
+            # Embedders locais (ia/embedders.py) vetorizam o lote inteiro
+            return self.embedder.embeddar_lote(textos)
+        if hasattr(self.embedder, 'response'):
+            resposta = self.embedder.response(list(textos))
+            return [item.embedding for item in sorted(resposta.data, key=lambda item: item.index)]
+        vetores = [self.embedder.get_embedding(texto) for texto in textos]
+        if any(not vetor for vetor in vetores):
+            raise RuntimeError(f"Embedder {self.nome} não retornou vetor para todos os textos")
+        return vetores
+
+
+@dataclass
+class MetricasIngestao:
+    chunks: int = 0
+    caracteres: int = 0
+    lotes: int = 0
+    segundos_chunking: float = 0.0
+    segundos_embedding: float = 0.0
+    latencias_lote: List[float] = field(default_factory=list)
+    # Textos distintos encontrados / não encontrados no cache de embeddings
+    cache_acertos: int = 0
+    cache_faltas: int = 0
+    embeddings_evitados: int = 0
+    chamadas_evitadas: int = 0
+
+    @property
+    def taxa_acerto_cache(self) -> float:
+        consultas = self.cache_acertos + self.cache_faltas
+        return self.cache_acertos / consultas if consultas else 0.0
+
+    @property
+    def segundos_total(self) -> float:
+        return self.segundos_chunking + self.segundos_embedding
+
+    @property
+    def chunks_por_segundo(self) -> float:
+        return self.chunks / self.segundos_total if self.segundos_total else 0.0
+
+    def resumo(self) -> dict:
+        latencias = sorted(self.latencias_lote)
+        return {
+            'chunks': self.chunks,
+            'caracteres': self.caracteres,
+            'lotes': self.lotes,
+            'segundos_chunking': round(self.segundos_chunking, 4),
+            'segundos_embedding': round(self.segundos_embedding, 4),
+            'chunks_por_segundo': round(self.chunks_por_segundo, 2),
+            'latencia_lote_media_ms': round(statistics.mean(latencias) * 1000, 2) if latencias else 0.0,
+            'latencia_lote_p95_ms': (
+                round(latencias[min(len(latencias) - 1, int(0.95 * len(latencias)))] * 1000, 2)
+                if latencias else 0.0
+            ),
+            'cache_acertos': self.cache_acertos,
+            'cache_faltas': self.cache_faltas,
+            'taxa_acerto_cache': round(self.taxa_acerto_cache, 4),
+            'embeddings_evitados': self.embeddings_evitados,
+            'chamadas_evitadas': self.chamadas_evitadas,
+        }
+
+
+class IngestaoRAG:
+    """
+    Chunking seguido de embeddings em lotes com concorrência limitada
+
+    Args:
+        embedder: Objeto com `embeddar_lote(textos)`, `nome` e `dimensoes`
+        chunker: Padrão: ChunkerJuridico.de_settings()
+        tamanho_lote: Textos por chamada ao embedder
+        concorrencia: Máximo de chamadas simultâneas
+        cache: Cache de embeddings; None desliga
+    """
+
+    def __init__(self, embedder, chunker: Optional[ChunkerJuridico] = None,
+                 tamanho_lote: Optional[int] = None, concorrencia: Optional[int] = None,
+                 cache: Optional[CacheEmbeddings] = None):
+        config = getattr(settings, 'RAG_INGESTAO', {})
+        self.embedder = embedder
+        self.cache = cache
+        self.chunker = chunker or ChunkerJuridico.de_settings()
+        self.tamanho_lote = max(1, tamanho_lote or config.get('tamanho_lote', TAMANHO_LOTE_PADRAO))
+        self.concorrencia = max(1, concorrencia or config.get('concorrencia', CONCORRENCIA_PADRAO))
+
+    def embeddar(self, textos: Sequence[str], metricas: MetricasIngestao) -> List[List[float]]:
+        """
+        Vetores na ordem dos textos: do cache quando possível, o resto do
+        embedder (cada texto distinto uma vez)
+        """
+        hashes = [hash_chunk(texto) for texto in textos]
+        unicos = dict(zip(hashes, textos))
+        modelo, dimensoes = self.embedder.nome, self.embedder.dimensoes
+
+        vetores = self.cache.obter(unicos, modelo, dimensoes) if self.cache is not None else {}
+        faltantes = [h for h in unicos if h not in vetores]
+        if self.cache is not None:
+            metricas.cache_acertos += len(vetores)
+            metricas.cache_faltas += len(faltantes)
+
+        if faltantes:
+            novos = self._chamar_embedder([unicos[h] for h in faltantes], metricas)
+            vetores.update(zip(faltantes, novos))
+            if self.cache is not None:
+                self.cache.salvar(list(zip(faltantes, novos)), modelo, dimensoes)
+
+        metricas.embeddings_evitados += len(textos) - len(faltantes)
+        metricas.chamadas_evitadas += (
+            math.ceil(len(textos) / self.tamanho_lote) - math.ceil(len(faltantes) / self.tamanho_lote)
+        )
+        return [list(map(float, vetores[h])) for h in hashes]
+
+    def _chamar_embedder(self, textos: Sequence[str], metricas: MetricasIngestao) -> List[List[float]]:
+        """Lotes em paralelo limitado; a falha de um lote propaga"""
+        lotes = [textos[i:i + self.tamanho_lote] for i in range(0, len(textos), self.tamanho_lote)]
+
+        def chamar(lote):
+            inicio = time.perf_counter()
+            vetores = self.embedder.embeddar_lote(lote)
+            if len(vetores) != len(lote):
+                raise RuntimeError(f"Embedder {self.embedder.nome}: {len(vetores)} vetores para {len(lote)} textos")
+            return vetores, time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        vetores: List[List[float]] = []
+        if len(lotes) <= 1 or self.concorrencia == 1:
+            resultados = map(chamar, lotes)
+            for lote_vetores, latencia in resultados:
+                vetores.extend(lote_vetores)
+                metricas.latencias_lote.append(latencia)
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.concorrencia, len(lotes))) as executor:
+                for lote_vetores, latencia in executor.map(chamar, lotes):
+                    vetores.extend(lote_vetores)
+                    metricas.latencias_lote.append(latencia)
+        metricas.lotes += len(lotes)
+        metricas.segundos_embedding += time.perf_counter() - inicio
+        return vetores
+
+    def dividir(self, texto: str, metricas: MetricasIngestao) -> List[Chunk]:
+        inicio = time.perf_counter()
+        chunks = self.chunker.dividir(texto)
+        metricas.segundos_chunking = time.perf_counter() - inicio
+        metricas.chunks = len(chunks)
+        metricas.caracteres = sum(len(chunk.texto) for chunk in chunks)
+        return chunks
+
+    def processar(self, texto: str) -> Tuple[List[Chunk], List[List[float]], MetricasIngestao]:
+        metricas = MetricasIngestao()
+        chunks = self.dividir(texto, metricas)
+        vetores = self.embeddar([chunk.texto for chunk in chunks], metricas)
+        return chunks, vetores, metricas
+
+
+def meta_data_chunk(chunk: Chunk, metadata: dict, chunk_id: str, knowledge_nome: str = '') -> dict:
+    """meta_data de um chunk, igual no banco vetorial e no índice léxico"""
+    return {
+        **metadata,
+        'chunk': chunk.indice,
+        'chunk_id': chunk_id,
+        'chunk_size': len(chunk.texto),
+        'pagina': chunk.pagina,
+        'secao': chunk.secao,
+        'linked_to': knowledge_nome,
+    }
+
+
+def documentos_vetoriais(chunks: Sequence[Chunk], vetores: Sequence[List[float]], nome: str,
+                         metadata: dict, content_id: str, knowledge_nome: str = '',
+                         ids: Optional[Sequence[str]] = None):
+    """
+    Chunks já com embedding no formato do banco vetorial do agno
+
+    Args:
+        ids: Id de cada Document (padrão: '<content_id>_<índice do chunk>')
+    """
+    from agno.knowledge.document.base import Document
+
+    ids = ids if ids is not None else [f'{content_id}_{chunk.indice}' for chunk in chunks]
+    return [
+        Document(
+            content=chunk.texto,
+            id=id_chunk,
+            name=nome,
+            meta_data=meta_data_chunk(chunk, metadata, id_chunk, knowledge_nome),
+            embedding=vetor,
+            content_id=content_id,
+            size=len(chunk.texto.encode('utf-8')),
+        )
+        for chunk, vetor, id_chunk in zip(chunks, vetores, ids)
+    ]
@@ -0,0 +1,105 @@
+"""
+Formato das linhas que o LanceDb do agno grava, num lugar só
+
+O agno não expõe o formato da tabela: a coluna de id (`_id`), a de vetor
+(`_vector_col`), o JSON do payload e o id md5 das linhas são detalhes do
+LanceDb.insert. A indexação incremental, a busca híbrida, a troca de
+embedder e o benchmark de partição dependem deles, então todo acesso passa
+por aqui. A versão do agno fica fixada em requirements.txt; ao atualizá-la,
+os testes de LinhaAgnoTests comparam este módulo com o insert do agno.
+
+Filtros de payload usam a ordem das chaves do json.dumps do agno ("name"
+primeiro) e do meta_data de ia/ingestao.py ("cliente_id" primeiro).
+"""
+import json
+from hashlib import md5
+from typing import Any, Dict, List, Optional, Sequence
+
+from agno.knowledge.document.base import Document
+
+COLUNA_PAYLOAD = 'payload'
+COLUNA_CLIENTE = 'cliente_id'
+
+# Preenche a coluna cliente_id nas tabelas gravadas antes dela
+EXTRAIR_CLIENTE = (
+    f"CAST(regexp_match({COLUNA_PAYLOAD}, '\"meta_data\": \\{{[^{{}}]*\"{COLUNA_CLIENTE}\": (\\d+)')[1] AS BIGINT)"
+)
+
+
+def coluna_id(vector_db) -> str:
+    return vector_db._id
+
+
+def coluna_vetor(vector_db) -> str:
+    return vector_db._vector_col
+
+
+def nomes_tabelas(conexao) -> List[str]:
+    """Tabelas da conexão (list_tables nas versões novas do LanceDB)"""
+    if hasattr(conexao, 'list_tables'):
+        return list(conexao.list_tables().tables)
+    return list(conexao.table_names())
+
+
+def id_linha(id_documento: str, content_hash: str) -> str:
+    """Id da linha que o LanceDb.insert do agno grava para o Document"""
+    return md5(f"{id_documento}_{content_hash}".encode()).hexdigest()
+
+
+def payload(nome: str, meta_data: Optional[dict], conteudo: str, content_id: Optional[str],
+            content_hash: str, usage: Optional[dict] = None) -> str:
+    return json.dumps({
+        "name": nome,
+        "meta_data": meta_data,
+        "content": conteudo,
+        "usage": usage,
+        "content_id": content_id,
+        "content_hash": content_hash,
+    })
+
+
+def linha(vector_db, documento: Document, content_hash: str) -> Dict[str, Any]:
+    """
+    Linha do LanceDb.insert para um Document já com embedding (o meta_data
+    já com os filtros aplicados)
+    """
+    conteudo = documento.content.replace("\x00", "\ufffd")
+    return {
+        coluna_id(vector_db): id_linha(documento.id or md5(conteudo.encode()).hexdigest(), content_hash),
+        coluna_vetor(vector_db): vector_db._prepare_vector(documento.embedding),
+        COLUNA_PAYLOAD: payload(
+            documento.name, documento.meta_data, conteudo, documento.content_id, content_hash, documento.usage
+        ),
+    }
+
+
+def documentos(vector_db, linhas: List[dict]) -> List[Document]:
+    """Documents das linhas de uma busca, como o LanceDb.search devolve"""
+    return vector_db._build_search_results(linhas)
+
+
+def filtro_ids(vector_db, ids: Sequence[str]) -> str:
+    # Ids são hexadecimais (md5), sem aspas a escapar
+    return f"{coluna_id(vector_db)} IN ({', '.join(repr(str(i)) for i in ids)})"
+
+
+def _escapar_like(texto: str) -> str:
+    return texto.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_').replace("'", "''")
+
+
+def filtro_content_id(content_id) -> str:
+    return f"{COLUNA_PAYLOAD} LIKE '%\"content_id\": \"{_escapar_like(str(content_id))}\"%'"
+
+
+def filtro_arquivo_cliente(nome: str, cliente_id: int) -> str:
+    """Linhas de um arquivo (primeira chave do payload) de um cliente"""
+    nome_payload = _escapar_like(json.dumps(nome)[1:-1])
+    return (
+        f"({COLUNA_PAYLOAD} LIKE '{{\"name\": \"{nome_payload}\",%' "
+        f"AND {COLUNA_PAYLOAD} LIKE '%\"{COLUNA_CLIENTE}\": {int(cliente_id)},%')"
+    )
+
+
+def filtro_cliente_payload(cliente_id: int) -> str:
+    """Linhas de um cliente em tabelas ainda sem a coluna cliente_id"""
+    return f"{COLUNA_PAYLOAD} LIKE '%\"meta_data\": {{\"{COLUNA_CLIENTE}\": {int(cliente_id)},%'"
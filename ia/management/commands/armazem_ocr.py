@@ -0,0 +1,26 @@
+"""
+Estatísticas do armazém de artefatos de OCR (ia/armazem_ocr.py), em JSON.
+
+Uso:
+    python manage.py armazem_ocr
+    python manage.py armazem_ocr --limpar
+"""
+import json
+
+from django.core.management.base import BaseCommand
+
+from ia.armazem_ocr import obter_armazem
+
+
+class Command(BaseCommand):
+    help = "Mostra acertos, faltas, bytes e despejos do armazém de artefatos de OCR"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limpar', action='store_true', help="Remove todos os artefatos e zera os contadores")
+
+    def handle(self, *args, **options):
+        armazem = obter_armazem()
+        if options['limpar']:
+            armazem.limpar()
+            self.stderr.write(f"Armazém {armazem.caminho} limpo")
+        self.stdout.write(json.dumps(armazem.estatisticas(), indent=2, ensure_ascii=False))
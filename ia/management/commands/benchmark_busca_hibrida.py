@@ -0,0 +1,182 @@
+"""
+Recall e latência da busca do RAG por modo (ia/busca_hibrida.py): vetorial,
+lexical (BM25 no FTS5) e hibrida (RRF), com o filtro por cliente.
+
+Monta, em um diretório temporário, um corpus sintético de --clientes x
+--documentos peças com termos exatos únicos inseridos no texto (número CNJ,
+nome da parte, valor, artigo de lei) e consulta cada um deles, mais trechos
+de --palavras-trecho palavras copiados dos chunks. Acerto: um chunk que
+contém o termo (ou o trecho) entre os --limite primeiros resultados.
+
+O embedder é o do backend informado (padrão: hashing, local); com 'openai'
+o corpus inteiro passa pela API.
+
+Uso:
+    python manage.py benchmark_busca_hibrida --clientes 5 --documentos 20
+    python manage.py benchmark_busca_hibrida --backend openai --clientes 2 --documentos 5
+"""
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from collections import defaultdict
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from ia.benchmark_utils import gerar_texto_pagina
+from ia.busca_hibrida import MODOS, IndiceLexico, LanceDbHibrido
+from ia.cache_embeddings import normalizar_texto
+from ia.embedders import embedder_configurado
+from ia.ingestao import ChunkerJuridico, EmbedderAgno, IngestaoRAG, documentos_vetoriais, meta_data_chunk
+
+NOMES = ['Ana', 'Bruno', 'Carla', 'Diego', 'Elisa', 'Fabio', 'Gisele', 'Heitor', 'Iara', 'Joaquim']
+SOBRENOMES = ['Albuquerque', 'Barreto', 'Cavalcanti', 'Drummond', 'Esteves', 'Figueiredo', 'Guimaraes', 'Holanda']
+
+
+def _termos_unicos(rng: random.Random) -> dict:
+    """Um termo exato de cada tipo, como aparece na peça"""
+    cnj = (
+        f"{rng.randrange(10 ** 7):07d}-{rng.randrange(100):02d}.{rng.randrange(2000, 2025)}."
+        f"{rng.randrange(1, 9)}.{rng.randrange(1, 28):02d}.{rng.randrange(10 ** 4):04d}"
+    )
+    return {
+        'cnj': cnj,
+        'cnj_digitos': cnj.replace('-', '').replace('.', ''),
+        'parte': f"{rng.choice(NOMES)} {rng.choice(SOBRENOMES)} {rng.choice(SOBRENOMES)} {rng.randrange(10 ** 4)}",
+        'valor': f"R$ {rng.randrange(1, 999)}.{rng.randrange(1000):03d},{rng.randrange(100):02d}",
+        'artigo': f"art. {rng.randrange(1, 2000)} da Lei {rng.randrange(1000, 15000)}/{rng.randrange(1990, 2024)}",
+    }
+
+
+def _linhas_termos(termos: dict) -> list:
+    return [
+        f"Processo n. {termos['cnj']}",
+        f"Autor: {termos['parte']}, qualificado nos autos",
+        f"Condenacao no valor de {termos['valor']}",
+        f"com fundamento no {termos['artigo']}",
+    ]
+
+
+class Command(BaseCommand):
+    help = "Mede recall e latência das buscas vetorial, léxica e híbrida do RAG"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clientes', type=int, default=5)
+        parser.add_argument('--documentos', type=int, default=20, help="Documentos por cliente")
+        parser.add_argument('--paginas', type=int, default=4, help="Páginas por documento")
+        parser.add_argument('--backend', default='hashing')
+        parser.add_argument('--limite', type=int, default=5)
+        parser.add_argument('--trechos', type=int, default=100)
+        parser.add_argument('--palavras-trecho', type=int, default=12)
+        parser.add_argument('--semente', type=int, default=0)
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as diretorio:
+            resultado = self._executar(diretorio, options)
+        self.stdout.write(json.dumps(resultado, indent=2, ensure_ascii=False))
+
+    def _executar(self, diretorio: str, options) -> dict:
+        rng = random.Random(options['semente'])
+        embedder = embedder_configurado('benchmark', {'backend': options['backend']}).embedder
+        vector_db = LanceDbHibrido(
+            table_name='benchmark', uri=os.path.join(diretorio, 'lance'), embedder=embedder,
+            indice_lexico=IndiceLexico(os.path.join(diretorio, 'lexico.sqlite3')),
+        )
+        vector_db.create()
+        ingestao = IngestaoRAG(EmbedderAgno(embedder), ChunkerJuridico.de_settings())
+
+        # (tipo, consulta, cliente_id, chunk_ids que a respondem)
+        consultas = []
+        textos_chunks = {}
+        chunks_por_cliente = defaultdict(list)
+        inicio = time.perf_counter()
+        documento_id = 0
+        for cliente_id in range(1, options['clientes'] + 1):
+            for _ in range(options['documentos']):
+                documento_id += 1
+                termos = _termos_unicos(rng)
+                linhas = gerar_texto_pagina(semente=rng.randrange(10 ** 6)).split('\n')
+                for linha in _linhas_termos(termos):
+                    linhas.insert(rng.randrange(len(linhas) + 1), linha)
+                paginas = ['\n'.join(linhas)] + [
+                    gerar_texto_pagina(semente=rng.randrange(10 ** 6)) for _ in range(options['paginas'] - 1)
+                ]
+                texto = '\n\n'.join(f"--- Página {i + 1} ---\n{pagina}" for i, pagina in enumerate(paginas))
+
+                chunks, vetores, _ = ingestao.processar(texto)
+                ids = [f'{documento_id}_{chunk.indice}' for chunk in chunks]
+                metadata = {'cliente_id': cliente_id, 'name': f'documentos/benchmark_{documento_id}.pdf'}
+                vector_db.insert(
+                    f'benchmark_{documento_id}',
+                    documentos_vetoriais(chunks, vetores, metadata['name'], metadata, str(documento_id), ids=ids),
+                    filters=metadata,
+                )
+                vector_db.indice_lexico.sincronizar(
+                    documento_id, cliente_id, metadata['name'],
+                    [(id_chunk, chunk.texto, meta_data_chunk(chunk, metadata, id_chunk)) for chunk, id_chunk in zip(chunks, ids)],
+                )
+                for id_chunk, chunk in zip(ids, chunks):
+                    textos_chunks[id_chunk] = normalizar_texto(chunk.texto)
+                    chunks_por_cliente[cliente_id].append(id_chunk)
+                for tipo, termo in termos.items():
+                    busca = termos['cnj'] if tipo == 'cnj_digitos' else termo
+                    consultas.append((tipo, termo, cliente_id, {
+                        id_chunk for id_chunk, chunk in zip(ids, chunks) if busca in chunk.texto
+                    }))
+        segundos_indexacao = time.perf_counter() - inicio
+        self.stderr.write(f"{documento_id} documentos, {len(textos_chunks)} chunks indexados em {segundos_indexacao:.1f}s")
+
+        for _ in range(options['trechos']):
+            cliente_id = rng.randrange(1, options['clientes'] + 1)
+            palavras = textos_chunks[rng.choice(chunks_por_cliente[cliente_id])].split()
+            inicio_trecho = rng.randrange(max(1, len(palavras) - options['palavras_trecho']))
+            trecho = ' '.join(palavras[inicio_trecho:inicio_trecho + options['palavras_trecho']])
+            consultas.append(('trecho', trecho, cliente_id, {
+                id_chunk for id_chunk in chunks_por_cliente[cliente_id] if trecho in textos_chunks[id_chunk]
+            }))
+
+        resultados = {}
+        for modo in MODOS:
+            vector_db.modo = modo
+            por_tipo = defaultdict(lambda: {'acertos': 0, 'consultas': 0, 'latencias': []})
+            vazamentos = 0
+            for tipo, consulta, cliente_id, esperados in consultas:
+                inicio = time.perf_counter()
+                documentos = vector_db.search(consulta, limit=options['limite'], filters={'cliente_id': cliente_id})
+                por_tipo[tipo]['latencias'].append((time.perf_counter() - inicio) * 1000)
+                por_tipo[tipo]['consultas'] += 1
+                por_tipo[tipo]['acertos'] += any(d.meta_data.get('chunk_id') in esperados for d in documentos)
+                vazamentos += sum(d.meta_data.get('cliente_id') != cliente_id for d in documentos)
+
+            latencias = [l for dados in por_tipo.values() for l in dados['latencias']]
+            resultados[modo] = {
+                'recall': round(sum(d['acertos'] for d in por_tipo.values()) / len(consultas), 3),
+                'latencia_p50_ms': round(statistics.median(latencias), 2),
+                'latencia_p95_ms': round(float(np.percentile(latencias, 95)), 2),
+                'resultados_de_outros_clientes': vazamentos,
+                'por_tipo': {
+                    tipo: {
+                        'recall': round(dados['acertos'] / dados['consultas'], 3),
+                        'latencia_p50_ms': round(statistics.median(dados['latencias']), 2),
+                    }
+                    for tipo, dados in sorted(por_tipo.items())
+                },
+            }
+            self.stderr.write(
+                f"{modo}: recall@{options['limite']} {resultados[modo]['recall']}, "
+                f"p50 {resultados[modo]['latencia_p50_ms']} ms"
+            )
+
+        return {
+            'backend': options['backend'],
+            'clientes': options['clientes'],
+            'documentos': documento_id,
+            'chunks': len(textos_chunks),
+            'consultas': len(consultas),
+            'limite': options['limite'],
+            'segundos_indexacao': round(segundos_indexacao, 2),
+            'resultados': resultados,
+        }
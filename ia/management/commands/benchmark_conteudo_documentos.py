@@ -0,0 +1,130 @@
+"""
+Listagem de documentos com o texto fora da tabela (ConteudoDocumento).
+
+Cria um cliente com N documentos sintéticos (texto comprimido, um conteúdo
+por documento) dentro de uma transação desfeita no final, e mede tempo e pico
+de memória alocada (tracemalloc) de:
+    listagem        Documentos do cliente sem o texto (como as views listam)
+    listagem_texto  mesma lista carregando o texto de cada documento, o custo
+                    que toda listagem pagava com o MartorField na tabela
+    pagina_cliente  GET da página do cliente
+    admin_lista     GET da lista de documentos do admin
+
+Uso:
+    python manage.py benchmark_conteudo_documentos --documentos 1000 --paginas 10
+"""
+import json
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from ia.benchmark_utils import gerar_texto_pagina
+from ia.ocr_utils import montar_texto_paginas
+from usuarios.conteudo import comprimir, hash_texto
+from usuarios.models import Cliente, ConteudoDocumento, Documentos
+
+
+def _medir(fn, repeticoes: int) -> dict:
+    """Menor tempo entre as repetições e pico de memória alocada da primeira"""
+    tracemalloc.start()
+    fn()
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        fn()
+        tempos.append(time.perf_counter() - inicio)
+    return {'ms': round(min(tempos) * 1000, 2), 'pico_memoria_mb': round(pico / (1024 * 1024), 2)}
+
+
+class Command(BaseCommand):
+    help = "Mede listagem e páginas de um cliente com muitos documentos (texto comprimido fora da tabela)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--documentos', type=int, default=1000)
+        parser.add_argument('--paginas', type=int, default=10, help="Páginas de texto por documento")
+        parser.add_argument('--repeticoes', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            resultado = self._executar(options)
+            transaction.set_rollback(True)
+        self.stdout.write(json.dumps(resultado, indent=2, ensure_ascii=False))
+
+    def _executar(self, options) -> dict:
+        n, paginas = options['documentos'], options['paginas']
+        usuario = User.objects.create_superuser(f'benchmark_{time.time_ns()}', password='x')
+        cliente = Cliente.objects.create(nome='Benchmark', email='benchmark@exemplo.com', user=usuario)
+
+        inicio = time.perf_counter()
+        conteudos = []
+        for i in range(n):
+            texto = montar_texto_paginas({p: gerar_texto_pagina(semente=i * paginas + p) for p in range(paginas)})
+            dados, compressao = comprimir(texto)
+            conteudos.append(ConteudoDocumento(
+                hash=hash_texto(texto), compressao=compressao, dados=dados,
+                tamanho=len(texto.encode('utf-8')), tamanho_comprimido=len(dados),
+            ))
+        tempo_compressao = time.perf_counter() - inicio
+        conteudos = ConteudoDocumento.objects.bulk_create(conteudos, batch_size=200)
+        agora = timezone.now()
+        Documentos.objects.bulk_create([
+            Documentos(
+                cliente=cliente, arquivo=f'documentos/benchmark_{i}.pdf', data_upload=agora,
+                tipo_mime='application/pdf', num_paginas=paginas, conteudo=conteudo,
+            )
+            for i, conteudo in enumerate(conteudos)
+        ], batch_size=200)
+        self.stderr.write(f"{n} documentos criados ({tempo_compressao:.1f}s de compressão)")
+
+        def listagem():
+            return [(d.arquivo.name, d.tipo, d.data_upload) for d in Documentos.objects.filter(cliente=cliente)]
+
+        def listagem_texto():
+            return [
+                (d.arquivo.name, d.tipo, d.data_upload, d.content)
+                for d in Documentos.objects.filter(cliente=cliente).select_related('conteudo')
+            ]
+
+        http = Client()
+        http.force_login(usuario)
+
+        def pagina(url):
+            def get():
+                resposta = http.get(url)
+                if resposta.status_code != 200:
+                    raise RuntimeError(f"GET {url}: HTTP {resposta.status_code}")
+            return get
+
+        repeticoes = options['repeticoes']
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            resultados = {
+                'listagem': _medir(listagem, repeticoes),
+                'listagem_texto': _medir(listagem_texto, repeticoes),
+                'pagina_cliente': _medir(pagina(reverse('cliente', kwargs={'id': cliente.id})), repeticoes),
+                'admin_lista': _medir(
+                    pagina(f"{reverse('admin:usuarios_documentos_changelist')}?cliente__id__exact={cliente.id}"),
+                    repeticoes,
+                ),
+            }
+        tamanho = sum(c.tamanho for c in conteudos)
+        tamanho_comprimido = sum(c.tamanho_comprimido for c in conteudos)
+        return {
+            'documentos': n,
+            'paginas_por_documento': paginas,
+            'compressao': conteudos[0].compressao,
+            'texto_mb': round(tamanho / (1024 * 1024), 2),
+            'comprimido_mb': round(tamanho_comprimido / (1024 * 1024), 2),
+            'taxa_compressao': round(tamanho / tamanho_comprimido, 2),
+            'compressao_ms_por_documento': round(tempo_compressao * 1000 / n, 3),
+            'resultados': resultados,
+        }
@@ -0,0 +1,113 @@
+"""
+Comparação dos embedders do RAG (ia/embedders.py) sobre chunks de um texto
+jurídico sintético.
+
+Por backend mede:
+    consulta     latência de um texto por vez (o caminho da busca do agente)
+    lote         chunks/s embeddando em lotes de --tamanho-lote
+    recall_5     fração de trechos de --palavras-trecho palavras cujo chunk de
+                 origem fica entre os 5 mais próximos (sanidade da busca)
+
+'api_simulada' é o EmbedderFalso com --latencia-ms por chamada, no lugar de
+uma API de embeddings; 'openai' só roda se pedido (usa rede e créditos).
+
+Uso:
+    python manage.py benchmark_embedders --paginas 50
+    python manage.py benchmark_embedders --backends hashing openai --consultas 20
+"""
+import json
+import statistics
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from ia.benchmark_utils import gerar_texto_pagina
+from ia.embedders import backends, embedder_configurado
+from ia.ingestao import ChunkerJuridico, EmbedderAgno, EmbedderFalso
+from ia.ocr_utils import montar_texto_paginas
+
+
+def _percentil(valores, p: float) -> float:
+    return float(np.percentile(valores, p)) if valores else 0.0
+
+
+class Command(BaseCommand):
+    help = "Compara latência, vazão e recall dos embedders do RAG"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backends', nargs='+', default=['hashing', 'api_simulada'])
+        parser.add_argument('--paginas', type=int, default=50)
+        parser.add_argument('--tamanho-lote', type=int, default=64)
+        parser.add_argument('--consultas', type=int, default=200)
+        parser.add_argument('--palavras-trecho', type=int, default=12)
+        parser.add_argument('--latencia-ms', type=float, default=150.0, help="Espera por chamada da api_simulada")
+        parser.add_argument('--dimensoes', type=int, default=1024, help="Dimensões do hashing e da api_simulada")
+
+    def handle(self, *args, **options):
+        texto = montar_texto_paginas({i: gerar_texto_pagina(semente=i) for i in range(options['paginas'])})
+        chunks = [chunk.texto for chunk in ChunkerJuridico.de_settings().dividir(texto)]
+        rng = np.random.default_rng(0)
+        trechos = []
+        for origem in rng.integers(0, len(chunks), options['consultas']):
+            palavras = chunks[origem].split()
+            inicio = int(rng.integers(0, max(1, len(palavras) - options['palavras_trecho'])))
+            trechos.append((int(origem), ' '.join(palavras[inicio:inicio + options['palavras_trecho']])))
+
+        resultados = {}
+        for backend in options['backends']:
+            embeddar_consulta, embeddar_lote, dimensoes = self._embedder(backend, options)
+            resultados[backend] = self._medir(
+                embeddar_consulta, embeddar_lote, chunks, trechos, options['tamanho_lote']
+            )
+            resultados[backend]['dimensoes'] = dimensoes
+            self.stderr.write(
+                f"{backend}: consulta p50 {resultados[backend]['consulta_p50_ms']} ms, "
+                f"{resultados[backend]['chunks_por_segundo']} chunks/s, recall@5 {resultados[backend]['recall_5']}"
+            )
+
+        self.stdout.write(json.dumps({
+            'paginas': options['paginas'],
+            'chunks': len(chunks),
+            'consultas': len(trechos),
+            'tamanho_lote': options['tamanho_lote'],
+            'resultados': resultados,
+        }, indent=2, ensure_ascii=False))
+
+    def _embedder(self, backend: str, options):
+        """(embeddar uma consulta, embeddar um lote, dimensões)"""
+        if backend == 'api_simulada':
+            falso = EmbedderFalso(options['dimensoes'], latencia_s=options['latencia_ms'] / 1000)
+            return lambda texto: falso.embeddar_lote([texto])[0], falso.embeddar_lote, falso.dimensoes
+        if backend not in backends():
+            raise ValueError(f"Backend desconhecido: {backend} (disponíveis: api_simulada, {', '.join(backends())})")
+        opcoes = {'dimensions': options['dimensoes']} if backend == 'hashing' else {}
+        embedder = embedder_configurado('benchmark', {'backend': backend, 'opcoes': opcoes}).embedder
+        return embedder.get_embedding, EmbedderAgno(embedder).embeddar_lote, embedder.dimensions
+
+    def _medir(self, embeddar_consulta, embeddar_lote, chunks, trechos, tamanho_lote) -> dict:
+        latencias = []
+        consultas = []
+        for _, trecho in trechos:
+            inicio = time.perf_counter()
+            consultas.append(embeddar_consulta(trecho))
+            latencias.append((time.perf_counter() - inicio) * 1000)
+
+        inicio = time.perf_counter()
+        vetores = []
+        for i in range(0, len(chunks), tamanho_lote):
+            vetores.extend(embeddar_lote(chunks[i:i + tamanho_lote]))
+        segundos_lote = time.perf_counter() - inicio
+
+        matriz = np.asarray(vetores, dtype=np.float32)
+        matriz /= np.maximum(np.linalg.norm(matriz, axis=1, keepdims=True), 1e-12)
+        similaridades = np.asarray(consultas, dtype=np.float32) @ matriz.T
+        top5 = np.argsort(-similaridades, axis=1)[:, :5]
+        acertos = sum(origem in linha for (origem, _), linha in zip(trechos, top5))
+        return {
+            'consulta_p50_ms': round(statistics.median(latencias), 3),
+            'consulta_p95_ms': round(_percentil(latencias, 95), 3),
+            'chunks_por_segundo': round(len(chunks) / segundos_lote, 1) if segundos_lote else 0.0,
+            'segundos_lote': round(segundos_lote, 3),
+            'recall_5': round(acertos / len(trechos), 3) if trechos else 0.0,
+        }
@@ -0,0 +1,91 @@
+"""
+Etapa de ingestão do RAG (ia/ingestao.py) com o embedder falso, offline.
+
+Divide um texto jurídico sintético em chunks e mede chunks/s e latência por
+lote variando o tamanho do lote e a concorrência; --latencia-ms simula o
+tempo de resposta de uma API de embeddings por chamada.
+
+Depois mede o cache de embeddings (em um arquivo temporário): o documento
+sem cache, de novo com o cache quente e uma revisão com --paginas-alteradas
+páginas trocadas, que só reenvia ao embedder os chunks que mudaram.
+
+Uso:
+    python manage.py benchmark_ingestao --paginas 200
+    python manage.py benchmark_ingestao --tamanho-lote 16 64 --concorrencia 1 4 8 --latencia-ms 150
+    python manage.py benchmark_ingestao --paginas 200 --paginas-alteradas 10
+"""
+import json
+import os
+import tempfile
+
+from django.core.management.base import BaseCommand
+
+from ia.benchmark_utils import gerar_texto_pagina
+from ia.cache_embeddings import CacheEmbeddings
+from ia.ingestao import ChunkerJuridico, EmbedderFalso, IngestaoRAG
+from ia.ocr_utils import montar_texto_paginas
+
+
+class Command(BaseCommand):
+    help = "Mede chunks/s e latência de embedding da ingestão do RAG com um embedder falso"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--paginas', type=int, default=100)
+        parser.add_argument('--tamanho-chunk', type=int, default=1500)
+        parser.add_argument('--sobreposicao', type=int, default=200)
+        parser.add_argument('--tamanho-lote', type=int, nargs='+', default=[16, 64])
+        parser.add_argument('--concorrencia', type=int, nargs='+', default=[1, 4])
+        parser.add_argument('--latencia-ms', type=float, default=100.0, help="Espera simulada por chamada")
+        parser.add_argument('--dimensoes', type=int, default=256)
+        parser.add_argument('--paginas-alteradas', type=int, default=5, help="Páginas trocadas na revisão")
+
+    def handle(self, *args, **options):
+        texto = montar_texto_paginas({
+            i: gerar_texto_pagina(semente=i) for i in range(options['paginas'])
+        })
+        chunker = ChunkerJuridico(options['tamanho_chunk'], options['sobreposicao'])
+        embedder = EmbedderFalso(options['dimensoes'], latencia_s=options['latencia_ms'] / 1000)
+
+        resultados = []
+        for tamanho_lote in options['tamanho_lote']:
+            for concorrencia in options['concorrencia']:
+                ingestao = IngestaoRAG(embedder, chunker, tamanho_lote=tamanho_lote, concorrencia=concorrencia)
+                _, _, metricas = ingestao.processar(texto)
+                resumo = metricas.resumo()
+                resultados.append({'tamanho_lote': tamanho_lote, 'concorrencia': concorrencia, **resumo})
+                self.stderr.write(
+                    f"lote {tamanho_lote}, concorrência {concorrencia}: {resumo['chunks_por_segundo']} chunks/s"
+                )
+
+        self.stdout.write(json.dumps({
+            'paginas': options['paginas'],
+            'caracteres': len(texto),
+            'tamanho_chunk': options['tamanho_chunk'],
+            'sobreposicao': options['sobreposicao'],
+            'latencia_ms': options['latencia_ms'],
+            'resultados': resultados,
+            'cache': self._medir_cache(texto, chunker, embedder, options),
+        }, indent=2, ensure_ascii=False))
+
+    def _medir_cache(self, texto: str, chunker: ChunkerJuridico, embedder: EmbedderFalso, options) -> dict:
+        alteradas = min(options['paginas_alteradas'], options['paginas'])
+        revisao = montar_texto_paginas({
+            i: gerar_texto_pagina(semente=options['paginas'] + i if i < alteradas else i)
+            for i in range(options['paginas'])
+        })
+        resultados = {}
+        with tempfile.TemporaryDirectory() as diretorio:
+            cache = CacheEmbeddings(os.path.join(diretorio, 'cache_embeddings.sqlite3'))
+            ingestao = IngestaoRAG(
+                embedder, chunker, tamanho_lote=max(options['tamanho_lote']),
+                concorrencia=max(options['concorrencia']), cache=cache,
+            )
+            for nome, documento in (('frio', texto), ('quente', texto), ('revisao', revisao)):
+                _, _, metricas = ingestao.processar(documento)
+                resultados[nome] = metricas.resumo()
+                self.stderr.write(
+                    f"cache {nome}: {resultados[nome]['taxa_acerto_cache']:.0%} de acerto, "
+                    f"{resultados[nome]['chamadas_evitadas']} chamada(s) evitada(s)"
+                )
+            resultados['estatisticas'] = cache.estatisticas()
+        return {'paginas_alteradas': alteradas, **resultados}
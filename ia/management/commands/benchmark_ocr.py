@@ -0,0 +1,159 @@
+"""
+Benchmark offline dos caminhos de OCR sobre um corpus sintético.
+
+Gera localmente PDFs nativos (com camada de texto), PDFs "digitalizados"
+(rasterizados com ruído e inclinação) e imagens, roda cada ponto de entrada
+(Docling, RapidOCR e pool paralelo) e reporta páginas/s, tempo total, pico de
+RSS e acurácia de caracteres contra o texto original, em JSON. Serve para
+calibrar o roteamento em usuarios/signals.py e pegar regressões.
+
+Cada medição roda em um processo filho (spawn), para que o pico de memória e
+os modelos carregados de um motor não contaminem o próximo.
+
+Uso:
+    python manage.py benchmark_ocr --paginas 4
+    python manage.py benchmark_ocr --motores rapidocr paralelo --tipos digitalizado --saida bench.json
+"""
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from ia.benchmark_utils import (
+    MonitorMemoria,
+    acuracia_caracteres,
+    digitalizar,
+    gerar_pagina_sintetica,
+    gerar_pdf_nativo,
+    gerar_texto_pagina,
+)
+
+MOTORES = ['docling', 'rapidocr', 'paralelo']
+TIPOS = ['nativo', 'digitalizado', 'imagem']
+
+
+def _extrator(motor: str):
+    from ia import tasks_otimizado
+
+    return {
+        'docling': tasks_otimizado.extrair_texto_docling,
+        'rapidocr': tasks_otimizado.extrair_texto_rapidocr,
+        'paralelo': tasks_otimizado.extrair_texto_paralelo,
+    }[motor]
+
+
+def _medir(motor: str, caminho: str, esperado: str, conexao):
+    """Executado no processo filho: roda o extrator sem cache e envia as métricas"""
+    import django
+    django.setup()
+    from ia.ocr_utils import montar_texto_paginas
+
+    try:
+        extrair = _extrator(motor)
+        with MonitorMemoria() as monitor:
+            inicio = time.perf_counter()
+            textos, pendentes, _ = extrair(caminho, cache_paginas=None)
+            tempo = time.perf_counter() - inicio
+
+        if motor == 'paralelo':
+            from ia.ocr_pool import descartar_pool
+            descartar_pool()
+
+        texto = montar_texto_paginas(textos) if caminho.endswith('.pdf') else textos[0]
+        conexao.send({
+            'paginas': len(textos),
+            'paginas_ocr': len(pendentes),
+            'segundos': round(tempo, 3),
+            'paginas_por_segundo': round(len(textos) / tempo, 3) if tempo else None,
+            'pico_rss_mb': round(monitor.pico_mb, 1),
+            'acuracia_caracteres': round(acuracia_caracteres(texto, esperado), 4),
+        })
+    except Exception as e:
+        conexao.send({'erro': f"{type(e).__name__}: {e}"})
+    finally:
+        conexao.close()
+
+
+class Command(BaseCommand):
+    help = "Benchmark offline dos motores de OCR (páginas/s, pico de RSS e acurácia) sobre corpus sintético"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--paginas', type=int, default=2, help="Páginas por documento do corpus")
+        parser.add_argument('--motores', nargs='+', choices=MOTORES, default=MOTORES)
+        parser.add_argument('--tipos', nargs='+', choices=TIPOS, default=TIPOS)
+        parser.add_argument('--ruido', type=float, default=12.0, help="Desvio do ruído das digitalizações")
+        parser.add_argument('--inclinacao', type=float, default=1.5, help="Inclinação máxima (graus)")
+        parser.add_argument('--saida', help="Grava o JSON também neste arquivo")
+
+    def _gerar_corpus(self, diretorio: str, options) -> dict:
+        """Retorna {tipo: (caminho, texto esperado)}"""
+        textos = [gerar_texto_pagina(semente=i) for i in range(options['paginas'])]
+        esperado = "\n".join(textos)
+        corpus = {}
+
+        if 'nativo' in options['tipos']:
+            caminho = os.path.join(diretorio, 'nativo.pdf')
+            gerar_pdf_nativo(textos, caminho)
+            corpus['nativo'] = (caminho, esperado)
+
+        paginas = [
+            digitalizar(gerar_pagina_sintetica(texto), options['ruido'], options['inclinacao'], semente=i)
+            for i, texto in enumerate(textos)
+        ]
+        if 'digitalizado' in options['tipos']:
+            caminho = os.path.join(diretorio, 'digitalizado.pdf')
+            paginas[0].save(caminho, save_all=True, append_images=paginas[1:], resolution=150)
+            corpus['digitalizado'] = (caminho, esperado)
+        if 'imagem' in options['tipos']:
+            caminho = os.path.join(diretorio, 'imagem.png')
+            paginas[0].save(caminho)
+            corpus['imagem'] = (caminho, textos[0])
+
+        return corpus
+
+    def handle(self, *args, **options):
+        contexto = multiprocessing.get_context('spawn')
+        resultados = []
+
+        with tempfile.TemporaryDirectory() as diretorio:
+            corpus = self._gerar_corpus(diretorio, options)
+
+            for motor in options['motores']:
+                for tipo, (caminho, esperado) in corpus.items():
+                    receber, enviar = contexto.Pipe(duplex=False)
+                    filho = contexto.Process(target=_medir, args=(motor, caminho, esperado, enviar))
+                    filho.start()
+                    enviar.close()
+                    try:
+                        metricas = receber.recv()
+                    except EOFError:
+                        metricas = {'erro': f"processo encerrado com código {filho.exitcode}"}
+                    filho.join()
+
+                    resultados.append({'motor': motor, 'tipo': tipo, **metricas})
+                    if 'erro' in metricas:
+                        self.stderr.write(f"{motor}/{tipo}: {metricas['erro']}")
+                    else:
+                        self.stderr.write(
+                            f"{motor}/{tipo}: {metricas['paginas_por_segundo']} páginas/s, "
+                            f"acurácia {metricas['acuracia_caracteres']:.1%}"
+                        )
+
+        saida = json.dumps({
+            'corpus': {
+                'paginas_por_documento': options['paginas'],
+                'tipos': options['tipos'],
+                'ruido': options['ruido'],
+                'inclinacao': options['inclinacao'],
+            },
+            'nucleos': os.cpu_count(),
+            'resultados': resultados,
+        }, indent=2, ensure_ascii=False)
+
+        if options['saida']:
+            with open(options['saida'], 'w', encoding='utf-8') as f:
+                f.write(saida)
+        self.stdout.write(saida)
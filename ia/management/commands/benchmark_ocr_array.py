@@ -0,0 +1,75 @@
+"""
+Compara o pipeline antigo (JPEG temporário em disco) com o pipeline em memória
+do OCROptimizado, em páginas por segundo.
+
+Uso:
+    python manage.py benchmark_ocr_array --paginas 10
+    python manage.py benchmark_ocr_array --pdf caminho/arquivo.pdf --dpi 150
+"""
+import json
+import os
+import tempfile
+
+import cv2
+from django.core.management.base import BaseCommand
+
+from ia.benchmark_utils import cronometrar, gerar_paginas_sinteticas
+from ia.ocr_utils import OCROptimizado
+
+
+def _pipeline_jpeg_temporario(ocr: OCROptimizado, img, diretorio: str, idx: int) -> str:
+    """Reproduz o caminho anterior: JPEG → imread → _processed → OCR por caminho"""
+    temp_path = os.path.join(diretorio, f"page_{idx}.jpg")
+    img.save(temp_path, 'JPEG', quality=85)
+    gray = ocr.preparar_array(cv2.imread(temp_path))
+    processed_path = temp_path.replace('.', '_processed.')
+    cv2.imwrite(processed_path, gray)
+    texto = ocr.processar_imagem(processed_path)
+    os.remove(processed_path)
+    os.remove(temp_path)
+    return texto
+
+
+class Command(BaseCommand):
+    help = "Benchmark do OCR em memória (processar_array) contra o fluxo com JPEG temporário"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pdf', help="PDF real a usar (padrão: páginas sintéticas)")
+        parser.add_argument('--paginas', type=int, default=5, help="Páginas sintéticas a gerar")
+        parser.add_argument('--dpi', type=int, default=150)
+        parser.add_argument('--repeticoes', type=int, default=1)
+
+    def handle(self, *args, **options):
+        if options['pdf']:
+            from pdf2image import convert_from_path
+            imagens = convert_from_path(options['pdf'], dpi=options['dpi'])
+        else:
+            imagens = [img for _, img in gerar_paginas_sinteticas(options['paginas'])]
+
+        ocr = OCROptimizado()
+        num_paginas = len(imagens)
+
+        with tempfile.TemporaryDirectory() as diretorio:
+            tempo_antes = cronometrar(
+                lambda: [_pipeline_jpeg_temporario(ocr, img, diretorio, i) for i, img in enumerate(imagens)],
+                options['repeticoes'],
+            )
+
+        tempo_depois = cronometrar(
+            lambda: [ocr.processar_array(OCROptimizado.array_de_pil(img)) for img in imagens],
+            options['repeticoes'],
+        )
+
+        resultado = {
+            'paginas': num_paginas,
+            'jpeg_temporario': {
+                'segundos': round(tempo_antes, 3),
+                'paginas_por_segundo': round(num_paginas / tempo_antes, 3),
+            },
+            'em_memoria': {
+                'segundos': round(tempo_depois, 3),
+                'paginas_por_segundo': round(num_paginas / tempo_depois, 3),
+            },
+            'ganho': round(tempo_antes / tempo_depois, 3),
+        }
+        self.stdout.write(json.dumps(resultado, indent=2, ensure_ascii=False))
@@ -0,0 +1,67 @@
+"""
+Reconhecimento em lote entre páginas no RapidOCR, em linhas/s (só CPU).
+
+Compara uma chamada do RapidOCR por página com o reconhecimento conjunto das
+linhas de várias páginas, variando rec_batch_num e as threads do ONNX.
+
+Uso:
+    python manage.py benchmark_ocr_lote --paginas 8
+    python manage.py benchmark_ocr_lote --rec-batch 6 32 64 --paginas-por-lote 1 4 8 --intra-op 2
+"""
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from ia.benchmark_utils import gerar_paginas_sinteticas
+from ia.ocr_utils import OCROptimizado, agrupar_em_lotes
+
+
+class Command(BaseCommand):
+    help = "Mede linhas/s do RapidOCR com reconhecimento em lote entre páginas"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--paginas', type=int, default=8)
+        parser.add_argument('--rec-batch', type=int, nargs='+', default=[6, 16])
+        parser.add_argument('--paginas-por-lote', type=int, nargs='+', default=[1, 4])
+        parser.add_argument('--intra-op', type=int, default=None, help="Threads ONNX por sessão")
+
+    def handle(self, *args, **options):
+        paginas = [
+            OCROptimizado.array_de_pil(img)
+            for _, img in gerar_paginas_sinteticas(options['paginas'])
+        ]
+
+        resultados = []
+        for rec_batch in options['rec_batch']:
+            ocr = OCROptimizado(intra_op_threads=options['intra_op'], rec_batch_num=rec_batch)
+            # Primeira inferência aloca as sessões; fica fora da medição
+            ocr.reconhecer_array(paginas[0])
+
+            for por_lote in options['paginas_por_lote']:
+                inicio = time.perf_counter()
+                linhas = 0
+                for lote in agrupar_em_lotes(iter(paginas), por_lote):
+                    for resultado in ocr.reconhecer_arrays(lote, lote=por_lote > 1):
+                        linhas += len(resultado.linhas)
+                tempo = time.perf_counter() - inicio
+
+                resultados.append({
+                    'rec_batch_num': rec_batch,
+                    'paginas_por_lote': por_lote,
+                    'linhas': linhas,
+                    'segundos': round(tempo, 3),
+                    'linhas_por_segundo': round(linhas / tempo, 2),
+                    'paginas_por_segundo': round(len(paginas) / tempo, 3),
+                })
+                self.stderr.write(
+                    f"rec_batch_num={rec_batch}, {por_lote} página(s)/lote: {linhas / tempo:.1f} linhas/s"
+                )
+
+        self.stdout.write(json.dumps({
+            'paginas': len(paginas),
+            'nucleos': os.cpu_count(),
+            'intra_op_threads': options['intra_op'],
+            'resultados': resultados,
+        }, indent=2, ensure_ascii=False))
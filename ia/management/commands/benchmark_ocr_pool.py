@@ -0,0 +1,71 @@
+"""
+Escalabilidade do pool de processos de OCR com 1/2/4/8 workers.
+
+Uso:
+    python manage.py benchmark_ocr_pool --paginas 16
+    python manage.py benchmark_ocr_pool --workers 1 2 4 --intra-op 2
+"""
+import json
+import os
+import time
+from concurrent.futures import as_completed
+
+from django.core.management.base import BaseCommand
+
+from ia.benchmark_utils import gerar_paginas_sinteticas
+from ia.ocr_pool import PoolOCR
+from ia.ocr_utils import OCROptimizado
+
+
+class Command(BaseCommand):
+    help = "Mede páginas/s do pool de OCR variando o número de processos"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+        parser.add_argument('--paginas', type=int, default=16)
+        parser.add_argument(
+            '--intra-op', type=int, default=None,
+            help="Threads ONNX por processo (padrão: núcleos / workers)",
+        )
+
+    def handle(self, *args, **options):
+        paginas = [
+            OCROptimizado.array_de_pil(img)
+            for _, img in gerar_paginas_sinteticas(options['paginas'])
+        ]
+        nucleos = os.cpu_count() or 1
+
+        resultados = []
+        base = None
+        for workers in options['workers']:
+            intra_op = options['intra_op'] or max(1, nucleos // workers)
+            pool = PoolOCR(workers=workers, intra_op_threads=intra_op)
+
+            inicio = time.perf_counter()
+            pool.iniciar()
+            tempo_aquecimento = time.perf_counter() - inicio
+
+            inicio = time.perf_counter()
+            futures = [pool.submeter(i, img) for i, img in enumerate(paginas)]
+            for future in as_completed(futures):
+                future.result()
+            tempo = time.perf_counter() - inicio
+            pool.encerrar()
+
+            paginas_por_segundo = len(paginas) / tempo
+            base = base or paginas_por_segundo
+            resultados.append({
+                'workers': workers,
+                'intra_op_threads': intra_op,
+                'aquecimento_s': round(tempo_aquecimento, 3),
+                'segundos': round(tempo, 3),
+                'paginas_por_segundo': round(paginas_por_segundo, 3),
+                'speedup': round(paginas_por_segundo / base, 3),
+            })
+            self.stderr.write(f"{workers} worker(s): {paginas_por_segundo:.2f} páginas/s")
+
+        self.stdout.write(json.dumps({
+            'paginas': len(paginas),
+            'nucleos': nucleos,
+            'resultados': resultados,
+        }, indent=2, ensure_ascii=False))
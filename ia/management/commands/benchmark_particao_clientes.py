@@ -0,0 +1,162 @@
+"""
+Latência da busca vetorial de um cliente conforme a tabela do LanceDB cresce
+com os chunks dos outros clientes (ia/busca_hibrida.py).
+
+O corpus do cliente medido fica fixo em --chunks-cliente linhas; a cada total
+de --totais as linhas dos demais clientes completam a tabela. Vetores
+aleatórios de --dimensoes dimensões, gravados direto na tabela (sem
+embedder); as consultas são vetores do cliente com ruído. Estratégias:
+    pos_filtro         busca na tabela inteira e filtra o meta_data depois
+                       (o LanceDb do agno): perde os resultados do cliente
+    payload_like       prefilter por LIKE no payload JSON
+    coluna_sem_indice  prefilter pela coluna cliente_id, sem índice
+    coluna_bitmap      prefilter pela coluna com índice BITMAP (o padrão)
+Recall: fração dos --limite vizinhos exatos do cliente retornados.
+
+Uso:
+    python manage.py benchmark_particao_clientes
+    python manage.py benchmark_particao_clientes --chunks-cliente 5000 --totais 20000 100000 500000
+"""
+import json
+import os
+import statistics
+import tempfile
+import time
+
+import numpy as np
+import pyarrow as pa
+from django.core.management.base import BaseCommand
+
+from ia import lancedb_agno
+from ia.busca_hibrida import COLUNA_CLIENTE, LanceDbHibrido
+from ia.embedders import embedder_configurado
+
+CLIENTE_MEDIDO = 1
+ESTRATEGIAS = ('pos_filtro', 'payload_like', 'coluna_sem_indice', 'coluna_bitmap')
+# Linhas por table.add
+_LOTE = 10000
+
+
+def _vetores(rng: np.random.Generator, quantidade: int, dimensoes: int) -> np.ndarray:
+    vetores = rng.standard_normal((quantidade, dimensoes), dtype=np.float32)
+    return vetores / np.linalg.norm(vetores, axis=1, keepdims=True)
+
+
+class Command(BaseCommand):
+    help = "Mede a latência da busca de um cliente com a tabela vetorial crescendo com os outros clientes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunks-cliente', type=int, default=2000)
+        parser.add_argument('--totais', type=int, nargs='+', default=[10000, 50000, 200000])
+        parser.add_argument('--clientes', type=int, default=50, help="Clientes que dividem as demais linhas")
+        parser.add_argument('--dimensoes', type=int, default=256)
+        parser.add_argument('--consultas', type=int, default=50)
+        parser.add_argument('--limite', type=int, default=5)
+        parser.add_argument('--semente', type=int, default=0)
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as diretorio:
+            resultado = self._executar(diretorio, options)
+        self.stdout.write(json.dumps(resultado, indent=2, ensure_ascii=False))
+
+    def _executar(self, diretorio: str, options) -> dict:
+        rng = np.random.default_rng(options['semente'])
+        dimensoes = options['dimensoes']
+        embedder = embedder_configurado('benchmark', {'backend': 'hashing', 'opcoes': {'dimensions': dimensoes}}).embedder
+        vector_db = LanceDbHibrido(table_name='benchmark', uri=os.path.join(diretorio, 'lance'), embedder=embedder)
+
+        do_cliente = _vetores(rng, options['chunks_cliente'], dimensoes)
+        self._gravar(vector_db, do_cliente, np.full(len(do_cliente), CLIENTE_MEDIDO), 0)
+        consultas = do_cliente[rng.integers(0, len(do_cliente), options['consultas'])]
+        consultas = consultas + _vetores(rng, len(consultas), dimensoes) * 0.5
+        # Vizinhos exatos dentro do corpus do cliente (distância L2 da tabela)
+        distancias = (do_cliente ** 2).sum(axis=1)[None, :] - 2 * consultas @ do_cliente.T
+        esperados = [set(linha) for linha in np.argsort(distancias, axis=1)[:, :options['limite']].tolist()]
+
+        filtros = {
+            'payload_like': f"payload LIKE '%\"meta_data\": {{\"cliente_id\": {CLIENTE_MEDIDO},%'",
+            'coluna_sem_indice': vector_db._filtro_cliente(CLIENTE_MEDIDO),
+            'coluna_bitmap': vector_db._filtro_cliente(CLIENTE_MEDIDO),
+        }
+        medicoes = []
+        linhas = len(do_cliente)
+        for total in sorted(options['totais']):
+            if total > linhas:
+                outros = _vetores(rng, total - linhas, dimensoes)
+                self._gravar(vector_db, outros, rng.integers(2, options['clientes'] + 2, len(outros)), linhas)
+                linhas = total
+            indice = vector_db.indice_cliente()
+            if indice is not None:
+                vector_db.table.drop_index(indice.name)
+
+            medicao = {'linhas': vector_db.table.count_rows(), 'chunks_cliente': len(do_cliente)}
+            for estrategia in ESTRATEGIAS:
+                if estrategia == 'coluna_bitmap':
+                    vector_db.preparar_coluna_cliente(retreinar=True)
+                medicao[estrategia] = self._medir(
+                    vector_db, consultas, esperados, options['limite'], filtros.get(estrategia)
+                )
+            medicoes.append(medicao)
+            self.stderr.write(
+                f"{medicao['linhas']} linhas: " + ', '.join(
+                    f"{estrategia} p50 {medicao[estrategia]['latencia_p50_ms']} ms"
+                    f" (recall {medicao[estrategia]['recall']})"
+                    for estrategia in ESTRATEGIAS
+                )
+            )
+
+        return {
+            'chunks_cliente': len(do_cliente),
+            'clientes': options['clientes'] + 1,
+            'dimensoes': dimensoes,
+            'consultas': len(consultas),
+            'limite': options['limite'],
+            'medicoes': medicoes,
+        }
+
+    def _gravar(self, vector_db: LanceDbHibrido, vetores: np.ndarray, clientes: np.ndarray, primeiro: int):
+        """Linhas no formato do LanceDbHibrido.insert, em lotes de _LOTE"""
+        coluna_id, coluna_vetor = lancedb_agno.coluna_id(vector_db), lancedb_agno.coluna_vetor(vector_db)
+        tipo_vetor = vector_db.table.schema.field(coluna_vetor).type
+        for inicio in range(0, len(vetores), _LOTE):
+            fim = min(inicio + _LOTE, len(vetores))
+            ids = [str(primeiro + i) for i in range(inicio, fim)]
+            lote_clientes = clientes[inicio:fim].tolist()
+            payloads = [
+                lancedb_agno.payload(
+                    f"documentos/benchmark_{cliente_id}.pdf", {"cliente_id": cliente_id, "chunk_id": id_linha},
+                    "", id_linha, "benchmark",
+                )
+                for id_linha, cliente_id in zip(ids, lote_clientes)
+            ]
+            vector_db.table.add(pa.table({
+                coluna_vetor: pa.FixedSizeListArray.from_arrays(
+                    pa.array(vetores[inicio:fim].ravel(), pa.float32()), type=tipo_vetor
+                ),
+                coluna_id: pa.array(ids),
+                lancedb_agno.COLUNA_PAYLOAD: pa.array(payloads),
+                COLUNA_CLIENTE: pa.array(lote_clientes, pa.int64()),
+            }))
+
+    def _medir(self, vector_db: LanceDbHibrido, consultas: np.ndarray, esperados, limite: int, filtro) -> dict:
+        coluna_id, coluna_vetor = lancedb_agno.coluna_id(vector_db), lancedb_agno.coluna_vetor(vector_db)
+        latencias = []
+        acertos = 0
+        for consulta, esperado in zip(consultas, esperados):
+            inicio = time.perf_counter()
+            busca = vector_db.table.search(consulta, vector_column_name=coluna_vetor).limit(limite)
+            if filtro:
+                busca = busca.where(filtro, prefilter=True)
+            linhas = busca.select([coluna_id, lancedb_agno.COLUNA_PAYLOAD, '_distance']).to_list()
+            if filtro is None:
+                linhas = [
+                    linha for linha in linhas
+                    if json.loads(linha[lancedb_agno.COLUNA_PAYLOAD])['meta_data'].get('cliente_id') == CLIENTE_MEDIDO
+                ]
+            latencias.append((time.perf_counter() - inicio) * 1000)
+            acertos += len({int(linha[coluna_id]) for linha in linhas} & esperado)
+        return {
+            'latencia_p50_ms': round(statistics.median(latencias), 2),
+            'latencia_p95_ms': round(float(np.percentile(latencias, 95)), 2),
+            'recall': round(acertos / (limite * len(consultas)), 3),
+        }
@@ -0,0 +1,70 @@
+"""
+Recalibra os coeficientes do modelo de custo do roteamento de OCR.
+
+Ajusta, por estratégia, tempo = fixo + por_pagina * páginas de OCR /
+paralelismo + por_mb * MB sobre as rotas registradas em RotaOCR com tempo
+real, e compara o erro dos coeficientes atuais com o dos sugeridos. O JSON
+de saída tem o formato de settings.OCR_ROTEAMENTO['custos'].
+
+Uso:
+    python manage.py calibrar_roteamento_ocr
+    python manage.py calibrar_roteamento_ocr --ultimas 500
+"""
+import json
+
+from django.core.management.base import BaseCommand
+
+from ia.models import RotaOCR
+from ia.roteamento_ocr import ESTRATEGIAS, ModeloCusto, ajustar_coeficientes
+
+
+class Command(BaseCommand):
+    help = "Ajusta os coeficientes do modelo de custo do OCR aos tempos reais registrados"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ultimas', type=int, default=1000, help="Rotas mais recentes usadas por estratégia")
+
+    def handle(self, *args, **options):
+        modelo = ModeloCusto.de_settings()
+        resultados = {}
+
+        for estrategia in ESTRATEGIAS:
+            rotas = (
+                RotaOCR.objects
+                .filter(estrategia=estrategia, tempo_real__isnull=False)
+                .order_by('-data_criacao')[:options['ultimas']]
+            )
+            amostras = [
+                (r.paginas_ocr / max(r.paralelismo, 1.0), r.tamanho_bytes / (1024 * 1024), r.tempo_real)
+                for r in rotas
+            ]
+            if not amostras:
+                continue
+
+            atual = modelo.custos[estrategia]
+            erro_atual = sum(
+                abs(atual['fixo'] + atual['por_pagina'] * paginas + atual['por_mb'] * mb - tempo)
+                for paginas, mb, tempo in amostras
+            ) / len(amostras)
+
+            sugerido = ajustar_coeficientes(amostras)
+            resultados[estrategia] = {
+                'amostras': len(amostras),
+                'atual': {**atual, 'erro_medio_s': round(erro_atual, 3)},
+                'sugerido': sugerido,
+            }
+            if sugerido is None:
+                self.stderr.write(f"{estrategia}: {len(amostras)} amostra(s), poucas para ajustar")
+            else:
+                self.stderr.write(
+                    f"{estrategia}: erro médio {erro_atual:.2f}s -> {sugerido['erro_medio_s']:.2f}s "
+                    f"({len(amostras)} amostras)"
+                )
+
+        self.stdout.write(json.dumps({
+            'resultados': resultados,
+            'custos': {
+                e: {k: v for k, v in r['sugerido'].items() if k in ('fixo', 'por_pagina', 'por_mb')}
+                for e, r in resultados.items() if r['sugerido']
+            },
+        }, indent=2, ensure_ascii=False))
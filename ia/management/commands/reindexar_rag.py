@@ -0,0 +1,116 @@
+"""
+Situação e controle da reindexação do RAG após a troca de embedder
+(settings.EMBEDDER_RAG), em JSON.
+
+Sem opções mostra, por embedder, documentos e chunks indexados e quantos
+documentos faltam para o embedder ativo.
+
+Uso:
+    python manage.py reindexar_rag
+    python manage.py reindexar_rag --iniciar
+    python manage.py reindexar_rag --descartar-antigos
+    python manage.py reindexar_rag --lexico
+    python manage.py reindexar_rag --otimizar
+"""
+import json
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from ia.agents import JuriAI
+from ia.busca_hibrida import obter_indice_lexico
+from ia.indice_vetorial import sincronizar_lexico
+from ia.ingestao import ChunkerJuridico
+from ia.models import ChunkIndexado
+from ia.tasks_otimizado import (
+    descartar_embedders_antigos, documentos_sem_indice, iniciar_reindexacao_embedder,
+)
+from usuarios.models import Documentos
+
+
+class Command(BaseCommand):
+    help = "Mostra e controla a reindexação completa do RAG para o embedder configurado"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iniciar', action='store_true',
+            help="Enfileira a reindexação dos documentos sem vetores do embedder ativo",
+        )
+        parser.add_argument(
+            '--descartar-antigos', action='store_true',
+            help="Apaga tabelas e manifestos dos outros embedders mesmo com documentos pendentes",
+        )
+        parser.add_argument(
+            '--lexico', action='store_true',
+            help="Grava no índice léxico da busca híbrida os documentos já indexados (sem embeddings)",
+        )
+        parser.add_argument(
+            '--otimizar', action='store_true',
+            help="Cria ou retreina o índice de cliente_id da tabela vetorial e compacta a tabela",
+        )
+
+    def handle(self, *args, **options):
+        if options['iniciar']:
+            if iniciar_reindexacao_embedder():
+                self.stderr.write(f"Reindexação para {JuriAI.EMBEDDER.assinatura} enfileirada")
+            else:
+                self.stderr.write(f"Reindexação para {JuriAI.EMBEDDER.assinatura} já em andamento")
+        if options['descartar_antigos']:
+            descartar_embedders_antigos()
+        if options['lexico']:
+            self._sincronizar_lexico()
+        if options['otimizar']:
+            self._otimizar()
+
+        por_embedder = (
+            ChunkIndexado.objects
+            .values('embedder')
+            .annotate(documentos=Count('documento', distinct=True), chunks=Count('id'))
+            .order_by('embedder')
+        )
+        self.stdout.write(json.dumps({
+            'ativo': {
+                'backend': JuriAI.EMBEDDER.backend,
+                'assinatura': JuriAI.EMBEDDER.assinatura,
+                'tabela': JuriAI.EMBEDDER.tabela,
+                'local': JuriAI.EMBEDDER.local,
+                'documentos_pendentes': documentos_sem_indice(JuriAI.EMBEDDER.assinatura).count(),
+            },
+            'embedders': list(por_embedder),
+            'tabela_vetorial': self._estatisticas_tabela(),
+            'indice_lexico': obter_indice_lexico().estatisticas(),
+        }, indent=2, ensure_ascii=False))
+
+    def _sincronizar_lexico(self):
+        chunker = ChunkerJuridico.de_settings()
+        indice = obter_indice_lexico()
+        documentos = (
+            Documentos.objects
+            .filter(id__in=ChunkIndexado.objects.filter(embedder=JuriAI.EMBEDDER.assinatura).values('documento_id'))
+            .select_related('conteudo')
+            .order_by('id')
+        )
+        regravados = 0
+        for documento in documentos.iterator(chunk_size=100):
+            regravados += sincronizar_lexico(documento, chunker, indice, JuriAI.knowledge.name or '')
+        self.stderr.write(f"Índice léxico: {regravados} documento(s) regravado(s)")
+
+    def _otimizar(self):
+        vector_db = JuriAI.knowledge.vector_db
+        if vector_db.table is None:
+            return
+        vector_db.preparar_coluna_cliente(retreinar=True)
+        vector_db.table.optimize()
+        self.stderr.write(f"Tabela {vector_db.table_name} otimizada")
+
+    def _estatisticas_tabela(self) -> dict:
+        vector_db = JuriAI.knowledge.vector_db
+        if vector_db.table is None:
+            return {'linhas': 0}
+        indice = vector_db.indice_cliente() if vector_db.tem_coluna_cliente else None
+        return {
+            'linhas': vector_db.table.count_rows(),
+            'coluna_cliente': vector_db.tem_coluna_cliente,
+            'indice_cliente': indice.name if indice else None,
+            'linhas_fora_do_indice': vector_db.linhas_fora_do_indice() if indice else None,
+        }
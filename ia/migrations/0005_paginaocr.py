@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-17 11:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuarios', '0002_documentos'),
+        ('ia', '0004_whatsapp_models'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaginaOCR',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pagina', models.PositiveIntegerField()),
+                ('origem', models.CharField(choices=[('text-layer', 'Camada de texto'), ('ocr', 'OCR')], max_length=20)),
+                ('caracteres', models.PositiveIntegerField(default=0)),
+                ('data_processamento', models.DateTimeField(auto_now=True)),
+                ('documento', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='paginas_ocr', to='usuarios.documentos')),
+            ],
+            options={
+                'verbose_name': 'Página OCR',
+                'verbose_name_plural': 'Páginas OCR',
+                'ordering': ['documento', 'pagina'],
+                'unique_together': {('documento', 'pagina')},
+            },
+        ),
+    ]
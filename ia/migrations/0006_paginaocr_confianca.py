@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-17 11:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ia', '0005_paginaocr'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paginaocr',
+            name='confianca',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='paginaocr',
+            name='dpi',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-17 11:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ia', '0006_paginaocr_confianca'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paginaocr',
+            name='hash_documento',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='paginaocr',
+            name='texto',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-17 11:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuarios', '0003_documentos_hash_conteudo'),
+        ('ia', '0007_paginaocr_checkpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProcessamentoOCR',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('grupo', models.CharField(blank=True, db_index=True, default='', max_length=100)),
+                ('motor', models.CharField(blank=True, default='', max_length=20)),
+                ('status', models.CharField(choices=[('processando', 'Processando'), ('montando', 'Montando'), ('concluido', 'Concluído'), ('erro', 'Erro')], default='processando', max_length=20)),
+                ('total_paginas', models.PositiveIntegerField(default=0)),
+                ('faixas_total', models.PositiveIntegerField(default=0)),
+                ('faixas_concluidas', models.PositiveIntegerField(default=0)),
+                ('erro', models.TextField(blank=True, default='')),
+                ('data_inicio', models.DateTimeField(auto_now_add=True)),
+                ('data_atualizacao', models.DateTimeField(auto_now=True)),
+                ('data_conclusao', models.DateTimeField(blank=True, null=True)),
+                ('documento', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='processamento_ocr', to='usuarios.documentos')),
+            ],
+            options={
+                'verbose_name': 'Processamento OCR',
+                'verbose_name_plural': 'Processamentos OCR',
+                'ordering': ['-data_inicio'],
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.30 on 2026-10-17 11:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuarios', '0003_documentos_hash_conteudo'),
+        ('ia', '0008_processamentoocr'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RotaOCR',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estrategia', models.CharField(choices=[('camada_texto', 'Camada de texto'), ('rapidocr', 'RapidOCR'), ('docling', 'Docling'), ('paralelo', 'Paralelo'), ('faixas', 'Faixas')], max_length=20)),
+                ('paginas', models.PositiveIntegerField(default=0)),
+                ('paginas_ocr', models.PositiveIntegerField(default=0)),
+                ('tamanho_bytes', models.BigIntegerField(default=0)),
+                ('proporcao_camada_texto', models.FloatField(default=0.0)),
+                ('fila', models.PositiveIntegerField(default=0)),
+                ('paralelismo', models.FloatField(default=1.0)),
+                ('estimativas', models.JSONField(default=dict)),
+                ('custo_estimado', models.FloatField(default=0.0)),
+                ('tempo_real', models.FloatField(blank=True, null=True)),
+                ('data_criacao', models.DateTimeField(auto_now_add=True)),
+                ('data_conclusao', models.DateTimeField(blank=True, null=True)),
+                ('documento', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rotas_ocr', to='usuarios.documentos')),
+            ],
+            options={
+                'verbose_name': 'Rota OCR',
+                'verbose_name_plural': 'Rotas OCR',
+                'ordering': ['-data_criacao'],
+            },
+        ),
+    ]
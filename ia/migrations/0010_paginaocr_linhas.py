@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 11:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ia', '0009_rotaocr'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paginaocr',
+            name='linhas',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.30 on 2026-10-17 12:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuarios', '0006_conteudo_documento'),
+        ('ia', '0010_paginaocr_linhas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChunkIndexado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hash', models.CharField(max_length=64)),
+                ('ocorrencia', models.PositiveIntegerField(default=0)),
+                ('id_vetor', models.CharField(max_length=64, unique=True)),
+                ('indice', models.PositiveIntegerField()),
+                ('pagina', models.PositiveIntegerField(blank=True, null=True)),
+                ('secao', models.CharField(blank=True, default='', max_length=255)),
+                ('data_criacao', models.DateTimeField(auto_now_add=True)),
+                ('documento', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks_indexados', to='usuarios.documentos')),
+            ],
+            options={
+                'verbose_name': 'Chunk indexado',
+                'verbose_name_plural': 'Chunks indexados',
+                'ordering': ['documento', 'indice'],
+                'unique_together': {('documento', 'hash', 'ocorrencia')},
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-17 12:20
+
+from django.db import migrations, models
+
+# Chunks indexados antes do registro de embedders vieram do OpenAIEmbedder padrão
+ASSINATURA_LEGADA = 'openai:text-embedding-3-small:1536'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ia', '0011_chunkindexado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chunkindexado',
+            name='embedder',
+            field=models.CharField(db_index=True, default=ASSINATURA_LEGADA, max_length=255),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='chunkindexado',
+            name='id_vetor',
+            field=models.CharField(max_length=64),
+        ),
+        migrations.AlterUniqueTogether(
+            name='chunkindexado',
+            unique_together={('documento', 'embedder', 'hash', 'ocorrencia'), ('embedder', 'id_vetor')},
+        ),
+    ]
@@ -108,3 +108,150 @@ class AgendamentoWhatsApp(models.Model):
     
     def __str__(self):
         return f"{self.conversa.phone} - {self.data_hora.strftime('%d/%m/%Y %H:%M')}"
+
+class PaginaOCR(models.Model):
+    """
+    Proveniência de cada página do texto de um documento:
+    camada de texto do PDF ou OCR
+    """
+    ORIGEM_CHOICES = [
+        ('text-layer', 'Camada de texto'),
+        ('ocr', 'OCR'),
+    ]
+
+    documento = models.ForeignKey(Documentos, on_delete=models.CASCADE, related_name='paginas_ocr')
+    pagina = models.PositiveIntegerField()  # base 1
+    origem = models.CharField(max_length=20, choices=ORIGEM_CHOICES)
+    caracteres = models.PositiveIntegerField(default=0)
+    # Checkpoint: texto da página e hash do arquivo em que foi extraído
+    texto = models.TextField(blank=True, default='')
+    hash_documento = models.CharField(max_length=64, blank=True, default='', db_index=True)
+    # Só para páginas de OCR processadas nesta execução (não vindas do cache)
+    confianca = models.FloatField(null=True, blank=True)
+    dpi = models.PositiveSmallIntegerField(null=True, blank=True)
+    # Linhas, caixas e confianças (.npz compacto, ia/sidecar_ocr.py)
+    linhas = models.BinaryField(null=True, blank=True)
+    data_processamento = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['documento', 'pagina']
+        unique_together = [('documento', 'pagina')]
+        verbose_name = 'Página OCR'
+        verbose_name_plural = 'Páginas OCR'
+
+    def __str__(self):
+        return f"{self.documento_id} - página {self.pagina} ({self.origem})"
+
+class ProcessamentoOCR(models.Model):
+    """
+    Andamento do OCR de um documento dividido em faixas de páginas
+    (fan-out em um grupo do django-q, fan-in ao concluir a última faixa)
+    """
+    STATUS_CHOICES = [
+        ('processando', 'Processando'),
+        ('montando', 'Montando'),
+        ('concluido', 'Concluído'),
+        ('erro', 'Erro'),
+    ]
+
+    documento = models.OneToOneField(Documentos, on_delete=models.CASCADE, related_name='processamento_ocr')
+    grupo = models.CharField(max_length=100, blank=True, default='', db_index=True)
+    motor = models.CharField(max_length=20, blank=True, default='')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='processando')
+    total_paginas = models.PositiveIntegerField(default=0)
+    faixas_total = models.PositiveIntegerField(default=0)
+    faixas_concluidas = models.PositiveIntegerField(default=0)
+    erro = models.TextField(blank=True, default='')
+    data_inicio = models.DateTimeField(auto_now_add=True)
+    data_atualizacao = models.DateTimeField(auto_now=True)
+    data_conclusao = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-data_inicio']
+        verbose_name = 'Processamento OCR'
+        verbose_name_plural = 'Processamentos OCR'
+
+    def __str__(self):
+        return f"{self.documento_id} - {self.status} ({self.faixas_concluidas}/{self.faixas_total} faixas)"
+
+    def progresso(self) -> dict:
+        """Faixas e páginas concluídas, para consulta enquanto o grupo roda"""
+        paginas_concluidas = self.documento.paginas_ocr.count()
+        return {
+            'documento_id': self.documento_id,
+            'status': self.status,
+            'motor': self.motor,
+            'faixas_total': self.faixas_total,
+            'faixas_concluidas': self.faixas_concluidas,
+            'total_paginas': self.total_paginas,
+            'paginas_concluidas': paginas_concluidas,
+            'percentual': round(100 * paginas_concluidas / self.total_paginas, 1) if self.total_paginas else 0.0,
+            'erro': self.erro,
+            'data_inicio': self.data_inicio.isoformat(),
+            'data_conclusao': self.data_conclusao.isoformat() if self.data_conclusao else None,
+        }
+
+class RotaOCR(models.Model):
+    """
+    Estratégia de OCR escolhida pelo modelo de custo (ia/roteamento_ocr.py),
+    com as entradas usadas e o tempo real, para recalibração
+    """
+    ESTRATEGIA_CHOICES = [
+        ('camada_texto', 'Camada de texto'),
+        ('rapidocr', 'RapidOCR'),
+        ('docling', 'Docling'),
+        ('paralelo', 'Paralelo'),
+        ('faixas', 'Faixas'),
+    ]
+
+    documento = models.ForeignKey(Documentos, on_delete=models.CASCADE, related_name='rotas_ocr')
+    estrategia = models.CharField(max_length=20, choices=ESTRATEGIA_CHOICES)
+    paginas = models.PositiveIntegerField(default=0)
+    paginas_ocr = models.PositiveIntegerField(default=0)
+    tamanho_bytes = models.BigIntegerField(default=0)
+    proporcao_camada_texto = models.FloatField(default=0.0)
+    fila = models.PositiveIntegerField(default=0)
+    paralelismo = models.FloatField(default=1.0)
+    # Segundos estimados por estratégia candidata
+    estimativas = models.JSONField(default=dict)
+    custo_estimado = models.FloatField(default=0.0)
+    # Execução do OCR (sem a espera da própria task na fila); nulo até concluir
+    tempo_real = models.FloatField(null=True, blank=True)
+    data_criacao = models.DateTimeField(auto_now_add=True)
+    data_conclusao = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-data_criacao']
+        verbose_name = 'Rota OCR'
+        verbose_name_plural = 'Rotas OCR'
+
+    def __str__(self):
+        return f"{self.documento_id} - {self.estrategia} ({self.custo_estimado:.1f}s estimados)"
+
+class ChunkIndexado(models.Model):
+    """
+    Chunk de um documento gravado no banco vetorial. O manifesto permite
+    reindexar só o que mudou no texto e apagar os vetores do documento
+    sem varrer a tabela
+    """
+    documento = models.ForeignKey(Documentos, on_delete=models.CASCADE, related_name='chunks_indexados')
+    # Assinatura do embedder (ia/embedders.py); cada um tem a própria tabela
+    embedder = models.CharField(max_length=255, db_index=True)
+    # Hash do texto normalizado do chunk e repetição dele no documento
+    hash = models.CharField(max_length=64)
+    ocorrencia = models.PositiveIntegerField(default=0)
+    # Id da linha na tabela do embedder
+    id_vetor = models.CharField(max_length=64)
+    indice = models.PositiveIntegerField()
+    pagina = models.PositiveIntegerField(null=True, blank=True)
+    secao = models.CharField(max_length=255, blank=True, default='')
+    data_criacao = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['documento', 'indice']
+        unique_together = [('documento', 'embedder', 'hash', 'ocorrencia'), ('embedder', 'id_vetor')]
+        verbose_name = 'Chunk indexado'
+        verbose_name_plural = 'Chunks indexados'
+
+    def __str__(self):
+        return f"{self.documento_id} - chunk {self.indice}"
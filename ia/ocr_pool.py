@@ -0,0 +1,199 @@
+"""
+Pool de processos de OCR com uma sessão RapidOCR aquecida por worker
+
+Cada processo carrega o RapidOCR uma única vez (no initializer) e depois
+atende páginas de qualquer documento. Assim o pré-processamento com OpenCV e
+a cola em Python deixam de disputar o GIL, e cada worker tem sua própria
+sessão ONNX.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+WORKERS_PADRAO = 4
+INTRA_OP_THREADS_PADRAO = 1
+
+# Instância de OCR do processo worker (criada no initializer)
+_ocr_worker = None
+# Cadeias de pré-processamento do worker, por tupla de etapas
+_preprocessadores: Dict[Tuple[str, ...], object] = {}
+
+_pool: Optional["PoolOCR"] = None
+_pool_lock = threading.Lock()
+
+
+def _inicializar_worker(intra_op_threads: int):
+    global _ocr_worker
+    import cv2
+    from .ocr_utils import OCROptimizado
+
+    # Paralelismo vem dos processos: evita sobreinscrição de threads
+    cv2.setNumThreads(1)
+    _ocr_worker = OCROptimizado(intra_op_threads=intra_op_threads)
+
+
+def _aquecer_worker() -> int:
+    return os.getpid()
+
+
+def _preprocessador_worker(etapas: Optional[Tuple[str, ...]]):
+    """Uma cadeia ImagePreprocessor por configuração, reaproveitada entre páginas"""
+    if not etapas:
+        return None
+    if etapas not in _preprocessadores:
+        from .ocr_utils import ImagePreprocessor
+        _preprocessadores[etapas] = ImagePreprocessor(etapas)
+    return _preprocessadores[etapas]
+
+
+def _ocr_pagina(
+    idx: int,
+    img,
+    preprocessar: bool = True,
+    dpi: Optional[int] = None,
+    melhorar_contraste: bool = False,
+    etapas: Optional[Tuple[str, ...]] = None
+):
+    return idx, _ocr_worker.reconhecer_array(
+        img, preprocessar=preprocessar, dpi=dpi, melhorar_contraste=melhorar_contraste,
+        preprocessador=_preprocessador_worker(etapas)
+    )
+
+
+class PoolOCR:
+    """
+    Pool de longa duração de processos de OCR
+
+    Args:
+        workers: Número de processos
+        intra_op_threads: Threads do ONNX Runtime em cada processo
+    """
+
+    def __init__(self, workers: int = WORKERS_PADRAO, intra_op_threads: int = INTRA_OP_THREADS_PADRAO):
+        self.workers = workers
+        self.intra_op_threads = intra_op_threads
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def iniciar(self) -> "PoolOCR":
+        """Sobe os processos e carrega o RapidOCR em todos eles"""
+        if self._executor is not None:
+            return self
+
+        if multiprocessing.current_process().daemon:
+            raise RuntimeError(
+                "O pool de OCR não pode ser criado em um processo daemon. "
+                "Defina 'daemonize_workers': False em Q_CLUSTER."
+            )
+
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_inicializar_worker,
+            initargs=(self.intra_op_threads,),
+        )
+        # Uma tarefa por worker força a criação de todos os processos agora
+        futures = [self._executor.submit(_aquecer_worker) for _ in range(self.workers)]
+        for future in futures:
+            future.result()
+
+        logger.info(
+            f"Pool de OCR iniciado: {self.workers} processos, "
+            f"{self.intra_op_threads} thread(s) ONNX por processo"
+        )
+        return self
+
+    def submeter(
+        self,
+        idx: int,
+        img,
+        preprocessar: bool = True,
+        dpi: Optional[int] = None,
+        melhorar_contraste: bool = False,
+        etapas: Optional[Sequence[str]] = None
+    ):
+        """Agenda o OCR de uma página; o future retorna (idx, ResultadoPagina)"""
+        if self._executor is None:
+            self.iniciar()
+        return self._executor.submit(
+            _ocr_pagina, idx, img, preprocessar, dpi, melhorar_contraste,
+            tuple(etapas) if etapas else None
+        )
+
+    def encerrar(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+def processos_por_worker(workers: Optional[int] = None) -> int:
+    """
+    Processos do pool de um worker do qcluster
+
+    Cada worker do Q_CLUSTER cria o seu pool, então o cluster roda
+    workers do cluster x processos x intra_op_threads threads de OCR. O valor
+    pedido (ou settings.OCR_POOL['workers']; None usa o máximo) é limitado
+    para que esse total não passe do número de núcleos.
+
+    Args:
+        workers: Processos pedidos; None usa settings.OCR_POOL
+    """
+    from django.conf import settings
+
+    config = getattr(settings, 'OCR_POOL', {})
+    nucleos = os.cpu_count() or 1
+    # Sem 'workers', o django-q usa um worker por núcleo
+    workers_cluster = settings.Q_CLUSTER.get('workers') or nucleos
+    threads = config.get('intra_op_threads', INTRA_OP_THREADS_PADRAO) or 1
+    maximo = max(1, nucleos // (workers_cluster * threads))
+
+    pedido = workers or config.get('workers')
+    if pedido is None:
+        return maximo
+    if pedido > maximo:
+        logger.warning(
+            f"Pool de OCR com {pedido} processos passaria de {nucleos} núcleos "
+            f"({workers_cluster} workers do qcluster x {threads} thread(s) ONNX); usando {maximo}"
+        )
+        return maximo
+    return pedido
+
+
+def obter_pool(workers: Optional[int] = None) -> PoolOCR:
+    """
+    Retorna o pool do processo atual, criando-o na primeira chamada
+
+    A configuração vem de settings.OCR_POOL ({'workers', 'intra_op_threads'});
+    `workers` sobrescreve o valor de settings apenas na criação. O número de
+    processos é limitado por processos_por_worker.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            from django.conf import settings
+
+            config = getattr(settings, 'OCR_POOL', {})
+            _pool = PoolOCR(
+                workers=processos_por_worker(workers),
+                intra_op_threads=config.get('intra_op_threads', INTRA_OP_THREADS_PADRAO),
+            ).iniciar()
+        elif workers and workers != _pool.workers:
+            logger.debug(f"Pool de OCR já ativo com {_pool.workers} processos; ignorando workers={workers}")
+        return _pool
+
+
+def descartar_pool():
+    """Encerra o pool atual (ex.: após BrokenProcessPool); o próximo uso recria"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            try:
+                _pool.encerrar()
+            except BrokenProcessPool:
+                pass
+            _pool = None
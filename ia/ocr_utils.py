@@ -3,58 +3,630 @@ Utilitários otimizados para processamento de OCR
 """
 import cv2
 import numpy as np
-from typing import List, Tuple, Optional
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple, Optional, Union
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Quantas páginas renderizadas podem ficar em memória aguardando o OCR
+JANELA_PAGINAS_PADRAO = 8
+
+# OCR adaptativo: toda página passa em DPI_BAIXO e só as ruins voltam em DPI_ALTO
+DPI_BAIXO = 150
+DPI_ALTO = 300
+# Confiança média mínima das linhas reconhecidas
+CONFIANCA_MINIMA = 0.90
+# Caracteres reconhecidos por polegada quadrada abaixo dos quais a página é suspeita...
+DENSIDADE_OCR_MINIMA = 3.0
+# ...desde que tenha tinta suficiente (fração de pixels escuros) para conter texto
+TINTA_MINIMA = 0.02
+
+# Etapas do ImagePreprocessor, na ordem em que são aplicadas
+ETAPAS_PREPROCESSAMENTO = ('bordas', 'inclinacao', 'contraste', 'threshold')
+
+
+@dataclass
+class LinhaOCR:
+    """Linha reconhecida: texto, confiança e caixa (4 pontos, em pixels da imagem)"""
+    texto: str
+    confianca: float
+    caixa: List[List[float]]
+
+
+@dataclass
+class ResultadoPagina:
+    """
+    Resultado do OCR de uma página com as confianças por linha
+    
+    Args:
+        texto: Texto da página (linhas separadas por \\n)
+        linhas: Linhas reconhecidas; vazio quando o texto veio do cache
+        dpi: Resolução em que a página foi renderizada
+        largura: Largura da imagem renderizada em pixels
+        altura: Altura da imagem renderizada em pixels
+        tempos: Segundos gastos em cada etapa do ImagePreprocessor
+    """
+    texto: str
+    linhas: List[LinhaOCR] = field(default_factory=list)
+    dpi: Optional[int] = None
+    largura: int = 0
+    altura: int = 0
+    tempos: Dict[str, float] = field(default_factory=dict)
+    
+    @property
+    def confianca_media(self) -> Optional[float]:
+        if not self.linhas:
+            return None
+        return sum(linha.confianca for linha in self.linhas) / len(self.linhas)
+    
+    @property
+    def densidade(self) -> Optional[float]:
+        """Caracteres visíveis por polegada quadrada da página"""
+        if not self.dpi or not self.largura or not self.altura:
+            return None
+        area_pol2 = (self.largura / self.dpi) * (self.altura / self.dpi)
+        return sum(1 for c in self.texto if not c.isspace()) / max(area_pol2, 1.0)
+
+
+def proporcao_tinta(img: np.ndarray) -> float:
+    """Fração de pixels escuros da página em cinza (0 = página em branco)"""
+    if img.ndim == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    return float(np.count_nonzero(img < 128)) / img.size
+
+
+def precisa_reocr(
+    resultado: ResultadoPagina,
+    tinta: float,
+    confianca_minima: float = CONFIANCA_MINIMA,
+    densidade_minima: float = DENSIDADE_OCR_MINIMA
+) -> bool:
+    """
+    Decide se a página deve ser renderizada de novo em DPI_ALTO
+    
+    Páginas com confiança média baixa voltam; páginas com pouca ou nenhuma
+    linha reconhecida só voltam se tiverem tinta (versos em branco e capas
+    com poucas palavras não pagam o segundo passe).
+    
+    Args:
+        resultado: OCR do primeiro passe
+        tinta: proporcao_tinta() da página renderizada
+    """
+    confianca = resultado.confianca_media
+    if confianca is not None and confianca < confianca_minima:
+        return True
+    densidade = resultado.densidade
+    if confianca is None or (densidade is not None and densidade < densidade_minima):
+        return tinta >= TINTA_MINIMA
+    return False
+
+
+def resumir_tempos(resultados) -> str:
+    """Soma os tempos das etapas de pré-processamento de vários ResultadoPagina"""
+    totais: Dict[str, float] = {}
+    for resultado in resultados:
+        for etapa, tempo in resultado.tempos.items():
+            totais[etapa] = totais.get(etapa, 0.0) + tempo
+    return ", ".join(f"{etapa} {tempo:.2f}s" for etapa, tempo in totais.items())
+
+
+def escolher_melhor(atual: ResultadoPagina, novo: ResultadoPagina) -> ResultadoPagina:
+    """Mantém o resultado do reprocessamento só se ele não piorou a confiança"""
+    if atual.confianca_media is None:
+        return novo if novo.linhas else atual
+    if novo.confianca_media is None:
+        return atual
+    return novo if novo.confianca_media >= atual.confianca_media else atual
+
+
+def montar_texto_paginas(textos: Dict[int, str]) -> str:
+    """Junta os textos por página (índice base 0) em ordem, com separadores"""
+    return "\n\n".join(
+        f"--- Página {i+1} ---\n{textos[i]}" for i in sorted(textos)
+    )
+
+
+def contar_paginas_pdf(pdf_path: str) -> int:
+    """Retorna o número de páginas do PDF sem renderizá-las"""
+    import pypdfium2 as pdfium
+    
+    pdf = pdfium.PdfDocument(pdf_path)
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+
+def iterar_paginas_pdf(
+    pdf_path: str,
+    dpi: int = 150,
+    janela: int = JANELA_PAGINAS_PADRAO,
+    paginas: Optional[List[int]] = None
+) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    Renderiza o PDF página a página com pypdfium2, em janelas
+    
+    O documento é reaberto a cada janela para que o pdfium libere os caches
+    internos (fontes, imagens) acumulados, então a memória depende do tamanho
+    da janela e não do total de páginas.
+    
+    Args:
+        pdf_path: Caminho para o PDF
+        dpi: Resolução de renderização
+        janela: Páginas renderizadas por abertura do documento
+        paginas: Índices (base 0) a renderizar; None renderiza todas
+        
+    Yields:
+        (índice da página, array em escala de cinza)
+    """
+    import pypdfium2 as pdfium
+    
+    if paginas is None:
+        paginas = list(range(contar_paginas_pdf(pdf_path)))
+    
+    escala = dpi / 72
+    for inicio in range(0, len(paginas), janela):
+        pdf = pdfium.PdfDocument(pdf_path)
+        try:
+            for idx in paginas[inicio:inicio + janela]:
+                page = pdf[idx]
+                try:
+                    bitmap = page.render(scale=escala, grayscale=True)
+                    # Copia para desacoplar o array do buffer do pdfium
+                    img = np.array(bitmap.to_numpy())
+                    bitmap.close()
+                finally:
+                    page.close()
+                yield idx, img
+        finally:
+            pdf.close()
+
+
+def paginas_em_fila(
+    pdf_path: str,
+    dpi: int = 150,
+    janela: int = JANELA_PAGINAS_PADRAO,
+    paginas: Optional[List[int]] = None
+) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    Renderiza as páginas em uma thread produtora e as entrega por uma fila
+    limitada: a renderização da próxima página se sobrepõe ao OCR da atual, e
+    no máximo `janela` páginas ficam aguardando em memória.
+    
+    Args:
+        pdf_path: Caminho para o PDF
+        dpi: Resolução de renderização
+        janela: Tamanho máximo da fila (e da janela de renderização)
+        paginas: Índices (base 0) a renderizar; None renderiza todas
+        
+    Yields:
+        (índice da página, array em escala de cinza)
+    """
+    fim = object()
+    fila: "queue.Queue" = queue.Queue(maxsize=janela)
+    parar = threading.Event()
+    erros: List[BaseException] = []
+    
+    def _colocar(item) -> bool:
+        while not parar.is_set():
+            try:
+                fila.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def _produtor():
+        try:
+            for item in iterar_paginas_pdf(pdf_path, dpi=dpi, janela=janela, paginas=paginas):
+                if not _colocar(item):
+                    return
+        except BaseException as e:
+            erros.append(e)
+        finally:
+            _colocar(fim)
+    
+    produtor = threading.Thread(target=_produtor, name="render-pdf", daemon=True)
+    produtor.start()
+    try:
+        while True:
+            item = fila.get()
+            if item is fim:
+                break
+            yield item
+        if erros:
+            raise erros[0]
+    finally:
+        # Consumidor encerrado (fim, erro ou abandono): libera o produtor
+        parar.set()
+        produtor.join(timeout=5)
+
+
+def agrupar_em_lotes(itens: Iterator, tamanho: int) -> Iterator[list]:
+    """Agrupa um iterador em listas de até `tamanho` itens, sem materializá-lo"""
+    lote = []
+    for item in itens:
+        lote.append(item)
+        if len(lote) >= tamanho:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
 
 class OCROptimizado:
     """
     Classe para processamento otimizado de OCR usando RapidOCR
     """
     
-    def __init__(self):
-        """Inicializa o engine de OCR"""
+    def __init__(
+        self,
+        intra_op_threads: Optional[int] = None,
+        rec_batch_num: Optional[int] = None,
+        etapas_preprocessamento: Optional[Sequence[str]] = None
+    ):
+        """
+        Inicializa o engine de OCR
+        
+        Args:
+            intra_op_threads: Threads do ONNX Runtime por sessão (None = padrão do ORT)
+            rec_batch_num: Recortes de linha por inferência do reconhecedor
+                (None = padrão do RapidOCR, 6)
+            etapas_preprocessamento: Etapas do ImagePreprocessor aplicadas no
+                pré-processamento (None = só cinza/redimensionamento/threshold)
+        """
+        self.preprocessador = (
+            ImagePreprocessor(etapas_preprocessamento) if etapas_preprocessamento else None
+        )
         try:
             from rapidocr_onnxruntime import RapidOCR
-            self.ocr = RapidOCR()
+            parametros = {}
+            if intra_op_threads:
+                parametros['intra_op_num_threads'] = intra_op_threads
+            if rec_batch_num:
+                parametros['rec_batch_num'] = rec_batch_num
+            self.ocr = RapidOCR(**parametros)
             logger.info("RapidOCR inicializado com sucesso")
         except ImportError:
             logger.warning("RapidOCR não disponível. Instale com: pip install rapidocr-onnxruntime")
             self.ocr = None
     
-    def processar_imagem(self, image_path: str) -> str:
+    def processar_imagem(self, imagem: Union[str, np.ndarray]) -> str:
         """
         Processa uma imagem com RapidOCR
         
         Args:
-            image_path: Caminho para a imagem
+            imagem: Caminho para a imagem ou array NumPy (escala de cinza ou BGR)
             
         Returns:
             str: Texto extraído
         """
+        return "\n".join(linha.texto for linha in self.reconhecer_linhas(imagem))
+    
+    def reconhecer_linhas(self, imagem: Union[str, np.ndarray]) -> List[LinhaOCR]:
+        """
+        Executa o RapidOCR preservando caixa e confiança de cada linha
+        
+        Args:
+            imagem: Caminho para a imagem ou array NumPy (escala de cinza ou BGR)
+            
+        Returns:
+            List[LinhaOCR]: Linhas reconhecidas (vazia se não houver texto)
+        """
         if self.ocr is None:
             raise ImportError("RapidOCR não está instalado")
         
+        origem = imagem if isinstance(imagem, str) else f"array {imagem.shape}"
+        
         try:
-            result, elapse = self.ocr(image_path)
+            result, elapse = self.ocr(imagem)
             
             if result is None:
-                logger.warning(f"Nenhum texto encontrado em {image_path}")
-                return ""
+                logger.warning(f"Nenhum texto encontrado em {origem}")
+                return []
             
             # result é uma lista de [bbox, texto, confiança]
-            textos = [item[1] for item in result]
+            linhas = [
+                LinhaOCR(texto=texto, confianca=float(score), caixa=[[float(x), float(y)] for x, y in caixa])
+                for caixa, texto, score in result
+            ]
+            
+            # Versões recentes do RapidOCR retornam [det, cls, rec]
+            if isinstance(elapse, (list, tuple)):
+                elapse = sum(elapse)
             
-            logger.info(f"OCR processado: {len(textos)} linhas de texto em {elapse:.2f}s")
+            logger.info(f"OCR processado: {len(linhas)} linhas de texto em {elapse:.2f}s")
             
-            return "\n".join(textos)
+            return linhas
             
         except Exception as e:
-            logger.error(f"Erro ao processar imagem {image_path}: {str(e)}")
+            logger.error(f"Erro ao processar imagem {origem}: {str(e)}")
             raise
     
+    def reconhecer_linhas_lote(self, imagens: List[np.ndarray]) -> List[List[LinhaOCR]]:
+        """
+        Detecta as linhas de várias páginas e reconhece todos os recortes
+        juntos, em lotes de rec_batch_num
+        
+        O RapidOCR ordena os recortes por proporção antes de montar os lotes;
+        juntando páginas, os lotes ficam cheios e com larguras parecidas, o
+        que reduz o padding e o número de inferências.
+        
+        Args:
+            imagens: Páginas (arrays em cinza ou BGR)
+            
+        Returns:
+            List[List[LinhaOCR]]: Linhas de cada página, na ordem de entrada
+        """
+        if self.ocr is None:
+            raise ImportError("RapidOCR não está instalado")
+        
+        motor = self.ocr
+        recortes: List[np.ndarray] = []
+        origem: List[Tuple[int, int]] = []
+        caixas_paginas: List[Optional[np.ndarray]] = []
+        tempo_det = 0.0
+        
+        for p, imagem in enumerate(imagens):
+            img = motor.load_img(imagem)
+            altura, largura = img.shape[:2]
+            img, ratio_h, ratio_w = motor.preprocess(img)
+            op_record = {"preprocess": {"ratio_h": ratio_h, "ratio_w": ratio_w}}
+            img, op_record = motor.maybe_add_letterbox(img, op_record)
+            
+            caixas, elapse = motor.auto_text_det(img)
+            tempo_det += elapse
+            if caixas is None:
+                caixas_paginas.append(None)
+                continue
+            
+            recortes.extend(motor.get_crop_img_list(img, caixas))
+            origem.extend((p, j) for j in range(len(caixas)))
+            caixas_paginas.append(motor._get_origin_points(caixas, op_record, altura, largura))
+        
+        linhas: List[List[LinhaOCR]] = [[] for _ in imagens]
+        if not recortes:
+            return linhas
+        
+        tempo_cls = 0.0
+        if motor.use_cls:
+            recortes, _, tempo_cls = motor.text_cls(recortes)
+        rec_res, tempo_rec = motor.text_rec(recortes)
+        
+        for (p, j), res in zip(origem, rec_res):
+            texto, score = res[0], float(res[1])
+            if score < motor.text_score:
+                continue
+            linhas[p].append(LinhaOCR(texto=texto, confianca=score, caixa=caixas_paginas[p][j].tolist()))
+        
+        logger.info(
+            f"OCR em lote: {len(imagens)} páginas, {len(recortes)} recortes "
+            f"(det {tempo_det:.2f}s, cls {tempo_cls:.2f}s, rec {tempo_rec:.2f}s)"
+        )
+        return linhas
+    
+    @staticmethod
+    def array_de_pil(img) -> np.ndarray:
+        """
+        Converte uma imagem PIL (ex.: página do pdf2image) em array de cinza,
+        sem passar por arquivo intermediário
+        """
+        return np.asarray(img.convert('L'))
+    
+    def preparar_array(
+        self,
+        img: np.ndarray,
+        max_width: int = 2000,
+        aplicar_threshold: bool = True,
+        remover_ruido: bool = False,
+        melhorar_contraste: bool = False,
+        preprocessador: Optional["ImagePreprocessor"] = None
+    ) -> np.ndarray:
+        """
+        Aplica escala de cinza, redimensionamento e threshold em memória
+        
+        Args:
+            img: Array da imagem (2D em cinza, BGR ou BGRA)
+            max_width: Largura máxima (redimensiona se maior)
+            aplicar_threshold: Aplicar threshold binário
+            remover_ruido: Aplicar remoção de ruído (mais lento)
+            melhorar_contraste: Aplicar CLAHE (ImagePreprocessor) antes do threshold
+            preprocessador: Cadeia ImagePreprocessor; quando informada, substitui
+                o threshold simples
+            
+        Returns:
+            np.ndarray: Imagem em cinza pronta para o OCR
+        """
+        return self._preparar(
+            img, max_width, aplicar_threshold, remover_ruido, melhorar_contraste, preprocessador
+        )[0]
+    
+    def _preparar(
+        self,
+        img: np.ndarray,
+        max_width: int = 2000,
+        aplicar_threshold: bool = True,
+        remover_ruido: bool = False,
+        melhorar_contraste: bool = False,
+        preprocessador: Optional["ImagePreprocessor"] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Como preparar_array, devolvendo também a matriz 3x3 que leva
+        coordenadas da imagem preparada para as de `img`
+        """
+        # 1. Converter para escala de cinza
+        if img.ndim == 3 and img.shape[2] == 4:
+            gray = cv2.cvtColor(img, cv2.COLOR_BGRA2GRAY)
+        elif img.ndim == 3:
+            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        else:
+            gray = img
+        transformacao = np.eye(3)
+        
+        # 2. Redimensionar se muito grande (otimiza velocidade)
+        height, width = gray.shape
+        if width > max_width:
+            scale = max_width / width
+            new_width = int(width * scale)
+            new_height = int(height * scale)
+            gray = cv2.resize(gray, (new_width, new_height), interpolation=cv2.INTER_AREA)
+            transformacao = np.diag([width / new_width, height / new_height, 1.0])
+            logger.debug(f"Imagem redimensionada de {width}x{height} para {new_width}x{new_height}")
+        
+        # 3. Realçar contraste local em digitalizações apagadas
+        if melhorar_contraste and (preprocessador is None or 'contraste' not in preprocessador.etapas):
+            gray = ImagePreprocessor.aumentar_contraste(gray)
+        
+        # 4. Cadeia configurada (bordas, inclinação, contraste, threshold)
+        #    ou threshold simples para melhorar contraste
+        if preprocessador is not None:
+            gray = preprocessador.aplicar(gray)
+            transformacao = transformacao @ preprocessador.transformacao
+        elif aplicar_threshold:
+            _, gray = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        
+        # 5. Remover ruído (opcional, mais lento)
+        if remover_ruido:
+            gray = cv2.fastNlMeansDenoising(gray, None, 10, 7, 21)
+        
+        return gray, transformacao
+    
+    def processar_array(
+        self,
+        img: np.ndarray,
+        preprocessar: bool = True,
+        max_width: int = 2000,
+        aplicar_threshold: bool = True,
+        remover_ruido: bool = False
+    ) -> str:
+        """
+        Executa pré-processamento e OCR diretamente sobre um buffer NumPy
+        
+        Args:
+            img: Array da imagem (2D em cinza, BGR ou BGRA)
+            preprocessar: Aplicar cinza/redimensionamento/threshold antes do OCR
+            max_width: Largura máxima (redimensiona se maior)
+            aplicar_threshold: Aplicar threshold binário
+            remover_ruido: Aplicar remoção de ruído (mais lento)
+            
+        Returns:
+            str: Texto extraído
+        """
+        if not preprocessar:
+            return self.processar_imagem(img)
+        
+        try:
+            gray = self.preparar_array(
+                img,
+                max_width=max_width,
+                aplicar_threshold=aplicar_threshold,
+                remover_ruido=remover_ruido,
+                preprocessador=self.preprocessador
+            )
+        except Exception as e:
+            logger.error(f"Erro ao pré-processar array {img.shape}: {str(e)}")
+            # Fallback: tentar processar sem pré-processamento
+            return self.processar_imagem(img)
+        
+        return self.processar_imagem(gray)
+    
+    def reconhecer_array(
+        self,
+        img: np.ndarray,
+        preprocessar: bool = True,
+        dpi: Optional[int] = None,
+        melhorar_contraste: bool = False,
+        preprocessador: Optional["ImagePreprocessor"] = None
+    ) -> ResultadoPagina:
+        """
+        Como processar_array, mas devolve as linhas com confiança
+        
+        Args:
+            img: Array da página renderizada
+            preprocessar: Aplicar cinza/redimensionamento/threshold antes do OCR
+            dpi: Resolução da renderização (para a densidade de texto)
+            melhorar_contraste: Aplicar CLAHE antes do threshold
+            preprocessador: Cadeia ImagePreprocessor (padrão: a da instância)
+            
+        Returns:
+            ResultadoPagina: Texto, linhas e dimensões da página
+        """
+        return self.reconhecer_arrays(
+            [img], preprocessar=preprocessar, dpi=dpi, melhorar_contraste=melhorar_contraste,
+            lote=False, preprocessador=preprocessador
+        )[0]
+    
+    def reconhecer_arrays(
+        self,
+        imgs: List[np.ndarray],
+        preprocessar: bool = True,
+        dpi: Optional[int] = None,
+        melhorar_contraste: bool = False,
+        lote: bool = True,
+        preprocessador: Optional["ImagePreprocessor"] = None
+    ) -> List[ResultadoPagina]:
+        """
+        OCR de várias páginas; com `lote`, o reconhecimento das linhas de
+        todas elas é feito em conjunto (reconhecer_linhas_lote)
+        
+        Args:
+            imgs: Arrays das páginas renderizadas
+            preprocessar: Aplicar cinza/redimensionamento/threshold antes do OCR
+            dpi: Resolução da renderização (para a densidade de texto)
+            melhorar_contraste: Aplicar CLAHE antes do threshold
+            lote: Reconhecer os recortes de todas as páginas juntos
+            preprocessador: Cadeia ImagePreprocessor (padrão: a da instância)
+            
+        Returns:
+            List[ResultadoPagina]: Um resultado por página, na ordem de entrada
+        """
+        preprocessador = preprocessador or self.preprocessador
+        entradas, transformacoes, tempos = [], [], []
+        for img in imgs:
+            entrada, transformacao = img, np.eye(3)
+            tempos.append({})
+            if preprocessar:
+                try:
+                    entrada, transformacao = self._preparar(
+                        img, melhorar_contraste=melhorar_contraste, preprocessador=preprocessador
+                    )
+                    if preprocessador is not None:
+                        tempos[-1] = dict(preprocessador.ultimos_tempos)
+                        # O buffer da cadeia é reaproveitado na próxima página
+                        if len(imgs) > 1:
+                            entrada = entrada.copy()
+                except Exception as e:
+                    logger.error(f"Erro ao pré-processar array {img.shape}: {str(e)}")
+            entradas.append(entrada)
+            transformacoes.append(transformacao)
+        
+        if lote:
+            linhas_paginas = self.reconhecer_linhas_lote(entradas)
+        else:
+            linhas_paginas = [self.reconhecer_linhas(entrada) for entrada in entradas]
+        
+        resultados = []
+        for img, transformacao, linhas, tempos_pagina in zip(imgs, transformacoes, linhas_paginas, tempos):
+            altura, largura = img.shape[:2]
+            # Caixas voltam para as coordenadas da imagem original
+            if not np.array_equal(transformacao, np.eye(3)):
+                for linha in linhas:
+                    pontos = np.hstack([np.asarray(linha.caixa), np.ones((len(linha.caixa), 1))])
+                    linha.caixa = (pontos @ transformacao.T)[:, :2].tolist()
+            resultados.append(ResultadoPagina(
+                texto="\n".join(linha.texto for linha in linhas),
+                linhas=linhas,
+                dpi=dpi,
+                largura=largura,
+                altura=altura,
+                tempos=tempos_pagina,
+            ))
+        return resultados
+    
     def preprocessar_imagem(
         self, 
         image_path: str, 
@@ -74,59 +646,149 @@ class OCROptimizado:
         Returns:
             str: Texto extraído da imagem processada
         """
-        try:
-            # Carregar imagem
-            img = cv2.imread(image_path)
-            
-            if img is None:
-                raise ValueError(f"Não foi possível carregar a imagem: {image_path}")
-            
-            # 1. Converter para escala de cinza
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            
-            # 2. Redimensionar se muito grande (otimiza velocidade)
-            height, width = gray.shape
-            if width > max_width:
-                scale = max_width / width
-                new_width = int(width * scale)
-                new_height = int(height * scale)
-                gray = cv2.resize(gray, (new_width, new_height))
-                logger.debug(f"Imagem redimensionada de {width}x{height} para {new_width}x{new_height}")
-            
-            # 3. Aplicar threshold para melhorar contraste
-            if aplicar_threshold:
-                _, gray = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-            
-            # 4. Remover ruído (opcional, mais lento)
-            if remover_ruido:
-                gray = cv2.fastNlMeansDenoising(gray, None, 10, 7, 21)
-            
-            # Salvar imagem processada temporariamente
-            processed_path = image_path.replace('.', '_processed.')
-            cv2.imwrite(processed_path, gray)
-            
-            # Processar com OCR
-            resultado = self.processar_imagem(processed_path)
-            
-            # Limpar arquivo temporário
-            import os
-            try:
-                os.remove(processed_path)
-            except:
-                pass
+        # Carregar imagem uma única vez; o restante acontece em memória
+        img = cv2.imread(image_path)
+        
+        if img is None:
+            logger.error(f"Não foi possível carregar a imagem: {image_path}")
+            # Fallback: deixar o RapidOCR tentar abrir o arquivo
+            return self.processar_imagem(image_path)
+        
+        return self.processar_array(
+            img,
+            max_width=max_width,
+            aplicar_threshold=aplicar_threshold,
+            remover_ruido=remover_ruido
+        )
+    
+    def reconhecer_paginas_pdf(
+        self,
+        pdf_path: str,
+        paginas: Optional[List[int]] = None,
+        dpi: int = DPI_BAIXO,
+        preprocessar: bool = True,
+        cache_paginas=None,
+        adaptativo: bool = False,
+        dpi_alto: int = DPI_ALTO,
+        melhorar_alto: bool = True,
+        confianca_minima: float = CONFIANCA_MINIMA,
+        paginas_por_lote: int = 1,
+        ao_concluir: Optional[Callable[[int, ResultadoPagina], None]] = None
+    ) -> Dict[int, ResultadoPagina]:
+        """
+        Renderiza e processa com OCR as páginas indicadas do PDF
+        
+        No modo adaptativo, todas as páginas passam primeiro em `dpi`; as que
+        ficam abaixo da confiança (ou da densidade) mínima são renderizadas de
+        novo em `dpi_alto` e fica o resultado de maior confiança.
+        
+        Args:
+            pdf_path: Caminho para o PDF
+            paginas: Índices (base 0) a processar; None processa todas
+            dpi: Resolução para conversão (primeiro passe no modo adaptativo)
+            preprocessar: Aplicar pré-processamento nas imagens
+            cache_paginas: CachePaginas opcional; páginas já vistas pulam o OCR
+            adaptativo: Reprocessar em `dpi_alto` as páginas de baixa confiança
+            dpi_alto: Resolução do segundo passe
+            melhorar_alto: Aplicar CLAHE no segundo passe
+            confianca_minima: Confiança média abaixo da qual a página volta
+            paginas_por_lote: Páginas cujas linhas são reconhecidas juntas
+                (1 = uma chamada do RapidOCR por página)
+            ao_concluir: Chamado com (índice, resultado) assim que o texto
+                final de cada página é conhecido (ex.: checkpoint)
             
-            return resultado
+        Returns:
+            Dict[int, ResultadoPagina]: Resultado por índice de página
+        """
+        resultados: Dict[int, ResultadoPagina] = {}
+        hashes: Dict[int, str] = {}
+        baixa_confianca: List[int] = []
+        em_lote = paginas_por_lote > 1
+        
+        for lote in agrupar_em_lotes(paginas_em_fila(pdf_path, dpi=dpi, paginas=paginas), paginas_por_lote):
+            a_processar = []
+            for i, img in lote:
+                if cache_paginas is not None:
+                    hashes[i], texto = cache_paginas.obter(img)
+                    if texto is not None:
+                        resultados[i] = ResultadoPagina(texto=texto)
+                        if ao_concluir is not None:
+                            ao_concluir(i, resultados[i])
+                        continue
+                a_processar.append((i, img))
+            if not a_processar:
+                continue
             
-        except Exception as e:
-            logger.error(f"Erro ao pré-processar imagem {image_path}: {str(e)}")
-            # Fallback: tentar processar sem pré-processamento
-            return self.processar_imagem(image_path)
+            novos = self.reconhecer_arrays(
+                [img for _, img in a_processar], preprocessar=preprocessar, dpi=dpi, lote=em_lote
+            )
+            for (i, img), resultado in zip(a_processar, novos):
+                resultados[i] = resultado
+                if adaptativo and precisa_reocr(resultado, proporcao_tinta(img), confianca_minima=confianca_minima):
+                    baixa_confianca.append(i)
+                    continue
+                if cache_paginas is not None:
+                    cache_paginas.salvar(hashes[i], resultado.texto)
+                if ao_concluir is not None:
+                    ao_concluir(i, resultado)
+        
+        if baixa_confianca:
+            logger.info(
+                f"{len(baixa_confianca)}/{len(resultados)} páginas abaixo da confiança mínima; "
+                f"reprocessando em {dpi_alto} DPI"
+            )
+            for lote in agrupar_em_lotes(
+                paginas_em_fila(pdf_path, dpi=dpi_alto, paginas=baixa_confianca), paginas_por_lote
+            ):
+                novos = self.reconhecer_arrays(
+                    [img for _, img in lote],
+                    preprocessar=preprocessar,
+                    dpi=dpi_alto,
+                    melhorar_contraste=melhorar_alto,
+                    lote=em_lote
+                )
+                for (i, _), novo in zip(lote, novos):
+                    resultados[i] = escolher_melhor(resultados[i], novo)
+                    if cache_paginas is not None:
+                        cache_paginas.salvar(hashes[i], resultados[i].texto)
+                    if ao_concluir is not None:
+                        ao_concluir(i, resultados[i])
+        
+        return resultados
+    
+    def processar_paginas_pdf(
+        self,
+        pdf_path: str,
+        paginas: Optional[List[int]] = None,
+        dpi: int = DPI_BAIXO,
+        preprocessar: bool = True,
+        cache_paginas=None,
+        adaptativo: bool = False,
+        paginas_por_lote: int = 1
+    ) -> Dict[int, str]:
+        """
+        Como reconhecer_paginas_pdf, devolvendo só o texto de cada página
+        
+        Returns:
+            Dict[int, str]: Texto extraído por índice de página
+        """
+        resultados = self.reconhecer_paginas_pdf(
+            pdf_path,
+            paginas=paginas,
+            dpi=dpi,
+            preprocessar=preprocessar,
+            cache_paginas=cache_paginas,
+            adaptativo=adaptativo,
+            paginas_por_lote=paginas_por_lote
+        )
+        return {i: r.texto for i, r in resultados.items()}
     
     def processar_pdf_como_imagens(
         self, 
         pdf_path: str, 
         dpi: int = 150,
-        preprocessar: bool = True
+        preprocessar: bool = True,
+        adaptativo: bool = False
     ) -> str:
         """
         Converte PDF em imagens e processa com OCR
@@ -135,48 +797,21 @@ class OCROptimizado:
             pdf_path: Caminho para o PDF
             dpi: Resolução para conversão (150-300, maior = melhor qualidade mas mais lento)
             preprocessar: Aplicar pré-processamento nas imagens
+            adaptativo: Reprocessar em DPI_ALTO as páginas de baixa confiança
             
         Returns:
             str: Texto extraído de todas as páginas
         """
         try:
-            from pdf2image import convert_from_path
-        except ImportError:
-            raise ImportError("pdf2image não está instalado. Instale com: pip install pdf2image")
-        
-        import os
-        
-        try:
-            logger.info(f"Convertendo PDF para imagens: {pdf_path} (DPI: {dpi})")
-            
-            # Converter PDF em imagens
-            images = convert_from_path(pdf_path, dpi=dpi)
+            logger.info(f"Renderizando PDF em fluxo: {pdf_path} (DPI: {dpi})")
             
-            logger.info(f"PDF convertido: {len(images)} páginas")
-            
-            textos = []
-            for i, img in enumerate(images):
-                # Salvar temporariamente
-                temp_path = f"/tmp/page_{os.getpid()}_{i}.jpg"
-                img.save(temp_path, 'JPEG', quality=85)
-                
-                # Processar OCR
-                if preprocessar:
-                    texto = self.preprocessar_imagem(temp_path)
-                else:
-                    texto = self.processar_imagem(temp_path)
-                
-                textos.append(f"--- Página {i+1} ---\n{texto}")
-                
-                # Limpar arquivo temporário
-                try:
-                    os.remove(temp_path)
-                except:
-                    pass
+            textos = self.processar_paginas_pdf(
+                pdf_path, dpi=dpi, preprocessar=preprocessar, adaptativo=adaptativo
+            )
             
             logger.info(f"OCR concluído: {len(textos)} páginas processadas")
             
-            return "\n\n".join(textos)
+            return montar_texto_paginas(textos)
             
         except Exception as e:
             logger.error(f"Erro ao processar PDF {pdf_path}: {str(e)}")
@@ -185,44 +820,155 @@ class OCROptimizado:
 
 class ImagePreprocessor:
     """
-    Classe auxiliar para pré-processamento avançado de imagens
+    Cadeia configurável de pré-processamento de páginas em escala de cinza
+    
+    As etapas rodam na ordem de ETAPAS_PREPROCESSAMENTO ('bordas',
+    'inclinacao', 'contraste', 'threshold'). Recorte de bordas e estimativa da
+    inclinação usam uma miniatura (proxy) da página; os buffers de saída de
+    cada etapa são reaproveitados entre páginas de mesmo tamanho, então o
+    array devolvido por aplicar() é sobrescrito na chamada seguinte.
+    
+    Args:
+        etapas: Etapas a aplicar (subconjunto de ETAPAS_PREPROCESSAMENTO)
+        largura_proxy: Largura da miniatura usada em bordas e inclinação
+        inclinacao_maxima: Ângulos estimados acima disso (graus) são ignorados
     """
     
-    @staticmethod
-    def remover_bordas(img: np.ndarray) -> np.ndarray:
-        """Remove bordas pretas da imagem"""
-        # Encontrar contornos
-        _, thresh = cv2.threshold(img, 127, 255, cv2.THRESH_BINARY)
-        contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    def __init__(
+        self,
+        etapas: Sequence[str] = ETAPAS_PREPROCESSAMENTO,
+        largura_proxy: int = 800,
+        inclinacao_maxima: float = 10.0
+    ):
+        desconhecidas = set(etapas) - set(ETAPAS_PREPROCESSAMENTO)
+        if desconhecidas:
+            raise ValueError(f"Etapas de pré-processamento desconhecidas: {sorted(desconhecidas)}")
+        
+        self.etapas = tuple(e for e in ETAPAS_PREPROCESSAMENTO if e in etapas)
+        self.largura_proxy = largura_proxy
+        self.inclinacao_maxima = inclinacao_maxima
+        self._clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+        self._buffers: Dict[str, np.ndarray] = {}
+        
+        # Mapeia coordenadas da saída para a entrada (matriz 3x3)
+        self.transformacao = np.eye(3)
+        self.ultimos_tempos: Dict[str, float] = {}
+    
+    def _buffer(self, nome: str, shape: Tuple[int, int]) -> np.ndarray:
+        """Buffer reaproveitado da etapa; só realoca se o tamanho mudar"""
+        buffer = self._buffers.get(nome)
+        if buffer is None or buffer.shape != shape:
+            buffer = np.empty(shape, dtype=np.uint8)
+            self._buffers[nome] = buffer
+        return buffer
+    
+    def _proxy(self, img: np.ndarray) -> Tuple[np.ndarray, float]:
+        altura, largura = img.shape
+        if largura <= self.largura_proxy:
+            return img, 1.0
+        escala = self.largura_proxy / largura
+        shape = (max(1, round(altura * escala)), self.largura_proxy)
+        proxy = self._buffer('proxy', shape)
+        cv2.resize(img, (shape[1], shape[0]), dst=proxy, interpolation=cv2.INTER_AREA)
+        return proxy, escala
+    
+    def _remover_bordas(self, img, proxy, escala):
+        """Recorta a página para o maior contorno claro (remove tarjas pretas da digitalização)"""
+        mascara = self._buffer('mascara', proxy.shape)
+        cv2.threshold(proxy, 127, 255, cv2.THRESH_BINARY, dst=mascara)
+        contornos, _ = cv2.findContours(mascara, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        if not contornos:
+            return img, proxy
+        
+        x, y, w, h = cv2.boundingRect(max(contornos, key=cv2.contourArea))
+        # Contorno pequeno não é a folha: melhor não recortar
+        if w * h < 0.5 * proxy.shape[0] * proxy.shape[1]:
+            return img, proxy
+        # Margem de 2px na miniatura para não levar restos da tarja
+        x, y, w, h = x + 2, y + 2, w - 4, h - 4
+        
+        x0, y0 = int(x / escala), int(y / escala)
+        x1 = min(img.shape[1], int(round((x + w) / escala)))
+        y1 = min(img.shape[0], int(round((y + h) / escala)))
+        self.transformacao = self.transformacao @ np.array([[1, 0, x0], [0, 1, y0], [0, 0, 1]], dtype=float)
+        return img[y0:y1, x0:x1], proxy[y:y + h, x:x + w]
+    
+    def _estimar_inclinacao(self, proxy: np.ndarray) -> float:
+        """Ângulo (graus) do bloco de texto, estimado na miniatura"""
+        tinta = self._buffer('tinta', proxy.shape)
+        cv2.threshold(proxy, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU, dst=tinta)
+        pontos = cv2.findNonZero(tinta)
+        if pontos is None or len(pontos) < 50:
+            return 0.0
+        
+        angulo = cv2.minAreaRect(pontos)[-1]
+        # OpenCV >= 4.5 devolve (0, 90]; versões antigas, [-90, 0)
+        if angulo > 45:
+            angulo -= 90
+        elif angulo < -45:
+            angulo += 90
+        return angulo
+    
+    def _corrigir_inclinacao(self, img, proxy):
+        angulo = self._estimar_inclinacao(proxy)
+        if abs(angulo) <= 0.5 or abs(angulo) > self.inclinacao_maxima:
+            return img
+        
+        altura, largura = img.shape
+        M = cv2.getRotationMatrix2D((largura / 2, altura / 2), angulo, 1.0)
+        saida = self._buffer('inclinacao', (altura, largura))
+        cv2.warpAffine(
+            img, M, (largura, altura), dst=saida,
+            flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE
+        )
+        inversa = cv2.invertAffineTransform(M)
+        self.transformacao = self.transformacao @ np.vstack([inversa, [0, 0, 1]])
+        return saida
+    
+    def aplicar(self, img: np.ndarray) -> np.ndarray:
+        """
+        Executa a cadeia sobre uma página em cinza (2D uint8)
+        
+        Returns:
+            np.ndarray: Página processada (buffer interno, válido até a próxima chamada)
+        """
+        self.transformacao = np.eye(3)
+        self.ultimos_tempos = {}
+        proxy = escala = None
         
-        if contours:
-            # Pegar maior contorno
-            largest = max(contours, key=cv2.contourArea)
-            x, y, w, h = cv2.boundingRect(largest)
-            return img[y:y+h, x:x+w]
+        for etapa in self.etapas:
+            inicio = time.perf_counter()
+            if etapa in ('bordas', 'inclinacao') and proxy is None:
+                proxy, escala = self._proxy(img)
+            
+            if etapa == 'bordas':
+                img, proxy = self._remover_bordas(img, proxy, escala)
+            elif etapa == 'inclinacao':
+                img = self._corrigir_inclinacao(img, proxy)
+            elif etapa == 'contraste':
+                saida = self._buffer('contraste', img.shape)
+                self._clahe.apply(img, dst=saida)
+                img = saida
+            elif etapa == 'threshold':
+                saida = self._buffer('threshold', img.shape)
+                cv2.threshold(img, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU, dst=saida)
+                img = saida
+            self.ultimos_tempos[etapa] = time.perf_counter() - inicio
         
+        logger.debug(
+            "Pré-processamento: " + ", ".join(f"{e} {t * 1000:.1f}ms" for e, t in self.ultimos_tempos.items())
+        )
         return img
     
+    @staticmethod
+    def remover_bordas(img: np.ndarray) -> np.ndarray:
+        """Remove bordas pretas da imagem"""
+        return ImagePreprocessor(etapas=('bordas',)).aplicar(img).copy()
+    
     @staticmethod
     def corrigir_inclinacao(img: np.ndarray) -> np.ndarray:
-        """Corrige inclinação do texto (deskew)"""
-        # Detectar ângulo
-        coords = np.column_stack(np.where(img > 0))
-        angle = cv2.minAreaRect(coords)[-1]
-        
-        if angle < -45:
-            angle = 90 + angle
-        
-        # Rotacionar
-        if abs(angle) > 0.5:  # Só rotacionar se inclinação significativa
-            (h, w) = img.shape[:2]
-            center = (w // 2, h // 2)
-            M = cv2.getRotationMatrix2D(center, angle, 1.0)
-            rotated = cv2.warpAffine(img, M, (w, h), flags=cv2.INTER_CUBIC, 
-                                    borderMode=cv2.BORDER_REPLICATE)
-            return rotated
-        
-        return img
+        """Corrige inclinação do texto (deskew), estimada em uma miniatura"""
+        return ImagePreprocessor(etapas=('inclinacao',)).aplicar(img).copy()
     
     @staticmethod
     def aumentar_contraste(img: np.ndarray) -> np.ndarray:
@@ -242,27 +988,26 @@ def processar_documento_completo(
     
     Args:
         file_path: Caminho para o arquivo
-        usar_cache: Usar cache se disponível
+        usar_cache: Usar o armazém de artefatos de OCR
         preprocessar: Aplicar pré-processamento
         dpi: DPI para conversão de PDF
         
     Returns:
         str: Texto extraído
     """
-    import hashlib
-    import os
-    from django.core.cache import cache
+    from usuarios.utils import hash_conteudo_caminho
+    from .armazem_ocr import TIPO_TEXTO, obter_armazem
     
-    # Verificar cache se habilitado
+    # Verificar o armazém de artefatos se habilitado
     if usar_cache:
-        with open(file_path, 'rb') as f:
-            file_hash = hashlib.md5(f.read()).hexdigest()
+        file_hash = hash_conteudo_caminho(file_path)
         
-        cache_key = f'ocr_{file_hash}'
-        cached_result = cache.get(cache_key)
+        # Parâmetros fazem parte da chave: outro DPI gera outro texto
+        cache_key = f'completo_{dpi}{"_pre" if preprocessar else ""}_{file_hash}'
+        cached_result = obter_armazem().obter_texto(TIPO_TEXTO, cache_key)
         
         if cached_result:
-            logger.info(f"Resultado obtido do cache: {file_path}")
+            logger.info(f"Resultado obtido do armazém de OCR: {file_path}")
             return cached_result
     
     # Processar documento
@@ -276,8 +1021,7 @@ def processar_documento_completo(
         else:
             texto = ocr.processar_imagem(file_path)
     
-    # Salvar em cache
     if usar_cache:
-        cache.set(cache_key, texto, 60 * 60 * 24 * 7)  # 7 dias
+        obter_armazem().salvar(TIPO_TEXTO, cache_key, texto)
     
     return texto
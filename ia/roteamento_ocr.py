@@ -0,0 +1,265 @@
+"""
+Roteamento do OCR por modelo de custo
+
+A primeira task de um documento mede características baratas (páginas,
+tamanho, fração com camada de texto, profundidade da fila do django-q) e
+estima o tempo de cada estratégia com coeficientes lineares de
+settings.OCR_ROTEAMENTO. A rota escolhida e o tempo real de execução ficam
+em RotaOCR, de onde `manage.py calibrar_roteamento_ocr` reajusta os
+coeficientes.
+"""
+import importlib.util
+import logging
+import os
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Tuple
+
+from .camada_texto import amostrar_camada_texto
+
+logger = logging.getLogger(__name__)
+
+ESTRATEGIA_CAMADA_TEXTO = 'camada_texto'
+ESTRATEGIA_RAPIDOCR = 'rapidocr'
+ESTRATEGIA_DOCLING = 'docling'
+ESTRATEGIA_PARALELO = 'paralelo'
+ESTRATEGIA_FAIXAS = 'faixas'
+
+ESTRATEGIAS = (
+    ESTRATEGIA_CAMADA_TEXTO,
+    ESTRATEGIA_RAPIDOCR,
+    ESTRATEGIA_DOCLING,
+    ESTRATEGIA_PARALELO,
+    ESTRATEGIA_FAIXAS,
+)
+
+# Segundos: custo = fixo + por_pagina * páginas de OCR / paralelismo + por_mb * MB
+CUSTOS_PADRAO = {
+    ESTRATEGIA_CAMADA_TEXTO: {'fixo': 0.2, 'por_pagina': 0.0, 'por_mb': 0.02},
+    ESTRATEGIA_RAPIDOCR: {'fixo': 1.5, 'por_pagina': 2.5, 'por_mb': 0.05},
+    ESTRATEGIA_DOCLING: {'fixo': 0.5, 'por_pagina': 2.0, 'por_mb': 0.05},
+    ESTRATEGIA_PARALELO: {'fixo': 3.0, 'por_pagina': 2.5, 'por_mb': 0.05},
+    ESTRATEGIA_FAIXAS: {'fixo': 5.0, 'por_pagina': 2.5, 'por_mb': 0.05},
+}
+SEGUNDOS_POR_TASK_FILA_PADRAO = 30.0
+MARGEM_TIMEOUT_PADRAO = 0.8
+AMOSTRA_CAMADA_TEXTO_PADRAO = 20
+
+TIPO_PDF = 'pdf'
+TIPO_IMAGEM = 'imagem'
+# .doc, .docx e demais formatos que só o Docling converte
+TIPO_DOCUMENTO = 'documento'
+
+EXTENSOES_IMAGEM = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.tif', '.webp'}
+
+
+@dataclass
+class CaracteristicasDocumento:
+    """Entradas do modelo de custo, medidas sem renderizar páginas"""
+    paginas: int
+    tamanho_bytes: int
+    proporcao_camada_texto: float
+    fila: int
+    tipo: str = TIPO_PDF
+
+    @property
+    def pdf(self) -> bool:
+        return self.tipo == TIPO_PDF
+
+    @property
+    def paginas_ocr(self) -> int:
+        return round(self.paginas * (1 - self.proporcao_camada_texto))
+
+    @property
+    def tamanho_mb(self) -> float:
+        return self.tamanho_bytes / (1024 * 1024)
+
+
+def tamanho_fila() -> int:
+    """Tasks aguardando no broker do django-q (0 se não for possível consultar)"""
+    try:
+        from django_q.tasks import queue_size
+        return queue_size() or 0
+    except Exception as e:
+        logger.debug(f"Tamanho da fila indisponível: {str(e)}")
+        return 0
+
+
+def tipo_arquivo(path: str, tipo_mime: str = '') -> str:
+    """PDF, imagem ou documento, pelo MIME detectado no upload ou pela extensão"""
+    if tipo_mime:
+        if tipo_mime == 'application/pdf':
+            return TIPO_PDF
+        return TIPO_IMAGEM if tipo_mime.startswith('image/') else TIPO_DOCUMENTO
+    extensao = os.path.splitext(path)[1].lower()
+    if extensao == '.pdf':
+        return TIPO_PDF
+    return TIPO_IMAGEM if extensao in EXTENSOES_IMAGEM else TIPO_DOCUMENTO
+
+
+def medir_documento(
+    path: str,
+    fila: Optional[int] = None,
+    amostra: int = AMOSTRA_CAMADA_TEXTO_PADRAO,
+    tamanho_bytes: Optional[int] = None,
+    tipo_mime: str = ''
+) -> CaracteristicasDocumento:
+    """
+    Args:
+        path: Caminho do arquivo
+        fila: Profundidade da fila; None consulta o broker
+        amostra: Páginas lidas para estimar a fração com camada de texto
+        tamanho_bytes: Tamanho gravado no upload; None consulta o disco
+        tipo_mime: MIME detectado no upload; vazio usa a extensão
+    """
+    tamanho = os.path.getsize(path) if tamanho_bytes is None else tamanho_bytes
+    fila = tamanho_fila() if fila is None else fila
+    tipo = tipo_arquivo(path, tipo_mime)
+    if tipo != TIPO_PDF:
+        return CaracteristicasDocumento(1, tamanho, 0.0, fila, tipo=tipo)
+    paginas, proporcao = amostrar_camada_texto(path, amostra)
+    return CaracteristicasDocumento(paginas, tamanho, proporcao, fila)
+
+
+def docling_disponivel() -> bool:
+    return importlib.util.find_spec('docling') is not None
+
+
+class ModeloCusto:
+    """
+    Estimativa linear de tempo de execução por estratégia
+
+    Args:
+        custos: {estrategia: {'fixo', 'por_pagina', 'por_mb'}}
+        workers: Workers do qcluster (paralelismo das faixas)
+        workers_pool: Processos do pool de OCR (paralelismo do paralelo)
+        paginas_por_faixa: Páginas de OCR por task de faixa
+        timeout: Timeout das tasks em segundos
+        margem_timeout: Fração do timeout que uma task única pode ocupar
+        segundos_por_task_fila: Espera estimada por task na frente na fila
+    """
+
+    def __init__(
+        self,
+        custos: Optional[Dict[str, Dict[str, float]]] = None,
+        workers: int = 3,
+        workers_pool: int = 4,
+        paginas_por_faixa: int = 20,
+        timeout: float = 120,
+        margem_timeout: float = MARGEM_TIMEOUT_PADRAO,
+        segundos_por_task_fila: float = SEGUNDOS_POR_TASK_FILA_PADRAO
+    ):
+        self.custos = {e: {**CUSTOS_PADRAO[e], **(custos or {}).get(e, {})} for e in ESTRATEGIAS}
+        self.workers = max(workers, 1)
+        self.workers_pool = max(workers_pool, 1)
+        self.paginas_por_faixa = max(paginas_por_faixa, 1)
+        self.timeout = timeout
+        self.margem_timeout = margem_timeout
+        self.segundos_por_task_fila = segundos_por_task_fila
+
+    @classmethod
+    def de_settings(cls) -> "ModeloCusto":
+        from django.conf import settings
+        from .ocr_pool import processos_por_worker
+
+        config = getattr(settings, 'OCR_ROTEAMENTO', {})
+        return cls(
+            custos=config.get('custos'),
+            workers=settings.Q_CLUSTER.get('workers', 3),
+            workers_pool=processos_por_worker(),
+            paginas_por_faixa=getattr(settings, 'OCR_FAIXAS', {}).get('paginas_por_faixa', 20),
+            timeout=settings.Q_CLUSTER.get('timeout', 120),
+            margem_timeout=config.get('margem_timeout', MARGEM_TIMEOUT_PADRAO),
+            segundos_por_task_fila=config.get('segundos_por_task_fila', SEGUNDOS_POR_TASK_FILA_PADRAO),
+        )
+
+    def paralelismo(self, estrategia: str, c: CaracteristicasDocumento) -> float:
+        """Páginas de OCR processadas ao mesmo tempo por cada estratégia"""
+        if estrategia == ESTRATEGIA_PARALELO:
+            return max(1, min(self.workers_pool, os.cpu_count() or 1, c.paginas_ocr))
+        if estrategia == ESTRATEGIA_FAIXAS:
+            faixas = -(-c.paginas_ocr // self.paginas_por_faixa)
+            # Com fila, as faixas disputam os workers com as tasks já enfileiradas
+            livres = max(1, self.workers - c.fila)
+            return max(1, min(faixas, livres))
+        return 1
+
+    def execucao(self, estrategia: str, c: CaracteristicasDocumento) -> float:
+        """Segundos estimados de execução, sem a espera na fila"""
+        coef = self.custos[estrategia]
+        return (
+            coef['fixo']
+            + coef['por_pagina'] * c.paginas_ocr / self.paralelismo(estrategia, c)
+            + coef['por_mb'] * c.tamanho_mb
+        )
+
+    def candidatas(self, c: CaracteristicasDocumento) -> Tuple[str, ...]:
+        """
+        Estratégias que leem o tipo do arquivo: imagens vão para o RapidOCR
+        (cv2), documentos do Word só o Docling converte e o custo decide
+        entre as rotas de PDF
+        """
+        if c.tipo == TIPO_IMAGEM:
+            return (ESTRATEGIA_RAPIDOCR, ESTRATEGIA_PARALELO)
+        if c.tipo == TIPO_DOCUMENTO:
+            if not docling_disponivel():
+                logger.warning("Docling não instalado: documentos que não são PDF nem imagem não serão convertidos")
+            return (ESTRATEGIA_DOCLING,)
+        if c.paginas_ocr == 0:
+            return (ESTRATEGIA_CAMADA_TEXTO,)
+        candidatas = [ESTRATEGIA_RAPIDOCR, ESTRATEGIA_PARALELO]
+        if docling_disponivel():
+            candidatas.append(ESTRATEGIA_DOCLING)
+        candidatas.append(ESTRATEGIA_FAIXAS)
+        return tuple(candidatas)
+
+    def estimar(self, c: CaracteristicasDocumento) -> Dict[str, float]:
+        """Segundos estimados até o texto pronto, por estratégia candidata"""
+        espera = c.fila / self.workers * self.segundos_por_task_fila
+        return {e: round(espera + self.execucao(e, c), 3) for e in self.candidatas(c)}
+
+    def escolher(self, c: CaracteristicasDocumento) -> Tuple[str, Dict[str, float]]:
+        """
+        Estratégia de menor custo; uma task única que passaria da margem do
+        timeout só é escolhida se não houver faixas
+
+        Returns:
+            (estratégia, estimativas por estratégia)
+        """
+        estimativas = self.estimar(c)
+        limite = self.timeout * self.margem_timeout
+        viaveis = {
+            e: custo for e, custo in estimativas.items()
+            if e == ESTRATEGIA_FAIXAS or self.execucao(e, c) <= limite
+        }
+        estrategia = min(viaveis or estimativas, key=(viaveis or estimativas).get)
+        return estrategia, estimativas
+
+
+def ajustar_coeficientes(amostras: Iterable[Tuple[float, float, float]]) -> Optional[Dict[str, float]]:
+    """
+    Mínimos quadrados de tempo = fixo + por_pagina * páginas_efetivas + por_mb * MB
+
+    Args:
+        amostras: (páginas de OCR / paralelismo, MB, segundos reais)
+
+    Returns:
+        Coeficientes (não negativos) e erro médio absoluto, ou None com
+        menos de 3 amostras
+    """
+    import numpy as np
+
+    dados = np.asarray(list(amostras), dtype=np.float64)
+    if len(dados) < 3:
+        return None
+    x = np.column_stack([np.ones(len(dados)), dados[:, 0], dados[:, 1]])
+    coef, *_ = np.linalg.lstsq(x, dados[:, 2], rcond=None)
+    coef = np.clip(coef, 0.0, None)
+    erro = float(np.mean(np.abs(x @ coef - dados[:, 2])))
+    return {
+        'fixo': round(float(coef[0]), 4),
+        'por_pagina': round(float(coef[1]), 4),
+        'por_mb': round(float(coef[2]), 4),
+        'erro_medio_s': round(erro, 3),
+        'amostras': len(dados),
+    }
+
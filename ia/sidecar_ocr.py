@@ -0,0 +1,288 @@
+"""
+Saída estruturada do OCR (linhas, caixas e confianças) em um sidecar .npz
+
+Cada página de OCR guarda suas linhas em PaginaOCR.linhas (um .npz pequeno
+por página), gravadas junto com o checkpoint; ao concluir o documento, as
+páginas são reunidas em um único arquivo colunar ao lado do original
+(`<arquivo>.ocr.npz`). Re-chunking, detecção de cabeçalho/rodapé e citações
+por página leem o sidecar sem refazer o OCR. Uma cópia vai para o armazém
+de artefatos (ia/armazem_ocr.py), de onde um reenvio do mesmo arquivo a lê.
+
+Layout do sidecar (sem objetos Python; carrega com allow_pickle=False):
+    linha_pagina (n,) int32            índice base 0 da página de cada linha
+    linha_caixa (n, 4, 2) float32      4 pontos em pixels da página renderizada
+    linha_confianca (n,) float32
+    linha_texto (bytes,) uint8         UTF-8 concatenado
+    linha_texto_offsets (n+1,) int64
+    pagina_numero (p,) int32           índice base 0
+    pagina_origem (p,) uint8           0 = camada de texto, 1 = OCR
+    pagina_dpi (p,) int16              0 quando desconhecido (imagens, cache)
+    pagina_dimensoes (p, 2) int32      largura e altura renderizadas em pixels
+    pagina_linhas (p+1,) int64         faixa de cada página nos arrays de linha
+    pagina_texto, pagina_texto_offsets texto completo de cada página
+    hash_documento (bytes,) uint8
+    versao () int8
+"""
+import io
+import logging
+import os
+import tempfile
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .armazem_ocr import TIPO_ESTRUTURADO, obter_armazem
+from .camada_texto import ORIGEM_CAMADA_TEXTO, ORIGEM_OCR
+from .ocr_utils import LinhaOCR, ResultadoPagina, montar_texto_paginas
+
+logger = logging.getLogger(__name__)
+
+VERSAO_SIDECAR = 1
+EXTENSAO_SIDECAR = '.ocr.npz'
+
+_CODIGOS_ORIGEM = {ORIGEM_CAMADA_TEXTO: 0, ORIGEM_OCR: 1}
+_ORIGENS = {codigo: origem for origem, codigo in _CODIGOS_ORIGEM.items()}
+
+
+def _codificar_textos(textos: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Strings em um blob UTF-8 + offsets (colunar, sem pickle)"""
+    codificados = [t.encode('utf-8') for t in textos]
+    offsets = np.zeros(len(codificados) + 1, dtype=np.int64)
+    np.cumsum([len(c) for c in codificados], out=offsets[1:])
+    return np.frombuffer(b''.join(codificados), dtype=np.uint8), offsets
+
+
+def _decodificar_texto(blob: np.ndarray, offsets: np.ndarray, i: int) -> str:
+    return blob[offsets[i]:offsets[i + 1]].tobytes().decode('utf-8')
+
+
+def caminho_sidecar(arquivo_path: str) -> str:
+    return arquivo_path + EXTENSAO_SIDECAR
+
+
+def codificar_linhas(resultado: ResultadoPagina) -> bytes:
+    """Linhas e dimensões de uma página em um .npz compacto (PaginaOCR.linhas)"""
+    texto, offsets = _codificar_textos([linha.texto for linha in resultado.linhas])
+    buffer = io.BytesIO()
+    np.savez(
+        buffer,
+        caixa=np.asarray([linha.caixa for linha in resultado.linhas], dtype=np.float32).reshape(-1, 4, 2),
+        confianca=np.asarray([linha.confianca for linha in resultado.linhas], dtype=np.float32),
+        texto=texto,
+        texto_offsets=offsets,
+        dimensoes=np.asarray([resultado.largura, resultado.altura], dtype=np.int32),
+    )
+    return buffer.getvalue()
+
+
+def _ler_linhas(blob: bytes) -> Dict[str, np.ndarray]:
+    with np.load(io.BytesIO(bytes(blob)), allow_pickle=False) as dados:
+        return {chave: dados[chave] for chave in dados.files}
+
+
+def decodificar_linhas(blob: bytes) -> List[LinhaOCR]:
+    """Inverso de codificar_linhas"""
+    dados = _ler_linhas(blob)
+    return [
+        LinhaOCR(
+            texto=_decodificar_texto(dados['texto'], dados['texto_offsets'], i),
+            confianca=float(dados['confianca'][i]),
+            caixa=dados['caixa'][i].tolist(),
+        )
+        for i in range(len(dados['confianca']))
+    ]
+
+
+def gravar_sidecar(documento, hash_documento: str) -> Optional[str]:
+    """
+    Reúne as páginas de PaginaOCR do documento no sidecar ao lado do arquivo
+
+    A gravação é atômica (arquivo temporário + os.replace), então um leitor
+    nunca vê um sidecar pela metade.
+
+    Args:
+        documento: Instância de Documentos
+        hash_documento: Hash do arquivo, gravado no sidecar para validar a leitura
+
+    Returns:
+        Caminho do sidecar, ou None se o documento não tem páginas
+    """
+    from .models import PaginaOCR
+
+    linhas_caixa: List[np.ndarray] = []
+    linhas_confianca: List[np.ndarray] = []
+    linhas_texto: List[np.ndarray] = []
+    linhas_offsets: List[np.ndarray] = []
+    numeros, origens, dpis, dimensoes, textos = [], [], [], [], []
+    inicio_linhas = [0]
+    bytes_texto = 0
+
+    paginas = (
+        PaginaOCR.objects
+        .filter(documento=documento, hash_documento=hash_documento)
+        .order_by('pagina')
+        .values_list('pagina', 'origem', 'dpi', 'texto', 'linhas')
+    )
+    for pagina, origem, dpi, texto, blob in paginas.iterator():
+        numeros.append(pagina - 1)
+        origens.append(_CODIGOS_ORIGEM.get(origem, 1))
+        dpis.append(dpi or 0)
+        textos.append(texto)
+        if blob:
+            dados = _ler_linhas(blob)
+            linhas_caixa.append(dados['caixa'])
+            linhas_confianca.append(dados['confianca'])
+            linhas_texto.append(dados['texto'])
+            # Offsets por página viram offsets no blob do documento
+            linhas_offsets.append(dados['texto_offsets'][1:] + bytes_texto)
+            bytes_texto += len(dados['texto'])
+            dimensoes.append(dados['dimensoes'])
+            inicio_linhas.append(inicio_linhas[-1] + len(dados['confianca']))
+        else:
+            dimensoes.append(np.zeros(2, dtype=np.int32))
+            inicio_linhas.append(inicio_linhas[-1])
+
+    if not numeros:
+        return None
+
+    n = inicio_linhas[-1]
+    pagina_texto, pagina_texto_offsets = _codificar_textos(textos)
+    arrays = {
+        'linha_pagina': np.repeat(
+            np.asarray(numeros, dtype=np.int32), np.diff(np.asarray(inicio_linhas, dtype=np.int64))
+        ),
+        'linha_caixa': np.concatenate(linhas_caixa) if linhas_caixa else np.zeros((0, 4, 2), np.float32),
+        'linha_confianca': np.concatenate(linhas_confianca) if linhas_confianca else np.zeros(0, np.float32),
+        'linha_texto': np.concatenate(linhas_texto) if linhas_texto else np.zeros(0, np.uint8),
+        'linha_texto_offsets': np.concatenate([np.zeros(1, np.int64), *linhas_offsets]),
+        'pagina_numero': np.asarray(numeros, dtype=np.int32),
+        'pagina_origem': np.asarray(origens, dtype=np.uint8),
+        'pagina_dpi': np.asarray(dpis, dtype=np.int16),
+        'pagina_dimensoes': np.asarray(dimensoes, dtype=np.int32).reshape(-1, 2),
+        'pagina_linhas': np.asarray(inicio_linhas, dtype=np.int64),
+        'pagina_texto': pagina_texto,
+        'pagina_texto_offsets': pagina_texto_offsets,
+        'hash_documento': np.frombuffer(hash_documento.encode(), dtype=np.uint8),
+        'versao': np.int8(VERSAO_SIDECAR),
+    }
+
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **arrays)
+    dados = buffer.getvalue()
+
+    destino = caminho_sidecar(documento.arquivo.path)
+    fd, temporario = tempfile.mkstemp(dir=os.path.dirname(destino), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(dados)
+        os.replace(temporario, destino)
+    except BaseException:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+    obter_armazem().salvar(TIPO_ESTRUTURADO, hash_documento, dados)
+
+    logger.info(
+        f"Sidecar de OCR gravado para documento {documento.id}: {len(numeros)} página(s), "
+        f"{n} linha(s), {os.path.getsize(destino) / 1024:.1f} KB"
+    )
+    return destino
+
+
+class SidecarOCR:
+    """
+    Leitura do sidecar de um documento
+
+    Args:
+        arrays: Arrays do .npz (ver o layout no topo do módulo)
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self.arrays = arrays
+        self.hash_documento = arrays['hash_documento'].tobytes().decode()
+        # Posição de cada página nos arrays por página
+        self._posicao = {int(p): i for i, p in enumerate(arrays['pagina_numero'])}
+
+    @classmethod
+    def carregar(cls, caminho) -> "SidecarOCR":
+        """caminho: arquivo .npz ou objeto de arquivo"""
+        with np.load(caminho, allow_pickle=False) as dados:
+            versao = int(dados['versao'])
+            if versao != VERSAO_SIDECAR:
+                raise ValueError(f"Versão de sidecar não suportada: {versao}")
+            return cls({chave: dados[chave] for chave in dados.files})
+
+    @property
+    def paginas(self) -> List[int]:
+        """Índices base 0 das páginas presentes"""
+        return sorted(self._posicao)
+
+    @property
+    def num_linhas(self) -> int:
+        return len(self.arrays['linha_confianca'])
+
+    def origem(self, pagina: int) -> str:
+        return _ORIGENS[int(self.arrays['pagina_origem'][self._posicao[pagina]])]
+
+    def dpi(self, pagina: int) -> Optional[int]:
+        return int(self.arrays['pagina_dpi'][self._posicao[pagina]]) or None
+
+    def dimensoes(self, pagina: int) -> Tuple[int, int]:
+        largura, altura = self.arrays['pagina_dimensoes'][self._posicao[pagina]]
+        return int(largura), int(altura)
+
+    def texto_pagina(self, pagina: int) -> str:
+        return _decodificar_texto(
+            self.arrays['pagina_texto'], self.arrays['pagina_texto_offsets'], self._posicao[pagina]
+        )
+
+    def texto(self) -> str:
+        """
+        Texto com separadores de página, igual a Documentos.content de PDFs
+        (imagens gravam só texto_pagina(0))
+        """
+        return montar_texto_paginas({p: self.texto_pagina(p) for p in self.paginas})
+
+    def _faixa_linhas(self, pagina: int) -> range:
+        i = self._posicao[pagina]
+        return range(int(self.arrays['pagina_linhas'][i]), int(self.arrays['pagina_linhas'][i + 1]))
+
+    def linhas_pagina(self, pagina: int) -> List[LinhaOCR]:
+        """
+        Linhas reconhecidas na página; vazio para camada de texto e para
+        páginas cujo texto veio do cache
+        """
+        return [self._linha(i) for i in self._faixa_linhas(pagina)]
+
+    def _linha(self, i: int) -> LinhaOCR:
+        return LinhaOCR(
+            texto=_decodificar_texto(self.arrays['linha_texto'], self.arrays['linha_texto_offsets'], i),
+            confianca=float(self.arrays['linha_confianca'][i]),
+            caixa=self.arrays['linha_caixa'][i].tolist(),
+        )
+
+    def iterar_linhas(self) -> Iterator[Tuple[int, LinhaOCR]]:
+        """(página base 0, linha) de todo o documento, em ordem"""
+        for i, pagina in enumerate(self.arrays['linha_pagina']):
+            yield int(pagina), self._linha(i)
+
+
+def carregar_sidecar(documento) -> Optional[SidecarOCR]:
+    """
+    Sidecar do documento, ou None se não existe ou foi gerado para outro
+    conteúdo (arquivo substituído)
+
+    Sem o arquivo ao lado do documento (ex.: mesmo conteúdo enviado de
+    novo), procura no armazém de artefatos pelo hash do arquivo.
+    """
+    caminho = caminho_sidecar(documento.arquivo.path)
+    if not os.path.exists(caminho):
+        if not documento.hash_conteudo:
+            return None
+        dados = obter_armazem().obter(TIPO_ESTRUTURADO, documento.hash_conteudo)
+        return SidecarOCR.carregar(io.BytesIO(dados)) if dados is not None else None
+    sidecar = SidecarOCR.carregar(caminho)
+    if documento.hash_conteudo and sidecar.hash_documento != documento.hash_conteudo:
+        logger.info(f"Sidecar de OCR do documento {documento.id} é de outro conteúdo; ignorado")
+        return None
+    return sidecar
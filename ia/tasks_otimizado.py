@@ -1,221 +1,822 @@
 """
 Versão otimizada das tasks com processamento paralelo e cache
 """
-from usuarios.models import Documentos
+from usuarios.models import Documentos, LoteDocumentos
+from usuarios.utils import hash_conteudo_caminho
+from django.conf import settings
+from django.core.cache import cache
 from django.shortcuts import get_object_or_404
 from .agents import JuriAI
+from .camada_texto import extrair_camada_texto, ORIGEM_OCR
+from .armazem_ocr import TIPO_TEXTO, obter_armazem
+from .busca_hibrida import obter_indice_lexico
+from .cache_paginas import CachePaginas
+from .cache_embeddings import obter_cache_embeddings
+from .indice_vetorial import indexar_documento, remover_documento
+from . import lancedb_agno
+from .ingestao import ChunkerJuridico, EmbedderAgno, IngestaoRAG
+from .checkpoint_ocr import CheckpointOCR, DocumentoIncompleto, contar_concluidas
+from .conversores_docling import obter_registro
+from .embedders import nome_tabela
+from .models import ChunkIndexado, ProcessamentoOCR, RotaOCR
+from .roteamento_ocr import ModeloCusto, medir_documento, tamanho_fila, ESTRATEGIA_FAIXAS
+from .sidecar_ocr import gravar_sidecar
+from .ocr_utils import (
+    contar_paginas_pdf,
+    paginas_em_fila,
+    agrupar_em_lotes,
+    proporcao_tinta,
+    precisa_reocr,
+    escolher_melhor,
+    resumir_tempos,
+    ResultadoPagina,
+    DPI_BAIXO,
+    DPI_ALTO,
+)
+import hashlib
+import json
 import logging
 import time
-import hashlib
-from django.core.cache import cache
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import List
-import os
+import uuid
+from django.db.models import F
+from django.utils import timezone
+from django_q.tasks import Chain, async_task, schedule
+from django_q.models import Schedule, Task
+from datetime import timedelta
+from concurrent.futures import as_completed, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+# Resolução da miniatura usada só como chave do cache de páginas do Docling
+DPI_HASH_DOCLING = 72
 
-def ocr_and_markdown_file_otimizado(instance_id):
+# Documentos divididos em faixas (settings.OCR_FAIXAS)
+PAGINAS_POR_FAIXA_PADRAO = 20
+MOTOR_FAIXAS_PADRAO = 'rapidocr'
+
+
+def _hash_documento(documentos) -> str:
     """
-    Versão otimizada com cache e logging
+    Retorna o hash de conteúdo gravado no upload; documentos antigos, sem
+    hash, têm o arquivo lido em blocos uma única vez
+    """
+    if not documentos.hash_conteudo:
+        documentos.hash_conteudo = hash_conteudo_caminho(documentos.arquivo.path)
+        Documentos.objects.filter(id=documentos.id).update(hash_conteudo=documentos.hash_conteudo)
+    return documentos.hash_conteudo
+
+
+def motor_cache_paginas(motor: str) -> str:
+    """
+    Motor do cache de páginas e do texto no armazém
+
+    Para o RapidOCR, o mesmo bitmap gera outro texto se a cadeia de
+    pré-processamento (settings.OCR_PREPROCESSAMENTO) ou o lote do
+    reconhecedor (settings.OCR_LOTE, só na task 'rapidocr'; o pool usa o
+    padrão) mudarem, então um hash dessa configuração entra no nome.
+
+    Args:
+        motor: 'docling', 'rapidocr' ou 'paralelo'
+    """
+    if motor == 'docling':
+        return 'docling'
+    configuracao = {'etapas': getattr(settings, 'OCR_PREPROCESSAMENTO', {}).get(motor)}
+    if motor == 'rapidocr':
+        lote = getattr(settings, 'OCR_LOTE', {})
+        configuracao['lote'] = {'paginas': lote.get('paginas', 1), 'rec_batch_num': lote.get('rec_batch_num')}
+    assinatura = hashlib.blake2b(
+        json.dumps(configuracao, sort_keys=True).encode(), digest_size=6
+    ).hexdigest()
+    return f'rapidocr_adaptativo_{assinatura}'
+
+
+def _separar_paginas(
+    pdf_path: str,
+    checkpoint: Optional[CheckpointOCR] = None,
+    paginas: Optional[List[int]] = None
+) -> Tuple[Dict[int, str], List[int]]:
+    """
+    Lê a camada de texto do PDF e separa as páginas já resolvidas das que
+    precisam de OCR
+    
+    Com checkpoint, as páginas da camada de texto são gravadas nele e as
+    páginas de OCR já concluídas em uma execução anterior não voltam como
+    pendentes.
+    
+    Com `paginas` (faixa de um documento dividido), a camada de texto não é
+    lida: ela já foi gravada no checkpoint pelo fan-out, e as páginas da faixa
+    que não estão nele são as pendentes.
+    
+    Returns:
+        (textos por índice base 0, índices pendentes de OCR)
+    """
+    if paginas is not None:
+        if checkpoint is None:
+            return {}, list(paginas)
+        textos = {i: checkpoint.concluidas[i] for i in paginas if i in checkpoint.concluidas}
+        return textos, checkpoint.faltantes(paginas)
+    
+    camada = extrair_camada_texto(pdf_path)
+    textos = {i: t for i, t in enumerate(camada) if t is not None}
+    pendentes = [i for i, t in enumerate(camada) if t is None]
+    if checkpoint is not None:
+        checkpoint.salvar_camada_texto(textos)
+        textos.update({i: checkpoint.concluidas[i] for i in pendentes if i in checkpoint.concluidas})
+        pendentes = checkpoint.faltantes(pendentes)
+    return textos, pendentes
+
+
+def _faixas_contiguas(indices: List[int]) -> List[Tuple[int, int]]:
+    """Agrupa índices ordenados em faixas contíguas [(inicio, fim)] inclusivas"""
+    faixas = []
+    for idx in indices:
+        if faixas and idx == faixas[-1][1] + 1:
+            faixas[-1] = (faixas[-1][0], idx)
+        else:
+            faixas.append((idx, idx))
+    return faixas
+
+
+def extrair_texto_docling(
+    path: str,
+    cache_paginas: Optional[CachePaginas] = None,
+    checkpoint: Optional[CheckpointOCR] = None,
+    paginas: Optional[List[int]] = None
+) -> Tuple[Dict[int, str], List[int], Dict[int, ResultadoPagina]]:
+    """
+    Extrai o texto por página: camada de texto do PDF e Docling no restante
+    
+    Args:
+        path: Caminho do arquivo (PDF ou imagem)
+        cache_paginas: CachePaginas opcional para as páginas que iriam ao Docling
+        checkpoint: CheckpointOCR opcional; páginas concluídas são puladas e
+            cada faixa convertida é gravada nele
+        paginas: Índices base 0 a processar (faixa de um documento dividido);
+            None processa o documento inteiro
+        
+    Returns:
+        (textos por índice base 0, índices que passaram por OCR, detalhes do OCR)
+    """
+    registro = obter_registro()
+    if not path.lower().endswith('.pdf'):
+        result = registro.converter(path)
+        logger.info(f"Docling no worker: {registro.resumo()}")
+        return {0: result.document.export_to_markdown()}, [0], {}
+    
+    # Docling apenas nas páginas sem camada de texto utilizável
+    textos, pendentes = _separar_paginas(path, checkpoint, paginas)
+    
+    # Miniatura de cada página pendente serve de chave do cache
+    hashes = {}
+    if cache_paginas is not None:
+        for idx, img in paginas_em_fila(path, dpi=DPI_HASH_DOCLING, paginas=pendentes):
+            hashes[idx], texto_cache = cache_paginas.obter(img)
+            if texto_cache is not None:
+                textos[idx] = texto_cache
+        if checkpoint is not None:
+            checkpoint.salvar_varias({idx: textos[idx] for idx in pendentes if idx in textos}, ORIGEM_OCR)
+    sem_cache = [idx for idx in pendentes if idx not in textos]
+    
+    for inicio, fim in _faixas_contiguas(sem_cache):
+        result = registro.converter(path, page_range=(inicio + 1, fim + 1))
+        for idx in range(inicio, fim + 1):
+            textos[idx] = result.document.export_to_markdown(page_no=idx + 1)
+            if cache_paginas is not None:
+                cache_paginas.salvar(hashes[idx], textos[idx])
+        if checkpoint is not None:
+            checkpoint.salvar_varias({idx: textos[idx] for idx in range(inicio, fim + 1)}, ORIGEM_OCR)
+    if sem_cache:
+        logger.info(f"Docling no worker: {registro.resumo()}")
+    return textos, pendentes, {}
+
+
+def extrair_texto_rapidocr(
+    path: str,
+    cache_paginas: Optional[CachePaginas] = None,
+    checkpoint: Optional[CheckpointOCR] = None,
+    paginas: Optional[List[int]] = None
+) -> Tuple[Dict[int, str], List[int], Dict[int, ResultadoPagina]]:
+    """
+    Extrai o texto por página: camada de texto do PDF e RapidOCR adaptativo
+    (em lotes de páginas, conforme settings.OCR_LOTE) no restante
+    
+    Args:
+        path: Caminho do arquivo (PDF ou imagem)
+        cache_paginas: CachePaginas opcional para as páginas que iriam ao OCR
+        checkpoint: CheckpointOCR opcional; páginas concluídas são puladas e
+            cada página reconhecida é gravada nele
+        paginas: Índices base 0 a processar (faixa de um documento dividido);
+            None processa o documento inteiro
+        
+    Returns:
+        (textos por índice base 0, índices que passaram por OCR, detalhes do OCR)
     """
-    from docling.document_converter import DocumentConverter, PdfFormatOption
-    from docling.datamodel.base_models import InputFormat
-    from docling.backend.pypdfium2_backend import PyPdfiumDocumentBackend
+    from .ocr_utils import OCROptimizado
+    
+    # Processar com RapidOCR, reconhecendo as linhas de várias páginas juntas
+    config = getattr(settings, 'OCR_LOTE', {})
+    
+    def criar_ocr():
+        return OCROptimizado(
+            intra_op_threads=config.get('intra_op_threads'),
+            rec_batch_num=config.get('rec_batch_num'),
+            etapas_preprocessamento=getattr(settings, 'OCR_PREPROCESSAMENTO', {}).get('rapidocr')
+        )
+    
+    if not path.lower().endswith('.pdf'):
+        import cv2
+        img = cv2.imread(path)
+        if img is None:
+            return {0: criar_ocr().preprocessar_imagem(path)}, [0], {}
+        # Mantém linhas e caixas da imagem para o sidecar
+        resultado = criar_ocr().reconhecer_array(img)
+        return {0: resultado.texto}, [0], {0: resultado}
+    
+    # RapidOCR apenas nas páginas sem camada de texto utilizável; sem
+    # pendentes, os modelos nem são carregados
+    textos, pendentes = _separar_paginas(path, checkpoint, paginas)
+    detalhes = {}
+    if pendentes:
+        ocr = criar_ocr()
+        ao_concluir = None
+        if checkpoint is not None:
+            ao_concluir = lambda idx, resultado: checkpoint.salvar(idx, resultado.texto, ORIGEM_OCR, resultado)
+        # 150 DPI em todas as páginas; 300 só nas de baixa confiança
+        detalhes = ocr.reconhecer_paginas_pdf(
+            path,
+            paginas=pendentes,
+            dpi=DPI_BAIXO,
+            preprocessar=True,
+            cache_paginas=cache_paginas,
+            adaptativo=True,
+            paginas_por_lote=config.get('paginas', 1),
+            ao_concluir=ao_concluir
+        )
+        textos.update({i: r.texto for i, r in detalhes.items()})
+        if ocr.preprocessador is not None:
+            logger.info(f"Pré-processamento: {resumir_tempos(detalhes.values())}")
+    return textos, pendentes, detalhes
+
+
+def extrair_texto_paralelo(
+    path: str,
+    cache_paginas: Optional[CachePaginas] = None,
+    checkpoint: Optional[CheckpointOCR] = None,
+    num_workers: Optional[int] = None,
+    paginas: Optional[List[int]] = None
+) -> Tuple[Dict[int, str], List[int], Dict[int, ResultadoPagina]]:
+    """
+    Extrai o texto por página: camada de texto do PDF e RapidOCR adaptativo
+    no pool de processos no restante
+    
+    Args:
+        path: Caminho do arquivo (PDF ou imagem)
+        cache_paginas: CachePaginas opcional para as páginas que iriam ao OCR
+        checkpoint: CheckpointOCR opcional; páginas concluídas são puladas e
+            cada página reconhecida é gravada nele
+        num_workers: Processos do pool (só na primeira criação)
+        paginas: Índices base 0 a processar (faixa de um documento dividido);
+            None processa o documento inteiro
+        
+    Returns:
+        (textos por índice base 0, índices que passaram por OCR, detalhes do OCR)
+    """
+    import cv2
+    from .ocr_pool import obter_pool, descartar_pool
+    
+    etapas = getattr(settings, 'OCR_PREPROCESSAMENTO', {}).get('paralelo')
+    
+    if not path.lower().endswith('.pdf'):
+        img = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if img is None:
+            # None no pool falharia dentro do worker, sem dizer qual arquivo
+            raise ValueError(f"OpenCV não conseguiu ler a imagem {path} (arquivo corrompido ou formato sem suporte)")
+        _, resultado = obter_pool(num_workers).submeter(0, img, etapas=etapas).result()
+        return {0: resultado.texto}, [0], {0: resultado}
+    
+    # Pool de processos com RapidOCR já carregado em cada worker
+    pool = obter_pool(num_workers)
+    
+    # Páginas com camada de texto utilizável dispensam o OCR
+    resultados, pendentes = _separar_paginas(path, checkpoint, paginas)
+    num_paginas = len(resultados) + len(pendentes)
+    logger.info(f"{len(pendentes)} de {num_paginas} páginas para processar com OCR")
     
+    limite_em_andamento = pool.workers * 2
+    hashes = {}
+    tinta = {}
+    detalhes: Dict[int, ResultadoPagina] = {}
+    baixa_confianca: List[int] = []
+    
+    def concluir(idx: int, texto: str, resultado: Optional[ResultadoPagina] = None):
+        resultados[idx] = texto
+        if checkpoint is not None:
+            checkpoint.salvar(idx, texto, ORIGEM_OCR, resultado)
+    
+    def coletar(concluidos, segundo_passe: bool):
+        for future in concluidos:
+            try:
+                idx, resultado = future.result()
+                if segundo_passe:
+                    resultado = escolher_melhor(detalhes[idx], resultado)
+                elif precisa_reocr(resultado, tinta[idx]):
+                    detalhes[idx] = resultado
+                    baixa_confianca.append(idx)
+                    continue
+                detalhes[idx] = resultado
+                concluir(idx, resultado.texto, resultado)
+                if cache_paginas is not None:
+                    cache_paginas.salvar(hashes[idx], resultado.texto)
+                logger.info(f"Página {idx+1}/{num_paginas} processada")
+            except BrokenProcessPool:
+                descartar_pool()
+                raise
+            except Exception as e:
+                logger.error(f"Erro ao processar página: {str(e)}")
+    
+    def executar_passe(dpi: int, paginas: List[int], segundo_passe: bool):
+        """Renderiza em fluxo e processa em paralelo, limitando as tarefas em andamento"""
+        em_andamento = set()
+        for idx, img in paginas_em_fila(path, dpi=dpi, paginas=paginas):
+            if not segundo_passe:
+                if cache_paginas is not None:
+                    hashes[idx], texto_cache = cache_paginas.obter(img)
+                    if texto_cache is not None:
+                        concluir(idx, texto_cache)
+                        continue
+                tinta[idx] = proporcao_tinta(img)
+            if len(em_andamento) >= limite_em_andamento:
+                concluidos, em_andamento = wait(em_andamento, return_when=FIRST_COMPLETED)
+                coletar(concluidos, segundo_passe)
+            em_andamento.add(pool.submeter(
+                idx, img, dpi=dpi, melhorar_contraste=segundo_passe, etapas=etapas
+            ))
+        coletar(as_completed(em_andamento), segundo_passe)
+    
+    # Todas as páginas em DPI_BAIXO; só as de baixa confiança voltam em DPI_ALTO
+    executar_passe(DPI_BAIXO, pendentes, segundo_passe=False)
+    if baixa_confianca:
+        logger.info(
+            f"{len(baixa_confianca)} página(s) abaixo da confiança mínima; "
+            f"reprocessando em {DPI_ALTO} DPI"
+        )
+        executar_passe(DPI_ALTO, sorted(baixa_confianca), segundo_passe=True)
+        # Falha no segundo passe: fica o texto do primeiro
+        for idx in baixa_confianca:
+            if idx not in resultados:
+                concluir(idx, detalhes[idx].texto, detalhes[idx])
+    if etapas and detalhes:
+        logger.info(f"Pré-processamento: {resumir_tempos(detalhes.values())}")
+    return resultados, pendentes, detalhes
+
+
+def _registrar_tempo_rota(instance_id, estrategia: str, segundos: float):
+    """Grava o tempo real na rota pendente mais recente do documento (se houver)"""
+    rota = (
+        RotaOCR.objects
+        .filter(documento_id=instance_id, estrategia=estrategia, tempo_real__isnull=True)
+        .order_by('-id')
+        .first()
+    )
+    if rota is not None:
+        RotaOCR.objects.filter(id=rota.id).update(tempo_real=segundos, data_conclusao=timezone.now())
+        logger.info(
+            f"Rota {estrategia} do documento {instance_id}: {segundos:.2f}s reais, "
+            f"{rota.custo_estimado:.2f}s estimados"
+        )
+
+
+def _gravar_sidecar(documentos, file_hash: str):
+    """Linhas, caixas e confianças ao lado do arquivo; falha aqui não perde o OCR"""
+    try:
+        gravar_sidecar(documentos, file_hash)
+    except Exception as e:
+        logger.warning(f"Sidecar de OCR do documento {documentos.id} não gravado: {str(e)}", exc_info=True)
+
+
+def _executar_ocr(
+    instance_id, descricao: str, prefixo_cache: str, motor: str, estrategia: str, extrair, **kwargs
+):
+    """
+    Fluxo comum das tasks de OCR: cache por documento, extração por página,
+    proveniência e gravação do conteúdo
+
+    `motor` ('docling', 'rapidocr' ou 'paralelo') define a configuração que
+    entra nas chaves de cache (motor_cache_paginas)
+    """
     start_time = time.time()
     
     try:
         documentos = get_object_or_404(Documentos, id=instance_id)
         
-        logger.info(f"Iniciando OCR para documento {instance_id}: {documentos.arquivo.name}")
+        logger.info(f"Iniciando {descricao} para documento {instance_id}: {documentos.arquivo.name}")
         
-        # Gerar hash do arquivo para cache
-        with open(documentos.arquivo.path, 'rb') as f:
-            file_hash = hashlib.md5(f.read()).hexdigest()
+        # Hash de conteúdo calculado no upload
+        file_hash = _hash_documento(documentos)
         
-        cache_key = f'ocr_{file_hash}'
+        motor_paginas = motor_cache_paginas(motor)
+        cache_key = f'{prefixo_cache}_{file_hash}'
+        if motor_paginas != motor:
+            cache_key = f'{prefixo_cache}_{motor_paginas}_{file_hash}'
         
-        # Verificar cache
-        cached_result = cache.get(cache_key)
+        # Verificar o armazém de artefatos
+        cached_result = obter_armazem().obter_texto(TIPO_TEXTO, cache_key)
         if cached_result:
-            logger.info(f"Resultado obtido do cache para documento {instance_id}")
+            logger.info(f"Resultado de {descricao} obtido do armazém para documento {instance_id}")
             documentos.content = cached_result
-            documentos.save()
+            documentos.save(reindexar=False)
             return
         
-        # Configuração otimizada do Docling
-        pipeline_options = PdfFormatOption(
-            backend=PyPdfiumDocumentBackend,
-            do_ocr=True,
-            do_table_structure=True,
-            images_scale=1.5,  # Reduzido para melhor performance
-            generate_page_images=False,
-            generate_picture_images=False,
-        )
-        
-        converter = DocumentConverter(
-            format_options={
-                InputFormat.PDF: pipeline_options,
-            }
-        )
-        
-        result = converter.convert(documentos.arquivo.path)
-        doc = result.document
-        texto = doc.export_to_markdown()
+        path = documentos.arquivo.path
+        # Páginas concluídas em execuções anteriores (timeout/retry) são puladas
+        checkpoint = CheckpointOCR(documentos, file_hash)
+        if checkpoint.retomadas:
+            logger.info(f"Retomando documento {instance_id}: {checkpoint.retomadas} página(s) já concluída(s)")
+        
+        cache_paginas = CachePaginas(motor_paginas)
+        textos, pendentes, detalhes = extrair(path, cache_paginas=cache_paginas, checkpoint=checkpoint, **kwargs)
+        if pendentes:
+            logger.info(f"Cache de páginas do documento {instance_id}: {cache_paginas.resumo()}")
+        
+        if path.lower().endswith('.pdf'):
+            # Só monta o conteúdo com todas as páginas concluídas; senão a
+            # task falha e o retry retoma as que faltam
+            texto = checkpoint.montar_texto(contar_paginas_pdf(path))
+        else:
+            # Imagens viram uma página só, sem separador
+            texto = textos[0]
+            checkpoint.salvar(0, texto, ORIGEM_OCR, detalhes.get(0))
+        logger.info(f"Documento {instance_id}: {checkpoint.resumo()}")
+        _gravar_sidecar(documentos, file_hash)
         
-        # Salvar em cache por 7 dias
-        cache.set(cache_key, texto, 60 * 60 * 24 * 7)
+        obter_armazem().salvar(TIPO_TEXTO, cache_key, texto)
         
         documentos.content = texto
-        documentos.save()
+        documentos.save(reindexar=False)
         
         elapsed = time.time() - start_time
-        logger.info(f"OCR concluído para documento {instance_id} em {elapsed:.2f}s")
+        logger.info(
+            f"{descricao} concluído para documento {instance_id} em {elapsed:.2f}s ({len(textos)} páginas)"
+        )
+        _registrar_tempo_rota(instance_id, estrategia, elapsed)
         
     except Exception as e:
-        logger.error(f"Erro no OCR do documento {instance_id}: {str(e)}", exc_info=True)
+        logger.error(f"Erro no {descricao} do documento {instance_id}: {str(e)}", exc_info=True)
         raise
 
 
+def ocr_and_markdown_file_otimizado(instance_id):
+    """
+    Versão otimizada com cache e logging
+    """
+    _executar_ocr(instance_id, 'OCR', 'ocr', 'docling', 'docling', extrair_texto_docling)
+
+
 def ocr_and_markdown_file_rapidocr(instance_id):
     """
     Versão usando RapidOCR (mais rápido)
     """
-    from .ocr_utils import OCROptimizado
+    _executar_ocr(instance_id, 'RapidOCR', 'rapidocr', 'rapidocr', 'rapidocr', extrair_texto_rapidocr)
+
+
+def ocr_paralelo_multipaginas(instance_id, num_workers: Optional[int] = None):
+    """
+    Versão com processamento paralelo de páginas em um pool de processos
+    Ideal para PDFs com muitas páginas
+    """
+    _executar_ocr(
+        instance_id, 'OCR paralelo', 'ocr_paralelo', 'paralelo', 'paralelo',
+        extrair_texto_paralelo, num_workers=num_workers
+    )
+
+
+def ocr_camada_texto(instance_id):
+    """
+    PDF inteiramente nativo: texto da camada de texto; páginas que a
+    amostragem do roteamento não viu e não têm texto ainda passam pelo RapidOCR
+    """
+    _executar_ocr(
+        instance_id, 'Camada de texto', 'rapidocr', 'rapidocr', 'camada_texto', extrair_texto_rapidocr
+    )
+
+
+# Extrator por nome de motor (o cache de páginas vem de motor_cache_paginas)
+EXTRATORES = {
+    'docling': extrair_texto_docling,
+    'rapidocr': extrair_texto_rapidocr,
+    'paralelo': extrair_texto_paralelo,
+}
+
+
+# Task de OCR de cada estratégia de rotear_ocr (faixas tem fluxo próprio)
+TASKS_ESTRATEGIA = {
+    'camada_texto': ocr_camada_texto,
+    'rapidocr': ocr_and_markdown_file_rapidocr,
+    'docling': ocr_and_markdown_file_otimizado,
+    'paralelo': ocr_paralelo_multipaginas,
+}
+
+
+def _chave_texto_faixas(file_hash: str) -> str:
+    """Chave do texto montado no armazém, com a configuração do motor das faixas"""
+    motor = getattr(settings, 'OCR_FAIXAS', {}).get('motor', MOTOR_FAIXAS_PADRAO)
+    return f'ocr_faixas_{motor_cache_paginas(motor)}_{file_hash}'
+
+
+def ocr_em_faixas(instance_id):
+    """
+    Fan-out do OCR de documentos grandes
     
-    start_time = time.time()
+    Lê a camada de texto uma vez, divide as páginas restantes em faixas de
+    settings.OCR_FAIXAS['paginas_por_faixa'] páginas pendentes e agenda uma
+    task por faixa em um grupo do django-q. O hook concluir_faixa faz o
+    fan-in; rag_documentos só roda depois da montagem do documento.
     
+    Chamar de novo retoma o documento: páginas já no checkpoint não voltam
+    para as faixas.
+    """
     try:
         documentos = get_object_or_404(Documentos, id=instance_id)
+        file_hash = _hash_documento(documentos)
         
-        logger.info(f"Iniciando RapidOCR para documento {instance_id}: {documentos.arquivo.name}")
-        
-        # Gerar hash do arquivo para cache
-        with open(documentos.arquivo.path, 'rb') as f:
-            file_hash = hashlib.md5(f.read()).hexdigest()
-        
-        cache_key = f'rapidocr_{file_hash}'
-        
-        # Verificar cache
-        cached_result = cache.get(cache_key)
+        cached_result = obter_armazem().obter_texto(TIPO_TEXTO, _chave_texto_faixas(file_hash))
         if cached_result:
-            logger.info(f"Resultado RapidOCR obtido do cache para documento {instance_id}")
+            logger.info(f"Resultado do OCR em faixas obtido do armazém para documento {instance_id}")
             documentos.content = cached_result
-            documentos.save()
+            documentos.save(reindexar=False)
+            async_task(rag_documentos, instance_id)
             return
         
-        # Processar com RapidOCR
-        ocr = OCROptimizado()
+        config = getattr(settings, 'OCR_FAIXAS', {})
+        motor = config.get('motor', MOTOR_FAIXAS_PADRAO)
+        tamanho = config.get('paginas_por_faixa', PAGINAS_POR_FAIXA_PADRAO)
+        
+        path = documentos.arquivo.path
+        checkpoint = CheckpointOCR(documentos, file_hash)
+        _, pendentes = _separar_paginas(path, checkpoint)
+        # Cada faixa cobre `tamanho` páginas pendentes; as da camada de texto
+        # no meio dela já estão no checkpoint e são puladas
+        faixas = [(lote[0], lote[-1]) for lote in agrupar_em_lotes(iter(pendentes), tamanho)]
+        
+        grupo = f'ocr_{instance_id}_{uuid.uuid4().hex[:8]}'
+        ProcessamentoOCR.objects.update_or_create(
+            documento=documentos,
+            defaults={
+                'grupo': grupo,
+                'motor': motor,
+                'status': 'processando',
+                'total_paginas': contar_paginas_pdf(path),
+                'faixas_total': len(faixas),
+                'faixas_concluidas': 0,
+                'erro': '',
+                'data_conclusao': None,
+            },
+        )
         
-        if documentos.arquivo.path.lower().endswith('.pdf'):
-            texto = ocr.processar_pdf_como_imagens(
-                documentos.arquivo.path, 
-                dpi=150,  # 150 para velocidade, 300 para qualidade
-                preprocessar=True
+        if not faixas:
+            ProcessamentoOCR.objects.filter(documento=documentos).update(status='montando')
+            _agendar_montagem(instance_id)
+            return
+        
+        for inicio, fim in faixas:
+            async_task(
+                ocr_faixa, instance_id, inicio, fim, motor,
+                group=grupo,
+                hook='ia.tasks_otimizado.concluir_faixa',
+                task_name=f'{grupo}_{inicio + 1}-{fim + 1}',
             )
-        else:
-            texto = ocr.preprocessar_imagem(documentos.arquivo.path)
+        logger.info(
+            f"Documento {instance_id}: {len(pendentes)} página(s) de OCR em {len(faixas)} faixa(s) "
+            f"(grupo {grupo}, motor {motor}); {checkpoint.retomadas} já no checkpoint"
+        )
         
-        # Salvar em cache por 7 dias
-        cache.set(cache_key, texto, 60 * 60 * 24 * 7)
+    except Exception as e:
+        logger.error(f"Erro ao dividir o OCR do documento {instance_id}: {str(e)}", exc_info=True)
+        raise
+
+
+def rotear_ocr(instance_id):
+    """
+    Primeira task de um documento novo: mede o arquivo, escolhe a estratégia
+    de OCR pelo modelo de custo, registra a rota e agenda o OCR seguido da
+    indexação (ou o fan-out em faixas, que agenda a indexação no fan-in)
+    """
+    try:
+        documentos = get_object_or_404(Documentos, id=instance_id)
         
-        documentos.content = texto
-        documentos.save()
+        modelo = ModeloCusto.de_settings()
+        caracteristicas = medir_documento(
+            documentos.arquivo.path, tamanho_bytes=documentos.tamanho_bytes, tipo_mime=documentos.tipo_mime
+        )
+        estrategia, estimativas = modelo.escolher(caracteristicas)
+        
+        RotaOCR.objects.create(
+            documento=documentos,
+            estrategia=estrategia,
+            paginas=caracteristicas.paginas,
+            paginas_ocr=caracteristicas.paginas_ocr,
+            tamanho_bytes=caracteristicas.tamanho_bytes,
+            proporcao_camada_texto=caracteristicas.proporcao_camada_texto,
+            fila=caracteristicas.fila,
+            paralelismo=modelo.paralelismo(estrategia, caracteristicas),
+            estimativas=estimativas,
+            custo_estimado=estimativas[estrategia],
+        )
+        logger.info(
+            f"Documento {instance_id}: rota {estrategia} ({caracteristicas.paginas} páginas, "
+            f"{caracteristicas.proporcao_camada_texto:.0%} com camada de texto, fila {caracteristicas.fila}); "
+            f"estimativas {estimativas}"
+        )
         
-        elapsed = time.time() - start_time
-        logger.info(f"RapidOCR concluído para documento {instance_id} em {elapsed:.2f}s")
+        if estrategia == ESTRATEGIA_FAIXAS:
+            ocr_em_faixas(instance_id)
+            return
+        
+        chain = Chain()
+        chain.append(TASKS_ESTRATEGIA[estrategia], instance_id)
+        chain.append(rag_documentos, instance_id)
+        chain.run()
         
     except Exception as e:
-        logger.error(f"Erro no RapidOCR do documento {instance_id}: {str(e)}", exc_info=True)
+        logger.error(f"Erro ao rotear o OCR do documento {instance_id}: {str(e)}", exc_info=True)
         raise
 
 
-def ocr_paralelo_multipaginas(instance_id, num_workers: int = 4):
-    """
-    Versão com processamento paralelo de páginas
-    Ideal para PDFs com muitas páginas
+def ocr_faixa(instance_id, inicio: int, fim: int, motor: str = MOTOR_FAIXAS_PADRAO):
     """
-    from pdf2image import convert_from_path
-    from .ocr_utils import OCROptimizado
+    OCR das páginas [inicio, fim] (base 0) de um documento dividido
     
+    Cada página vai para o checkpoint assim que concluída; a task só termina
+    com sucesso quando a faixa inteira está nele.
+    """
     start_time = time.time()
     
+    documentos = get_object_or_404(Documentos, id=instance_id)
+    file_hash = _hash_documento(documentos)
+    extrair = EXTRATORES[motor]
+    
+    checkpoint = CheckpointOCR(documentos, file_hash)
+    paginas = list(range(inicio, fim + 1))
+    cache_paginas = CachePaginas(motor_cache_paginas(motor))
+    _, pendentes, _ = extrair(
+        documentos.arquivo.path, cache_paginas=cache_paginas, checkpoint=checkpoint, paginas=paginas
+    )
+    
+    faltando = checkpoint.faltantes(paginas)
+    if faltando:
+        raise DocumentoIncompleto(
+            f"Documento {instance_id}: faixa {inicio + 1}-{fim + 1} com {len(faltando)} página(s) sem texto"
+        )
+    
+    elapsed = time.time() - start_time
+    logger.info(
+        f"Faixa {inicio + 1}-{fim + 1} do documento {instance_id} concluída em {elapsed:.2f}s "
+        f"({len(pendentes)} página(s) de OCR)"
+    )
+
+
+def concluir_faixa(task):
+    """
+    Hook de cada task de faixa: atualiza o progresso e, quando o checkpoint
+    tem todas as páginas, agenda a montagem do documento seguida da
+    indexação (fan-in)
+    
+    O hook pode rodar mais de uma vez para a mesma faixa (falha seguida do
+    retry do broker), então nada é incrementado: faixas concluídas são as
+    tasks do grupo com sucesso e o fechamento depende só do checkpoint.
+    """
+    instance_id = task.args[0]
+    # Tasks de um grupo anterior (documento redisparado) são ignoradas
+    processamento = ProcessamentoOCR.objects.filter(documento_id=instance_id, grupo=task.group)
+    
+    if not task.success:
+        # Falhas não são confirmadas no broker: a faixa volta após o `retry`
+        # do Q_CLUSTER e só é definitiva ao esgotar o max_attempts
+        max_tentativas = getattr(settings, 'Q_CLUSTER', {}).get('max_attempts', 0)
+        definitiva = max_tentativas > 0 and task.attempt_count >= max_tentativas
+        alteracoes = {'erro': f"Faixa {task.name}: {task.result}"[:2000]}
+        if definitiva:
+            alteracoes['status'] = 'erro'
+        processamento.update(**alteracoes)
+        if definitiva:
+            _concluir_lote(instance_id)
+        logger.error(
+            f"Faixa {task.name} do documento {instance_id} falhou "
+            f"(tentativa {task.attempt_count}{', sem novas tentativas' if definitiva else ''}); "
+            f"ocr_em_faixas({instance_id}) retoma as páginas que faltam"
+        )
+        return
+    
+    atual = processamento.first()
+    if atual is None:
+        return
+    concluidas = Task.objects.filter(group=task.group, success=True).values('name').distinct().count()
+    processamento.update(faixas_concluidas=min(concluidas, atual.faixas_total))
+    
+    documentos = get_object_or_404(Documentos, id=instance_id)
+    if contar_concluidas(instance_id, _hash_documento(documentos)) < atual.total_paginas:
+        return
+    # Só a atualização que muda o status agenda a montagem, então ela roda
+    # uma única vez mesmo com hooks concorrentes ou repetidos
+    fechou = processamento.filter(status__in=('processando', 'erro')).update(status='montando', erro='')
+    if fechou:
+        _agendar_montagem(instance_id)
+
+
+def _agendar_montagem(instance_id):
+    chain = Chain()
+    chain.append(montar_documento_faixas, instance_id)
+    chain.append(rag_documentos, instance_id)
+    chain.run()
+
+
+def montar_documento_faixas(instance_id):
+    """
+    Fan-in: junta as páginas do checkpoint no conteúdo do documento
+    """
     try:
         documentos = get_object_or_404(Documentos, id=instance_id)
+        file_hash = _hash_documento(documentos)
         
-        logger.info(f"Iniciando OCR paralelo para documento {instance_id}: {documentos.arquivo.name}")
-        
-        # Gerar hash do arquivo para cache
-        with open(documentos.arquivo.path, 'rb') as f:
-            file_hash = hashlib.md5(f.read()).hexdigest()
-        
-        cache_key = f'ocr_paralelo_{file_hash}'
-        
-        # Verificar cache
-        cached_result = cache.get(cache_key)
-        if cached_result:
-            logger.info(f"Resultado paralelo obtido do cache para documento {instance_id}")
-            documentos.content = cached_result
-            documentos.save()
-            return
-        
-        # Converter PDF em imagens
-        logger.info(f"Convertendo PDF em imagens...")
-        images = convert_from_path(documentos.arquivo.path, dpi=150)
-        logger.info(f"{len(images)} páginas para processar")
-        
-        # Criar instância OCR
-        ocr = OCROptimizado()
+        checkpoint = CheckpointOCR(documentos, file_hash)
+        texto = checkpoint.montar_texto(contar_paginas_pdf(documentos.arquivo.path))
+        logger.info(f"Documento {instance_id}: {checkpoint.resumo()}")
+        _gravar_sidecar(documentos, file_hash)
         
-        def processar_pagina(img_data):
-            idx, img = img_data
-            temp_path = f"/tmp/doc_{instance_id}_page_{idx}_{os.getpid()}.jpg"
-            img.save(temp_path, 'JPEG', quality=85)
-            texto = ocr.preprocessar_imagem(temp_path)
-            try:
-                os.remove(temp_path)
-            except:
-                pass
-            return idx, texto
-        
-        # Processar páginas em paralelo
-        resultados = {}
-        with ThreadPoolExecutor(max_workers=num_workers) as executor:
-            futures = {executor.submit(processar_pagina, (i, img)): i 
-                      for i, img in enumerate(images)}
-            
-            for future in as_completed(futures):
-                try:
-                    idx, texto = future.result()
-                    resultados[idx] = texto
-                    logger.info(f"Página {idx+1}/{len(images)} processada")
-                except Exception as e:
-                    logger.error(f"Erro ao processar página: {str(e)}")
-        
-        # Ordenar e juntar textos
-        texto_final = "\n\n".join([
-            f"--- Página {i+1} ---\n{resultados[i]}" 
-            for i in sorted(resultados.keys())
-        ])
-        
-        # Salvar em cache por 7 dias
-        cache.set(cache_key, texto_final, 60 * 60 * 24 * 7)
-        
-        documentos.content = texto_final
-        documentos.save()
+        obter_armazem().salvar(TIPO_TEXTO, _chave_texto_faixas(file_hash), texto)
         
-        elapsed = time.time() - start_time
-        logger.info(f"OCR paralelo concluído para documento {instance_id} em {elapsed:.2f}s ({len(images)} páginas)")
+        documentos.content = texto
+        documentos.save(reindexar=False)
+        agora = timezone.now()
+        ProcessamentoOCR.objects.filter(documento=documentos).update(status='concluido', data_conclusao=agora)
+        
+        # Tempo da rota em faixas: do fan-out à montagem, incluindo as esperas
+        # das faixas na fila
+        processamento = ProcessamentoOCR.objects.filter(documento=documentos).first()
+        if processamento is not None:
+            _registrar_tempo_rota(
+                instance_id, ESTRATEGIA_FAIXAS, (agora - processamento.data_inicio).total_seconds()
+            )
         
     except Exception as e:
-        logger.error(f"Erro no OCR paralelo do documento {instance_id}: {str(e)}", exc_info=True)
+        ProcessamentoOCR.objects.filter(documento_id=instance_id).update(status='erro', erro=str(e)[:2000])
+        logger.error(f"Erro ao montar o documento {instance_id}: {str(e)}", exc_info=True)
+        _concluir_lote(instance_id)
         raise
 
 
+def enfileirar_lote(lote_id):
+    """
+    Alimenta a fila com os documentos de um lote sem inundá-la: enfileira
+    até `enfileirar_por_vez` enquanto a fila estiver abaixo de `fila_max`
+    (settings.UPLOAD_LOTE) e se reagenda até o lote inteiro estar na fila.
+    Todas as tasks do lote ficam no grupo do lote.
+    """
+    from usuarios.signals import iniciar_processamento
+
+    config = getattr(settings, 'UPLOAD_LOTE', {})
+    por_vez = config.get('enfileirar_por_vez', 10)
+    fila_max = config.get('fila_max', 30)
+    intervalo = config.get('intervalo_s', 15)
+
+    lote = get_object_or_404(LoteDocumentos, id=lote_id)
+    vagas = min(por_vez, max(0, fila_max - tamanho_fila()))
+    documentos = list(lote.documentos.order_by('id')[lote.enfileirados:lote.enfileirados + vagas])
+    for documento in documentos:
+        iniciar_processamento(documento, group=lote.grupo)
+    
+    if documentos:
+        LoteDocumentos.objects.filter(id=lote_id).update(enfileirados=F('enfileirados') + len(documentos))
+    restantes = lote.total - lote.enfileirados - len(documentos)
+    logger.info(
+        f"Lote {lote_id}: {len(documentos)} documento(s) enfileirado(s) no grupo {lote.grupo}, "
+        f"{restantes} restante(s)"
+    )
+    
+    if restantes > 0:
+        schedule(
+            'ia.tasks_otimizado.enfileirar_lote', lote_id,
+            name=f'lote_{lote_id}_{uuid.uuid4().hex[:8]}',
+            schedule_type=Schedule.ONCE,
+            next_run=timezone.now() + timedelta(seconds=intervalo),
+        )
+
+
+def _concluir_lote(instance_id):
+    """Fecha o lote do documento se este era o último a terminar"""
+    lote = LoteDocumentos.objects.filter(documentos__id=instance_id).first()
+    if lote is not None and lote.registrar_conclusao():
+        logger.info(f"Lote {lote.id} concluído com o documento {instance_id}")
+
+
 def rag_documentos(instance_id):
     """
-    Mantido como está, mas com logging adicional
+    Indexa o conteúdo do documento: chunks com fronteiras jurídicas e
+    embeddings em lotes com concorrência limitada (ia/ingestao.py), gravados
+    direto no banco vetorial do Knowledge. Reindexações gravam só os chunks
+    que mudaram (ia/indice_vetorial.py)
     """
     start_time = time.time()
     
@@ -224,21 +825,169 @@ def rag_documentos(instance_id):
         
         logger.info(f"Iniciando indexação RAG para documento {instance_id}")
         
-        JuriAI.knowledge.insert(
-            name=documentos.arquivo.name,
-            text_content=documentos.content,
-            metadata={
-                "cliente_id": documentos.cliente.id,
-                "name": documentos.arquivo.name,
-            },
+        knowledge = JuriAI.knowledge
+        vector_db = knowledge.vector_db
+        # Embedders locais calculam mais rápido do que o cache lê
+        usar_cache = getattr(settings, 'CACHE_EMBEDDINGS', {}).get('ativo', True) and not JuriAI.EMBEDDER.local
+        ingestao = IngestaoRAG(EmbedderAgno(vector_db.embedder), cache=obter_cache_embeddings() if usar_cache else None)
+        resumo = indexar_documento(
+            documentos, vector_db, ingestao,
+            content_hash=_hash_documento(documentos), assinatura=JuriAI.EMBEDDER.assinatura,
+            knowledge_nome=knowledge.name or '', indice_lexico=obter_indice_lexico(),
         )
         
         elapsed = time.time() - start_time
-        logger.info(f"RAG concluído para documento {instance_id} em {elapsed:.2f}s")
+        logger.info(
+            f"RAG concluído para documento {instance_id} em {elapsed:.2f}s: {resumo}"
+        )
         
     except Exception as e:
         logger.error(f"Erro na indexação RAG do documento {instance_id}: {str(e)}", exc_info=True)
         raise
+    finally:
+        # Última etapa de todas as rotas: o texto do documento já foi gravado
+        _concluir_lote(instance_id)
+
+
+def remover_vetores_documento(instance_id, ids, cliente_id=None, nome=None):
+    """
+    Apaga do banco vetorial e do índice léxico os chunks de um documento
+    excluído
+
+    Args:
+        instance_id: Id do documento (já apagado do banco)
+        ids: Ids das linhas, lidos do manifesto antes da exclusão
+        cliente_id: Cliente do documento, para as linhas sem manifesto
+        nome: Nome do arquivo, para as linhas sem manifesto
+    """
+    removidos = remover_documento(JuriAI.knowledge.vector_db, ids, instance_id, cliente_id, nome)
+    obter_indice_lexico().remover(instance_id)
+    logger.info(f"Vetores do documento {instance_id} removidos ({removidos} chunk(s) pelo manifesto)")
+
+
+# Reindexação sem sinal de vida por esse tempo é considerada interrompida
+VALIDADE_MARCA_REINDEXACAO_PADRAO = 3600
+
+
+def _marca_reindexacao(assinatura: str) -> str:
+    """Chave do cache que marca a reindexação em andamento para o embedder"""
+    return f'reindexacao_embedder_{assinatura}'
+
+
+def _validade_marca_reindexacao() -> int:
+    config = getattr(settings, 'EMBEDDER_RAG', {}).get('reindexacao', {})
+    return config.get('validade_marca_s', VALIDADE_MARCA_REINDEXACAO_PADRAO)
+
+
+def iniciar_reindexacao_embedder() -> bool:
+    """
+    Enfileira reindexar_embedder, a menos que uma reindexação para o
+    embedder ativo já esteja na fila ou rodando
+
+    A primeira leva vai por async_task e cada leva seguinte é um Schedule
+    ONCE apagado ao disparar, então nenhuma linha do django-q marca a
+    reindexação inteira; a marca fica no cache, criada aqui e renovada por
+    reindexar_embedder a cada leva.
+
+    Returns:
+        False se já havia uma reindexação em andamento
+    """
+    if not cache.add(_marca_reindexacao(JuriAI.EMBEDDER.assinatura), True, _validade_marca_reindexacao()):
+        return False
+    async_task('ia.tasks_otimizado.reindexar_embedder')
+    return True
+
+
+def documentos_sem_indice(assinatura: str):
+    """Documentos com texto ainda não indexados pelo embedder"""
+    return (
+        Documentos.objects
+        .exclude(conteudo=None)
+        .exclude(id__in=ChunkIndexado.objects.filter(embedder=assinatura).values('documento_id'))
+    )
+
+
+def documentos_com_chunks(documentos) -> List[int]:
+    """
+    Ids dos documentos cujo texto gera algum chunk; os demais (ex.: scan em
+    branco, só com os separadores de página) nunca ganham manifesto e não
+    contam como pendentes
+    """
+    chunker = ChunkerJuridico.de_settings()
+    return [documento.id for documento in documentos.iterator() if chunker.dividir(documento.content)]
+
+
+def reindexar_embedder(ultimo_id=0, verificacoes=0):
+    """
+    Reindexação completa após a troca do embedder (settings.EMBEDDER_RAG):
+    enfileira rag_documentos para os documentos sem vetores do embedder
+    ativo, em levas limitadas pelo tamanho da fila, e se reagenda. Com todos
+    na fila, confere a cada intervalo se terminaram e só então apaga as
+    tabelas e os manifestos dos embedders anteriores
+
+    Args:
+        ultimo_id: Maior id de documento já enfileirado
+        verificacoes: Conferências feitas depois de enfileirar todos
+    """
+    config = getattr(settings, 'EMBEDDER_RAG', {}).get('reindexacao', {})
+    por_vez = config.get('enfileirar_por_vez', 20)
+    fila_max = config.get('fila_max', 30)
+    intervalo = config.get('intervalo_s', 15)
+    verificacoes_max = config.get('verificacoes', 20)
+
+    assinatura = JuriAI.EMBEDDER.assinatura
+    grupo = f'reindexacao_{JuriAI.EMBEDDER.tabela}'
+    marca = _marca_reindexacao(assinatura)
+    cache.set(marca, True, _validade_marca_reindexacao())
+    pendentes = documentos_sem_indice(assinatura)
+    vagas = min(por_vez, max(0, fila_max - tamanho_fila()))
+    ids = list(pendentes.filter(id__gt=ultimo_id).order_by('id').values_list('id', flat=True)[:vagas])
+    for documento_id in ids:
+        async_task(rag_documentos, documento_id, group=grupo)
+
+    if ids or pendentes.filter(id__gt=ultimo_id).exists():
+        ultimo_id = ids[-1] if ids else ultimo_id
+        logger.info(f"Reindexação para {assinatura}: {len(ids)} documento(s) enfileirado(s) até o id {ultimo_id}")
+    else:
+        restantes = len(documentos_com_chunks(pendentes))
+        if restantes == 0:
+            descartar_embedders_antigos()
+            cache.delete(marca)
+            logger.info(f"Reindexação para {assinatura} concluída")
+            return
+        if verificacoes >= verificacoes_max:
+            cache.delete(marca)
+            logger.error(
+                f"Reindexação para {assinatura}: {restantes} documento(s) sem vetores após "
+                f"{verificacoes} conferência(s); tabelas antigas mantidas (manage.py reindexar_rag)"
+            )
+            return
+        verificacoes += 1
+        logger.info(f"Reindexação para {assinatura}: aguardando {restantes} documento(s)")
+
+    schedule(
+        'ia.tasks_otimizado.reindexar_embedder', ultimo_id, verificacoes,
+        name=f'{grupo}_{uuid.uuid4().hex[:8]}',
+        schedule_type=Schedule.ONCE,
+        next_run=timezone.now() + timedelta(seconds=intervalo),
+    )
+
+
+def descartar_embedders_antigos():
+    """Apaga as tabelas do LanceDB e os manifestos de embedders que não são o ativo"""
+    ativo = JuriAI.EMBEDDER.assinatura
+    antigos = list(
+        ChunkIndexado.objects.exclude(embedder=ativo).order_by().values_list('embedder', flat=True).distinct()
+    )
+    vector_db = JuriAI.knowledge.vector_db
+    conexao = vector_db.connection
+    tabelas = set(lancedb_agno.nomes_tabelas(conexao))
+    for assinatura in antigos:
+        tabela = nome_tabela(assinatura, JuriAI.VECTOR_DB_TABLE)
+        if tabela in tabelas:
+            conexao.drop_table(tabela)
+        removidos, _ = ChunkIndexado.objects.filter(embedder=assinatura).delete()
+        logger.info(f"Embedder {assinatura} descartado: tabela {tabela} e {removidos} chunk(s) do manifesto")
 
 
 def rag_dados_empresa(instance_id):
@@ -1,3 +1,1727 @@
-from django.test import TestCase
+import io
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from agno.filters import AND, EQ, IN, OR
+from agno.knowledge.document.base import Document
+from agno.vectordb.lancedb import LanceDb
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django_q.models import Task
+
+from . import conversores_docling, embedders, lancedb_agno
+from .armazem_ocr import TIPO_ESTRUTURADO, TIPO_PAGINA, TIPO_TEXTO, ArmazemOCR
+from .busca_hibrida import IndiceLexico, LanceDbHibrido, expressao_fts, filtros_de_expressoes, fundir_rrf
+from .cache_embeddings import CacheEmbeddings, hash_chunk
+from .camada_texto import ORIGEM_CAMADA_TEXTO, amostrar_camada_texto, extrair_camada_texto, texto_utilizavel
+from .checkpoint_ocr import CheckpointOCR, DocumentoIncompleto, contar_concluidas
+from .conversores_docling import OpcoesDocling, RegistroConversores, obter_registro, pre_aquecer
+from .agents import JuriAI
+from .apps import verificar_embedder
+from .embedders import (
+    ASSINATURA_LEGADA, EmbedderHashing, assinatura, embedder_configurado, nome_tabela, registrar_backend,
+)
+from .indice_vetorial import ids_vetores_documento, indexar_documento, remover_documento
+from .ingestao import ChunkerJuridico, EmbedderAgno, EmbedderFalso, IngestaoRAG, MetricasIngestao, meta_data_chunk
+from .models import ChunkIndexado, PaginaOCR, ProcessamentoOCR
+from .ocr_pool import processos_por_worker
+from .ocr_utils import (
+    DPI_ALTO, DPI_BAIXO, ImagePreprocessor, LinhaOCR, OCROptimizado, ResultadoPagina, escolher_melhor,
+    iterar_paginas_pdf, paginas_em_fila, precisa_reocr,
+)
+from .roteamento_ocr import (
+    ESTRATEGIA_CAMADA_TEXTO, ESTRATEGIA_DOCLING, ESTRATEGIA_FAIXAS, ESTRATEGIA_PARALELO, ESTRATEGIA_RAPIDOCR,
+    TIPO_DOCUMENTO, TIPO_IMAGEM, CaracteristicasDocumento, ModeloCusto, ajustar_coeficientes, tipo_arquivo,
+)
+from .sidecar_ocr import (
+    SidecarOCR, caminho_sidecar, carregar_sidecar, codificar_linhas, decodificar_linhas, gravar_sidecar,
+)
+from .tasks_otimizado import (
+    _separar_paginas, concluir_faixa, extrair_texto_paralelo, motor_cache_paginas, reindexar_embedder,
+)
+from usuarios.models import Cliente, Documentos, LoteDocumentos
+
+
+def _paragrafo(palavra: str, repeticoes: int) -> str:
+    return ' '.join(f'{palavra}{i}' for i in range(repeticoes))
+
+
+def _pdf_com_texto(paginas) -> bytes:
+    """PDF A4 com uma linha de Helvetica por item; página sem linhas = página só imagem"""
+    objetos = ['<< /Type /Catalog /Pages 2 0 R >>', None, '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>']
+    kids = []
+    for linhas in paginas:
+        fluxo = 'BT /F1 10 Tf 12 TL 40 800 Td ' + ' '.join(f'({linha}) Tj T*' for linha in linhas) + ' ET'
+        objetos.append(f'<< /Length {len(fluxo)} >>\nstream\n{fluxo}\nendstream')
+        objetos.append(
+            '<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] '
+            f'/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objetos)} 0 R >>'
+        )
+        kids.append(f'{len(objetos)} 0 R')
+    objetos[1] = f'<< /Type /Pages /Kids [{" ".join(kids)}] /Count {len(kids)} >>'
+    saida = b'%PDF-1.4\n'
+    posicoes = []
+    for numero, objeto in enumerate(objetos, 1):
+        posicoes.append(len(saida))
+        saida += f'{numero} 0 obj\n{objeto}\nendobj\n'.encode('latin-1')
+    xref = len(saida)
+    saida += f'xref\n0 {len(objetos) + 1}\n0000000000 65535 f \n'.encode()
+    saida += ''.join(f'{posicao:010d} 00000 n \n' for posicao in posicoes).encode()
+    saida += f'trailer << /Size {len(objetos) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF'.encode()
+    return saida
+
+
+class MotorOCRFalso:
+    """
+    No lugar do RapidOCR: devolve `linhas` linhas por imagem com a próxima
+    confiança da lista e registra o formato de cada imagem recebida
+    """
+
+    def __init__(self, confiancas, linhas: int = 30, caixa=((10, 10), (110, 10), (110, 30), (10, 30))):
+        self.confiancas = list(confiancas)
+        self.linhas = linhas
+        self.caixa = [list(ponto) for ponto in caixa]
+        self.formatos = []
+
+    def __call__(self, imagem):
+        self.formatos.append(imagem.shape)
+        confianca = self.confiancas.pop(0)
+        return [[self.caixa, f'linha reconhecida {i}', confianca] for i in range(self.linhas)], 0.0
+
+
+def _ocr_falso(motor, etapas=None) -> OCROptimizado:
+    ocr = OCROptimizado(etapas_preprocessamento=etapas)
+    ocr.ocr = motor
+    return ocr
+
+
+class ArquivoTemporario:
+    """Grava bytes em um diretório temporário do teste"""
+
+    def arquivo_temporario(self, nome: str, dados: bytes) -> str:
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        caminho = os.path.join(diretorio.name, nome)
+        with open(caminho, 'wb') as arquivo:
+            arquivo.write(dados)
+        return caminho
+
+
+def _documentos(cliente, *textos):
+    """Documentos com texto, criados sem o post_save que agenda o OCR"""
+    documentos = Documentos.objects.bulk_create([
+        Documentos(cliente=cliente, arquivo=f'documentos/doc{i}.pdf', data_upload=timezone.now())
+        for i in range(len(textos))
+    ])
+    for documento, texto in zip(documentos, textos):
+        documento.content = texto
+        documento.save(reindexar=False)
+    return documentos
+
+
+class EmbedderContador(EmbedderFalso):
+    """EmbedderFalso que registra os lotes recebidos"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lotes = []
+
+    def embeddar_lote(self, textos):
+        self.lotes.append(list(textos))
+        return super().embeddar_lote(textos)
+
+
+class ChunkerJuridicoTests(SimpleTestCase):
+
+    def test_sobreposicao_maior_que_tamanho(self):
+        with self.assertRaises(ValueError):
+            ChunkerJuridico(tamanho=100, sobreposicao=100)
+
+    def test_chunks_respeitam_o_tamanho_e_nao_partem_palavras(self):
+        chunker = ChunkerJuridico(tamanho=200, sobreposicao=40)
+        texto = _paragrafo('palavra', 150)
+
+        chunks = chunker.dividir(texto)
+
+        self.assertGreater(len(chunks), 1)
+        palavras = set(texto.split())
+        for chunk in chunks:
+            self.assertLessEqual(len(chunk.texto), 200)
+            self.assertTrue(set(chunk.texto.split()) <= palavras)
+        self.assertEqual([chunk.indice for chunk in chunks], list(range(len(chunks))))
+
+    def test_sobreposicao_dentro_da_secao(self):
+        chunker = ChunkerJuridico(tamanho=200, sobreposicao=40)
+
+        primeiro, segundo = chunker.dividir(_paragrafo('termo', 40))[:2]
+
+        cauda = segundo.texto.split()[0]
+        self.assertIn(cauda, primeiro.texto.split()[-8:])
+
+    def test_titulo_e_dispositivo_abrem_chunk_sem_sobreposicao(self):
+        chunker = ChunkerJuridico(tamanho=400, sobreposicao=50, tamanho_minimo=20)
+        texto = '\n'.join([
+            'DOS FATOS',
+            'O autor celebrou contrato de prestação de serviços com a ré.',
+            'DO DIREITO',
+            'Art. 186 Aquele que, por ação ou omissão voluntária, causar dano a outrem comete ato ilícito.',
+            'Cláusula 5 O prazo de vigência é de doze meses.',
+        ])
+
+        chunks = chunker.dividir(texto)
+
+        self.assertEqual([chunk.texto.splitlines()[0] for chunk in chunks], [
+            'DOS FATOS', 'DO DIREITO', 'Cláusula 5 O prazo de vigência é de doze meses.',
+        ])
+        self.assertEqual([chunk.secao for chunk in chunks], ['DOS FATOS', 'DO DIREITO', 'DO DIREITO'])
+        self.assertNotIn('contrato', chunks[1].texto)
+
+    def test_pagina_de_inicio_sem_separadores_no_texto(self):
+        chunker = ChunkerJuridico(tamanho=300, sobreposicao=30, tamanho_minimo=10)
+        texto = '\n'.join([
+            '--- Página 1 ---',
+            'EMENTA',
+            'Apelação cível. Indenização por danos morais.',
+            '--- Página 2 ---',
+            'VOTO',
+            'Conheço do recurso e nego-lhe provimento.',
+        ])
+
+        chunks = chunker.dividir(texto)
+
+        self.assertEqual([(chunk.pagina, chunk.secao) for chunk in chunks], [(1, 'EMENTA'), (2, 'VOTO')])
+        self.assertFalse(any('--- Página' in chunk.texto for chunk in chunks))
+
+    def test_meta_data_do_chunk(self):
+        chunk = ChunkerJuridico(tamanho=300, sobreposicao=30).dividir('--- Página 3 ---\nEMENTA\nTexto.')[0]
+
+        meta = meta_data_chunk(chunk, {'cliente_id': 7, 'name': 'documentos/a.pdf'}, '10_abc_0', 'juriai')
+
+        self.assertEqual(meta, {
+            'cliente_id': 7,
+            'name': 'documentos/a.pdf',
+            'chunk': 0,
+            'chunk_id': '10_abc_0',
+            'chunk_size': len(chunk.texto),
+            'pagina': 3,
+            'secao': 'EMENTA',
+            'linked_to': 'juriai',
+        })
+
+
+class IngestaoRAGTests(SimpleTestCase):
+
+    def test_lotes_do_tamanho_configurado_na_ordem_dos_textos(self):
+        embedder = EmbedderContador(dimensoes=16)
+        ingestao = IngestaoRAG(embedder, ChunkerJuridico(), tamanho_lote=3, concorrencia=1)
+        textos = [f'texto {i}' for i in range(10)]
+        metricas = MetricasIngestao()
+
+        vetores = ingestao.embeddar(textos, metricas)
+
+        self.assertEqual([len(lote) for lote in embedder.lotes], [3, 3, 3, 1])
+        self.assertEqual(metricas.lotes, 4)
+        self.assertEqual(vetores, EmbedderFalso(dimensoes=16).embeddar_lote(textos))
+
+    def test_concorrencia_preserva_a_ordem(self):
+        textos = [f'trecho {i}' for i in range(50)]
+        sequencial = IngestaoRAG(EmbedderFalso(), ChunkerJuridico(), tamanho_lote=4, concorrencia=1)
+        concorrente = IngestaoRAG(EmbedderFalso(latencia_s=0.001), ChunkerJuridico(), tamanho_lote=4, concorrencia=4)
+
+        self.assertEqual(
+            concorrente.embeddar(textos, MetricasIngestao()),
+            sequencial.embeddar(textos, MetricasIngestao()),
+        )
+
+    def test_textos_repetidos_embeddados_uma_vez(self):
+        embedder = EmbedderContador()
+        ingestao = IngestaoRAG(embedder, ChunkerJuridico(), tamanho_lote=10)
+        metricas = MetricasIngestao()
+
+        vetores = ingestao.embeddar(['a', 'b', 'a', 'b', 'c'], metricas)
+
+        self.assertEqual(sum(len(lote) for lote in embedder.lotes), 3)
+        self.assertEqual(vetores[0], vetores[2])
+        self.assertEqual(metricas.embeddings_evitados, 2)
+
+    def test_embedder_com_vetores_a_menos_falha(self):
+        class EmbedderIncompleto(EmbedderFalso):
+            def embeddar_lote(self, textos):
+                return super().embeddar_lote(textos)[:-1]
+
+        ingestao = IngestaoRAG(EmbedderIncompleto(), ChunkerJuridico(), tamanho_lote=2)
+
+        with self.assertRaises(RuntimeError):
+            ingestao.embeddar(['a', 'b', 'c'], MetricasIngestao())
+
+    def test_processar_um_vetor_por_chunk(self):
+        ingestao = IngestaoRAG(EmbedderFalso(dimensoes=8), ChunkerJuridico(tamanho=200, sobreposicao=20), tamanho_lote=2)
+
+        chunks, vetores, metricas = ingestao.processar(_paragrafo('fato', 120))
+
+        self.assertEqual(len(chunks), len(vetores))
+        self.assertEqual(metricas.chunks, len(chunks))
+        self.assertTrue(all(len(vetor) == 8 for vetor in vetores))
+        self.assertEqual(metricas.lotes, -(-len(chunks) // 2))
+
+
+def _documento(chunk_id=None, conteudo='texto'):
+    return Document(content=conteudo, meta_data={'chunk_id': chunk_id} if chunk_id else {})
+
+
+class FusaoRRFTests(SimpleTestCase):
+
+    def test_presente_nas_duas_listas_vem_primeiro(self):
+        vetorial = [_documento('a'), _documento('c')]
+        lexical = [_documento('b'), _documento('c')]
+
+        fundidos = fundir_rrf([vetorial, lexical], k=60)
+
+        self.assertEqual([d.meta_data['chunk_id'] for d in fundidos], ['c', 'a', 'b'])
+
+    def test_posicao_decide_entre_listas(self):
+        fundidos = fundir_rrf([[_documento('a'), _documento('b')], [_documento('b')]], k=1)
+
+        # b: 1/3 + 1/2 > a: 1/2
+        self.assertEqual([d.meta_data['chunk_id'] for d in fundidos], ['b', 'a'])
+
+    def test_deduplica_por_chunk_id_e_mantem_o_primeiro(self):
+        primeiro = _documento('x', 'versão vetorial')
+
+        fundidos = fundir_rrf([[primeiro], [_documento('x', 'versão léxica')]])
+
+        self.assertEqual(len(fundidos), 1)
+        self.assertIs(fundidos[0], primeiro)
+
+    def test_sem_chunk_id_usa_o_conteudo(self):
+        fundidos = fundir_rrf([[_documento(conteudo='mesmo')], [_documento(conteudo='mesmo'), _documento(conteudo='outro')]])
+
+        self.assertEqual([d.content for d in fundidos], ['mesmo', 'outro'])
+
+
+class ExpressaoFTSTests(SimpleTestCase):
+
+    def test_termos_em_or_com_a_frase(self):
+        self.assertEqual(
+            expressao_fts('Art. 300 do CPC'),
+            '"art" OR "300" OR "do" OR "cpc" OR "art 300 do cpc"',
+        )
+
+    def test_termo_unico_sem_frase(self):
+        self.assertEqual(expressao_fts('Tutela'), '"tutela"')
+
+    def test_numero_cnj_tambem_so_com_digitos(self):
+        expressao = expressao_fts('processo 0008323-52.2018.4.01.3202')
+
+        self.assertIn('"00083235220184013202"', expressao.split(' OR '))
+
+    def test_sintaxe_do_fts5_nao_passa_para_a_expressao(self):
+        expressao = expressao_fts('"dano" AND NEAR(moral*) -culpa ^x :')
+
+        for termo in expressao.split(' OR '):
+            self.assertRegex(termo, r'^"[\w ]+"$')
+        self.assertEqual(expressao_fts('"*" - : ^'), '')
+
+
+class IndiceLexicoTests(SimpleTestCase):
+
+    def setUp(self):
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        self.indice = IndiceLexico(os.path.join(diretorio.name, 'lexico.sqlite3'))
+
+    def _sincronizar(self, documento_id, cliente_id, textos):
+        itens = [
+            (f'{documento_id}_{i}', texto, {'cliente_id': cliente_id, 'chunk_id': f'{documento_id}_{i}'})
+            for i, texto in enumerate(textos)
+        ]
+        return self.indice.sincronizar(documento_id, cliente_id, f'documentos/{documento_id}.pdf', itens)
+
+    def test_filtro_por_cliente(self):
+        self._sincronizar(1, 10, ['Contrato de locação comercial'])
+        self._sincronizar(2, 20, ['Contrato de locação residencial'])
+
+        self.assertEqual([d.content_id for d in self.indice.buscar('contrato locação', 5, cliente_id=10)], ['1'])
+        self.assertEqual([d.content_id for d in self.indice.buscar('contrato locação', 5, cliente_id=20)], ['2'])
+        self.assertEqual(len(self.indice.buscar('contrato locação', 5)), 2)
+
+    def test_cnj_so_com_digitos_e_sem_acentos(self):
+        self._sincronizar(1, 10, ['Processo n. 0008323-52.2018.4.01.3202, ação de cobrança'])
+
+        self.assertEqual(len(self.indice.buscar('00083235220184013202', 5, cliente_id=10)), 1)
+        self.assertEqual(len(self.indice.buscar('acao cobranca', 5, cliente_id=10)), 1)
+
+    def test_consulta_com_sintaxe_do_fts5(self):
+        self._sincronizar(1, 10, ['Dano moral por negativação indevida'])
+
+        resultados = self.indice.buscar('"dano" AND NEAR(moral*) -culpa', 5, cliente_id=10)
+
+        self.assertEqual([d.meta_data['chunk_id'] for d in resultados], ['1_0'])
+
+    def test_bm25_ordena_pelo_termo_raro(self):
+        self._sincronizar(1, 10, ['recurso de apelação', 'recurso de apelação sobre usucapião'])
+
+        resultados = self.indice.buscar('recurso usucapião', 5, cliente_id=10)
+
+        self.assertEqual(resultados[0].meta_data['chunk_id'], '1_1')
+
+    def test_sincronizar_so_regrava_o_que_mudou_e_remover(self):
+        self.assertTrue(self._sincronizar(1, 10, ['primeira versão']))
+        self.assertFalse(self._sincronizar(1, 10, ['primeira versão']))
+        self.assertTrue(self._sincronizar(1, 10, ['primeira versão', 'trecho novo']))
+        self.assertEqual(self.indice.estatisticas()['chunks'], 2)
+
+        self.indice.remover(1)
+
+        self.assertEqual(self.indice.buscar('versão', 5), [])
+        self.assertEqual(self.indice.estatisticas()['chunks'], 0)
+
+
+class CacheEmbeddingsTests(SimpleTestCase):
+
+    def setUp(self):
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        self.caminho = os.path.join(diretorio.name, 'cache', 'embeddings.sqlite3')
+
+    def test_hash_ignora_quebras_e_espacos(self):
+        self.assertEqual(hash_chunk('Cláusula 1\n  O  prazo '), hash_chunk('Cláusula 1 O prazo'))
+        self.assertNotEqual(hash_chunk('prazo'), hash_chunk('Prazo'))
+
+    def test_chave_inclui_modelo_e_dimensoes(self):
+        cache = CacheEmbeddings(self.caminho, tipo_vetor='float32')
+        cache.salvar([('h1', [0.5, 0.25])], 'modelo-a', 2)
+
+        self.assertEqual(list(cache.obter(['h1', 'h2'], 'modelo-a', 2)), ['h1'])
+        self.assertEqual(cache.obter(['h1'], 'modelo-b', 2), {})
+        self.assertEqual(cache.obter(['h1'], 'modelo-a', 3), {})
+        self.assertEqual(cache.obter(['h1'], 'modelo-a', 2)['h1'].tolist(), [0.5, 0.25])
+
+    def test_float16_persiste_entre_instancias(self):
+        vetor = EmbedderFalso(dimensoes=32).embeddar_lote(['texto'])[0]
+        CacheEmbeddings(self.caminho).salvar([('h', vetor)], 'falso', 32)
+
+        lido = CacheEmbeddings(self.caminho).obter(['h'], 'falso', 32)['h']
+
+        self.assertEqual(lido.dtype, np.float32)
+        np.testing.assert_allclose(lido, vetor, atol=1e-3)
+        self.assertEqual(CacheEmbeddings(self.caminho).estatisticas()['modelos'][0]['bytes'], 32 * 2)
+
+    def test_tipo_de_vetor_invalido(self):
+        with self.assertRaises(ValueError):
+            CacheEmbeddings(self.caminho, tipo_vetor='int8')
+
+    def test_ingestao_usa_o_cache(self):
+        cache = CacheEmbeddings(self.caminho, tipo_vetor='float32')
+        textos = ['trecho a', 'trecho b']
+        IngestaoRAG(EmbedderFalso(), ChunkerJuridico(), cache=cache).embeddar(textos, MetricasIngestao())
+        embedder = EmbedderContador()
+        metricas = MetricasIngestao()
+
+        vetores = IngestaoRAG(embedder, ChunkerJuridico(), cache=cache).embeddar(textos + ['trecho\nc'], metricas)
+
+        self.assertEqual(embedder.lotes, [['trecho\nc']])
+        self.assertEqual((metricas.cache_acertos, metricas.cache_faltas), (2, 1))
+        np.testing.assert_allclose(vetores[:2], EmbedderFalso().embeddar_lote(textos), atol=1e-6)
+
+
+class CheckpointOCRTests(TestCase):
+
+    def setUp(self):
+        usuario = User.objects.create_user('advogado')
+        cliente = Cliente.objects.create(nome='Cliente', email='cliente@exemplo.com', user=usuario)
+        # bulk_create, como nos lotes: sem o post_save que agenda o OCR
+        self.documento, = Documentos.objects.bulk_create([
+            Documentos(cliente=cliente, arquivo='documentos/peticao.pdf', data_upload=timezone.now(), num_paginas=3)
+        ])
+
+    def test_monta_em_ordem_so_com_todas_as_paginas(self):
+        checkpoint = CheckpointOCR(self.documento, 'hash-a')
+        checkpoint.salvar(2, 'terceira')
+        checkpoint.salvar_varias({0: 'primeira'}, ORIGEM_CAMADA_TEXTO)
+
+        with self.assertRaisesMessage(DocumentoIncompleto, '1 de 3 página(s) sem texto (primeira: 2)'):
+            checkpoint.montar_texto(3)
+        self.assertEqual(checkpoint.faltantes([0, 1, 2]), [1])
+
+        checkpoint.salvar(1, 'segunda')
+
+        self.assertEqual(
+            checkpoint.montar_texto(3),
+            '--- Página 1 ---\nprimeira\n\n--- Página 2 ---\nsegunda\n\n--- Página 3 ---\nterceira',
+        )
+
+    def test_retomada_no_retry(self):
+        CheckpointOCR(self.documento, 'hash-a').salvar_varias({0: 'primeira', 1: 'segunda'}, 'ocr')
+
+        retomado = CheckpointOCR(self.documento, 'hash-a')
+
+        self.assertEqual(retomado.retomadas, 2)
+        self.assertEqual(retomado.faltantes([0, 1, 2]), [2])
+        self.assertEqual(contar_concluidas(self.documento.id, 'hash-a'), 2)
+
+    def test_arquivo_substituido_descarta_o_checkpoint(self):
+        CheckpointOCR(self.documento, 'hash-a').salvar_varias({0: 'antiga', 1: 'antiga'}, 'ocr')
+
+        checkpoint = CheckpointOCR(self.documento, 'hash-b')
+
+        self.assertEqual(checkpoint.retomadas, 0)
+        self.assertEqual(contar_concluidas(self.documento.id, 'hash-a'), 0)
+        self.assertFalse(PaginaOCR.objects.filter(documento=self.documento).exists())
+
+    def test_camada_de_texto_nao_sobrescreve_ocr(self):
+        checkpoint = CheckpointOCR(self.documento, 'hash-a')
+        checkpoint.salvar(0, 'texto do OCR')
+
+        checkpoint.salvar_camada_texto({0: 'camada', 1: 'camada'})
+
+        self.assertEqual(
+            dict(PaginaOCR.objects.filter(documento=self.documento).values_list('pagina', 'texto')),
+            {1: 'texto do OCR', 2: 'camada'},
+        )
+
+
+@mock.patch('ia.roteamento_ocr.docling_disponivel', return_value=False)
+class ModeloCustoTests(SimpleTestCase):
+
+    def _pdf(self, paginas, proporcao_camada_texto=0.0, fila=0):
+        return CaracteristicasDocumento(paginas, 2 * 1024 * 1024, proporcao_camada_texto, fila)
+
+    def test_tipo_pelo_mime_ou_extensao(self, _docling):
+        self.assertEqual(tipo_arquivo('documentos/a.bin', 'application/pdf'), 'pdf')
+        self.assertEqual(tipo_arquivo('documentos/a.pdf', 'image/png'), TIPO_IMAGEM)
+        self.assertEqual(tipo_arquivo('documentos/a.JPG'), TIPO_IMAGEM)
+        self.assertEqual(tipo_arquivo('documentos/a.docx'), TIPO_DOCUMENTO)
+
+    def test_candidatas_por_tipo(self, _docling):
+        modelo = ModeloCusto()
+
+        self.assertEqual(modelo.candidatas(self._pdf(10, proporcao_camada_texto=1.0)), (ESTRATEGIA_CAMADA_TEXTO,))
+        self.assertEqual(
+            modelo.candidatas(self._pdf(10)), (ESTRATEGIA_RAPIDOCR, ESTRATEGIA_PARALELO, ESTRATEGIA_FAIXAS)
+        )
+        imagem = CaracteristicasDocumento(1, 1024, 0.0, 0, tipo=TIPO_IMAGEM)
+        self.assertEqual(modelo.candidatas(imagem), (ESTRATEGIA_RAPIDOCR, ESTRATEGIA_PARALELO))
+        documento = CaracteristicasDocumento(1, 1024, 0.0, 0, tipo=TIPO_DOCUMENTO)
+        self.assertEqual(modelo.escolher(documento)[0], ESTRATEGIA_DOCLING)
+
+    def test_documento_curto_em_uma_task(self, _docling):
+        estrategia, estimativas = ModeloCusto().escolher(self._pdf(1))
+
+        self.assertEqual(estrategia, ESTRATEGIA_RAPIDOCR)
+        self.assertEqual(estimativas[ESTRATEGIA_RAPIDOCR], 1.5 + 2.5 + 0.1)
+
+    def test_documento_longo_vai_para_faixas(self, _docling):
+        modelo = ModeloCusto(timeout=120)
+
+        estrategia, estimativas = modelo.escolher(self._pdf(200))
+
+        self.assertEqual(estrategia, ESTRATEGIA_FAIXAS)
+        self.assertGreater(modelo.execucao(ESTRATEGIA_RAPIDOCR, self._pdf(200)), 120 * modelo.margem_timeout)
+
+    def test_fila_reduz_o_paralelismo_das_faixas_e_soma_espera(self, _docling):
+        modelo = ModeloCusto(workers=3, paginas_por_faixa=20, segundos_por_task_fila=30)
+
+        self.assertEqual(modelo.paralelismo(ESTRATEGIA_FAIXAS, self._pdf(100)), 3)
+        self.assertEqual(modelo.paralelismo(ESTRATEGIA_FAIXAS, self._pdf(100, fila=1)), 2)
+        self.assertEqual(modelo.paralelismo(ESTRATEGIA_FAIXAS, self._pdf(100, fila=10)), 1)
+        self.assertEqual(
+            modelo.estimar(self._pdf(1, fila=6))[ESTRATEGIA_RAPIDOCR],
+            round(6 / 3 * 30 + modelo.execucao(ESTRATEGIA_RAPIDOCR, self._pdf(1)), 3),
+        )
+
+    def test_custos_parciais_completam_os_padroes(self, _docling):
+        modelo = ModeloCusto(custos={ESTRATEGIA_RAPIDOCR: {'por_pagina': 0.5}})
+
+        self.assertEqual(modelo.custos[ESTRATEGIA_RAPIDOCR], {'fixo': 1.5, 'por_pagina': 0.5, 'por_mb': 0.05})
+
+    def test_ajustar_coeficientes(self, _docling):
+        amostras = [(paginas, mb, 2.0 + 1.5 * paginas + 0.1 * mb) for paginas, mb in [(1, 1), (4, 2), (10, 8), (3, 20)]]
+
+        ajuste = ajustar_coeficientes(amostras)
+
+        self.assertEqual((ajuste['fixo'], ajuste['por_pagina'], ajuste['por_mb']), (2.0, 1.5, 0.1))
+        self.assertEqual(ajuste['erro_medio_s'], 0.0)
+        self.assertIsNone(ajustar_coeficientes(amostras[:2]))
+
+
+class MotorCachePaginasTests(SimpleTestCase):
+
+    @override_settings(
+        OCR_PREPROCESSAMENTO={'rapidocr': ['bordas', 'threshold'], 'paralelo': ['bordas', 'threshold']},
+        OCR_LOTE={'paginas': 4, 'rec_batch_num': 6},
+    )
+    def test_configuracao_entra_na_chave(self):
+        rapidocr = motor_cache_paginas('rapidocr')
+
+        self.assertTrue(rapidocr.startswith('rapidocr_adaptativo_'))
+        self.assertEqual(motor_cache_paginas('rapidocr'), rapidocr)
+        self.assertNotEqual(motor_cache_paginas('paralelo'), rapidocr)
+        self.assertEqual(motor_cache_paginas('docling'), 'docling')
+        with self.settings(OCR_PREPROCESSAMENTO={'rapidocr': ['bordas', 'inclinacao', 'threshold']}):
+            self.assertNotEqual(motor_cache_paginas('rapidocr'), rapidocr)
+        with self.settings(OCR_LOTE={'paginas': 4, 'rec_batch_num': 12}):
+            self.assertNotEqual(motor_cache_paginas('rapidocr'), rapidocr)
+        with self.settings(OCR_LOTE={'paginas': 4, 'rec_batch_num': 6, 'intra_op_threads': 2}):
+            self.assertEqual(motor_cache_paginas('rapidocr'), rapidocr)
+
+
+@mock.patch('ia.ocr_pool.os.cpu_count', return_value=12)
+class PoolOCRTests(SimpleTestCase):
+
+    @override_settings(Q_CLUSTER={'workers': 3}, OCR_POOL={'workers': None, 'intra_op_threads': 1})
+    def test_pool_dividido_entre_os_workers_do_cluster(self, _cpu_count):
+        self.assertEqual(processos_por_worker(), 4)
+        self.assertEqual(processos_por_worker(2), 2)
+
+    @override_settings(Q_CLUSTER={'workers': 3}, OCR_POOL={'workers': 8, 'intra_op_threads': 2})
+    def test_pedido_acima_dos_nucleos_e_limitado(self, _cpu_count):
+        with self.assertLogs('ia.ocr_pool', 'WARNING'):
+            self.assertEqual(processos_por_worker(), 2)
+
+    @override_settings(Q_CLUSTER={'workers': 16}, OCR_POOL={})
+    def test_ao_menos_um_processo(self, _cpu_count):
+        self.assertEqual(processos_por_worker(), 1)
+
+    def test_imagem_ilegivel_falha_antes_do_pool(self, _cpu_count):
+        with tempfile.NamedTemporaryFile(suffix='.png') as arquivo:
+            arquivo.write(b'nao e uma imagem')
+            arquivo.flush()
+            with mock.patch('ia.ocr_pool.obter_pool') as obter_pool:
+                with self.assertRaisesMessage(ValueError, arquivo.name):
+                    extrair_texto_paralelo(arquivo.name)
+        obter_pool.assert_not_called()
+
+
+class BancoVetorialTemporario:
+    """LanceDbHibrido e índice léxico em um diretório temporário, com o embedder local de hashing"""
+
+    ASSINATURA = 'teste'
+
+    def criar_banco_vetorial(self):
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        embedder = embedder_configurado('teste', {'backend': 'hashing', 'opcoes': {'dimensions': 64}}).embedder
+        self.indice_lexico = IndiceLexico(os.path.join(diretorio.name, 'lexico.sqlite3'))
+        self.vector_db = LanceDbHibrido(
+            table_name='teste', uri=os.path.join(diretorio.name, 'lance'), embedder=embedder,
+            indice_lexico=self.indice_lexico, modo='hibrida',
+        )
+        self.ingestao = IngestaoRAG(EmbedderAgno(embedder), ChunkerJuridico(tamanho=200, sobreposicao=20))
+
+    def indexar(self, documento):
+        documento = Documentos.objects.get(id=documento.id)
+        return indexar_documento(
+            documento, self.vector_db, self.ingestao, content_hash=f'hash{documento.id}',
+            assinatura=self.ASSINATURA, indice_lexico=self.indice_lexico,
+        )
+
+    def remover(self, documento):
+        documento_id = documento.id
+        ids = ids_vetores_documento(documento_id, self.ASSINATURA)
+        documento.delete()
+        remover_documento(self.vector_db, ids, documento_id)
+        self.indice_lexico.remover(documento_id)
+
+
+class DocumentoIdenticoTests(BancoVetorialTemporario, TestCase):
+
+    def setUp(self):
+        self.criar_banco_vetorial()
+        usuario = User.objects.create_user('advogado')
+        self.cliente = Cliente.objects.create(nome='Cliente', email='cliente@exemplo.com', user=usuario)
+
+    def test_copia_indexada_com_vetores_do_original_continua_apos_excluir_o_original(self):
+        original, = _documentos(self.cliente, 'Contrato de locação comercial. ' + _paragrafo('cláusula', 60))
+        copia, = Documentos.objects.bulk_create([
+            Documentos(cliente=self.cliente, arquivo='documentos/copia.pdf', data_upload=timezone.now(),
+                       conteudo_id=original.conteudo_id)
+        ])
+        self.indexar(original)
+
+        with mock.patch.object(self.ingestao, '_chamar_embedder') as chamar_embedder:
+            resumo = self.indexar(copia)
+
+        chamar_embedder.assert_not_called()
+        self.assertEqual(resumo['novos'], 0)
+        self.assertEqual(resumo['copiados'], ChunkIndexado.objects.filter(documento=original).count())
+
+        self.remover(original)
+
+        filtro = {'cliente_id': self.cliente.id}
+        self.assertEqual(self.vector_db.table.count_rows(), ChunkIndexado.objects.filter(documento=copia).count())
+        self.assertEqual({d.content_id for d in self.vector_db.search('locação comercial', 5, filtro)}, {str(copia.id)})
+        self.assertEqual({d.content_id for d in self.indice_lexico.buscar('locação', 5, self.cliente.id)}, {str(copia.id)})
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ReindexacaoEmbedderTests(BancoVetorialTemporario, TestCase):
+
+    def setUp(self):
+        self.criar_banco_vetorial()
+        cache.clear()
+        usuario = User.objects.create_user('advogado')
+        cliente = Cliente.objects.create(nome='Cliente', email='cliente@exemplo.com', user=usuario)
+        self.documento, self.em_branco = _documentos(
+            cliente, 'DOS FATOS\nO autor celebrou contrato com a ré.', '--- Página 1 ---\n\n--- Página 2 ---\n',
+        )
+        ChunkIndexado.objects.create(documento=self.documento, embedder='antigo', hash='h', id_vetor='v', indice=0)
+        self.tabela_antiga = nome_tabela('antigo', JuriAI.VECTOR_DB_TABLE)
+        self.vector_db.connection.create_table(self.tabela_antiga, data=[{'id': 'v'}])
+
+        for alvo, valor in [
+            ('EMBEDDER', SimpleNamespace(assinatura='novo', tabela='documentos_novo')),
+            ('knowledge', SimpleNamespace(vector_db=self.vector_db)),
+        ]:
+            patcher = mock.patch.object(JuriAI, alvo, valor)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        for alvo in ('async_task', 'schedule'):
+            patcher = mock.patch(f'ia.tasks_otimizado.{alvo}')
+            setattr(self, alvo, patcher.start())
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch('ia.tasks_otimizado.tamanho_fila', return_value=0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_migrate_nao_inicia_uma_segunda_reindexacao(self):
+        verificar_embedder(sender=None)
+        verificar_embedder(sender=None)
+
+        self.async_task.assert_called_once_with('ia.tasks_otimizado.reindexar_embedder')
+
+    def test_troca_de_embedder_reindexa_e_descarta_a_tabela_antiga(self):
+        verificar_embedder(sender=None)
+
+        reindexar_embedder()
+
+        enfileirados = [chamada.args[1] for chamada in self.async_task.call_args_list[1:]]
+        self.assertEqual(enfileirados, [self.documento.id, self.em_branco.id])
+        self.assertEqual(self.schedule.call_args.args[1:], (self.em_branco.id, 0))
+
+        # rag_documentos do documento com texto; o em branco não gera chunks
+        ChunkIndexado.objects.create(documento=self.documento, embedder='novo', hash='h', id_vetor='n', indice=0)
+        reindexar_embedder(self.em_branco.id, 0)
+
+        self.assertEqual(self.schedule.call_count, 1)
+        self.assertNotIn(self.tabela_antiga, self.vector_db.connection.table_names())
+        self.assertEqual(list(ChunkIndexado.objects.values_list('embedder', flat=True)), ['novo'])
+
+        # Concluída, a marca sai e um novo migrate pode reindexar de novo
+        ChunkIndexado.objects.create(documento=self.documento, embedder='outro', hash='h', id_vetor='o', indice=0)
+        verificar_embedder(sender=None)
+        self.assertEqual(
+            [c.args for c in self.async_task.call_args_list].count(('ia.tasks_otimizado.reindexar_embedder',)), 2
+        )
+
+
+class FiltrosBuscaHibridaTests(BancoVetorialTemporario, TestCase):
+
+    def setUp(self):
+        self.criar_banco_vetorial()
+        usuario = User.objects.create_user('advogado')
+        self.clientes = [
+            Cliente.objects.create(nome=nome, email=f'{nome}@exemplo.com', user=usuario) for nome in ('a', 'b')
+        ]
+        for cliente in self.clientes:
+            documento, = _documentos(cliente, 'Contrato de locação comercial com cláusula de reajuste anual.')
+            self.indexar(documento)
+
+    def _clientes_encontrados(self, filtros):
+        return {d.meta_data['cliente_id'] for d in self.vector_db.search('locação comercial', 10, filtros)}
+
+    def test_expressoes_eq_filtram_o_cliente(self):
+        cliente = self.clientes[0].id
+
+        self.assertEqual(self._clientes_encontrados([EQ('cliente_id', cliente)]), {cliente})
+        self.assertEqual(self._clientes_encontrados([AND(EQ('cliente_id', cliente), EQ('cliente_id', cliente))]), {cliente})
+        self.assertEqual(self._clientes_encontrados({'cliente_id': cliente}), {cliente})
+
+    def test_expressao_nao_suportada_nao_abre_o_filtro(self):
+        for filtros in (
+            [OR(EQ('cliente_id', self.clientes[0].id), EQ('cliente_id', self.clientes[1].id))],
+            [IN('cliente_id', [self.clientes[0].id])],
+            [EQ('cliente_id', self.clientes[0].id), EQ('cliente_id', self.clientes[1].id)],
+        ):
+            with self.assertRaises(ValueError):
+                self.vector_db.search('locação comercial', 10, filtros)
+
+    def test_lista_vazia_sem_filtros(self):
+        self.assertEqual(filtros_de_expressoes([]), {})
+
+
+def _clausulas(*clausulas):
+    return '\n'.join(f'CLÁUSULA {numero}\n{_paragrafo(palavra, 12)}' for numero, palavra in clausulas)
+
+
+class IndexacaoIncrementalTests(BancoVetorialTemporario, TestCase):
+    """Manifesto de chunks contra um LanceDB temporário: cada cláusula é um chunk"""
+
+    CLAUSULAS = [('PRIMEIRA', 'locação'), ('SEGUNDA', 'fiança'), ('TERCEIRA', 'multa'), ('QUARTA', 'foro')]
+
+    def setUp(self):
+        self.criar_banco_vetorial()
+        usuario = User.objects.create_user('advogado')
+        self.cliente = Cliente.objects.create(nome='Cliente', email='cliente@exemplo.com', user=usuario)
+        self.documento, = _documentos(self.cliente, _clausulas(*self.CLAUSULAS))
+
+    def _reindexar(self, *clausulas):
+        self.documento.content = _clausulas(*clausulas)
+        self.documento.save(reindexar=False)
+        return self.indexar(self.documento)
+
+    def _contagens(self, resultado):
+        return {chave: resultado[chave] for chave in ('mantidos', 'movidos', 'novos', 'removidos')}
+
+    def _linhas(self):
+        return self.vector_db.table.count_rows()
+
+    def test_ida_e_volta(self):
+        resultado = self.indexar(self.documento)
+        self.assertEqual(self._contagens(resultado), {'mantidos': 0, 'movidos': 0, 'novos': 4, 'removidos': 0})
+        self.assertEqual(self._linhas(), 4)
+
+        alteradas = self.CLAUSULAS[:2] + [('TERCEIRA', 'juros')] + self.CLAUSULAS[3:]
+        resultado = self._reindexar(*alteradas)
+        self.assertEqual(self._contagens(resultado), {'mantidos': 3, 'movidos': 0, 'novos': 1, 'removidos': 1})
+        self.assertEqual(self._linhas(), 4)
+
+        resultado = self._reindexar(('PRIMEIRA', 'objeto'), *alteradas)
+        self.assertEqual(self._contagens(resultado), {'mantidos': 0, 'movidos': 4, 'novos': 1, 'removidos': 0})
+        self.assertEqual(self._linhas(), 5)
+        self.assertEqual(ChunkIndexado.objects.filter(documento=self.documento).count(), 5)
+
+        self.remover(self.documento)
+        self.assertEqual(self._linhas(), 0)
+        self.assertFalse(ChunkIndexado.objects.exists())
+
+    def test_reindexar_sem_mudancas_nao_grava(self):
+        self.indexar(self.documento)
+        versao = self.vector_db.table.version
+
+        resultado = self.indexar(self.documento)
+
+        self.assertEqual(self._contagens(resultado), {'mantidos': 4, 'movidos': 0, 'novos': 0, 'removidos': 0})
+        self.assertEqual(self.vector_db.table.version, versao)
+
+    def test_movido_reaproveita_o_vetor(self):
+        self.indexar(self.documento)
+        antes = {c.hash: c.id_vetor for c in ChunkIndexado.objects.all()}
+        vetores = dict(
+            (linha['id'], list(linha['vector']))
+            for linha in self.vector_db.table.search().select(['id', 'vector']).to_list()
+        )
+
+        self._reindexar(*reversed(self.CLAUSULAS))
+
+        for chunk in ChunkIndexado.objects.all():
+            vetor, = self.vector_db.table.search().where(f"id = '{chunk.id_vetor}'").select(['vector']).to_list()
+            self.assertEqual(list(vetor['vector']), vetores[antes[chunk.hash]])
+
+
+class LinhaAgnoTests(SimpleTestCase):
+    """ia/lancedb_agno.py contra o LanceDb do agno instalado"""
+
+    def setUp(self):
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        embedder = embedder_configurado('teste', {'backend': 'hashing', 'opcoes': {'dimensions': 16}}).embedder
+        self.vector_db = LanceDb(table_name='agno', uri=os.path.join(diretorio.name, 'lance'), embedder=embedder)
+        self.vector_db.create()
+
+    def _documento(self, nome='documentos/a_b.pdf', cliente_id=7):
+        return Document(
+            id='1_abc_0', name=nome, content='Cláusula\x00 primeira', content_id='1',
+            meta_data={'cliente_id': cliente_id, 'name': nome}, embedding=[0.5] * 16,
+        )
+
+    def test_linha_igual_a_do_insert_do_agno(self):
+        self.vector_db.insert('hash', [self._documento()])
+        gravada, = self.vector_db.table.search().to_list()
+
+        linha = lancedb_agno.linha(self.vector_db, self._documento(), 'hash')
+
+        self.assertEqual(linha[lancedb_agno.coluna_id(self.vector_db)], gravada[lancedb_agno.coluna_id(self.vector_db)])
+        self.assertEqual(
+            json.loads(linha[lancedb_agno.COLUNA_PAYLOAD]), json.loads(gravada[lancedb_agno.COLUNA_PAYLOAD])
+        )
+        self.assertEqual(linha[lancedb_agno.coluna_id(self.vector_db)], lancedb_agno.id_linha('1_abc_0', 'hash'))
+
+    def test_filtros_de_payload_encontram_as_linhas_do_agno(self):
+        self.vector_db.insert('hash', [self._documento(), self._documento('documentos/outro.pdf', 8)])
+
+        def contar(filtro):
+            return self.vector_db.table.count_rows(filtro)
+
+        self.assertEqual(contar(lancedb_agno.filtro_content_id('1')), 2)
+        self.assertEqual(contar(lancedb_agno.filtro_cliente_payload(7)), 1)
+        self.assertEqual(contar(lancedb_agno.filtro_arquivo_cliente('documentos/a_b.pdf', 7)), 1)
+        self.assertEqual(contar(lancedb_agno.filtro_arquivo_cliente('documentos/a_b.pdf', 8)), 0)
+        self.assertEqual(contar(lancedb_agno.filtro_arquivo_cliente('documentos/a%b.pdf', 7)), 0)
+
+    def test_nomes_tabelas(self):
+        self.assertEqual(lancedb_agno.nomes_tabelas(self.vector_db.connection), ['agno'])
+
+
+@override_settings(Q_CLUSTER={'max_attempts': 2})
+class FaixasOCRTests(TestCase):
+    """Fan-in do OCR em faixas: duas faixas de duas páginas, a primeira falhando uma vez"""
+
+    GRUPO = 'ocr_1_teste'
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('advogado', password='senha123')
+        cliente = Cliente.objects.create(nome='Cliente', email='cliente@exemplo.com', user=self.usuario)
+        self.lote = LoteDocumentos.objects.create(cliente=cliente, grupo='lote_teste', total=1)
+        self.documento, = Documentos.objects.bulk_create([
+            Documentos(cliente=cliente, arquivo='documentos/peticao.pdf', data_upload=timezone.now(),
+                       num_paginas=4, hash_conteudo='hash-a', lote=self.lote)
+        ])
+        self.processamento = ProcessamentoOCR.objects.create(
+            documento=self.documento, grupo=self.GRUPO, total_paginas=4, faixas_total=2,
+        )
+        self.checkpoint = CheckpointOCR(self.documento, 'hash-a')
+
+    def _faixa(self, nome, paginas, success=True, tentativa=1):
+        """Hook da task da faixa; com sucesso, grava antes as páginas e a Task como o django-q"""
+        if success:
+            self.checkpoint.salvar_varias({p: f'página {p}' for p in paginas}, 'ocr')
+            Task.objects.get_or_create(id=f'{nome}{tentativa}', defaults=dict(
+                name=nome, func='ia.tasks_otimizado.ocr_faixa', group=self.GRUPO,
+                started=timezone.now(), stopped=timezone.now(), success=True, attempt_count=tentativa,
+            ))
+        task = SimpleNamespace(
+            args=(self.documento.id,), group=self.GRUPO, name=nome, success=success,
+            attempt_count=tentativa, result='falhou',
+        )
+        with mock.patch('ia.tasks_otimizado._agendar_montagem') as agendar:
+            concluir_faixa(task)
+        self.processamento.refresh_from_db()
+        return agendar
+
+    def test_faixa_repetida_apos_falha(self):
+        self._faixa('faixa_1', [0, 1], success=False).assert_not_called()
+        self.assertEqual(self.processamento.status, 'processando')
+        self.assertIn('faixa_1', self.processamento.erro)
+
+        self._faixa('faixa_2', [2, 3]).assert_not_called()
+        self.assertEqual(self.processamento.faixas_concluidas, 1)
+
+        self._faixa('faixa_1', [0, 1], tentativa=2).assert_called_once_with(self.documento.id)
+        self.assertEqual(self.processamento.status, 'montando')
+        self.assertEqual(self.processamento.faixas_concluidas, 2)
+        self.assertEqual(self.processamento.erro, '')
+
+    def test_hook_repetido_monta_uma_vez(self):
+        self._faixa('faixa_1', [0, 1])
+        self._faixa('faixa_2', [2, 3]).assert_called_once()
+
+        self._faixa('faixa_2', [2, 3]).assert_not_called()
+        self.assertEqual(self.processamento.faixas_concluidas, 2)
+
+    def test_falha_definitiva_encerra_o_documento_e_o_lote(self):
+        self._faixa('faixa_1', [0, 1], success=False, tentativa=2)
+
+        self.assertEqual(self.processamento.status, 'erro')
+        self.assertIsNotNone(LoteDocumentos.objects.get(id=self.lote.id).data_conclusao)
+
+    def test_faixa_recuperada_apos_falha_definitiva(self):
+        self._faixa('faixa_1', [0, 1], success=False, tentativa=2)
+        self._faixa('faixa_2', [2, 3])
+
+        # Redisparo manual (ocr_em_faixas) só das páginas que faltavam
+        self._faixa('faixa_1', [0, 1], tentativa=3).assert_called_once()
+        self.assertEqual(self.processamento.status, 'montando')
+
+    def test_progresso_exige_o_dono_do_documento(self):
+        url = reverse('progresso_ocr', kwargs={'id': self.documento.id})
+
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        User.objects.create_user('outro', password='senha123')
+        self.client.login(username='outro', password='senha123')
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+        self.client.login(username='advogado', password='senha123')
+        resposta = self.client.get(url)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.json()['faixas_total'], 2)
+
+
+class ArmazemOCRTests(SimpleTestCase):
+
+    def setUp(self):
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        self.caminho = os.path.join(diretorio.name, 'armazem.sqlite3')
+
+    def _armazem(self, orcamento_bytes=10 ** 6, **kwargs):
+        return ArmazemOCR(self.caminho, orcamento_bytes, **kwargs)
+
+    def _acessos(self):
+        with sqlite3.connect(self.caminho) as conexao:
+            return dict(conexao.execute("SELECT chave, acessos FROM artefatos"))
+
+    def test_leituras_nao_escrevem_ate_descarregar(self):
+        armazem = self._armazem()
+        armazem.salvar(TIPO_ESTRUTURADO, 'a', b'dados')
+        with sqlite3.connect(self.caminho) as conexao:
+            contadores = conexao.execute("SELECT COUNT(*) FROM contadores").fetchone()
+
+        for _ in range(3):
+            self.assertEqual(armazem.obter(TIPO_ESTRUTURADO, 'a'), b'dados')
+        self.assertIsNone(armazem.obter(TIPO_ESTRUTURADO, 'b'))
+
+        self.assertEqual(self._acessos(), {'estruturado:a': 0})
+        with sqlite3.connect(self.caminho) as conexao:
+            self.assertEqual(conexao.execute("SELECT COUNT(*) FROM contadores").fetchone(), contadores)
+
+        armazem.descarregar()
+        self.assertEqual(self._acessos(), {'estruturado:a': 3})
+
+    def test_descarrega_a_cada_lote(self):
+        armazem = self._armazem(lote_acessos=2)
+        armazem.salvar(TIPO_ESTRUTURADO, 'a', b'dados')
+
+        armazem.obter(TIPO_ESTRUTURADO, 'a')
+        self.assertEqual(self._acessos(), {'estruturado:a': 0})
+        armazem.obter(TIPO_ESTRUTURADO, 'a')
+        self.assertEqual(self._acessos(), {'estruturado:a': 2})
+
+    def test_contadores_por_tipo(self):
+        armazem = self._armazem()
+        armazem.salvar(TIPO_TEXTO, 'doc', 'texto do documento ' * 20)
+        armazem.obter_texto(TIPO_TEXTO, 'doc')
+        armazem.obter_texto(TIPO_TEXTO, 'outro')
+        armazem.obter_texto(TIPO_PAGINA, 'pagina')
+
+        estatisticas = armazem.estatisticas()
+
+        texto = estatisticas['tipos'][TIPO_TEXTO]
+        self.assertEqual((texto['acertos'], texto['faltas'], texto['itens']), (1, 1, 1))
+        self.assertEqual(texto['bytes_lidos'], texto['bytes'])
+        self.assertLess(texto['bytes'], len('texto do documento ' * 20))
+        self.assertEqual(texto['taxa_acerto'], 0.5)
+        self.assertEqual(estatisticas['tipos'][TIPO_PAGINA]['faltas'], 1)
+        self.assertEqual(estatisticas['total_bytes'], texto['bytes'])
+
+    def test_despejo_lru_considera_leituras_pendentes(self):
+        armazem = self._armazem(orcamento_bytes=250)
+        for chave in 'abc':
+            armazem.salvar(TIPO_ESTRUTURADO, chave, chave.encode() * 100)
+        # A terceira gravação passa do orçamento: sai o menos usado, 'a'
+        self.assertIsNone(armazem.obter(TIPO_ESTRUTURADO, 'a'))
+
+        # A leitura de 'b' ainda está só em memória quando 'd' é gravado
+        armazem.obter(TIPO_ESTRUTURADO, 'b')
+        armazem.salvar(TIPO_ESTRUTURADO, 'd', b'd' * 100)
+
+        self.assertIsNotNone(armazem.obter(TIPO_ESTRUTURADO, 'b'))
+        self.assertIsNone(armazem.obter(TIPO_ESTRUTURADO, 'c'))
+        tipo = armazem.estatisticas()['tipos'][TIPO_ESTRUTURADO]
+        self.assertEqual((tipo['despejos'], tipo['bytes_despejados'], tipo['itens']), (2, 200, 2))
+
+    def test_limpar_descarta_pendentes(self):
+        armazem = self._armazem()
+        armazem.salvar(TIPO_ESTRUTURADO, 'a', b'dados')
+        armazem.obter(TIPO_ESTRUTURADO, 'a')
+
+        armazem.limpar()
+
+        self.assertEqual(armazem.estatisticas()['tipos'], {})
+
+
+# Página A4 em pontos: ~96,6 pol², então o texto utilizável precisa de ~290 caracteres visíveis
+A4 = (595, 842)
+LINHA_CONTRATO = 'Contrato de locacao comercial entre as partes abaixo qualificadas'
+
+
+class TextoUtilizavelTests(SimpleTestCase):
+
+    def test_densidade_minima(self):
+        self.assertFalse(texto_utilizavel('', *A4))
+        self.assertFalse(texto_utilizavel('   \n  ', *A4))
+        self.assertFalse(texto_utilizavel('a' * 280, *A4))
+        self.assertTrue(texto_utilizavel('a' * 300, *A4))
+
+    def test_pagina_pequena_usa_area_minima(self):
+        self.assertTrue(texto_utilizavel('ok!', 10, 10))
+
+    def test_caracteres_invalidos(self):
+        self.assertTrue(texto_utilizavel('a' * 380 + '\ufffd' * 15, *A4))
+        self.assertFalse(texto_utilizavel('a' * 380 + '\ufffd' * 25, *A4))
+        self.assertFalse(texto_utilizavel('a' * 380 + '\x07' * 25, *A4))
+
+    def test_fonte_sem_tounicode(self):
+        self.assertFalse(texto_utilizavel('a' * 380 + '(cid:12)' * 4, *A4))
+
+    def test_proporcao_alfanumerica(self):
+        self.assertTrue(texto_utilizavel('ab.' * 150, *A4))
+        self.assertFalse(texto_utilizavel('a..' * 150, *A4))
+
+
+class CamadaTextoTests(ArquivoTemporario, TestCase):
+
+    def setUp(self):
+        # Página 1 nativa, página 2 só imagem (sem texto), página 3 nativa
+        self.caminho = self.arquivo_temporario(
+            'misto.pdf', _pdf_com_texto([[LINHA_CONTRATO] * 40, [], [LINHA_CONTRATO] * 40])
+        )
+
+    def test_paginas_sem_camada_utilizavel_vao_para_o_ocr(self):
+        paginas = extrair_camada_texto(self.caminho)
+
+        self.assertEqual(len(paginas), 3)
+        self.assertIsNone(paginas[1])
+        self.assertTrue(paginas[0].startswith(LINHA_CONTRATO))
+        self.assertEqual(paginas[0].count('\n'), 39)
+
+    def test_amostra(self):
+        self.assertEqual(amostrar_camada_texto(self.caminho), (3, 2 / 3))
+        self.assertEqual(amostrar_camada_texto(self.caminho, amostra=1), (3, 1.0))
+
+    def test_separar_grava_a_camada_no_checkpoint(self):
+        usuario = User.objects.create_user('advogado')
+        cliente = Cliente.objects.create(nome='Cliente', email='cliente@exemplo.com', user=usuario)
+        documento, = Documentos.objects.bulk_create([
+            Documentos(cliente=cliente, arquivo='documentos/misto.pdf', data_upload=timezone.now(), num_paginas=3)
+        ])
+        checkpoint = CheckpointOCR(documento, 'hash-a')
+
+        textos, pendentes = _separar_paginas(self.caminho, checkpoint)
+
+        self.assertEqual(sorted(textos), [0, 2])
+        self.assertEqual(pendentes, [1])
+        self.assertEqual(
+            set(PaginaOCR.objects.filter(documento=documento).values_list('pagina', 'origem')),
+            {(1, ORIGEM_CAMADA_TEXTO), (3, ORIGEM_CAMADA_TEXTO)},
+        )
+
+        # Retomada com a página de OCR já no checkpoint: nada pendente
+        checkpoint.salvar(1, 'texto do OCR')
+        textos, pendentes = _separar_paginas(self.caminho, CheckpointOCR(documento, 'hash-a'))
+        self.assertEqual((sorted(textos), pendentes), ([0, 1, 2], []))
+
+
+def _resultado(confianca=None, caracteres=600, dpi=DPI_BAIXO, largura=1240, altura=1754):
+    linhas = [] if confianca is None else [LinhaOCR('x' * caracteres, confianca, [])]
+    return ResultadoPagina(texto='x' * caracteres if linhas else '', linhas=linhas, dpi=dpi, largura=largura, altura=altura)
+
+
+class OCRAdaptativoTests(ArquivoTemporario, SimpleTestCase):
+
+    def test_precisa_reocr(self):
+        # Confiança baixa volta mesmo sem tinta medida
+        self.assertTrue(precisa_reocr(_resultado(0.5), tinta=0.0))
+        self.assertFalse(precisa_reocr(_resultado(0.95), tinta=0.3))
+        # Sem linhas: só volta se a página tiver tinta (verso em branco não)
+        self.assertTrue(precisa_reocr(_resultado(), tinta=0.05))
+        self.assertFalse(precisa_reocr(_resultado(), tinta=0.001))
+        # Confiança boa, mas poucos caracteres para uma página com tinta
+        self.assertTrue(precisa_reocr(_resultado(0.95, caracteres=50), tinta=0.05))
+        self.assertFalse(precisa_reocr(_resultado(0.95, caracteres=50), tinta=0.001))
+        self.assertFalse(precisa_reocr(_resultado(0.85), tinta=0.3, confianca_minima=0.8))
+
+    def test_escolher_melhor(self):
+        baixa, alta, vazio = _resultado(0.6), _resultado(0.9, dpi=DPI_ALTO), _resultado()
+
+        self.assertIs(escolher_melhor(baixa, alta), alta)
+        self.assertIs(escolher_melhor(alta, baixa), alta)
+        self.assertIs(escolher_melhor(baixa, vazio), baixa)
+        self.assertIs(escolher_melhor(vazio, baixa), baixa)
+        self.assertIs(escolher_melhor(vazio, _resultado()), vazio)
+
+    def test_so_a_pagina_de_baixa_confianca_volta_em_dpi_alto(self):
+        caminho = self.arquivo_temporario('scan.pdf', _pdf_com_texto([[LINHA_CONTRATO] * 40] * 2))
+        # Primeiro passe: página 0 boa, página 1 ruim; segundo passe da página 1 melhor
+        motor = MotorOCRFalso([0.95, 0.5, 0.97])
+        concluidas = []
+
+        resultados = _ocr_falso(motor).reconhecer_paginas_pdf(
+            caminho, preprocessar=False, adaptativo=True, ao_concluir=lambda i, r: concluidas.append((i, r.dpi)),
+        )
+
+        self.assertEqual(len(motor.formatos), 3)
+        self.assertEqual(motor.formatos[2][1], 2 * motor.formatos[1][1])
+        self.assertEqual((resultados[0].dpi, resultados[1].dpi), (DPI_BAIXO, DPI_ALTO))
+        self.assertAlmostEqual(resultados[1].confianca_media, 0.97)
+        self.assertEqual(concluidas, [(0, DPI_BAIXO), (1, DPI_ALTO)])
+
+    def test_segundo_passe_pior_mantem_o_primeiro(self):
+        caminho = self.arquivo_temporario('scan.pdf', _pdf_com_texto([[LINHA_CONTRATO] * 40]))
+
+        resultados = _ocr_falso(MotorOCRFalso([0.6, 0.4])).reconhecer_paginas_pdf(
+            caminho, preprocessar=False, adaptativo=True,
+        )
+
+        self.assertEqual(resultados[0].dpi, DPI_BAIXO)
+        self.assertAlmostEqual(resultados[0].confianca_media, 0.6)
+
+
+class OCRArraysTests(ArquivoTemporario, SimpleTestCase):
+    """Páginas tratadas como arrays do render ao OCR, sem arquivos intermediários"""
+
+    def test_preparar_array_aceita_cinza_bgr_e_bgra(self):
+        ocr = _ocr_falso(MotorOCRFalso([]))
+        cinza = np.full((300, 400), 200, np.uint8)
+        cinza[100:120, 50:350] = 20
+
+        for img in (cinza, np.dstack([cinza] * 3), np.dstack([cinza] * 3 + [np.full_like(cinza, 255)])):
+            preparada = ocr.preparar_array(img, max_width=200)
+            self.assertEqual(preparada.shape, (150, 200))
+            self.assertEqual(set(np.unique(preparada)), {0, 255})
+
+    def test_caixas_voltam_para_a_imagem_original(self):
+        motor = MotorOCRFalso([0.9], linhas=1)
+        img = np.full((1000, 4000), 255, np.uint8)
+
+        resultado = _ocr_falso(motor).reconhecer_array(img, dpi=DPI_BAIXO)
+
+        self.assertEqual(motor.formatos, [(500, 2000)])
+        self.assertEqual((resultado.largura, resultado.altura), (4000, 1000))
+        self.assertEqual(resultado.linhas[0].caixa, [[20, 20], [220, 20], [220, 60], [20, 60]])
+
+    def test_array_de_pil(self):
+        from PIL import Image
+
+        img = OCROptimizado.array_de_pil(Image.new('RGB', (30, 20), (255, 0, 0)))
+
+        self.assertEqual((img.shape, img.dtype), ((20, 30), np.uint8))
+
+    def test_pdf_sem_arquivos_de_imagem(self):
+        caminho = self.arquivo_temporario('scan.pdf', _pdf_com_texto([[LINHA_CONTRATO] * 40] * 2))
+        motor = MotorOCRFalso([0.95, 0.95], linhas=2)
+
+        with mock.patch('ia.ocr_utils.cv2.imwrite') as imwrite, mock.patch('ia.ocr_utils.cv2.imread') as imread:
+            texto = _ocr_falso(motor).processar_pdf_como_imagens(caminho)
+
+        imwrite.assert_not_called()
+        imread.assert_not_called()
+        self.assertEqual(len(motor.formatos), 2)
+        self.assertTrue(all(len(formato) == 2 for formato in motor.formatos))
+        self.assertEqual(
+            texto,
+            '--- Página 1 ---\nlinha reconhecida 0\nlinha reconhecida 1\n\n'
+            '--- Página 2 ---\nlinha reconhecida 0\nlinha reconhecida 1',
+        )
+
+
+class PaginasEmFilaTests(ArquivoTemporario, SimpleTestCase):
+
+    def setUp(self):
+        self.caminho = self.arquivo_temporario('autos.pdf', _pdf_com_texto([[f'Folha {i}'] for i in range(7)]))
+
+    def test_documento_reaberto_a_cada_janela(self):
+        import pypdfium2 as pdfium
+
+        with mock.patch.object(pdfium, 'PdfDocument', wraps=pdfium.PdfDocument) as abrir:
+            paginas = list(iterar_paginas_pdf(self.caminho, dpi=30, janela=3))
+
+        self.assertEqual([idx for idx, _ in paginas], list(range(7)))
+        # Uma abertura para contar as páginas e uma por janela (3 + 3 + 1)
+        self.assertEqual(abrir.call_count, 4)
+        self.assertEqual(paginas[0][1].ndim, 2)
+
+    def test_so_as_paginas_pedidas(self):
+        indices = [idx for idx, _ in paginas_em_fila(self.caminho, dpi=30, janela=2, paginas=[5, 1, 6])]
+
+        self.assertEqual(indices, [5, 1, 6])
+
+    def test_fila_limitada_com_consumidor_lento(self):
+        renderizadas = []
+        iterar = iterar_paginas_pdf
+
+        def contar(*args, **kwargs):
+            for item in iterar(*args, **kwargs):
+                renderizadas.append(item[0])
+                yield item
+
+        adiantadas = []
+        with mock.patch('ia.ocr_utils.iterar_paginas_pdf', side_effect=contar):
+            for consumidas, _ in enumerate(paginas_em_fila(self.caminho, dpi=30, janela=2), 1):
+                time.sleep(0.05)
+                adiantadas.append(len(renderizadas) - consumidas)
+
+        self.assertEqual(len(renderizadas), 7)
+        # Na fila (janela) mais a página que o produtor segura esperando vaga
+        self.assertLessEqual(max(adiantadas), 3)
+
+    def test_consumidor_que_desiste_libera_o_produtor(self):
+        antes = {t.ident for t in threading.enumerate() if t.name == 'render-pdf'}
+        paginas = paginas_em_fila(self.caminho, dpi=30, janela=1)
+        next(paginas)
+
+        paginas.close()
+
+        vivos = [t for t in threading.enumerate() if t.name == 'render-pdf' and t.ident not in antes]
+        self.assertEqual(vivos, [])
+
+    def test_erro_do_produtor_chega_ao_consumidor(self):
+        with self.assertRaises(Exception):
+            list(paginas_em_fila(os.path.join(os.path.dirname(self.caminho), 'inexistente.pdf')))
+
+
+class ConversorFalso:
+    def __init__(self, opcoes):
+        self.opcoes = opcoes
+        self.convertidos = []
+
+    def convert(self, path, **kwargs):
+        self.convertidos.append((path, kwargs))
+        return SimpleNamespace(path=path)
+
+
+class RegistroConversoresTests(SimpleTestCase):
+
+    def setUp(self):
+        criar = mock.patch.object(conversores_docling, '_criar_conversor', side_effect=ConversorFalso)
+        memoria = mock.patch.object(conversores_docling, 'memoria_processo_mb', return_value=100.0)
+        self.criar = criar.start()
+        self.memoria = memoria.start()
+        self.addCleanup(criar.stop)
+        self.addCleanup(memoria.stop)
+
+    def test_conversor_reutilizado_entre_conversoes(self):
+        registro = RegistroConversores()
+
+        registro.converter('a.pdf')
+        registro.converter('b.pdf', page_range=(1, 3))
+
+        self.assertEqual(self.criar.call_count, 1)
+        conversor = registro.obter()
+        self.assertEqual(conversor.convertidos, [('a.pdf', {}), ('b.pdf', {'page_range': (1, 3)})])
+        estatisticas = registro.estatisticas()
+        self.assertEqual(estatisticas['cargas'], 1)
+        self.assertEqual(estatisticas['conversoes'], 2)
+        self.assertEqual(estatisticas['conversores_ativos'], 1)
+
+    def test_um_conversor_por_opcoes_com_descarte_lru(self):
+        registro = RegistroConversores(max_conversores=2)
+        sem_ocr = OpcoesDocling(do_ocr=False)
+        sem_tabelas = OpcoesDocling(do_table_structure=False)
+
+        padrao = registro.obter()
+        registro.obter(sem_ocr)
+        self.assertIs(registro.obter(), padrao)
+        registro.obter(sem_tabelas)
+
+        # sem_ocr era o menos usado recentemente
+        self.assertIs(registro.obter(), padrao)
+        self.assertEqual(self.criar.call_count, 3)
+        registro.obter(sem_ocr)
+        self.assertEqual(self.criar.call_count, 4)
+        self.assertEqual(registro.obter(sem_ocr).opcoes, sem_ocr)
+
+    def test_reciclado_apos_conversoes_max(self):
+        registro = RegistroConversores(conversoes_max=2)
+
+        primeiro = registro.obter()
+        registro.converter('a.pdf')
+        registro.converter('b.pdf')
+
+        self.assertIsNot(registro.obter(), primeiro)
+        self.assertEqual(registro.reciclagens, 1)
+        self.assertEqual(self.criar.call_count, 2)
+
+    def test_memoria_acima_do_limite_descarta_todos(self):
+        registro = RegistroConversores(memoria_max_mb=1000)
+        registro.obter(OpcoesDocling(do_ocr=False))
+        registro.converter('a.pdf')
+        self.assertEqual(registro.estatisticas()['conversores_ativos'], 2)
+
+        self.memoria.return_value = 2000.0
+        registro.converter('b.pdf')
+
+        self.assertEqual(registro.estatisticas()['conversores_ativos'], 0)
+        self.assertEqual(registro.reciclagens, 2)
+
+    @override_settings(DOCLING_CONVERSORES={'max_conversores': 1, 'conversoes_max': 5, 'memoria_max_mb': 512})
+    def test_registro_unico_por_processo_com_settings(self):
+        with mock.patch.object(conversores_docling, '_registro', None):
+            registro = obter_registro()
+
+            self.assertIs(obter_registro(), registro)
+            self.assertEqual(
+                (registro.max_conversores, registro.conversoes_max, registro.memoria_max_mb), (1, 5, 512)
+            )
+
+    def test_pre_aquecer_carrega_o_conversor_padrao(self):
+        with mock.patch.object(conversores_docling, '_registro', RegistroConversores()):
+            pre_aquecer()
+
+            self.assertEqual(obter_registro().estatisticas()['cargas'], 1)
+            self.criar.assert_called_once_with(OpcoesDocling())
+
+    def test_pre_aquecer_sem_docling_nao_derruba_o_worker(self):
+        self.criar.side_effect = ImportError('docling')
+
+        with mock.patch.object(conversores_docling, '_registro', RegistroConversores()):
+            with self.assertLogs('ia.conversores_docling', 'WARNING'):
+                pre_aquecer()
+
+
+def _pagina_linhas(angulo=0.0, borda=0):
+    """Página em cinza com faixas de texto, opcionalmente inclinada e com tarja preta"""
+    import cv2
+
+    img = np.full((1400, 1000), 255, np.uint8)
+    for y in range(200, 1200, 40):
+        cv2.rectangle(img, (150, y), (850, y + 12), 0, -1)
+    if angulo:
+        M = cv2.getRotationMatrix2D((500, 700), angulo, 1.0)
+        img = cv2.warpAffine(img, M, (1000, 1400), borderValue=255)
+    if borda:
+        img = cv2.copyMakeBorder(img, borda, borda, borda, borda, cv2.BORDER_CONSTANT, value=0)
+    return img
+
+
+class ImagePreprocessorTests(SimpleTestCase):
+
+    def test_etapas_na_ordem_da_cadeia(self):
+        preprocessador = ImagePreprocessor(etapas=('threshold', 'bordas', 'contraste'))
+
+        preprocessador.aplicar(_pagina_linhas())
+
+        self.assertEqual(preprocessador.etapas, ('bordas', 'contraste', 'threshold'))
+        self.assertEqual(list(preprocessador.ultimos_tempos), ['bordas', 'contraste', 'threshold'])
+
+    def test_etapa_desconhecida(self):
+        with self.assertRaises(ValueError):
+            ImagePreprocessor(etapas=('bordas', 'denoise'))
+
+    def test_buffers_reaproveitados_entre_paginas_do_mesmo_tamanho(self):
+        preprocessador = ImagePreprocessor(etapas=('contraste', 'threshold'))
+
+        primeira = preprocessador.aplicar(_pagina_linhas())
+        segunda = preprocessador.aplicar(_pagina_linhas(angulo=2))
+        outra_dimensao = preprocessador.aplicar(_pagina_linhas(borda=10))
+
+        self.assertIs(segunda, primeira)
+        self.assertIsNot(outra_dimensao, primeira)
+        self.assertEqual(set(np.unique(outra_dimensao)), {0, 255})
+
+    def test_bordas_recortadas_com_deslocamento_na_transformacao(self):
+        preprocessador = ImagePreprocessor(etapas=('bordas',))
+        img = _pagina_linhas(borda=60)
+
+        saida = preprocessador.aplicar(img)
+
+        self.assertLess(saida.shape[0], img.shape[0] - 100)
+        self.assertLess(saida.shape[1], img.shape[1] - 100)
+        self.assertEqual(saida[:5, :5].min(), 255)
+        dx, dy = preprocessador.transformacao[0, 2], preprocessador.transformacao[1, 2]
+        self.assertEqual(dx, dy)
+        self.assertTrue(60 <= dx <= 66)
+
+    def test_inclinacao_corrigida_e_transformacao_volta_para_a_entrada(self):
+        preprocessador = ImagePreprocessor(etapas=('inclinacao',))
+        img = _pagina_linhas(angulo=4)
+        self.assertAlmostEqual(abs(preprocessador._estimar_inclinacao(img)), 4, places=1)
+
+        saida = preprocessador.aplicar(img)
+
+        self.assertAlmostEqual(preprocessador._estimar_inclinacao(saida), 0, places=1)
+        # O centro da rotação é fixo nas duas imagens
+        centro = preprocessador.transformacao @ np.array([500, 700, 1])
+        np.testing.assert_allclose(centro[:2], [500, 700], atol=1)
+
+    def test_inclinacao_acima_do_maximo_ignorada(self):
+        preprocessador = ImagePreprocessor(etapas=('inclinacao',), inclinacao_maxima=3)
+        img = _pagina_linhas(angulo=4)
+
+        self.assertIs(preprocessador.aplicar(img), img)
+        np.testing.assert_array_equal(preprocessador.transformacao, np.eye(3))
+
+    def test_atalhos_devolvem_copia(self):
+        img = _pagina_linhas(borda=60)
+
+        saida = ImagePreprocessor.remover_bordas(img)
+
+        self.assertTrue(saida.flags.owndata)
+        self.assertLess(saida.shape[0], img.shape[0])
+
+
+def _linhas_ocr(*textos):
+    return [
+        LinhaOCR(
+            texto=texto, confianca=0.9 - i * 0.1,
+            caixa=[[10, 40 * i], [300, 40 * i], [300, 40 * i + 30], [10, 40 * i + 30]],
+        )
+        for i, texto in enumerate(textos)
+    ]
+
+
+class SidecarOCRTests(TestCase):
+
+    def setUp(self):
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        os.makedirs(os.path.join(diretorio.name, 'documentos'))
+        media = override_settings(MEDIA_ROOT=diretorio.name)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.armazem = ArmazemOCR(os.path.join(diretorio.name, 'armazem.sqlite3'), 10 ** 6)
+        armazem = mock.patch('ia.sidecar_ocr.obter_armazem', return_value=self.armazem)
+        armazem.start()
+        self.addCleanup(armazem.stop)
+
+        usuario = User.objects.create_user('advogado')
+        cliente = Cliente.objects.create(nome='Cliente', email='cliente@exemplo.com', user=usuario)
+        self.documento, = Documentos.objects.bulk_create([
+            Documentos(cliente=cliente, arquivo='documentos/peticao.pdf', data_upload=timezone.now(),
+                       num_paginas=3, hash_conteudo='hash-a')
+        ])
+
+    def _gravar_paginas(self):
+        checkpoint = CheckpointOCR(self.documento, 'hash-a')
+        primeira = ResultadoPagina(
+            'EXCELENTÍSSIMO SENHOR\nJuízo da 2ª Vara', _linhas_ocr('EXCELENTÍSSIMO SENHOR', 'Juízo da 2ª Vara'),
+            dpi=DPI_BAIXO, largura=1240, altura=1754,
+        )
+        terceira = ResultadoPagina('Termos em que pede deferimento', _linhas_ocr('Termos em que pede deferimento'),
+                                   dpi=DPI_ALTO, largura=2480, altura=3508)
+        checkpoint.salvar_varias({0: primeira.texto, 2: terceira.texto}, 'ocr', {0: primeira, 2: terceira})
+        checkpoint.salvar_camada_texto({1: 'Dos fatos'})
+        return primeira, terceira
+
+    def test_linhas_da_pagina_ida_e_volta(self):
+        linhas = _linhas_ocr('Cláusula 1ª', 'ação')
+        blob = codificar_linhas(ResultadoPagina('', linhas, largura=1240, altura=1754))
+
+        lidas = decodificar_linhas(blob)
+
+        self.assertEqual([l.texto for l in lidas], ['Cláusula 1ª', 'ação'])
+        self.assertEqual([l.caixa for l in lidas], [l.caixa for l in linhas])
+        for lida, linha in zip(lidas, linhas):
+            self.assertAlmostEqual(lida.confianca, linha.confianca, places=6)
+
+    def test_sidecar_reune_as_paginas_do_documento(self):
+        primeira, terceira = self._gravar_paginas()
+
+        caminho = gravar_sidecar(self.documento, 'hash-a')
+        sidecar = carregar_sidecar(self.documento)
+
+        self.assertEqual(caminho, caminho_sidecar(self.documento.arquivo.path))
+        self.assertEqual(sidecar.paginas, [0, 1, 2])
+        self.assertEqual([sidecar.origem(p) for p in sidecar.paginas], ['ocr', ORIGEM_CAMADA_TEXTO, 'ocr'])
+        self.assertEqual([sidecar.dpi(p) for p in sidecar.paginas], [DPI_BAIXO, None, DPI_ALTO])
+        self.assertEqual(sidecar.dimensoes(2), (2480, 3508))
+        self.assertEqual(sidecar.linhas_pagina(1), [])
+        self.assertEqual([l.texto for l in sidecar.linhas_pagina(2)], ['Termos em que pede deferimento'])
+        # Offsets de texto das linhas continuam certos após juntar páginas com acentos
+        self.assertEqual(
+            [(p, l.texto) for p, l in sidecar.iterar_linhas()],
+            [(0, 'EXCELENTÍSSIMO SENHOR'), (0, 'Juízo da 2ª Vara'), (2, 'Termos em que pede deferimento')],
+        )
+        self.assertEqual(sidecar.num_linhas, 3)
+        self.assertEqual(sidecar.linhas_pagina(0)[1].caixa, primeira.linhas[1].caixa)
+        self.assertEqual(
+            sidecar.texto(),
+            '--- Página 1 ---\nEXCELENTÍSSIMO SENHOR\nJuízo da 2ª Vara\n\n--- Página 2 ---\nDos fatos\n\n'
+            '--- Página 3 ---\nTermos em que pede deferimento',
+        )
+
+    def test_sem_paginas_nao_grava(self):
+        self.assertIsNone(gravar_sidecar(self.documento, 'hash-a'))
+        self.assertIsNone(carregar_sidecar(self.documento))
+
+    def test_sidecar_de_outro_conteudo_ignorado(self):
+        self._gravar_paginas()
+        gravar_sidecar(self.documento, 'hash-a')
+
+        self.documento.hash_conteudo = 'hash-b'
+
+        self.assertIsNone(carregar_sidecar(self.documento))
+
+    def test_sem_o_arquivo_le_do_armazem(self):
+        self._gravar_paginas()
+        os.remove(gravar_sidecar(self.documento, 'hash-a'))
+
+        sidecar = carregar_sidecar(self.documento)
+
+        self.assertEqual(sidecar.hash_documento, 'hash-a')
+        self.assertEqual(sidecar.texto_pagina(1), 'Dos fatos')
+
+    def test_versao_desconhecida(self):
+        buffer = io.BytesIO()
+        np.savez(buffer, versao=np.int8(99), hash_documento=np.zeros(0, np.uint8))
+        buffer.seek(0)
+
+        with self.assertRaisesMessage(ValueError, 'Versão de sidecar não suportada: 99'):
+            SidecarOCR.carregar(buffer)
+
+
+class EmbedderHashingTests(SimpleTestCase):
+
+    def test_mesmo_vetor_em_outro_processo(self):
+        texto = 'Petição inicial de ação de cobrança'
+        codigo = (
+            "import json, sys; from ia.embedders import EmbedderHashing; "
+            "print(json.dumps(EmbedderHashing(dimensions=64).get_embedding(sys.argv[1])))"
+        )
+        raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        saida = subprocess.run(
+            [sys.executable, '-c', codigo, texto], cwd=raiz, capture_output=True, text=True, check=True,
+            env={**os.environ, 'PYTHONHASHSEED': '123'},
+        ).stdout
+
+        np.testing.assert_allclose(json.loads(saida), EmbedderHashing(dimensions=64).get_embedding(texto), rtol=1e-6)
+
+    def test_acentos_e_maiusculas_normalizados(self):
+        embedder = EmbedderHashing(dimensions=256)
+
+        self.assertEqual(embedder.get_embedding('PETIÇÃO Inicial'), embedder.get_embedding('peticao inicial'))
+        self.assertNotEqual(embedder.get_embedding('petição inicial'), embedder.get_embedding('contestação'))
+
+    def test_lote_com_dimensoes_e_norma_unitaria(self):
+        embedder = EmbedderHashing(dimensions=128)
+        textos = ['Cláusula primeira do contrato', 'Do prazo prazo prazo de vigência', '', '!!!']
+
+        matriz = embedder.embeddar_lote(textos)
+
+        self.assertEqual(matriz.shape, (4, 128))
+        self.assertEqual(matriz.dtype, np.float32)
+        np.testing.assert_allclose(np.linalg.norm(matriz[:2], axis=1), [1, 1], rtol=1e-5)
+        # Sem palavras: vetor nulo, não NaN
+        self.assertFalse(matriz[2:].any())
+        np.testing.assert_allclose(matriz[1], embedder.get_embedding(textos[1]), rtol=1e-6)
+
+    def test_frequencia_sublinear(self):
+        embedder = EmbedderHashing(dimensions=1024, ngramas=(1,))
+        posicao_prazo = abs(embedder._posicao('prazo')) - 1
+        posicao_multa = abs(embedder._posicao('multa')) - 1
+
+        vetor = np.asarray(embedder.get_embedding('prazo prazo prazo multa'))
+
+        self.assertAlmostEqual(abs(vetor[posicao_prazo] / vetor[posicao_multa]), np.log1p(3) / np.log1p(1), places=5)
+
+    def test_pares_de_palavras_distinguem_a_ordem(self):
+        so_palavras = EmbedderHashing(dimensions=512, ngramas=(1,))
+        com_pares = EmbedderHashing(dimensions=512)
+
+        self.assertEqual(so_palavras.get_embedding('réu autor'), so_palavras.get_embedding('autor réu'))
+        self.assertNotEqual(com_pares.get_embedding('réu autor'), com_pares.get_embedding('autor réu'))
+
+    def test_tokens_memorizados_limitados(self):
+        embedder = EmbedderHashing(dimensions=64)
+        esperado = EmbedderHashing(dimensions=64).get_embedding('julgamento antecipado da lide')
+
+        with mock.patch.object(embedders, '_MAX_TOKENS_MEMORIZADOS', 3):
+            vetor = embedder.get_embedding('julgamento antecipado da lide')
+
+        self.assertLessEqual(len(embedder._posicoes), 3)
+        self.assertEqual(vetor, esperado)
+
+
+@mock.patch.dict(embedders._BACKENDS)
+class RegistroEmbeddersTests(SimpleTestCase):
+
+    def test_backend_registrado_fica_disponivel_nas_settings(self):
+        @registrar_backend('teste', local=True)
+        def criar(**opcoes):
+            return EmbedderHashing(id='teste-v1', **opcoes)
+
+        configurado = embedder_configurado('documentos', {'backend': 'teste', 'opcoes': {'dimensions': 32}})
+
+        self.assertEqual(configurado.assinatura, 'teste:teste-v1:32')
+        self.assertEqual(configurado.tabela, 'documentos_teste_teste_v1_32')
+        self.assertTrue(configurado.local)
+        self.assertEqual(configurado.embedder.dimensions, 32)
+
+    def test_backend_desconhecido(self):
+        with self.assertRaisesMessage(ValueError, 'Backend de embeddings desconhecido: bert'):
+            embedder_configurado('documentos', {'backend': 'bert'})
+
+    def test_ngramas_das_settings_viram_tupla(self):
+        configurado = embedder_configurado('documentos', {'backend': 'hashing', 'opcoes': {'ngramas': [1]}})
+
+        self.assertEqual(configurado.embedder.ngramas, (1,))
+        self.assertEqual(configurado.assinatura, assinatura('hashing', configurado.embedder))
+        self.assertEqual(configurado.assinatura, 'hashing:hashing-v1:1024')
+
+    def test_tabela_legada_mantem_o_nome(self):
+        self.assertEqual(nome_tabela(ASSINATURA_LEGADA, 'documentos'), 'documentos')
+        self.assertEqual(
+            nome_tabela('openai:text-embedding-3-large:3072', 'documentos'),
+            'documentos_openai_text_embedding_3_large_3072',
+        )
+
+
+class ColunaClienteTests(SimpleTestCase):
+    """Tabela gravada pelo LanceDb do agno, antes da coluna cliente_id"""
+
+    def setUp(self):
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        self.uri = os.path.join(diretorio.name, 'lance')
+        self.embedder = EmbedderHashing(dimensions=64)
+        self.indice_lexico = IndiceLexico(os.path.join(diretorio.name, 'lexico.sqlite3'))
+
+        antigo = LanceDb(table_name='documentos', uri=self.uri, embedder=self.embedder)
+        antigo.create()
+        antigo.insert('hash-antigo', [
+            Document(
+                content=f'Contrato de locação comercial número {i}', name=f'contrato{i}.pdf',
+                meta_data={'cliente_id': 1 + i % 2, 'documento_id': i},
+            )
+            for i in range(6)
+        ])
+
+    def _vector_db(self):
+        return LanceDbHibrido(
+            table_name='documentos', uri=self.uri, embedder=self.embedder,
+            indice_lexico=self.indice_lexico, modo='vetorial',
+        )
+
+    def _clientes(self, vector_db, cliente_id):
+        return [d.meta_data['cliente_id'] for d in vector_db.busca_vetorial('locação comercial', 10, cliente_id)]
+
+    def test_sem_a_coluna_filtra_pelo_payload(self):
+        vector_db = self._vector_db()
+
+        self.assertFalse(vector_db.tem_coluna_cliente)
+        self.assertEqual(vector_db._filtro_cliente(2), lancedb_agno.filtro_cliente_payload(2))
+        self.assertEqual(self._clientes(vector_db, 2), [2, 2, 2])
+
+    def test_create_preenche_a_coluna_do_payload_com_indice_bitmap(self):
+        vector_db = self._vector_db()
+
+        vector_db.create()
+
+        self.assertTrue(vector_db.tem_coluna_cliente)
+        linhas = vector_db.table.to_arrow().to_pylist()
+        self.assertEqual(
+            [linha['cliente_id'] for linha in linhas],
+            [json.loads(linha['payload'])['meta_data']['cliente_id'] for linha in linhas],
+        )
+        self.assertEqual(vector_db.indice_cliente().index_type, 'Bitmap')
+        self.assertEqual(vector_db.linhas_fora_do_indice(), 0)
+        self.assertEqual(vector_db._filtro_cliente(2), 'cliente_id = 2')
+        self.assertEqual(self._clientes(vector_db, 2), [2, 2, 2])
+
+    def test_insert_retreina_o_indice_acima_do_limite(self):
+        vector_db = self._vector_db()
+        vector_db.create()
+        aditivo = Document(content='Aditivo ao contrato de locação', name='aditivo.pdf', meta_data={'cliente_id': 3})
+        distrato = Document(content='Distrato da locação', name='distrato.pdf', meta_data={'cliente_id': 3})
+
+        with override_settings(BUSCA_HIBRIDA={'max_fora_indice': 1}):
+            vector_db.insert('hash-aditivo', [aditivo])
+            self.assertEqual(vector_db.linhas_fora_do_indice(), 1)
+
+            vector_db.insert('hash-distrato', [distrato])
+
+        self.assertEqual(vector_db.linhas_fora_do_indice(), 0)
+        self.assertEqual(self._clientes(vector_db, 3), [3, 3])
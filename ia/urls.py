@@ -7,6 +7,7 @@ urlpatterns = [
     path("ver_referencias/<int:id>", views.ver_referencias, name='ver_referencias'),
     path("analise_jurisprudencia/<int:id>", views.analise_jurisprudencia, name='analise_jurisprudencia'),
     path("processar_analise/<int:id>", views.processar_analise, name='processar_analise'),
+    path("progresso_ocr/<int:id>", views.progresso_ocr, name='progresso_ocr'),
     path("qrcode_whatsapp/", views.qrcode_whatsapp, name='qrcode_whatsapp'),
     path("webhook_whatsapp/", views.webhook_whatsapp, name='webhook_whatsapp'),
 ]
@@ -1,10 +1,11 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
+from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.contrib.messages import constants
 from usuarios.models import Cliente, Documentos
-from .models import Pergunta, ContextRag, AnaliseJurisprudencia
+from .models import Pergunta, ContextRag, AnaliseJurisprudencia, ProcessamentoOCR
 import time
 import json
 import logging
@@ -90,6 +91,23 @@ def analise_jurisprudencia(request, id):
         'analise': analise
     })
 
+@login_required
+def progresso_ocr(request, id):
+    """
+    Andamento do OCR de um documento em JSON (faixas e páginas concluídas).
+    """
+    documento = get_object_or_404(Documentos, id=id, cliente__user=request.user)
+    processamento = ProcessamentoOCR.objects.filter(documento=documento).first()
+    if processamento is not None:
+        return JsonResponse(processamento.progresso())
+
+    # Documento processado em uma task só: apenas o checkpoint por página
+    return JsonResponse({
+        'documento_id': documento.id,
+        'status': 'concluido' if documento.conteudo_id else 'processando',
+        'paginas_concluidas': documento.paginas_ocr.count(),
+    })
+
 @csrf_exempt
 def processar_analise(request, id):
     """
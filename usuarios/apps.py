@@ -5,6 +5,5 @@ class UsuariosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'usuarios'
 
-
-def ready(self):
-    import usuarios.signals
+    def ready(self):
+        import usuarios.signals
@@ -0,0 +1,69 @@
+"""
+Compressão do texto extraído dos documentos (ConteudoDocumento)
+
+zstd quando o pacote zstandard está instalado, gzip caso contrário; o
+algoritmo fica gravado em cada linha, então registros antigos continuam
+legíveis se a configuração mudar.
+"""
+import gzip
+import hashlib
+import logging
+from typing import Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+COMPRESSAO_ZSTD = 'zstd'
+COMPRESSAO_GZIP = 'gzip'
+
+NIVEL_PADRAO = {COMPRESSAO_ZSTD: 3, COMPRESSAO_GZIP: 6}
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - depende do ambiente
+    zstandard = None
+
+
+def hash_texto(texto: str) -> str:
+    """SHA-256 do texto em UTF-8 (chave do armazenamento endereçado por conteúdo)"""
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+
+def algoritmo_configurado() -> str:
+    config = getattr(settings, 'CONTEUDO_DOCUMENTOS', {})
+    algoritmo = config.get('compressao', COMPRESSAO_ZSTD)
+    if algoritmo == COMPRESSAO_ZSTD and zstandard is None:
+        logger.warning("zstandard não instalado; conteúdo dos documentos comprimido com gzip")
+        return COMPRESSAO_GZIP
+    return algoritmo
+
+
+def comprimir(texto: str, algoritmo: str = None) -> Tuple[bytes, str]:
+    """
+    Args:
+        texto: Texto do documento
+        algoritmo: 'zstd' ou 'gzip' (padrão: settings.CONTEUDO_DOCUMENTOS)
+
+    Returns:
+        (bytes comprimidos, algoritmo usado)
+    """
+    algoritmo = algoritmo or algoritmo_configurado()
+    nivel = getattr(settings, 'CONTEUDO_DOCUMENTOS', {}).get('nivel', NIVEL_PADRAO[algoritmo])
+    dados = texto.encode('utf-8')
+    if algoritmo == COMPRESSAO_ZSTD:
+        return zstandard.ZstdCompressor(level=nivel).compress(dados), algoritmo
+    if algoritmo == COMPRESSAO_GZIP:
+        # mtime fixo: o mesmo texto gera sempre os mesmos bytes
+        return gzip.compress(dados, compresslevel=nivel, mtime=0), algoritmo
+    raise ValueError(f"Compressão desconhecida: {algoritmo}")
+
+
+def descomprimir(dados: bytes, algoritmo: str) -> str:
+    if algoritmo == COMPRESSAO_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("Conteúdo comprimido com zstd, mas o pacote zstandard não está instalado")
+        return zstandard.ZstdDecompressor().decompress(bytes(dados)).decode('utf-8')
+    if algoritmo == COMPRESSAO_GZIP:
+        return gzip.decompress(bytes(dados)).decode('utf-8')
+    raise ValueError(f"Compressão desconhecida: {algoritmo}")
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 11:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuarios', '0002_documentos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentos',
+            name='hash_conteudo',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-17 11:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuarios', '0003_documentos_hash_conteudo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentos',
+            name='num_paginas',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='documentos',
+            name='tamanho_bytes',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='documentos',
+            name='tipo_mime',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+    ]
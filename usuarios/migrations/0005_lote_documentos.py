@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-17 11:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuarios', '0004_documentos_metadados_upload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoteDocumentos',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('grupo', models.CharField(db_index=True, max_length=100)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('enfileirados', models.PositiveIntegerField(default=0)),
+                ('recusados', models.JSONField(blank=True, default=list)),
+                ('data_criacao', models.DateTimeField(auto_now_add=True)),
+                ('data_conclusao', models.DateTimeField(blank=True, null=True)),
+                ('cliente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lotes', to='usuarios.cliente')),
+            ],
+            options={
+                'verbose_name': 'Lote de documentos',
+                'verbose_name_plural': 'Lotes de documentos',
+                'ordering': ['-data_criacao'],
+            },
+        ),
+        migrations.AddField(
+            model_name='documentos',
+            name='lote',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='documentos', to='usuarios.lotedocumentos'),
+        ),
+    ]
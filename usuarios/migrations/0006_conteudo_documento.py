@@ -0,0 +1,106 @@
+# Generated by Django 4.2.30 on 2026-10-17 11:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+import gzip
+import hashlib
+
+import martor.models
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - depende do ambiente
+    zstandard = None
+
+
+# Cópias congeladas de usuarios/conteudo.py: a migração não acompanha
+# mudanças no código do app (algoritmo e nível fixos, sem settings)
+def hash_texto(texto):
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+
+def comprimir(texto):
+    dados = texto.encode('utf-8')
+    if zstandard is not None:
+        return zstandard.ZstdCompressor(level=3).compress(dados), 'zstd'
+    return gzip.compress(dados, compresslevel=6, mtime=0), 'gzip'
+
+
+def descomprimir(dados, algoritmo):
+    if algoritmo == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("Conteúdo comprimido com zstd, mas o pacote zstandard não está instalado")
+        return zstandard.ZstdDecompressor().decompress(bytes(dados)).decode('utf-8')
+    if algoritmo == 'gzip':
+        return gzip.decompress(bytes(dados)).decode('utf-8')
+    raise ValueError(f"Compressão desconhecida: {algoritmo}")
+
+
+def mover_conteudo(apps, schema_editor):
+    """Comprime o texto de cada documento em ConteudoDocumento (um por texto distinto)"""
+    Documentos = apps.get_model('usuarios', 'Documentos')
+    ConteudoDocumento = apps.get_model('usuarios', 'ConteudoDocumento')
+    ids = {}
+    for documento in Documentos.objects.exclude(content='').only('id', 'content').iterator(chunk_size=200):
+        hash_ = hash_texto(documento.content)
+        if hash_ not in ids:
+            dados, compressao = comprimir(documento.content)
+            ids[hash_] = ConteudoDocumento.objects.create(
+                hash=hash_,
+                compressao=compressao,
+                dados=dados,
+                tamanho=len(documento.content.encode('utf-8')),
+                tamanho_comprimido=len(dados),
+            ).id
+        Documentos.objects.filter(id=documento.id).update(conteudo_id=ids[hash_])
+
+
+def restaurar_conteudo(apps, schema_editor):
+    Documentos = apps.get_model('usuarios', 'Documentos')
+    ConteudoDocumento = apps.get_model('usuarios', 'ConteudoDocumento')
+    for conteudo in ConteudoDocumento.objects.iterator(chunk_size=50):
+        Documentos.objects.filter(conteudo_id=conteudo.id).update(
+            content=descomprimir(conteudo.dados, conteudo.compressao)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usuarios', '0005_lote_documentos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConteudoDocumento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hash', models.CharField(max_length=64, unique=True)),
+                ('compressao', models.CharField(max_length=10)),
+                ('dados', models.BinaryField()),
+                ('tamanho', models.PositiveIntegerField(help_text='Bytes do texto em UTF-8, sem compressão')),
+                ('tamanho_comprimido', models.PositiveIntegerField()),
+                ('data_criacao', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Conteúdo de documento',
+                'verbose_name_plural': 'Conteúdos de documentos',
+            },
+        ),
+        migrations.AddField(
+            model_name='documentos',
+            name='conteudo',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='documentos', to='usuarios.conteudodocumento'),
+        ),
+        # Com default, a volta desta migração recria a coluna em tabelas com linhas
+        migrations.AlterField(
+            model_name='documentos',
+            name='content',
+            field=martor.models.MartorField(blank=True, default=''),
+        ),
+        migrations.RunPython(mover_conteudo, restaurar_conteudo),
+        migrations.RemoveField(
+            model_name='documentos',
+            name='content',
+        ),
+    ]
@@ -2,7 +2,9 @@ from django.db import models
 
 # Create your models here.
 from django.contrib.auth.models import User
-from martor.models import MartorField
+from django.db.models import Count, Sum
+from django.utils import timezone
+from .conteudo import comprimir, descomprimir, hash_texto
 
 class Cliente(models.Model):
     TIPO_CHOICES = [
@@ -18,6 +20,134 @@ class Cliente(models.Model):
     def __str__(self):
         return self.nome
 
+class LoteDocumentos(models.Model):
+    """
+    Upload em lote de um cliente: os documentos são criados de uma vez e
+    enfileirados aos poucos em um único grupo do django-q
+    """
+    cliente = models.ForeignKey(Cliente, on_delete=models.CASCADE, related_name='lotes')
+    grupo = models.CharField(max_length=100, db_index=True)
+    total = models.PositiveIntegerField(default=0)
+    enfileirados = models.PositiveIntegerField(default=0)
+    recusados = models.JSONField(default=list, blank=True)
+    data_criacao = models.DateTimeField(auto_now_add=True)
+    data_conclusao = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-data_criacao']
+        verbose_name = 'Lote de documentos'
+        verbose_name_plural = 'Lotes de documentos'
+
+    def __str__(self):
+        return f"{self.cliente} - {self.total} documento(s)"
+
+    def _concluidos_e_erros(self):
+        documentos = self.documentos.all()
+        return (
+            documentos.exclude(conteudo=None).count(),
+            documentos.filter(processamento_ocr__status='erro').count(),
+        )
+
+    def registrar_conclusao(self) -> bool:
+        """
+        Grava a data de conclusão quando todos os documentos terminaram (com
+        texto ou com erro); chamado pelas tasks ao fim de cada documento
+
+        Returns:
+            True se esta chamada concluiu o lote
+        """
+        if self.data_conclusao is not None or not self.total:
+            return False
+        concluidos, erros = self._concluidos_e_erros()
+        if concluidos + erros < self.total:
+            return False
+        agora = timezone.now()
+        if not LoteDocumentos.objects.filter(id=self.id, data_conclusao=None).update(data_conclusao=agora):
+            return False
+        self.data_conclusao = agora
+        return True
+
+    def progresso(self) -> dict:
+        """Documentos e páginas concluídos do lote, com a vazão desde a criação"""
+        documentos = self.documentos.all()
+        concluidos, erros = self._concluidos_e_erros()
+        paginas_total = documentos.aggregate(total=Sum('num_paginas'))['total'] or 0
+        # Documentos prontos contam todas as páginas (texto pode ter vindo do
+        # cache); os em andamento, as páginas já no checkpoint de OCR
+        paginas_concluidas = (
+            (documentos.exclude(conteudo=None).aggregate(total=Sum('num_paginas'))['total'] or 0)
+            + (documentos.filter(conteudo=None).aggregate(total=Count('paginas_ocr'))['total'] or 0)
+        )
+
+        fim = self.data_conclusao or timezone.now()
+        minutos = max((fim - self.data_criacao).total_seconds(), 1) / 60
+
+        return {
+            'lote_id': self.id,
+            'cliente_id': self.cliente_id,
+            'status': 'concluido' if self.data_conclusao else 'processando',
+            'total': self.total,
+            'enfileirados': self.enfileirados,
+            'concluidos': concluidos,
+            'erros': erros,
+            'paginas_total': paginas_total,
+            'paginas_concluidas': paginas_concluidas,
+            'percentual': round(100 * (concluidos + erros) / self.total, 1) if self.total else 0.0,
+            'documentos_por_minuto': round(concluidos / minutos, 2),
+            'paginas_por_minuto': round(paginas_concluidas / minutos, 2),
+            'recusados': self.recusados,
+            'data_criacao': self.data_criacao.isoformat(),
+            'data_conclusao': self.data_conclusao.isoformat() if self.data_conclusao else None,
+        }
+
+class ConteudoDocumento(models.Model):
+    """
+    Texto extraído de um documento, comprimido e endereçado pelo SHA-256 do
+    texto: documentos com o mesmo conteúdo compartilham a linha
+    """
+    hash = models.CharField(max_length=64, unique=True)
+    compressao = models.CharField(max_length=10)
+    dados = models.BinaryField()
+    tamanho = models.PositiveIntegerField(help_text='Bytes do texto em UTF-8, sem compressão')
+    tamanho_comprimido = models.PositiveIntegerField()
+    data_criacao = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Conteúdo de documento'
+        verbose_name_plural = 'Conteúdos de documentos'
+
+    def __str__(self):
+        return f"{self.hash[:12]} ({self.tamanho} → {self.tamanho_comprimido} bytes, {self.compressao})"
+
+    @property
+    def texto(self) -> str:
+        return descomprimir(self.dados, self.compressao)
+
+    @classmethod
+    def armazenar(cls, texto: str) -> "ConteudoDocumento":
+        """Linha do texto, criada (comprimida) só se ainda não existir"""
+        hash_ = hash_texto(texto)
+        existente = cls.objects.filter(hash=hash_).defer('dados').first()
+        if existente is not None:
+            return existente
+        dados, compressao = comprimir(texto)
+        conteudo, _ = cls.objects.get_or_create(
+            hash=hash_,
+            defaults={
+                'compressao': compressao,
+                'dados': dados,
+                'tamanho': len(texto.encode('utf-8')),
+                'tamanho_comprimido': len(dados),
+            },
+        )
+        return conteudo
+
+    @classmethod
+    def descartar_orfao(cls, conteudo_id):
+        """Remove o conteúdo se nenhum documento o referencia mais"""
+        if conteudo_id is not None and not Documentos.objects.filter(conteudo_id=conteudo_id).exists():
+            cls.objects.filter(id=conteudo_id).delete()
+
 class Documentos(models.Model):
     TIPO_CHOICES = [
         ('C', 'Contrato'),
@@ -30,7 +160,62 @@ class Documentos(models.Model):
     tipo = models.CharField(max_length=255, choices=TIPO_CHOICES, default='O')
     arquivo = models.FileField(upload_to='documentos/')
     data_upload = models.DateTimeField()
-    content = MartorField()
+    # Texto extraído fora da tabela (ConteudoDocumento); acessado por .content
+    conteudo = models.ForeignKey(
+        ConteudoDocumento, on_delete=models.PROTECT, null=True, blank=True, related_name='documentos'
+    )
+    # SHA-256 do arquivo, calculado em blocos no upload
+    hash_conteudo = models.CharField(max_length=64, blank=True, default='', db_index=True)
+    # Metadados calculados na mesma passada do upload (usuarios/upload.py)
+    tamanho_bytes = models.BigIntegerField(null=True, blank=True)
+    tipo_mime = models.CharField(max_length=100, blank=True, default='')
+    num_paginas = models.PositiveIntegerField(null=True, blank=True)
+    lote = models.ForeignKey(
+        LoteDocumentos, on_delete=models.SET_NULL, null=True, blank=True, related_name='documentos'
+    )
 
     def __str__(self):
-        return self.tipo
\ No newline at end of file
+        return self.tipo
+
+    @property
+    def content(self) -> str:
+        """
+        Texto extraído, lido e descomprimido só no primeiro acesso; listas de
+        documentos não carregam o texto
+        """
+        if '_content' in self.__dict__:
+            return self.__dict__['_content']
+        texto = self.conteudo.texto if self.conteudo_id else ''
+        self.__dict__['_content'] = texto
+        return texto
+
+    @content.setter
+    def content(self, texto):
+        # Gravado em ConteudoDocumento no save()
+        self.__dict__['_content'] = texto or ''
+        self.__dict__['_content_alterado'] = True
+
+    def save(self, *args, reindexar: bool = True, **kwargs):
+        """
+        Args:
+            reindexar: False quando quem grava já agenda rag_documentos em
+                seguida (tasks de OCR); o post_save não reindexa de novo
+        """
+        anterior = self.conteudo_id
+        if self.__dict__.pop('_content_alterado', False):
+            texto = self.__dict__['_content']
+            self.conteudo = ConteudoDocumento.armazenar(texto) if texto else None
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'content' in update_fields:
+            kwargs['update_fields'] = [f for f in update_fields if f != 'content'] + ['conteudo']
+        # Lido pelo post_save para reindexar o texto corrigido
+        self._conteudo_anterior = anterior
+        self._reindexar = reindexar
+        super().save(*args, **kwargs)
+        if anterior != self.conteudo_id:
+            ConteudoDocumento.descartar_orfao(anterior)
+
+    def refresh_from_db(self, *args, **kwargs):
+        self.__dict__.pop('_content', None)
+        self.__dict__.pop('_content_alterado', None)
+        super().refresh_from_db(*args, **kwargs)
\ No newline at end of file
@@ -1,52 +1,115 @@
-import os
-from django.db.models.signals import post_save
+import logging
+from functools import partial
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
 from django.dispatch import receiver
-from .models import Documentos
-from django_q.tasks import Chain
-from ia.tasks_otimizado import (
-    ocr_and_markdown_file_otimizado,
-    ocr_and_markdown_file_rapidocr,
-    ocr_paralelo_multipaginas,
-    rag_documentos,
-)
-
-# Extensões tratadas como imagem → RapidOCR (mais rápido)
-EXTENSOES_IMAGEM = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.tif', '.webp'}
-# A partir de quantas páginas usar OCR paralelo
-LIMIAR_PAGINAS_PDF_PARALELO = 20
-
-
-def _escolher_task_ocr(instance):
+from .models import ConteudoDocumento, Documentos
+from django_q.tasks import async_task
+from ia.agents import JuriAI
+from ia.indice_vetorial import ids_vetores_documento
+from ia.models import ChunkIndexado
+from ia.tasks_otimizado import rotear_ocr, rag_documentos, remover_vetores_documento
+
+logger = logging.getLogger(__name__)
+
+
+def _documento_identico(instance):
     """
-    Decide qual task de OCR usar: otimizado (Docling), RapidOCR ou paralelo.
-    Retorna (função, lista_args, dict_kwargs) para chain.append(fn, *args, **kwargs).
+    Procura um documento já processado com o mesmo hash de conteúdo.
+    Prefere um do mesmo cliente.
     """
-    path = instance.arquivo.path
-    ext = os.path.splitext(path)[1].lower()
+    if not instance.hash_conteudo:
+        return None
+    candidatos = (
+        Documentos.objects
+        .filter(hash_conteudo=instance.hash_conteudo)
+        .exclude(id=instance.id)
+        .exclude(conteudo=None)
+    )
+    return (
+        candidatos.filter(cliente_id=instance.cliente_id).order_by('id').first()
+        or candidatos.order_by('id').first()
+    )
 
-    if ext in EXTENSOES_IMAGEM:
-        return ocr_and_markdown_file_rapidocr, [instance.id], {}
 
-    if ext == '.pdf':
-        try:
-            from pdf2image import pdfinfo_from_path
-            info = pdfinfo_from_path(path)
-            num_paginas = int(info.get('Pages', 1))
-            if num_paginas > LIMIAR_PAGINAS_PDF_PARALELO:
-                return ocr_paralelo_multipaginas, [instance.id, 4], {}
-        except Exception:
-            pass
-        return ocr_and_markdown_file_otimizado, [instance.id], {}
+def iniciar_processamento(instance, **opcoes_task):
+    """
+    Reaproveita o texto de um documento idêntico ou agenda o roteamento do OCR
 
-    # Fallback (outros tipos): Docling otimizado
-    return ocr_and_markdown_file_otimizado, [instance.id], {}
+    Args:
+        instance: Documento recém-criado
+        **opcoes_task: Repassadas ao async_task (ex.: group de um lote)
+    """
+    original = _documento_identico(instance)
+    if original is not None:
+        # Conteúdo idêntico já extraído: reaproveita o texto sem OCR. O
+        # documento é indexado com id próprio (vetores relidos do original),
+        # então continua na busca se o original for excluído
+        Documentos.objects.filter(id=instance.id).update(conteudo=original.conteudo_id)
+        logger.info(f"Documento {instance.id} idêntico ao {original.id}: OCR reaproveitado, indexando")
+        async_task(rag_documentos, instance.id, **opcoes_task)
+        return
+
+    # A escolha da estratégia de OCR (páginas, camada de texto, fila)
+    # roda na primeira task, fora da requisição do upload
+    async_task(rotear_ocr, instance.id, **opcoes_task)
 
 
 @receiver(post_save, sender=Documentos)
 def post_save_documentos(sender, instance, created, **kwargs):
+    # Documentos de lote são criados com bulk_create (sem post_save) e
+    # enfileirados por ia.tasks_otimizado.enfileirar_lote
     if created:
-        chain = Chain()
-        fn, args, kws = _escolher_task_ocr(instance)
-        chain.append(fn, *args, **kws)
-        chain.append(rag_documentos, instance.id)
-        chain.run() 
\ No newline at end of file
+        iniciar_processamento(instance)
+        return
+
+    conteudo_anterior = instance.__dict__.pop('_conteudo_anterior', instance.conteudo_id)
+    # As tasks de OCR gravam com reindexar=False: a Chain delas já roda
+    # rag_documentos depois
+    reindexar = instance.__dict__.pop('_reindexar', True)
+    if (
+        reindexar
+        and conteudo_anterior != instance.conteudo_id
+        and ChunkIndexado.objects.filter(documento=instance).exists()
+    ):
+        # Texto corrigido (editor, admin, novo OCR) de um documento já
+        # indexado: a reindexação grava só os chunks que mudaram
+        logger.info(f"Conteúdo do documento {instance.id} alterado, reindexando")
+        transaction.on_commit(partial(async_task, rag_documentos, instance.id))
+
+
+def _indexar_dependentes(ids):
+    """Agenda a indexação dos documentos que ainda existem após o commit"""
+    for documento_id in Documentos.objects.filter(id__in=ids).values_list('id', flat=True):
+        async_task(rag_documentos, documento_id)
+
+
+@receiver(pre_delete, sender=Documentos)
+def pre_delete_documentos(sender, instance, **kwargs):
+    # Também roda para cada documento na exclusão em cascata de um Cliente.
+    # Os ids saem do manifesto antes que ele seja apagado junto
+    assinatura = JuriAI.EMBEDDER.assinatura
+    ids = ids_vetores_documento(instance.id, assinatura)
+    if not ids and instance.conteudo_id is None:
+        return
+    transaction.on_commit(partial(
+        async_task, remover_vetores_documento, instance.id, ids, instance.cliente_id, instance.arquivo.name
+    ))
+    if instance.conteudo_id is not None:
+        # Cópias idênticas enviadas antes de serem indexadas com id próprio
+        # dependiam das linhas deste documento; ganham as suas
+        dependentes = list(
+            Documentos.objects
+            .filter(conteudo_id=instance.conteudo_id)
+            .exclude(id=instance.id)
+            .exclude(id__in=ChunkIndexado.objects.filter(embedder=assinatura).values('documento_id'))
+            .values_list('id', flat=True)
+        )
+        if dependentes:
+            transaction.on_commit(partial(_indexar_dependentes, dependentes))
+
+
+@receiver(post_delete, sender=Documentos)
+def post_delete_documentos(sender, instance, **kwargs):
+    # O texto é compartilhado entre documentos idênticos; só sai com o último
+    ConteudoDocumento.descartar_orfao(instance.conteudo_id)
@@ -1,3 +1,360 @@
-from django.test import TestCase
+import io
+import os
+import tempfile
+import zipfile
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from ia.models import ChunkIndexado
+from .conteudo import COMPRESSAO_GZIP, comprimir, descomprimir
+from .models import Cliente, ConteudoDocumento, Documentos, LoteDocumentos
+from .signals import iniciar_processamento
+from .upload import (
+    DIRETORIO_PROVISORIOS, MIME_DOCX, MIME_ZIP, ArquivoRecusado, GravacaoDocumento, detectar_mime, extrair_zip,
+)
+
+TIPOS = ('application/pdf', 'image/png', MIME_DOCX)
+
+
+def _pdf(paginas: int) -> bytes:
+    objetos = b''.join(b'%d 0 obj << /Type /Page /Parent 1 0 R >> endobj\n' % (i + 2) for i in range(paginas))
+    return b'%PDF-1.4\n1 0 obj << /Type /Pages /Count ' + str(paginas).encode() + b' >> endobj\n' + objetos + b'%%EOF'
+
+
+class DetectarMimeTests(SimpleTestCase):
+
+    def test_assinaturas(self):
+        self.assertEqual(detectar_mime(b'%PDF-1.7\n'), 'application/pdf')
+        self.assertEqual(detectar_mime(b'\x89PNG\r\n\x1a\n\x00\x00'), 'image/png')
+        self.assertEqual(detectar_mime(b'\xff\xd8\xff\xe0'), 'image/jpeg')
+        self.assertEqual(detectar_mime(b'RIFF\x24\x00\x00\x00WEBPVP8 '), 'image/webp')
+        self.assertEqual(detectar_mime(b'II*\x00\x08\x00'), 'image/tiff')
+
+    def test_extensao_nao_decide_o_tipo(self):
+        self.assertEqual(detectar_mime(b'%PDF-1.4', 'foto.png'), 'application/pdf')
+        self.assertIsNone(detectar_mime(b'<html><body>', 'peticao.pdf'))
+        self.assertIsNone(detectar_mime(b''))
+
+    def test_docx_e_zip(self):
+        self.assertEqual(detectar_mime(b'PK\x03\x04\x14\x00', 'Contrato.DOCX'), MIME_DOCX)
+        self.assertEqual(detectar_mime(b'PK\x03\x04\x14\x00', 'lote.zip'), MIME_ZIP)
+
+
+class GravacaoDocumentoTests(SimpleTestCase):
+
+    def setUp(self):
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        configuracao = override_settings(MEDIA_ROOT=diretorio.name)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+
+    def _gravar(self, conteudo: bytes, nome='peticao.pdf', bloco=7, tamanho_max_mb=1.0):
+        gravacao = GravacaoDocumento(nome, tamanho_max_mb, TIPOS)
+        for inicio in range(0, len(conteudo), bloco):
+            gravacao.escrever(conteudo[inicio:inicio + bloco])
+        return gravacao.concluir()
+
+    def _provisorios(self):
+        return os.listdir(default_storage.path(DIRETORIO_PROVISORIOS))
+
+    def test_pdf_paginas_contadas_entre_blocos(self):
+        recebido = self._gravar(_pdf(3))
+
+        self.assertEqual(recebido.tipo_mime, 'application/pdf')
+        self.assertEqual(recebido.num_paginas, 3)
+        self.assertEqual(recebido.size, len(_pdf(3)))
+
+    def test_armazenar_move_o_provisorio(self):
+        recebido = self._gravar(_pdf(1), nome='../Petição inicial.pdf')
+
+        nome = recebido.armazenar()
+
+        self.assertTrue(nome.startswith('documentos/'))
+        self.assertNotIn('..', nome)
+        with open(default_storage.path(nome), 'rb') as arquivo:
+            self.assertEqual(arquivo.read(), _pdf(1))
+        self.assertEqual(self._provisorios(), [])
+        self.assertEqual(recebido.armazenar(), nome)
+
+    def test_tipo_nao_permitido_remove_o_parcial(self):
+        with self.assertRaisesMessage(ArquivoRecusado, 'tipo de arquivo não permitido'):
+            self._gravar(b'MZ\x90\x00' + b'\x00' * 60, nome='peticao.pdf')
+
+        self.assertEqual(self._provisorios(), [])
+
+    def test_limite_de_tamanho_remove_o_parcial(self):
+        with self.assertRaisesMessage(ArquivoRecusado, 'maior que o limite'):
+            self._gravar(_pdf(1) + b'\x00' * 2048, bloco=1024, tamanho_max_mb=0.001)
+
+        self.assertEqual(self._provisorios(), [])
+
+    def test_zip_extrai_so_os_tipos_permitidos(self):
+        conteudo = io.BytesIO()
+        with zipfile.ZipFile(conteudo, 'w') as zip_:
+            zip_.writestr('a.pdf', _pdf(2))
+            zip_.writestr('b.exe', b'MZ\x90\x00' + b'\x00' * 60)
+            zip_.writestr('c.zip', b'PK\x03\x04' + b'\x00' * 60)
+        caminho = default_storage.path('lote.zip')
+        with open(caminho, 'wb') as arquivo:
+            arquivo.write(conteudo.getvalue())
+
+        recebidos, erros = extrair_zip(caminho, tamanho_max_mb=1, tipos_permitidos=TIPOS + (MIME_ZIP,))
+
+        self.assertEqual([(r.name, r.num_paginas) for r in recebidos], [('a.pdf', 2)])
+        self.assertEqual(len(erros), 2)
+        self.assertEqual(len(self._provisorios()), 1)
+
+
+class ReindexacaoTests(TestCase):
+
+    def setUp(self):
+        usuario = User.objects.create_user('advogado')
+        cliente = Cliente.objects.create(nome='Cliente', email='cliente@exemplo.com', user=usuario)
+        # bulk_create: sem o post_save que agenda o OCR
+        self.documento, = Documentos.objects.bulk_create([
+            Documentos(cliente=cliente, arquivo='documentos/peticao.pdf', data_upload=timezone.now())
+        ])
+        self.documento.content = 'texto do OCR'
+        self.documento.save(reindexar=False)
+        ChunkIndexado.objects.create(
+            documento=self.documento, embedder='falso', hash='h', id_vetor='v', indice=0
+        )
+
+    def _salvar(self, texto, **kwargs):
+        documento = Documentos.objects.get(id=self.documento.id)
+        documento.content = texto
+        with mock.patch('usuarios.signals.async_task') as async_task:
+            with self.captureOnCommitCallbacks(execute=True):
+                documento.save(**kwargs)
+        return async_task
+
+    def test_texto_corrigido_reindexa(self):
+        async_task = self._salvar('texto corrigido')
+
+        async_task.assert_called_once()
+        self.assertEqual(async_task.call_args.args[1], self.documento.id)
+
+    def test_gravacao_da_task_de_ocr_nao_reindexa(self):
+        self._salvar('texto do novo OCR', reindexar=False).assert_not_called()
+
+    def test_mesmo_texto_nao_reindexa(self):
+        self._salvar('texto do OCR').assert_not_called()
+
+
+class DocumentoIdenticoTests(TestCase):
+
+    def setUp(self):
+        usuario = User.objects.create_user('advogado')
+        self.cliente = Cliente.objects.create(nome='Cliente', email='cliente@exemplo.com', user=usuario)
+        self.original, self.copia = Documentos.objects.bulk_create([
+            Documentos(cliente=self.cliente, arquivo=f'documentos/{nome}.pdf', data_upload=timezone.now(),
+                       hash_conteudo='mesmo-arquivo')
+            for nome in ('original', 'copia')
+        ])
+        self.original.content = 'texto extraído'
+        self.original.save(reindexar=False)
+
+    def test_copia_do_mesmo_cliente_e_indexada_com_id_proprio(self):
+        with mock.patch('usuarios.signals.async_task') as async_task:
+            iniciar_processamento(self.copia)
+
+        self.copia.refresh_from_db()
+        self.assertEqual(self.copia.conteudo_id, self.original.conteudo_id)
+        self.assertEqual(async_task.call_args.args[1:], (self.copia.id,))
+        self.assertEqual(async_task.call_args.args[0].__name__, 'rag_documentos')
+
+    def test_excluir_o_original_indexa_copias_sem_manifesto(self):
+        Documentos.objects.filter(id=self.copia.id).update(conteudo=self.original.conteudo_id)
+
+        with mock.patch('usuarios.signals.async_task') as async_task:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.original.delete()
+
+        agendadas = [(chamada.args[0].__name__, chamada.args[1]) for chamada in async_task.call_args_list]
+        self.assertIn(('rag_documentos', self.copia.id), agendadas)
+
+
+class LoteDocumentosTests(TestCase):
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('advogado', password='senha123')
+        self.cliente = Cliente.objects.create(nome='Cliente', email='cliente@exemplo.com', user=self.usuario)
+        self.lote = LoteDocumentos.objects.create(cliente=self.cliente, grupo='lote_teste', total=2)
+        self.documentos = Documentos.objects.bulk_create([
+            Documentos(cliente=self.cliente, arquivo=f'documentos/lote{i}.pdf', data_upload=timezone.now(), lote=self.lote)
+            for i in range(2)
+        ])
+
+    def _extrair(self, documento):
+        documento.content = f'texto do documento {documento.id}'
+        documento.save(reindexar=False)
+
+    def _entrar(self, username='advogado'):
+        if username != 'advogado':
+            User.objects.create_user(username, password='senha123')
+        self.client.login(username=username, password='senha123')
+
+    def test_conclusao_so_com_todos_os_documentos(self):
+        self._extrair(self.documentos[0])
+        self.assertFalse(self.lote.registrar_conclusao())
+
+        self._extrair(self.documentos[1])
+        self.assertTrue(self.lote.registrar_conclusao())
+        self.assertIsNotNone(LoteDocumentos.objects.get(id=self.lote.id).data_conclusao)
+        self.assertFalse(self.lote.registrar_conclusao())
+
+    def test_progresso_nao_grava(self):
+        for documento in self.documentos:
+            self._extrair(documento)
+
+        progresso = self.lote.progresso()
+
+        self.assertEqual(progresso['concluidos'], 2)
+        self.assertEqual(progresso['status'], 'processando')
+        self.assertIsNone(LoteDocumentos.objects.get(id=self.lote.id).data_conclusao)
+
+    def test_progresso_exige_login(self):
+        resposta = self.client.get(reverse('lote_progresso', kwargs={'id': self.lote.id}))
+
+        self.assertEqual(resposta.status_code, 302)
+
+    def test_progresso_de_lote_de_outro_usuario(self):
+        self._entrar('outro')
+
+        resposta = self.client.get(reverse('lote_progresso', kwargs={'id': self.lote.id}))
+
+        self.assertEqual(resposta.status_code, 404)
+
+    def test_progresso_do_dono(self):
+        self._entrar()
+
+        resposta = self.client.get(reverse('lote_progresso', kwargs={'id': self.lote.id}))
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.json()['total'], 2)
+
+    def test_upload_em_lote_exige_login(self):
+        resposta = self.client.post(reverse('cliente_lote', kwargs={'id': self.cliente.id}))
+
+        self.assertEqual(resposta.status_code, 302)
+
+    def test_upload_em_lote_para_cliente_de_outro_usuario(self):
+        self._entrar('outro')
+        arquivo = io.BytesIO(_pdf(1))
+        arquivo.name = 'peticao.pdf'
+
+        with mock.patch('usuarios.views.async_task') as async_task:
+            resposta = self.client.post(reverse('cliente_lote', kwargs={'id': self.cliente.id}), {'documentos': arquivo})
+
+        self.assertEqual(resposta.status_code, 404)
+        async_task.assert_not_called()
+        self.assertEqual(LoteDocumentos.objects.count(), 1)
+
+
+class ConteudoDocumentoTests(TestCase):
+
+    TEXTO = 'Cláusula primeira: o locatário pagará o aluguel até o dia 5. ' * 50
+
+    def setUp(self):
+        usuario = User.objects.create_user('advogado')
+        self.cliente = Cliente.objects.create(nome='Cliente', email='cliente@exemplo.com', user=usuario)
+
+    def _documento(self, texto):
+        documento, = Documentos.objects.bulk_create([
+            Documentos(cliente=self.cliente, arquivo='documentos/peticao.pdf', data_upload=timezone.now())
+        ])
+        documento.content = texto
+        documento.save(reindexar=False)
+        return documento
+
+    def _excluir(self, documento):
+        with mock.patch('usuarios.signals.async_task'):
+            documento.delete()
+
+    def test_textos_iguais_compartilham_a_linha_comprimida(self):
+        primeiro, segundo = self._documento(self.TEXTO), self._documento(self.TEXTO)
+
+        conteudo, = ConteudoDocumento.objects.all()
+        self.assertEqual(primeiro.conteudo_id, segundo.conteudo_id)
+        self.assertEqual(conteudo.tamanho, len(self.TEXTO.encode('utf-8')))
+        self.assertLess(conteudo.tamanho_comprimido, conteudo.tamanho)
+        self.assertEqual(Documentos.objects.get(id=segundo.id).content, self.TEXTO)
+
+    def test_conteudo_sai_com_o_ultimo_documento(self):
+        primeiro, segundo = self._documento(self.TEXTO), self._documento(self.TEXTO)
+
+        self._excluir(primeiro)
+        self.assertEqual(ConteudoDocumento.objects.count(), 1)
+
+        self._excluir(segundo)
+        self.assertFalse(ConteudoDocumento.objects.exists())
+
+    def test_texto_alterado_descarta_o_anterior_sem_outros_documentos(self):
+        documento = self._documento(self.TEXTO)
+        anterior = documento.conteudo_id
+
+        documento.content = 'texto corrigido'
+        documento.save(reindexar=False)
+
+        self.assertFalse(ConteudoDocumento.objects.filter(id=anterior).exists())
+        self.assertEqual(Documentos.objects.get(id=documento.id).content, 'texto corrigido')
+
+    def test_texto_vazio_sem_linha(self):
+        documento = self._documento('')
+
+        self.assertIsNone(documento.conteudo_id)
+        self.assertEqual(Documentos.objects.get(id=documento.id).content, '')
+
+    def test_gzip_deterministico(self):
+        dados, algoritmo = comprimir(self.TEXTO, COMPRESSAO_GZIP)
+
+        self.assertEqual(comprimir(self.TEXTO, COMPRESSAO_GZIP), (dados, algoritmo))
+        self.assertEqual(descomprimir(dados, algoritmo), self.TEXTO)
+
+
+class MigracaoConteudoTests(TransactionTestCase):
+    """0006_conteudo_documento: texto da coluna content para ConteudoDocumento e de volta"""
+
+    ANTES = [('usuarios', '0005_lote_documentos'), ('ia', '0010_paginaocr_linhas')]
+    DEPOIS = [('usuarios', '0006_conteudo_documento')]
+
+    def _migrar(self, alvos):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(alvos)
+        return executor.loader.project_state(alvos).apps
+
+    def tearDown(self):
+        self._migrar(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_ida_e_volta(self):
+        apps = self._migrar(self.ANTES)
+        usuario = apps.get_model('auth', 'User').objects.create(username='advogado')
+        cliente = apps.get_model('usuarios', 'Cliente').objects.create(
+            nome='Cliente', email='cliente@exemplo.com', user_id=usuario.id
+        )
+        Documentos = apps.get_model('usuarios', 'Documentos')
+        textos = ['petição inicial', 'petição inicial', 'contestação', '']
+        for texto in textos:
+            Documentos.objects.create(cliente=cliente, arquivo='documentos/a.pdf', data_upload=timezone.now(), content=texto)
+
+        apps = self._migrar(self.DEPOIS)
+        conteudos = apps.get_model('usuarios', 'ConteudoDocumento').objects.all()
+        self.assertEqual(
+            sorted(descomprimir(c.dados, c.compressao) for c in conteudos), ['contestação', 'petição inicial']
+        )
+        self.assertEqual(apps.get_model('usuarios', 'Documentos').objects.filter(conteudo=None).count(), 1)
+
+        apps = self._migrar(self.ANTES)
+        self.assertEqual(
+            list(apps.get_model('usuarios', 'Documentos').objects.order_by('id').values_list('content', flat=True)),
+            textos,
+        )
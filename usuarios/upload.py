@@ -0,0 +1,480 @@
+"""
+Upload de documentos gravado direto no storage
+
+O UploadDocumentoHandler substitui os handlers padrão do Django nas views
+de documentos: cada bloco recebido vai direto para um arquivo provisório em
+MEDIA_ROOT, e na mesma passada são calculados o SHA-256, o tipo MIME (pelos
+bytes iniciais) e o número de páginas de PDFs. Os limites de tamanho são
+verificados pelo Content-Length, antes de ler o corpo, e de novo a cada
+bloco. Os metadados ficam no objeto em request.FILES e são gravados em
+Documentos, para que nenhuma task precise reabrir o arquivo para obtê-los.
+
+O corpo é lido pelo CSRF, antes da view validar o formulário; o arquivo só
+ganha o nome definitivo em documentos/ quando a view cria o documento
+(ArquivoRecebido.armazenar). Os provisórios não armazenados são apagados
+ao fim da requisição (descartar_nao_armazenados), inclusive em 403 e erros.
+"""
+import hashlib
+import logging
+import os
+import re
+import uuid
+import zipfile
+import zlib
+from typing import List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile, StopFutureHandlers, StopUpload
+from django.utils.text import get_valid_filename
+
+logger = logging.getLogger(__name__)
+
+# Diretório de upload_to de Documentos.arquivo
+DIRETORIO_DOCUMENTOS = 'documentos'
+# Arquivos provisórios do upload, no mesmo sistema de arquivos (os.replace)
+DIRETORIO_PROVISORIOS = os.path.join(DIRETORIO_DOCUMENTOS, '.recebendo')
+# Tentativas de reservar um nome livre quando outro upload o ocupa antes
+TENTATIVAS_NOME = 10
+
+TAMANHO_MAX_MB_PADRAO = 100
+TIPOS_PERMITIDOS_PADRAO = (
+    'application/pdf',
+    'image/png',
+    'image/jpeg',
+    'image/gif',
+    'image/bmp',
+    'image/tiff',
+    'image/webp',
+    'application/msword',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+)
+
+MIME_ZIP = 'application/zip'
+MIME_DOCX = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+
+# (assinatura, deslocamento, tipo MIME)
+_ASSINATURAS = (
+    (b'%PDF-', 0, 'application/pdf'),
+    (b'\x89PNG\r\n\x1a\n', 0, 'image/png'),
+    (b'\xff\xd8\xff', 0, 'image/jpeg'),
+    (b'GIF87a', 0, 'image/gif'),
+    (b'GIF89a', 0, 'image/gif'),
+    (b'BM', 0, 'image/bmp'),
+    (b'II*\x00', 0, 'image/tiff'),
+    (b'MM\x00*', 0, 'image/tiff'),
+    (b'WEBP', 8, 'image/webp'),
+    (b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', 0, 'application/msword'),
+    (b'PK\x03\x04', 0, MIME_ZIP),
+)
+
+# Bloco lido de cada membro de um ZIP
+TAMANHO_BLOCO_ZIP = 1024 * 1024
+
+# Objetos de página do PDF (não casa /Pages)
+_REGEX_PAGINA_PDF = re.compile(rb'/Type\s*/Page(?![A-Za-z])')
+# Bytes do bloco anterior mantidos para casar marcadores divididos entre blocos
+_SOBREPOSICAO = 32
+
+
+def detectar_mime(inicio: bytes, nome: str = '') -> Optional[str]:
+    """
+    Tipo MIME pelos primeiros bytes do arquivo
+
+    Args:
+        inicio: Primeiros bytes (16 bastam)
+        nome: Nome do arquivo, para separar .docx de .zip
+
+    Returns:
+        Tipo MIME ou None se desconhecido
+    """
+    for assinatura, deslocamento, mime in _ASSINATURAS:
+        if inicio[deslocamento:deslocamento + len(assinatura)] == assinatura:
+            if mime == MIME_ZIP and nome.lower().endswith('.docx'):
+                return MIME_DOCX
+            return mime
+    return None
+
+
+def _reservar_nome(nome: str) -> Tuple[str, str]:
+    """
+    Cria vazio o arquivo com o primeiro nome livre em documentos/, sem
+    sobrescrever nenhum; outro upload pode ocupar o nome entre a escolha e a
+    criação, então o nome é escolhido de novo
+
+    Returns:
+        (nome no storage, caminho em disco)
+    """
+    for _ in range(TENTATIVAS_NOME):
+        nome_armazenado = default_storage.get_available_name(os.path.join(DIRETORIO_DOCUMENTOS, nome))
+        caminho = default_storage.path(nome_armazenado)
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        try:
+            with open(caminho, 'xb'):
+                return nome_armazenado, caminho
+        except FileExistsError:
+            continue
+    raise FileExistsError(f"Nenhum nome livre para {nome} após {TENTATIVAS_NOME} tentativas")
+
+
+class ArquivoRecebido(UploadedFile):
+    """
+    Arquivo já gravado em um provisório do storage, com os metadados
+    calculados no upload
+
+    `armazenar()` move o provisório para documentos/ e devolve o nome a
+    atribuir ao FileField (campo.name = ...), sem segunda cópia.
+    """
+
+    def __init__(self, nome_provisorio: str, nome_original: str, tamanho: int,
+                 hash_conteudo: str, tipo_mime: Optional[str], num_paginas: Optional[int]):
+        super().__init__(file=None, name=nome_original, content_type=tipo_mime, size=tamanho)
+        self.nome_provisorio = nome_provisorio
+        self.nome_armazenado: Optional[str] = None
+        self.hash_conteudo = hash_conteudo
+        self.tipo_mime = tipo_mime or ''
+        self.num_paginas = num_paginas
+
+    @property
+    def caminho(self) -> str:
+        return default_storage.path(self.nome_armazenado or self.nome_provisorio)
+
+    def open(self, mode='rb'):
+        self.file = open(self.caminho, mode)
+        return self
+
+    def armazenar(self) -> str:
+        """Move o provisório para o nome definitivo em documentos/"""
+        if self.nome_armazenado is None:
+            nome = get_valid_filename(os.path.basename(self.name)) or 'documento'
+            nome_armazenado, caminho = _reservar_nome(nome)
+            try:
+                os.replace(default_storage.path(self.nome_provisorio), caminho)
+            except OSError:
+                default_storage.delete(nome_armazenado)
+                raise
+            self.nome_armazenado = nome_armazenado
+        return self.nome_armazenado
+
+    def descartar(self):
+        """Apaga o arquivo, provisório ou já armazenado"""
+        default_storage.delete(self.nome_armazenado or self.nome_provisorio)
+
+    def metadados(self) -> dict:
+        """Campos de Documentos preenchidos pelo upload"""
+        return {
+            'hash_conteudo': self.hash_conteudo,
+            'tamanho_bytes': self.size,
+            'tipo_mime': self.tipo_mime,
+            'num_paginas': self.num_paginas,
+        }
+
+
+class ArquivoRecusado(Exception):
+    """Arquivo acima do limite ou de tipo não permitido (parcial já removido)"""
+
+
+class GravacaoDocumento:
+    """
+    Grava um arquivo em blocos em um provisório, calculando hash, MIME e
+    páginas na mesma passada
+
+    Args:
+        nome_original: Nome enviado pelo usuário
+        tamanho_max_mb: Tamanho máximo do arquivo
+        tipos_permitidos: Tipos MIME aceitos
+        tamanho_max_zip_mb: Limite próprio para arquivos ZIP (padrão: o mesmo)
+    """
+
+    def __init__(self, nome_original: str, tamanho_max_mb: float, tipos_permitidos: Sequence[str],
+                 tamanho_max_zip_mb: Optional[float] = None):
+        self.nome_original = nome_original
+        self.tamanho_max_mb = tamanho_max_mb
+        self.tamanho_max_zip_mb = tamanho_max_zip_mb or tamanho_max_mb
+        self.tipos_permitidos = set(tipos_permitidos)
+
+        self.nome_provisorio = os.path.join(DIRETORIO_PROVISORIOS, f'{uuid.uuid4().hex}.parcial')
+        caminho = default_storage.path(self.nome_provisorio)
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        self._arquivo = open(caminho, 'xb')
+
+        self._hash = hashlib.sha256()
+        self._tamanho = 0
+        self._inicio = b''
+        self.tipo_mime: Optional[str] = None
+        self._paginas = 0
+        self._cauda = b''
+
+    @property
+    def _limite_mb(self) -> float:
+        return self.tamanho_max_zip_mb if self.tipo_mime == MIME_ZIP else self.tamanho_max_mb
+
+    def escrever(self, bloco: bytes):
+        """
+        Raises:
+            ArquivoRecusado: Limite de tamanho excedido ou tipo não permitido
+        """
+        if self.tipo_mime is None:
+            self._inicio += bloco[:16 - len(self._inicio)]
+            if len(self._inicio) >= 16:
+                self._verificar_tipo()
+
+        self._tamanho += len(bloco)
+        if self._tamanho > self._limite_mb * 1024 * 1024:
+            self._recusar(f"{self.nome_original}: maior que o limite de {self._limite_mb:g} MB")
+
+        self._hash.update(bloco)
+        if self.tipo_mime == 'application/pdf':
+            janela = self._cauda + bloco
+            self._paginas += sum(
+                1 for m in _REGEX_PAGINA_PDF.finditer(janela) if m.end() > len(self._cauda)
+            )
+            self._cauda = janela[-_SOBREPOSICAO:]
+        self._arquivo.write(bloco)
+
+    def concluir(self) -> ArquivoRecebido:
+        """
+        Fecha o arquivo e devolve os metadados
+
+        Raises:
+            ArquivoRecusado: Tipo não permitido (arquivos com menos de 16 bytes)
+        """
+        if self.tipo_mime is None:
+            self._verificar_tipo()
+        self._arquivo.close()
+        self._arquivo = None
+
+        num_paginas = self._contar_paginas()
+        logger.info(
+            f"Upload de {self.nome_original} recebido em {self.nome_provisorio}: {self._tamanho} bytes, "
+            f"{self.tipo_mime}, {num_paginas or '?'} página(s)"
+        )
+        return ArquivoRecebido(
+            nome_provisorio=self.nome_provisorio,
+            nome_original=self.nome_original,
+            tamanho=self._tamanho,
+            hash_conteudo=self._hash.hexdigest(),
+            tipo_mime=self.tipo_mime,
+            num_paginas=num_paginas,
+        )
+
+    def descartar(self):
+        if self._arquivo is not None:
+            self._arquivo.close()
+            self._arquivo = None
+            default_storage.delete(self.nome_provisorio)
+
+    def _verificar_tipo(self):
+        self.tipo_mime = detectar_mime(self._inicio, self.nome_original) or ''
+        if self.tipo_mime not in self.tipos_permitidos:
+            self._recusar(
+                f"{self.nome_original}: tipo de arquivo não permitido ({self.tipo_mime or 'desconhecido'})"
+            )
+
+    def _recusar(self, motivo: str):
+        self.descartar()
+        logger.warning(f"Upload recusado: {motivo}")
+        raise ArquivoRecusado(motivo)
+
+    def _contar_paginas(self) -> Optional[int]:
+        if self.tipo_mime.startswith('image/') and self.tipo_mime != 'image/tiff':
+            return 1
+        if self.tipo_mime != 'application/pdf':
+            return None
+        if self._paginas:
+            return self._paginas
+        # Páginas dentro de object streams comprimidos não aparecem no fluxo;
+        # o pdfium lê só a xref e a árvore de páginas
+        try:
+            import pypdfium2 as pdfium
+            pdf = pdfium.PdfDocument(default_storage.path(self.nome_provisorio))
+            try:
+                return len(pdf)
+            finally:
+                pdf.close()
+        except Exception as e:
+            logger.warning(f"Não foi possível contar as páginas de {self.nome_original}: {str(e)}")
+            return None
+
+
+class UploadDocumentoHandler(FileUploadHandler):
+    """
+    Grava os arquivos do upload direto no storage, calculando hash, MIME e
+    páginas em uma passada
+
+    Arquivos acima do limite ou de tipo não permitido são descartados
+    (parcial removido) e o motivo fica em erros_upload(request). Os aceitos
+    ficam também em arquivos_upload(request), para o descarte dos que a view
+    não armazenar.
+
+    Args:
+        request: HttpRequest
+        tamanho_max_mb: Tamanho máximo por arquivo (padrão: settings.UPLOAD_DOCUMENTOS)
+        tipos_permitidos: Tipos MIME aceitos (padrão: settings.UPLOAD_DOCUMENTOS)
+        tamanho_max_requisicao_mb: Corpo máximo da requisição; maior que isso
+            ela é recusada sem ler o corpo (padrão: o limite por arquivo)
+        tamanho_max_zip_mb: Limite para arquivos ZIP, quando aceitos
+    """
+
+    def __init__(self, request=None, tamanho_max_mb: Optional[float] = None,
+                 tipos_permitidos: Optional[Sequence[str]] = None,
+                 tamanho_max_requisicao_mb: Optional[float] = None,
+                 tamanho_max_zip_mb: Optional[float] = None):
+        super().__init__(request)
+        config = getattr(settings, 'UPLOAD_DOCUMENTOS', {})
+        self.tamanho_max_mb = tamanho_max_mb or config.get('tamanho_max_mb', TAMANHO_MAX_MB_PADRAO)
+        self.tamanho_max_zip_mb = tamanho_max_zip_mb
+        self.tamanho_max_requisicao_mb = tamanho_max_requisicao_mb or self.tamanho_max_mb
+        # Folga para os campos do formulário e as fronteiras do multipart
+        self.tamanho_max_requisicao = int(self.tamanho_max_requisicao_mb * 1024 * 1024) + 64 * 1024
+        self.corpo_grande_demais = False
+        self.tipos_permitidos = tipos_permitidos or config.get('tipos_permitidos', TIPOS_PERMITIDOS_PADRAO)
+        self.erros: List[str] = []
+        self.recebidos: List[ArquivoRecebido] = []
+        if request is not None:
+            request.erros_upload = self.erros
+            request.arquivos_upload = self.recebidos
+        self._gravacao: Optional[GravacaoDocumento] = None
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        self.corpo_grande_demais = content_length > self.tamanho_max_requisicao
+        return None
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        if self.corpo_grande_demais:
+            # Nem o corpo restante é lido: a conexão é encerrada
+            motivo = f"{file_name}: upload maior que o limite de {self.tamanho_max_requisicao_mb:g} MB"
+            logger.warning(f"Upload recusado: {motivo}")
+            self.erros.append(motivo)
+            raise StopUpload(connection_reset=True)
+        limite_mb = max(self.tamanho_max_mb, self.tamanho_max_zip_mb or 0)
+        if content_length and content_length > limite_mb * 1024 * 1024:
+            self._rejeitar(f"{file_name}: maior que o limite de {limite_mb:g} MB")
+
+        self._gravacao = GravacaoDocumento(
+            file_name, self.tamanho_max_mb, self.tipos_permitidos, self.tamanho_max_zip_mb
+        )
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        try:
+            self._gravacao.escrever(raw_data)
+        except ArquivoRecusado as e:
+            self._gravacao = None
+            self._rejeitar(str(e))
+        return None
+
+    def file_complete(self, file_size):
+        gravacao, self._gravacao = self._gravacao, None
+        try:
+            recebido = gravacao.concluir()
+        except ArquivoRecusado as e:
+            self.erros.append(str(e))
+            return None
+        self.recebidos.append(recebido)
+        return recebido
+
+    def upload_interrupted(self):
+        if self._gravacao is not None:
+            self._gravacao.descartar()
+            self._gravacao = None
+
+    def _rejeitar(self, motivo: str):
+        if motivo not in self.erros:
+            self.erros.append(motivo)
+        raise SkipFile(motivo)
+
+
+def extrair_zip(
+    caminho_zip: str,
+    tamanho_max_mb: Optional[float] = None,
+    tipos_permitidos: Optional[Sequence[str]] = None,
+    max_arquivos: Optional[int] = None
+) -> Tuple[List[ArquivoRecebido], List[str]]:
+    """
+    Extrai os documentos de um ZIP em fluxo, membro a membro, direto para o
+    storage (mesma passada de hash, MIME e páginas do upload)
+
+    O limite de tamanho vale para os bytes descomprimidos de fato, não para
+    o tamanho declarado no ZIP. ZIPs aninhados não são aceitos.
+
+    Args:
+        caminho_zip: Caminho do ZIP em disco
+        tamanho_max_mb: Limite por documento (padrão: settings.UPLOAD_DOCUMENTOS)
+        tipos_permitidos: Tipos aceitos (padrão: settings.UPLOAD_DOCUMENTOS)
+        max_arquivos: Máximo de documentos extraídos
+
+    Returns:
+        (documentos gravados, motivos dos membros recusados)
+    """
+    config = getattr(settings, 'UPLOAD_DOCUMENTOS', {})
+    tamanho_max_mb = tamanho_max_mb or config.get('tamanho_max_mb', TAMANHO_MAX_MB_PADRAO)
+    tipos = [t for t in (tipos_permitidos or config.get('tipos_permitidos', TIPOS_PERMITIDOS_PADRAO)) if t != MIME_ZIP]
+
+    recebidos: List[ArquivoRecebido] = []
+    erros: List[str] = []
+    try:
+        _extrair_membros(caminho_zip, tamanho_max_mb, tipos, max_arquivos, recebidos, erros)
+    except BaseException:
+        # Os já extraídos ainda são provisórios sem dono
+        for recebido in recebidos:
+            recebido.descartar()
+        raise
+    return recebidos, erros
+
+
+def _extrair_membros(caminho_zip: str, tamanho_max_mb: float, tipos: Sequence[str], max_arquivos: Optional[int],
+                     recebidos: List[ArquivoRecebido], erros: List[str]):
+    with zipfile.ZipFile(caminho_zip) as zf:
+        for info in zf.infolist():
+            nome = os.path.basename(info.filename)
+            if info.is_dir() or not nome or nome.startswith('.') or '__MACOSX' in info.filename:
+                continue
+            if max_arquivos is not None and len(recebidos) >= max_arquivos:
+                erros.append(f"Limite de {max_arquivos} documentos por lote atingido; restante ignorado")
+                break
+            if info.file_size > tamanho_max_mb * 1024 * 1024:
+                erros.append(f"{info.filename}: maior que o limite de {tamanho_max_mb:g} MB")
+                continue
+
+            gravacao = GravacaoDocumento(nome, tamanho_max_mb, tipos)
+            try:
+                with zf.open(info) as fluxo:
+                    for bloco in iter(lambda: fluxo.read(TAMANHO_BLOCO_ZIP), b''):
+                        gravacao.escrever(bloco)
+                recebidos.append(gravacao.concluir())
+            except ArquivoRecusado as e:
+                erros.append(str(e))
+            except (zipfile.BadZipFile, zlib.error, EOFError, NotImplementedError) as e:
+                gravacao.descartar()
+                erros.append(f"{info.filename}: não foi possível extrair ({str(e)})")
+            except BaseException:
+                gravacao.descartar()
+                raise
+
+
+def erros_upload(request) -> List[str]:
+    """Motivos dos arquivos descartados pelo UploadDocumentoHandler"""
+    return getattr(request, 'erros_upload', [])
+
+
+def arquivos_upload(request) -> List[ArquivoRecebido]:
+    """Arquivos aceitos pelo UploadDocumentoHandler (e extraídos de ZIPs pela view)"""
+    return getattr(request, 'arquivos_upload', [])
+
+
+def descartar_nao_armazenados(request) -> int:
+    """
+    Apaga os provisórios que a view não armazenou (CSRF recusado, formulário
+    inválido, exceção); chamado ao fim de toda requisição de upload
+    """
+    descartados = 0
+    for arquivo in arquivos_upload(request):
+        if arquivo.nome_armazenado is None:
+            arquivo.descartar()
+            descartados += 1
+    if descartados:
+        logger.info(f"{descartados} arquivo(s) recebido(s) e não armazenado(s) apagado(s)")
+    return descartados
@@ -6,4 +6,6 @@ urlpatterns = [
     path("login/", views.login, name='login'),
     path("clientes/", views.clientes, name='clientes'),
     path("cliente/<int:id>", views.cliente, name='cliente'),
+    path("cliente/<int:id>/lote", views.cliente_lote, name='cliente_lote'),
+    path("lote/<int:id>", views.lote_progresso, name='lote_progresso'),
 ]
\ No newline at end of file
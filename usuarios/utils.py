@@ -0,0 +1,26 @@
+import hashlib
+
+# Tamanho dos blocos lidos ao calcular o hash (1 MiB)
+TAMANHO_BLOCO_HASH = 1024 * 1024
+
+
+def hash_conteudo_arquivo(arquivo) -> str:
+    """
+    Calcula o SHA-256 de um arquivo do Django (UploadedFile ou File) lendo em
+    blocos, sem carregar o arquivo inteiro em memória
+    """
+    h = hashlib.sha256()
+    for bloco in arquivo.chunks(TAMANHO_BLOCO_HASH):
+        h.update(bloco)
+    if hasattr(arquivo, 'seek'):
+        arquivo.seek(0)
+    return h.hexdigest()
+
+
+def hash_conteudo_caminho(caminho: str) -> str:
+    """Calcula o SHA-256 de um arquivo em disco lendo em blocos"""
+    h = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(TAMANHO_BLOCO_HASH), b''):
+            h.update(bloco)
+    return h.hexdigest()
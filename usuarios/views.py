@@ -4,9 +4,19 @@ from django.contrib import messages
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
 from django.contrib import auth
-from .models import Cliente, Documentos
+import uuid
+from django.conf import settings
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django_q.tasks import async_task
+from .models import Cliente, Documentos, LoteDocumentos
+from .upload import (
+    MIME_ZIP, UploadDocumentoHandler, arquivos_upload, descartar_nao_armazenados, erros_upload, extrair_zip,
+)
 from django.contrib.auth.decorators import login_required
 from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
 
 
 def cadastro(request):
@@ -76,7 +86,18 @@ def clientes(request):
         messages.add_message(request, constants.SUCCESS, 'Cliente cadastrado com sucesso!')
         return redirect('clientes')
 
+@csrf_exempt
 def cliente(request, id):
+    # Os handlers precisam ser trocados antes de o CSRF ler request.POST
+    request.upload_handlers = [UploadDocumentoHandler(request)]
+    try:
+        return _cliente(request, id)
+    finally:
+        descartar_nao_armazenados(request)
+
+
+@csrf_protect
+def _cliente(request, id):
     cliente = Cliente.objects.get(id=id)
     if request.method == 'GET':
         documentos = Documentos.objects.filter(cliente=cliente)
@@ -85,13 +106,119 @@ def cliente(request, id):
         tipo = request.POST.get('tipo')
         documento = request.FILES.get('documento')
         data = request.POST.get('data')
-        
+
+        if documento is None:
+            for erro in erros_upload(request) or ['Selecione um documento.']:
+                messages.add_message(request, constants.ERROR, erro)
+            return redirect(reverse('cliente', kwargs={'id': cliente.id}))
+
+        # O arquivo já está no storage; hash, tipo e páginas vieram do upload
         documentos = Documentos(
             cliente=cliente,
             tipo=tipo,
-            arquivo=documento,
-            data_upload=data
+            data_upload=data,
+            **documento.metadados()
+        )
+        documentos.arquivo.name = documento.armazenar()
+        try:
+            documentos.save()
+        except Exception:
+            documento.descartar()
+            raise
+
+        return redirect(reverse('cliente', kwargs={'id': cliente.id}))
+
+
+@csrf_exempt
+@login_required
+def cliente_lote(request, id):
+    """
+    Upload em lote: vários arquivos e/ou ZIPs no campo 'documentos'.
+
+    Os documentos são criados de uma vez e enfileirados aos poucos por
+    ia.tasks_otimizado.enfileirar_lote; o andamento fica em lote_progresso.
+    """
+    # Cliente de outro usuário é recusado antes de qualquer arquivo ir ao disco
+    cliente = get_object_or_404(Cliente, id=id, user=request.user)
+    if request.method == 'POST':
+        config = getattr(settings, 'UPLOAD_LOTE', {})
+        tipos = getattr(settings, 'UPLOAD_DOCUMENTOS', {}).get('tipos_permitidos')
+        request.upload_handlers = [UploadDocumentoHandler(
+            request,
+            tipos_permitidos=[*(tipos or []), MIME_ZIP] if tipos else None,
+            tamanho_max_requisicao_mb=config.get('tamanho_max_requisicao_mb'),
+            tamanho_max_zip_mb=config.get('tamanho_max_zip_mb'),
+        )]
+    try:
+        return _cliente_lote(request, cliente)
+    finally:
+        descartar_nao_armazenados(request)
+
+
+@csrf_protect
+def _cliente_lote(request, cliente):
+    if request.method != 'POST':
+        return JsonResponse({'erro': 'Método não permitido.'}, status=405)
+
+    max_arquivos = getattr(settings, 'UPLOAD_LOTE', {}).get('max_arquivos', 500)
+    recebidos, recusados = [], list(erros_upload(request))
+    for arquivo in request.FILES.getlist('documentos'):
+        if arquivo.tipo_mime != MIME_ZIP:
+            recebidos.append(arquivo)
+            continue
+        # ZIP extraído em fluxo, membro a membro; o ZIP em si não é guardado
+        try:
+            membros, erros = extrair_zip(arquivo.caminho, max_arquivos=max(0, max_arquivos - len(recebidos)))
+            # Descartados ao fim da requisição se o lote não for criado
+            arquivos_upload(request).extend(membros)
+            recebidos.extend(membros)
+            recusados.extend(erros)
+        except Exception as e:
+            recusados.append(f"{arquivo.name}: ZIP inválido ({str(e)})")
+
+    for excedente in recebidos[max_arquivos:]:
+        recusados.append(f"{excedente.name}: limite de {max_arquivos} documentos por lote")
+    recebidos = recebidos[:max_arquivos]
+
+    if not recebidos:
+        return JsonResponse({'erro': 'Nenhum documento aceito.', 'recusados': recusados}, status=400)
+
+    lote = LoteDocumentos.objects.create(
+        cliente=cliente,
+        grupo=f'lote_{cliente.id}_{uuid.uuid4().hex[:8]}',
+        total=len(recebidos),
+        recusados=recusados,
+    )
+    tipo = request.POST.get('tipo') or 'O'
+    data = request.POST.get('data') or timezone.now()
+    documentos = []
+    for arquivo in recebidos:
+        documento = Documentos(
+            cliente=cliente, tipo=tipo, data_upload=data, lote=lote, **arquivo.metadados()
         )
-        documentos.save()
+        documento.arquivo.name = arquivo.armazenar()
+        documentos.append(documento)
+    # bulk_create não dispara post_save: o lote é enfileirado de forma controlada
+    try:
+        Documentos.objects.bulk_create(documentos, batch_size=200)
+    except Exception:
+        for arquivo in recebidos:
+            arquivo.descartar()
+        lote.delete()
+        raise
+    async_task('ia.tasks_otimizado.enfileirar_lote', lote.id, group=lote.grupo)
+
+    return JsonResponse({
+        'lote_id': lote.id,
+        'grupo': lote.grupo,
+        'total': lote.total,
+        'recusados': recusados,
+        'progresso': reverse('lote_progresso', kwargs={'id': lote.id}),
+    }, status=201)
 
-        return redirect(reverse('cliente', kwargs={'id': cliente.id}))
\ No newline at end of file
+
+@login_required
+def lote_progresso(request, id):
+    """Andamento de um lote em JSON (documentos, páginas e vazão)"""
+    lote = get_object_or_404(LoteDocumentos, id=id, cliente__user=request.user)
+    return JsonResponse(lote.progresso())